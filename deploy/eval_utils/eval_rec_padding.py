@@ -0,0 +1,51 @@
+"""
+Measure the padded pixels of recognition batches, with sub images batched in input order and sorted by aspect ratio.
+
+Example:
+    $ python deploy/eval_utils/eval_rec_padding.py --image_dir path/to/crops --batch_num 8 --target_height 48
+"""
+import argparse
+import math
+import os
+
+import cv2
+import numpy as np
+
+
+def batch_padded_pixels(hw_list, batch_num, target_height, min_width):
+    """
+    Number of valid and padded pixels when the sub images are resized to target_height keeping the aspect ratio,
+    and padded to the widest one of each batch.
+    """
+    widths = [math.ceil(target_height * w / h) for h, w in hw_list]
+    valid, padded = 0, 0
+    for start in range(0, len(widths), batch_num):
+        batch = widths[start : start + batch_num]
+        batch_width = max(max(batch), min_width)
+        valid += sum(batch) * target_height
+        padded += (batch_width * len(batch) - sum(batch)) * target_height
+    return valid, padded
+
+
+def read_hw_list(image_dir):
+    hw_list = []
+    for name in sorted(os.listdir(image_dir)):
+        img = cv2.imread(os.path.join(image_dir, name))
+        if img is not None:
+            hw_list.append(img.shape[:2])
+    return hw_list
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image_dir", required=True, type=str, help="Dir of cropped text images, e.g. crop_save_dir.")
+    parser.add_argument("--batch_num", required=False, default=8, type=int)
+    parser.add_argument("--target_height", required=False, default=48, type=int)
+    parser.add_argument("--min_width", required=False, default=320, type=int)
+    args = parser.parse_args()
+
+    hw_list = read_hw_list(args.image_dir)
+    order = np.argsort([w / float(h) for h, w in hw_list], kind="stable")
+    for name, hws in (("input order", hw_list), ("sorted by aspect ratio", [hw_list[i] for i in order])):
+        valid, padded = batch_padded_pixels(hws, args.batch_num, args.target_height, args.min_width)
+        print(f"{name}: {padded} padded pixels, {padded / max(valid + padded, 1):.2%} of the rec input")
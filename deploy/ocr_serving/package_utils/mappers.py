@@ -75,3 +75,8 @@ SERVABLE_CONFIGS_MAPPER = {
     "visionlan_resnet45_LF_1.yaml": "rec_common_servable_config",
     "visionlan_resnet45_LF_2.yaml": "rec_common_servable_config",
 }
+
+# models exported with a fixed batch size regardless of the batch size to package
+FIXED_BATCH_SIZE_MAPPER = {
+    "abinet_resnet45_en.yaml": 96,
+}
@@ -12,7 +12,7 @@ from typing import Dict
 
 import requests
 import yaml
-from package_utils.mappers import EXPORT_NAME_MAPPER, SERVABLE_CONFIGS_MAPPER
+from package_utils.mappers import EXPORT_NAME_MAPPER, FIXED_BATCH_SIZE_MAPPER, SERVABLE_CONFIGS_MAPPER
 from package_utils.path_utils import get_base_path
 
 current_file_path = os.path.abspath(__file__)
@@ -34,7 +34,12 @@ class PackageException(Exception):
 
 class PackageHelper:
     def __init__(
-        self, package_name: str, mindir_file_path: str = None, test_mode: bool = True, ch_detection: bool = False
+        self,
+        package_name: str,
+        mindir_file_path: str = None,
+        test_mode: bool = True,
+        ch_detection: bool = False,
+        batch_size: int = 1,
     ):
         """
         Args:
@@ -42,6 +47,7 @@ class PackageHelper:
             mindir_file_path: custom mindir file path. default None
             test_mode: True if you need to do test
             ch_detection: weather chinese ocr detection
+            batch_size: batch size of the exported mindir file, requests are batched by the servable up to it
         """
         self.package_name = package_name
         self.custom_mindir_path = mindir_file_path
@@ -62,6 +68,7 @@ class PackageHelper:
         self.target_config_yaml = None
         self.test_mode = test_mode
         self.ch_detection = ch_detection
+        self.batch_size = batch_size
 
     def input_check(self):
         """
@@ -127,6 +134,7 @@ class PackageHelper:
                 else:
                     if not yaml_config["ckpt_link"]:
                         raise PackageException("No valid ckpt file to convert")
+                yaml_config["batch_size"] = FIXED_BATCH_SIZE_MAPPER.get(yaml_config["yaml_file_name"], self.batch_size)
                 with open(target_config_yaml_path, "w+", encoding="utf-8") as g:
                     yaml.dump(yaml_config, stream=g)
                 self.target_config_yaml = yaml_config
@@ -215,7 +223,8 @@ class PackageHelper:
             "python {export_tool_path} --model_name_or_config {model_name} "
             "--data_shape {data_shape} --local_ckpt_path {local_ckpt_path} "
             "--save_dir {save_dir} "
-            "--custom_exported_name {exported_name}"
+            "--custom_exported_name {exported_name} "
+            "--batch_size {batch_size}"
         ).format(
             export_tool_path=os.path.join(get_base_path(), "tools/export.py"),
             model_name=EXPORT_NAME_MAPPER[self.target_config_yaml["yaml_file_name"]],
@@ -223,6 +232,7 @@ class PackageHelper:
             local_ckpt_path=os.path.join(self.target_mindir_folder, "model.ckpt"),
             save_dir=self.target_mindir_folder,
             exported_name="model",
+            batch_size=self.target_config_yaml["batch_size"],
         )
         os.system(shell_command)
         os.remove(os.path.join(self.target_mindir_folder, "model.ckpt"))
@@ -271,6 +281,8 @@ class PackageHelper:
         target_folder = os.path.join(self.base_path, TARGET_SERVER_FOLDER, "mytest")
         shutil.copytree(my_test_folder_src, target_folder, dirs_exist_ok=True)
         shutil.copy(client_py_src, os.path.join(self.base_path, TARGET_SERVER_FOLDER))
+        benchmark_py_src = os.path.join(self.base_path, "deploy/ocr_serving/test/serving_benchmark.py")
+        shutil.copy(benchmark_py_src, os.path.join(self.base_path, TARGET_SERVER_FOLDER))
 
     def do_package(self):
         """
@@ -310,6 +322,14 @@ if __name__ == "__main__":
     parser.add_argument(
         "--ch_det", help="if you need to do chinese ocr detection, you should add this param.", action="store_true"
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help="batch size of the exported mindir file, the custom mindir file must have the same batch size.",
+    )
     args = parser.parse_args()
-    package_helper = PackageHelper(args.package_name, args.mindir_file_path, args.test_mode, args.ch_det)
+    package_helper = PackageHelper(
+        args.package_name, args.mindir_file_path, args.test_mode, args.ch_det, args.batch_size
+    )
     package_helper.do_package()
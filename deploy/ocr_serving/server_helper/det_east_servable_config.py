@@ -1,9 +1,7 @@
 import os
 import sys
 from os.path import dirname
-from typing import List
 
-import numpy as np
 from mindspore_serving.server import register
 
 from .model_process_helper import ModelProcessor
@@ -14,30 +12,31 @@ if mindocr_path not in sys.path:
     sys.path.append(mindocr_path)
 
 model_processor = ModelProcessor(os.path.join(dirname(current_file_path), "config.yaml"))
+# requests are batched by every stage, and requests in the same shape bucket share one model batch
+BATCH_SIZE = model_processor.batch_size
 
 
 # define preprocess and postprocess
-def preprocess(data_nparray: np.ndarray) -> tuple:
-    return model_processor.preprocess(data_nparray)
+def preprocess(instances):
+    yield from model_processor.preprocess_batch([instance[0] for instance in instances])
 
 
-def postprocess(scores, geo) -> List[np.ndarray]:
-    return model_processor.postprocess_method(tuple((scores, geo)))["polys"]
+def postprocess(instances):
+    yield from model_processor.postprocess_batch(instances, "polys", pack=tuple)
 
 
 # register model
-model = register.declare_model(model_file="model.mindir", model_format="MindIR", with_batch_dim=False)
+model = register.declare_model(model_file="model.mindir", model_format="MindIR", with_batch_dim=True)
 
 
-def model_infer(net_inputs) -> tuple:
-    scores, geo = model.call(net_inputs)
-    return scores, geo
+def model_infer(instances):
+    yield from model_processor.infer_batch(model, [instance[0] for instance in instances])
 
 
 # register url
 @register.register_method(output_names=["polys"])
 def infer(image):
-    net_inputs = register.add_stage(preprocess, image, outputs_count=1)
-    scores, geo = register.add_stage(model_infer, net_inputs, outputs_count=2)
-    polys = register.add_stage(postprocess, scores, geo, outputs_count=1)
+    net_inputs = register.add_stage(preprocess, image, outputs_count=1, batch_size=BATCH_SIZE)
+    scores, geo = register.add_stage(model_infer, net_inputs, outputs_count=2, batch_size=BATCH_SIZE)
+    polys = register.add_stage(postprocess, scores, geo, outputs_count=1, batch_size=BATCH_SIZE)
     return polys
@@ -1,10 +1,13 @@
 import os
 import sys
+from collections import defaultdict
+from functools import cached_property
 from io import BytesIO
 from os.path import dirname
-from typing import Tuple
+from typing import Callable, Dict, List, Sequence, Tuple
 
 import numpy as np
+import yaml
 from PIL import Image
 
 from deploy.py_infer.src.data_process.postprocess.builder import build_postprocess
@@ -15,20 +18,118 @@ mindocr_path = dirname(dirname(dirname(dirname(dirname(current_file_path)))))
 if mindocr_path not in sys.path:
     sys.path.append(mindocr_path)
 
+# H and W of the inputs of dynamic shape models are padded to multiples of it, so that requests of similar size share
+# a shape bucket
+BUCKET_STRIDE = 32
+
+
+def group_by_shape(arrays: Sequence[np.ndarray]) -> Dict[Tuple, List[int]]:
+    """
+    group the indices of arrays by their shapes
+    """
+    groups = defaultdict(list)
+    for i, array in enumerate(arrays):
+        groups[array.shape].append(i)
+    return groups
+
 
 class ModelProcessor:
-    def __init__(self, related_yaml_path: str):
+    def __init__(self, related_yaml_path: str, bucket_stride: int = BUCKET_STRIDE):
         self.related_yaml_path = related_yaml_path
+        self.bucket_stride = bucket_stride
+        with open(related_yaml_path, "r", encoding="utf-8") as fp:
+            config = yaml.safe_load(fp)
+        # batch size of the exported model, set by package_helper.py
+        self.batch_size = int(config.get("batch_size", 1))
+        # H and W of the exported model, None if the model takes dynamic shapes
+        data_shape_nchw = [int(x) for x in config.get("data_shape_nchw") or []]
+        self.input_hw = tuple(data_shape_nchw[2:]) if len(data_shape_nchw) == 4 and min(data_shape_nchw) > 0 else None
 
-    @property
+    @cached_property
     def preprocess_method(self):
         return build_preprocess(self.related_yaml_path, False)
 
+    @cached_property
+    def postprocess_method(self):
+        return build_postprocess(self.related_yaml_path)
+
+    @staticmethod
+    def decode(data_nparray: np.ndarray) -> np.ndarray:
+        return np.array(Image.open(BytesIO(data_nparray.tobytes())))
+
     def preprocess(self, data_nparray: np.ndarray) -> Tuple:
-        image = Image.open(BytesIO(data_nparray.tobytes()))
-        result = self.preprocess_method([np.array(image)])
+        result = self.preprocess_method([self.decode(data_nparray)])
         return result["net_inputs"]
 
-    @property
-    def postprocess_method(self):
-        return build_postprocess(self.related_yaml_path)
+    def pad_to_bucket(self, image: np.ndarray) -> np.ndarray:
+        """
+        pad the bottom and right of a CHW image with zeros, so that H and W are multiples of bucket_stride
+        """
+        h, w = image.shape[-2:]
+        pad_h = -h % self.bucket_stride
+        pad_w = -w % self.bucket_stride
+        if not pad_h and not pad_w:
+            return image
+        return np.pad(image, ((0, 0), (0, pad_h), (0, pad_w)))
+
+    def pad_to_input_shape(self, image: np.ndarray) -> np.ndarray:
+        """
+        pad the bottom and right of a CHW image with zeros to the input shape of the static shape model
+        """
+        h, w = image.shape[-2:]
+        pad_h, pad_w = self.input_hw[0] - h, self.input_hw[1] - w
+        if pad_h < 0 or pad_w < 0:
+            raise ValueError(f"the preprocessed image of shape {image.shape} exceeds the model input {self.input_hw}")
+        if not pad_h and not pad_w:
+            return image
+        return np.pad(image, ((0, 0), (0, pad_h), (0, pad_w)))
+
+    def preprocess_batch(self, data_nparray_list: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        preprocess the images of several requests, return the net input image(CHW) of each request padded to the
+        input shape of a static shape model, or to its shape bucket for a dynamic shape model
+        """
+        images = [self.preprocess_method([self.decode(x)])["net_inputs"][0][0] for x in data_nparray_list]
+        if self.input_hw:
+            return [self.pad_to_input_shape(image) for image in images]
+        return [self.pad_to_bucket(image) for image in images]
+
+    @staticmethod
+    def infer_batch(model, images: List[np.ndarray]) -> List[Tuple]:
+        """
+        infer the images of several requests, images in the same shape bucket are sent to the model as one batch
+
+        Args:
+            model: mindspore_serving model declared with batch dim
+            images: net input image(CHW) of each request
+        Returns:
+            outputs(a tuple) of each request, in the same order as images
+        """
+        outputs = [None] * len(images)
+        for indices in group_by_shape(images).values():
+            for i, output in zip(indices, model.call([(images[i],) for i in indices])):
+                outputs[i] = output
+        return outputs
+
+    def postprocess_batch(
+        self, outputs: List[Tuple], result_name: str, pack: Callable = None
+    ) -> List[List[np.ndarray]]:
+        """
+        postprocess the model outputs of several requests, outputs of the same shape are stacked and postprocessed
+        at once
+
+        Args:
+            outputs: model outputs(a tuple) of each request, without batch dim
+            result_name: name of the result in the returns of postprocess method, such as "polys"
+            pack: pack the stacked outputs as the input of postprocess method, the only output is used by default
+        Returns:
+            result of each request as a list of length 1, the same as postprocessing a single request
+        """
+        pack = pack or (lambda preds: preds[0])
+        results = [None] * len(outputs)
+        for indices in group_by_shape([output[0] for output in outputs]).values():
+            preds = [np.stack([outputs[i][j] for i in indices]) for j in range(len(outputs[indices[0]]))]
+            batch_result = self.postprocess_method(pack(preds))[result_name]
+            for i, result in zip(indices, batch_result):
+                results[i] = [result]
+        return results
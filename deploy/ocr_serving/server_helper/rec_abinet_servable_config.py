@@ -1,9 +1,7 @@
 import os
 import sys
 from os.path import dirname
-from typing import List, Tuple
 
-import numpy as np
 from mindspore_serving.server import register
 
 from .model_process_helper import ModelProcessor
@@ -14,30 +12,31 @@ if mindocr_path not in sys.path:
     sys.path.append(mindocr_path)
 
 model_processor = ModelProcessor(os.path.join(dirname(current_file_path), "config.yaml"))
+# requests are batched by every stage, and requests in the same shape bucket share one model batch
+BATCH_SIZE = model_processor.batch_size
 
 
 # define preprocess and postprocess
-def preprocess(data_nparray: np.ndarray) -> tuple:
-    return model_processor.preprocess(data_nparray)
+def preprocess(instances):
+    yield from model_processor.preprocess_batch([instance[0] for instance in instances])
 
 
-def postprocess(all_a_res, all_l_res, v_res) -> List[np.ndarray]:
-    return model_processor.postprocess_method([all_a_res, all_l_res, v_res])["texts"]
+def postprocess(instances):
+    yield from model_processor.postprocess_batch(instances, "texts", pack=list)
 
 
 # register model
-model = register.declare_model(model_file="model.mindir", model_format="MindIR", with_batch_dim=False)
+model = register.declare_model(model_file="model.mindir", model_format="MindIR", with_batch_dim=True)
 
 
-def model_infer(net_inputs) -> Tuple:
-    all_a_res, all_l_res, v_res = model.call(net_inputs)
-    return all_a_res, all_l_res, v_res
+def model_infer(instances):
+    yield from model_processor.infer_batch(model, [instance[0] for instance in instances])
 
 
 # register url
 @register.register_method(output_names=["texts"])
 def infer(image):
-    net_inputs = register.add_stage(preprocess, image, outputs_count=1)
-    all_a_res, all_l_res, v_res = register.add_stage(model_infer, net_inputs, outputs_count=3)
-    texts = register.add_stage(postprocess, all_a_res, all_l_res, v_res, outputs_count=1)
+    net_inputs = register.add_stage(preprocess, image, outputs_count=1, batch_size=BATCH_SIZE)
+    all_a_res, all_l_res, v_res = register.add_stage(model_infer, net_inputs, outputs_count=3, batch_size=BATCH_SIZE)
+    texts = register.add_stage(postprocess, all_a_res, all_l_res, v_res, outputs_count=1, batch_size=BATCH_SIZE)
     return texts
@@ -1,9 +1,7 @@
 import os
 import sys
 from os.path import dirname
-from typing import List
 
-import numpy as np
 from mindspore_serving.server import register
 
 from .model_process_helper import ModelProcessor
@@ -14,29 +12,32 @@ if mindocr_path not in sys.path:
     sys.path.append(mindocr_path)
 
 model_processor = ModelProcessor(os.path.join(dirname(current_file_path), "config.yaml"))
+# requests are batched by every stage, and requests in the same shape bucket share one model batch
+BATCH_SIZE = model_processor.batch_size
 
 
 # define preprocess and postprocess
-def preprocess(data_nparray: np.ndarray) -> tuple:
-    return model_processor.preprocess(data_nparray)
+def preprocess(instances):
+    yield from model_processor.preprocess_batch([instance[0] for instance in instances])
 
 
-def postprocess(pred: np.ndarray) -> List[np.ndarray]:
-    return model_processor.postprocess_method(pred)["texts"]
+def postprocess(instances):
+    yield from model_processor.postprocess_batch(instances, "texts")
 
 
 # register model
-model = register.declare_model(model_file="model.mindir", model_format="MindIR", with_batch_dim=False)
+model = register.declare_model(model_file="model.mindir", model_format="MindIR", with_batch_dim=True)
 
 
-def model_infer(net_inputs) -> np.ndarray:
-    return model.call(net_inputs)
+def model_infer(instances):
+    for outputs in model_processor.infer_batch(model, [instance[0] for instance in instances]):
+        yield outputs[0]
 
 
 # register url
 @register.register_method(output_names=["texts"])
 def infer(image):
-    net_inputs = register.add_stage(preprocess, image, outputs_count=1)
-    output = register.add_stage(model_infer, net_inputs, outputs_count=1)
-    texts = register.add_stage(postprocess, output, outputs_count=1)
+    net_inputs = register.add_stage(preprocess, image, outputs_count=1, batch_size=BATCH_SIZE)
+    output = register.add_stage(model_infer, net_inputs, outputs_count=1, batch_size=BATCH_SIZE)
+    texts = register.add_stage(postprocess, output, outputs_count=1, batch_size=BATCH_SIZE)
     return texts
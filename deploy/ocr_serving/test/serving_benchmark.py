@@ -0,0 +1,182 @@
+"""Benchmark a servable by sweeping the number of concurrent clients"""
+import argparse
+import base64
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from serving_client import read_images
+
+
+def build_request_body(images_buffer, instances_per_request, offset):
+    instances = []
+    for i in range(instances_per_request):
+        image = images_buffer[(offset + i) % len(images_buffer)]
+        instances.append({"image": {"b64": base64.b64encode(image).decode()}})
+    return json.dumps({"instances": instances})
+
+
+def run_client(url, images_buffer, instances_per_request, request_num, client_id, latencies, errors):
+    for i in range(request_num):
+        body = build_request_body(images_buffer, instances_per_request, client_id + i)
+        request = urllib.request.Request(url, data=body.encode(), headers={"Content-Type": "application/json"})
+        start = time.time()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                failed = "error_msg" in json.loads(response.read())
+        except (urllib.error.URLError, ValueError):
+            failed = True
+        if failed:
+            errors.append(client_id)
+        else:
+            latencies.append(time.time() - start)
+
+
+def run_benchmark(url, images_buffer, concurrency, instances_per_request, request_num):
+    """
+    start `concurrency` clients, each sends `request_num` requests one after another, return the statistics
+    """
+    latencies, errors = [], []
+    clients = [
+        threading.Thread(
+            target=run_client,
+            args=(url, images_buffer, instances_per_request, request_num, client_id, latencies, errors),
+        )
+        for client_id in range(concurrency)
+    ]
+    start = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    cost = time.time() - start
+
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "req/s": len(latencies) / cost,
+        "img/s": len(latencies) * instances_per_request / cost,
+        "p50(ms)": float(np.percentile(latencies_ms, 50)),
+        "p99(ms)": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def print_report(model_name, results):
+    columns = ["concurrency", "requests", "errors", "req/s", "img/s", "p50(ms)", "p99(ms)"]
+    print(f"benchmark of {model_name}:")
+    print("".join(f"{name:>14}" for name in columns))
+    for result in results:
+        print(
+            "".join(
+                f"{result[name]:>14.2f}" if isinstance(result[name], float) else f"{result[name]:>14}"
+                for name in columns
+            )
+        )
+
+
+class StubServingServer:
+    """
+    A local stand-in of the RESTful server of mindspore serving for testing the client. Instances of concurrent
+    requests are batched up to `batch_size` like a servable with batch dim, and each batch costs
+    `batch_latency + instance_latency * batch size` seconds.
+    """
+
+    def __init__(self, address, batch_size=8, batch_latency=0.02, instance_latency=0.002, batch_timeout=0.002):
+        self.batch_size = batch_size
+        self.batch_latency = batch_latency
+        self.instance_latency = instance_latency
+        self.batch_timeout = batch_timeout
+        self.instances = queue.Queue()
+        self.stopped = False
+
+        host, port = address.split(":")
+        self.server = ThreadingHTTPServer((host, int(port)), self._build_handler())
+        self.server.daemon_threads = True
+        self.threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+            threading.Thread(target=self._run_batches, daemon=True),
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.server.shutdown()
+
+    def _build_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                events = [threading.Event() for _ in body["instances"]]
+                for event in events:
+                    stub.instances.put(event)
+                for event in events:
+                    event.wait()
+                content = json.dumps({"instances": [{"polys": []} for _ in events]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _run_batches(self):
+        while not self.stopped:
+            try:
+                batch = [self.instances.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time.time() + self.batch_timeout
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.instances.get(timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+            time.sleep(self.batch_latency + self.instance_latency * len(batch))
+            for event in batch:
+                event.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_name", help="for example: db_mobilenetv3_icdar15")
+    parser.add_argument("--restful_address", default="127.0.0.1:1501")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--request_num", type=int, default=20, help="number of requests sent by each client")
+    parser.add_argument("--instances_per_request", type=int, default=1)
+    parser.add_argument(
+        "--stub", action="store_true", help="benchmark a local stub server instead of a mindspore serving server"
+    )
+    parser.add_argument("--stub_batch_size", type=int, default=8)
+    args = parser.parse_args()
+
+    stub_server = None
+    if args.stub:
+        stub_server = StubServingServer(args.restful_address, batch_size=args.stub_batch_size)
+        stub_server.start()
+
+    images, _ = read_images()
+    restful_url = f"http://{args.restful_address}/model/{args.model_name}:infer"
+    benchmark_results = [
+        run_benchmark(restful_url, images, concurrency, args.instances_per_request, args.request_num)
+        for concurrency in args.concurrency
+    ]
+    print_report(args.model_name, benchmark_results)
+
+    if stub_server:
+        stub_server.stop()
@@ -7,13 +7,13 @@ mindocr_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..
 sys.path.insert(0, mindocr_path)
 
 from deploy.py_infer.src.infer import TaskType  # noqa
-from deploy.py_infer.src.infer_args import setup_logger, str2bool  # noqa
+from deploy.py_infer.src.infer_args import parse_warmup_shapes, setup_logger, str2bool  # noqa
 from deploy.py_infer.src.utils import get_config_by_name_for_model, save_path_init  # noqa
 
 
-def get_args():
+def get_args(argv=None):
     """
-    command line parameters for inference
+    command line parameters for inference, parsed from argv if given, otherwise from sys.argv
     """
     parser = argparse.ArgumentParser(description="Arguments for inference.")
 
@@ -22,11 +22,29 @@ def get_args():
         type=str.lower,
         default="lite",
         required=False,
-        choices=["lite"],
+        choices=["lite", "onnx"],
         help="Inference backend type.",
     )
-    parser.add_argument("--device", type=str, default="Ascend", required=False, choices=["Ascend"], help="Device type.")
+    parser.add_argument(
+        "--device", type=str, default="Ascend", required=False, choices=["Ascend", "CPU"], help="Device type."
+    )
     parser.add_argument("--device_id", type=int, default=0, required=False, help="Device id.")
+    parser.add_argument(
+        "--executor",
+        type=str,
+        default="multiprocess",
+        choices=["multiprocess", "inproc"],
+        required=False,
+        help="Executor of pipeline. multiprocess runs every stage in separate processes for throughput, inproc runs "
+        "all stages on a thread pool in one process for low latency of small requests.",
+    )
+    parser.add_argument(
+        "--inproc_threads",
+        type=int,
+        default=4,
+        required=False,
+        help="Number of threads of the inproc executor.",
+    )
     parser.add_argument(
         "--parallel_num",
         type=int,
@@ -34,6 +52,53 @@ def get_args():
         required=False,
         help="Number of parallel in each stage of pipeline parallelism.",
     )
+    parser.add_argument(
+        "--core_budget",
+        type=int,
+        default=0,
+        required=False,
+        help="Max total number of node instances, except HandoutNode and CollectNode. Used as the limit of "
+        "active instances when rebalancing at runtime.",
+    )
+    parser.add_argument(
+        "--rebalance_interval",
+        type=float,
+        default=0,
+        required=False,
+        help="Interval(seconds) to move node instances from idle stages to the busiest stage at runtime, each stage "
+        "keeps a standby instance for it. Disabled if 0.",
+    )
+    parser.add_argument(
+        "--intra_op_threads",
+        type=int,
+        default=0,
+        required=False,
+        help="Number of threads used within each operator on CPU device, 0 means the default of the backend.",
+    )
+    parser.add_argument(
+        "--inter_op_threads",
+        type=int,
+        default=0,
+        required=False,
+        help="Number of threads used to run independent operators in parallel on CPU device, "
+        "0 means the default of the backend.",
+    )
+    parser.add_argument(
+        "--gear_calibration",
+        type=str2bool,
+        default=False,
+        required=False,
+        help="Whether measure the latency of every shape gear of models at init, if there is no gear latency table "
+        "saved alongside the model. The table is saved for later runs, and used to choose the gears with least cost.",
+    )
+    parser.add_argument(
+        "--warmup_shapes",
+        type=parse_warmup_shapes,
+        default=None,
+        required=False,
+        help="Representative image sizes(HxW) to warm up for dynamic shape models, e.g. "
+        "'det:736x1280,960x960;rec:48x320'. Models with shape gears are warmed up on all gears.",
+    )
     parser.add_argument(
         "--precision_mode", type=str, default=None, choices=["fp16", "fp32"], required=False, help="Precision mode."
     )
@@ -72,6 +137,14 @@ def get_args():
     parser.add_argument(
         "--rec_batch_num", type=int, default=6, required=False, help="Batch size for recognition model."
     )
+    parser.add_argument(
+        "--rec_batch_max_wait",
+        type=float,
+        default=0,
+        required=False,
+        help="Max time(seconds) to wait for gathering sub images from several images into one batch for the "
+        "recognition model in det+rec pipeline. Sub images of each image are batched separately if 0.",
+    )
     parser.add_argument(
         "--character_dict_path", type=str, required=False, help="Character dict file path for recognition models."
     )
@@ -114,7 +187,7 @@ def get_args():
     )
     parser.add_argument("--save_log_dir", type=str, required=False, help="Log saving dir.")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     setup_logger(args)
     args = update_task_info(args)
     check_and_update_args(args)
@@ -223,11 +296,28 @@ def check_and_update_args(args):
         "rec_batch_num": args.rec_batch_num,
         "cls_batch_num": args.cls_batch_num,
         "layout_batch_num": args.layout_batch_num,
+        "inproc_threads": args.inproc_threads,
     }
     for name, value in need_check_positive.items():
         if value < 1:
             raise ValueError(f"{name} must be positive, but got {value}.")
 
+    if args.backend == "onnx" and args.device != "CPU":
+        raise ValueError(f"onnx backend only supports CPU device, but got {args.device}.")
+
+    need_check_not_negative = {
+        "intra_op_threads": args.intra_op_threads,
+        "inter_op_threads": args.inter_op_threads,
+        "core_budget": args.core_budget,
+        "rebalance_interval": args.rebalance_interval,
+    }
+    for name, value in need_check_not_negative.items():
+        if value < 0:
+            raise ValueError(f"{name} must not be negative, but got {value}.")
+
+    if args.rec_batch_max_wait < 0:
+        raise ValueError(f"rec_batch_max_wait must not be negative, but got {args.rec_batch_max_wait}.")
+
     need_check_dir_not_same = {
         "crop_save_dir": args.crop_save_dir,
         "vis_pipeline_save_dir": args.vis_pipeline_save_dir,
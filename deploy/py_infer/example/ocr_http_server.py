@@ -0,0 +1,113 @@
+"""
+Asyncio HTTP server running several pipelines side by side.
+
+Example:
+    # pipelines with models, see server_config.yaml
+    $ python deploy/py_infer/example/ocr_http_server.py --config=deploy/py_infer/example/server_config.yaml
+    # local test with stub pipelines, no model is needed
+    $ python deploy/py_infer/example/ocr_http_server.py --stub_pipelines=ocr,layout
+    $ curl --data-binary @deploy/py_infer/example/dataset/det/example1.png http://127.0.0.1:8000/v1/pipelines/ocr/infer
+    $ curl http://127.0.0.1:8000/ready
+    $ curl http://127.0.0.1:8000/metrics
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import yaml
+
+mindocr_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../"))
+sys.path.insert(0, mindocr_path)
+
+from deploy.py_infer.src.serving import OCRHttpServer, PipelineService, ServingMetrics, StubPipeline  # noqa
+from deploy.py_infer.src.utils import log  # noqa
+
+
+def str2bool(v):
+    return v.lower() in ("true", "t", "1")
+
+
+def get_server_args():
+    parser = argparse.ArgumentParser(description="Arguments for OCR http server.")
+    parser.add_argument("--config", type=str, required=False, help="Yaml file of pipelines, see server_config.yaml.")
+    parser.add_argument(
+        "--stub_pipelines",
+        type=str,
+        required=False,
+        help="Comma-separated names of stub pipelines without models, for testing the server locally.",
+    )
+    parser.add_argument("--stub_latency", type=float, default=0.01, required=False, help="Latency of stub pipelines.")
+    parser.add_argument(
+        "--stub_startup_latency",
+        type=float,
+        default=0.0,
+        required=False,
+        help="Seconds for stub pipelines to start, like loading and warming up models.",
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", required=False, help="Host to listen on.")
+    parser.add_argument("--port", type=int, default=8000, required=False, help="Port to listen on.")
+    parser.add_argument(
+        "--max_queue_depth",
+        type=int,
+        default=64,
+        required=False,
+        help="Max number of pending requests of each pipeline, more requests are rejected with 429.",
+    )
+    parser.add_argument(
+        "--request_timeout",
+        type=float,
+        default=30.0,
+        required=False,
+        help="Seconds to wait for the result of a request, 504 is returned after that.",
+    )
+    parser.add_argument("--show_log", type=str2bool, default=False, required=False, help="Whether show log.")
+    args = parser.parse_args()
+
+    if not args.config and not args.stub_pipelines:
+        raise ValueError("config or stub_pipelines must be set.")
+    if args.max_queue_depth < 1:
+        raise ValueError(f"max_queue_depth must be positive, but got {args.max_queue_depth}.")
+    if args.request_timeout <= 0:
+        raise ValueError(f"request_timeout must be positive, but got {args.request_timeout}.")
+    return args
+
+
+def build_pipeline(pipeline_args: dict):
+    from infer_args import get_args
+
+    from deploy.py_infer.src.parallel import InprocPipeline, ParallelPipeline
+
+    args = get_args([f"--{name}={value}" for name, value in pipeline_args.items()])
+    # results are sent back by task, and the finished tasks are released
+    args.serving_mode = True
+    # the results of an array are keyed by its index in the request, instead of the path it is saved to
+    args.input_array_save_dir = None
+    return InprocPipeline(args) if args.executor == "inproc" else ParallelPipeline(args)
+
+
+def main():
+    server_args = get_server_args()
+    log.init_logger(server_args.show_log)
+
+    metrics = ServingMetrics()
+    services = {}
+    if server_args.config:
+        with open(server_args.config, "r") as fp:
+            pipelines_args = yaml.safe_load(fp)["pipelines"]
+        for name, pipeline_args in pipelines_args.items():
+            services[name] = PipelineService(name, build_pipeline(pipeline_args), metrics, server_args.max_queue_depth)
+    if server_args.stub_pipelines:
+        for name in server_args.stub_pipelines.split(","):
+            pipeline = StubPipeline(latency=server_args.stub_latency, startup_latency=server_args.stub_startup_latency)
+            services[name] = PipelineService(name, pipeline, metrics, server_args.max_queue_depth)
+
+    server = OCRHttpServer(services, metrics, request_timeout=server_args.request_timeout)
+    try:
+        asyncio.run(server.serve_forever(server_args.host, server_args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
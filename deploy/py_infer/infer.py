@@ -5,12 +5,18 @@ __dir__ = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, __dir__)  # src path
 
 from src import infer_args  # noqa
-from src.parallel import ParallelPipeline  # noqa
+from src.parallel import InprocPipeline, ParallelPipeline, calibrate_topology  # noqa
 
 
 def main():
     args = infer_args.get_args()
-    parallel_pipeline = ParallelPipeline(args)
+    # results are only written to the result sink, so that they are released once written
+    args.return_results = False
+    if args.executor == "inproc":
+        parallel_pipeline = InprocPipeline(args)
+    else:
+        topology = calibrate_topology(args) if args.core_budget > 0 else None
+        parallel_pipeline = ParallelPipeline(args, topology)
     parallel_pipeline.start_pipeline()
     parallel_pipeline.infer_for_images(args.input_images_dir, task_id=0)
     parallel_pipeline.stop_pipeline()
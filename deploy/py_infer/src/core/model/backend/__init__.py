@@ -1,3 +1,4 @@
 from .lite_model import LiteModel
+from .onnx_model import OnnxModel
 
-__all__ = ["LiteModel"]
+__all__ = ["LiteModel", "OnnxModel"]
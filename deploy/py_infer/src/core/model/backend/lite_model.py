@@ -7,12 +7,15 @@ from .model_base import ModelBase
 
 
 class LiteModel(ModelBase):
-    def __init__(self, model_path, device, device_id):
+    def __init__(self, model_path, device, device_id, intra_op_threads=0, inter_op_threads=0):
         from mindspore_lite.version import __version__
 
         if __version__ < "2.0":
             raise ValueError(f"Only support mindspore lite >= 2.0, but got version {__version__}.")
 
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
         super().__init__(model_path, device, device_id)
 
     def _init_model(self):
@@ -26,6 +29,11 @@ class LiteModel(ModelBase):
             context.ascend.device_id = self.device_id
         elif self.device.lower() == "gpu":
             context.gpu.device_id = self.device_id
+        elif self.device.lower() == "cpu":
+            if self.intra_op_threads > 0:
+                context.cpu.thread_num = self.intra_op_threads
+            if self.inter_op_threads > 0:
+                context.cpu.inter_op_parallel_num = self.inter_op_threads
         else:
             pass
 
@@ -0,0 +1,103 @@
+from typing import List
+
+import numpy as np
+
+from .model_base import ModelBase
+
+
+class OnnxModel(ModelBase):
+    """
+    ONNX model inference with onnxruntime on CPU.
+
+    Symbolic or unknown dims of the model inputs are reported as -1, i.e. dynamic shape.
+    Outputs whose shape is known from the input shapes are written by onnxruntime into numpy arrays bound through
+    IO binding, the others are allocated by onnxruntime and returned as numpy views of them, without any copy.
+    """
+
+    def __init__(self, model_path, device, device_id, intra_op_threads=0, inter_op_threads=0):
+        if device.lower() != "cpu":
+            raise ValueError(f"Only support CPU device for onnx backend, but got {device}.")
+
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+        super().__init__(model_path, device, device_id)
+
+    def _init_model(self):
+        global ort
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 means using the default number of threads of onnxruntime
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        if self.inter_op_threads > 1:
+            # inter-op threads only take effect in parallel execution mode
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        self.model = ort.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.io_binding = self.model.io_binding()
+
+        inputs = self.model.get_inputs()
+        outputs = self.model.get_outputs()
+        self._input_names = [x.name for x in inputs]
+        self._output_names = [x.name for x in outputs]
+        # symbolic dims of the inputs, to resolve the same symbols of the output shapes from the input shapes
+        self._input_symbols = [[x if isinstance(x, str) else None for x in input.shape] for input in inputs]
+        self._output_shape = [[x if isinstance(x, (int, str)) else None for x in output.shape] for output in outputs]
+        self._output_dtype = [self.__dtype_to_nptype(x.type) for x in outputs]
+        self._input_num = len(inputs)
+        self._input_shape = [[x if isinstance(x, int) and x > 0 else -1 for x in input.shape] for input in inputs]
+        self._input_dtype = [self.__dtype_to_nptype(x.type) for x in inputs]
+
+    def infer(self, inputs: List[np.ndarray]) -> List[np.ndarray]:
+        self.io_binding.clear_binding_inputs()
+        self.io_binding.clear_binding_outputs()
+
+        symbol_values = {}
+        for name, symbols, input in zip(self._input_names, self._input_symbols, inputs):
+            input = np.ascontiguousarray(input)
+            self.io_binding.bind_cpu_input(name, input)
+            symbol_values.update({symbol: dim for symbol, dim in zip(symbols, input.shape) if symbol})
+
+        outputs = []
+        for name, output_shape, dtype in zip(self._output_names, self._output_shape, self._output_dtype):
+            shape = [symbol_values.get(x, -1) if isinstance(x, str) else x for x in output_shape]
+            if all(isinstance(x, int) and x >= 0 for x in shape):
+                # a new array per run, as the outputs of the last run may still be used by the caller
+                output = np.empty(shape, dtype=dtype)
+                self.io_binding.bind_output(name, "cpu", 0, dtype, shape, output.ctypes.data)
+            else:
+                output = None
+                self.io_binding.bind_output(name, "cpu")
+            outputs.append(output)
+
+        self.model.run_with_iobinding(self.io_binding)
+
+        if any(output is None for output in outputs):
+            ort_outputs = self.io_binding.get_outputs()
+            outputs = [
+                ort_output.numpy() if output is None else output for output, ort_output in zip(outputs, ort_outputs)
+            ]
+        return outputs
+
+    def get_gear(self):
+        # ONNX model does not have shape gear, dynamic dims accept any value.
+        return []
+
+    def __dtype_to_nptype(self, type_):
+        return {
+            "tensor(bool)": np.bool_,
+            "tensor(int8)": np.int8,
+            "tensor(int16)": np.int16,
+            "tensor(int32)": np.int32,
+            "tensor(int64)": np.int64,
+            "tensor(uint8)": np.uint8,
+            "tensor(uint16)": np.uint16,
+            "tensor(uint32)": np.uint32,
+            "tensor(uint64)": np.uint64,
+            "tensor(float16)": np.float16,
+            "tensor(float)": np.float32,
+            "tensor(double)": np.float64,
+        }[type_]
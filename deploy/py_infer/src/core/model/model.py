@@ -1,13 +1,15 @@
-from typing import List, Tuple
+import itertools
+import time
+from typing import Dict, List, Sequence, Tuple
 
 import numpy as np
 
-from .backend import LiteModel
+from .backend import LiteModel, OnnxModel
 from .shape import ShapeType
 
 __all__ = ["Model"]
 
-_INFER_BACKEND_MAP = {"lite": LiteModel}
+_INFER_BACKEND_MAP = {"lite": LiteModel, "onnx": OnnxModel}
 
 
 class Model:
@@ -17,6 +19,10 @@ class Model:
     def infer(self, input: List[np.ndarray]) -> List[np.ndarray]:
         return self.model.infer(input)
 
+    @property
+    def model_path(self) -> str:
+        return self.model.model_path
+
     @property
     def input_num(self) -> int:
         return self.model.input_num
@@ -90,24 +96,57 @@ class Model:
         hw_list.sort(key=lambda x: x[0] * x[1])
         return ShapeType.DYNAMIC_IMAGESIZE, [(batchsize, channel, tuple(hw_list))]
 
-    def warmup(self):
+    def get_warmup_shapes(
+        self, batch_sizes: Sequence[int] = (), image_sizes: Sequence[Tuple[int, int]] = ()
+    ) -> List[List[Tuple[int]]]:
+        """
+        Input shapes of every gear of the model, each item is the shapes of all inputs for one inference.
+        For a dynamic shape model, the dynamic batch size and image size(h, w) of NCHW input are filled by the
+        representative batch_sizes and image_sizes, and the other dynamic dims are filled by 64.
+        """
         scale_divisor = 64
         shape_type, shape_value = self.get_shape_details()
 
-        if shape_type in (ShapeType.STATIC_SHAPE, ShapeType.DYNAMIC_SHAPE):
-            warmup_shape = shape_value
-            warmup_shape = [tuple(scale_divisor if x == -1 else x for x in shape) for shape in warmup_shape]
-        elif shape_type == ShapeType.DYNAMIC_BATCHSIZE:
+        if shape_type == ShapeType.STATIC_SHAPE:
+            return [[tuple(shape) for shape in shape_value]]
+
+        if shape_type == ShapeType.DYNAMIC_BATCHSIZE:
             batchsize_list, *other_shape = shape_value[0]
-            batchsize = batchsize_list[0]
-            warmup_shape = [(batchsize, *other_shape)]  # Only single input
-        else:  # ShapeType.DYNAMIC_IMAGESIZE
-            *other_shape, hw_list = shape_value[0]
-            height, width = hw_list[0]
-            warmup_shape = [(*other_shape, height, width)]  # Only single input
+            return [[(batchsize, *other_shape)] for batchsize in batchsize_list]  # Only single input
 
-        dummy_tensor = [np.random.randn(*shape).astype(dtype) for shape, dtype in zip(warmup_shape, self.input_dtype)]
-        self.model.infer(dummy_tensor)
+        if shape_type == ShapeType.DYNAMIC_IMAGESIZE:
+            *other_shape, hw_list = shape_value[0]
+            return [[(*other_shape, height, width)] for height, width in hw_list]  # Only single input
+
+        # ShapeType.DYNAMIC_SHAPE
+        default_shapes = [tuple(scale_divisor if x == -1 else x for x in shape) for shape in shape_value]
+        if self.input_num != 1 or len(shape_value[0]) != 4:
+            return [default_shapes]
+
+        batchsize, channel, height, width = shape_value[0]
+        batchsize_list = list(batch_sizes) if batchsize == -1 and batch_sizes else [default_shapes[0][0]]
+        hw_list = list(image_sizes) if (height == -1 or width == -1) and image_sizes else [default_shapes[0][2:]]
+        shapes = []
+        for n, (h, w) in itertools.product(batchsize_list, hw_list):
+            shapes.append([(n, channel, h if height == -1 else height, w if width == -1 else width)])
+        return shapes
+
+    def warmup(
+        self, batch_sizes: Sequence[int] = (), image_sizes: Sequence[Tuple[int, int]] = ()
+    ) -> Dict[Tuple[int], float]:
+        """
+        Run a dummy inference on every gear returned by get_warmup_shapes, so that no real request pays the
+        initialization of a gear. Return the cost(ms) of each gear, keyed by the shape of input[0].
+        """
+        warmup_cost = {}
+        for warmup_shape in self.get_warmup_shapes(batch_sizes, image_sizes):
+            dummy_tensor = [
+                np.random.randn(*shape).astype(dtype) for shape, dtype in zip(warmup_shape, self.input_dtype)
+            ]
+            start = time.perf_counter()
+            self.model.infer(dummy_tensor)
+            warmup_cost[warmup_shape[0]] = (time.perf_counter() - start) * 1000
+        return warmup_cost
 
     def __del__(self):
         if hasattr(self, "model") and self.model:
@@ -1,3 +1,3 @@
 from .postprocess import build_postprocess
 from .preprocess import build_preprocess
-from .utils import cv_utils, gear_utils
+from .utils import cv_utils, gear_utils, image_source, layout_utils
@@ -0,0 +1,148 @@
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from .gear_utils import get_matched_gear_bs
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+__all__ = ["GearPlanner"]
+
+
+class GearPlanner:
+    """
+    Choose the batch-size gears and the HxW gear of a model by the estimated compute cost.
+
+    The cost of a gear is its latency in the latency table measured by warmup calibration. Without the latency of
+    batch-size gears, batches are split as `get_matched_gear_bs` does, since the overhead of each model call is
+    unknown. An HxW gear missing from the table is estimated by its area h*w, i.e. padded pixels count as compute.
+
+    Args:
+        bs_list: sorted batch-size gears.
+        hw_list: sorted HxW gears, empty if the image size is not a gear.
+        latency_table: {"bs": {bs: latency}, "hw": {(h, w): latency}}, see `load_latency_table`.
+    """
+
+    def __init__(
+        self,
+        bs_list: Tuple[int],
+        hw_list: Tuple[Tuple[int]] = tuple(),
+        latency_table: Optional[Dict[str, Dict]] = None,
+    ):
+        self.bs_list = tuple(bs_list)
+        self.hw_list = tuple(tuple(hw) for hw in hw_list)
+        latency_table = latency_table or {}
+        bs_latency = latency_table.get("bs", {})
+        self.bs_cost = {bs: bs_latency[bs] for bs in self.bs_list} if set(self.bs_list) <= set(bs_latency) else None
+        self.hw_cost = {hw: latency_table.get("hw", {}).get(hw, hw[0] * hw[1]) for hw in self.hw_list}
+
+    @lru_cache(maxsize=1024)
+    def plan_batches(self, image_num: int) -> Tuple[int]:
+        """
+        Split image_num images into batch-size gears with the least total cost. Only the last batch may be padded.
+        Ties are broken by the number of batches, i.e. model calls.
+        """
+        if image_num <= 0:
+            return tuple()
+        if self.bs_cost is None:
+            return get_matched_gear_bs(image_num, self.bs_list)
+
+        # best[n] = (cost, batch count, first gear) for n images left
+        best = [(0, 0, 0)] * (image_num + 1)
+        for n in range(1, image_num + 1):
+            candidates = []
+            for bs in self.bs_list:
+                cost, count, _ = best[max(n - bs, 0)]
+                candidates.append((cost + self.bs_cost[bs], count + 1, bs))
+            best[n] = min(candidates)
+
+        batch_list = []
+        n = image_num
+        while n > 0:
+            bs = best[n][2]
+            batch_list.append(bs)
+            n -= bs
+        return tuple(batch_list)
+
+    @lru_cache(maxsize=1024)
+    def match_hw(self, image_hw: Tuple[int]) -> Tuple[int]:
+        """
+        Find the HxW gear with the least cost among the gears the image fits in with an aspect-ratio-preserving
+        resize without downscaling. If the image does not fit in any gear, take the gear with the least downscale.
+        """
+        if len(self.hw_list) == 1:
+            return self.hw_list[0]
+
+        origin_h, origin_w = image_hw[0], image_hw[1]
+
+        def _key(hw):
+            scale = min(hw[0] / max(origin_h, 1), hw[1] / max(origin_w, 1))
+            return -min(scale, 1.0), self.hw_cost[hw]
+
+        return min(self.hw_list, key=_key)
+
+    @staticmethod
+    @contextmanager
+    def calibration_lock():
+        """
+        Inter-process lock of gear calibration, so that the instances of a pipeline calibrate one at a time instead of
+        competing for the device, and the later ones load the table saved by the first. It does not lock if the lock
+        file cannot be opened or fcntl is not available.
+        """
+        lock_path = os.path.join(tempfile.gettempdir(), "mindocr_gear_calibration.lock")
+        try:
+            fp = open(lock_path, "a") if fcntl is not None else None
+        except OSError:
+            fp = None
+
+        if fp is None:
+            yield
+            return
+
+        with fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    @staticmethod
+    def get_latency_table_path(model_path: str) -> str:
+        """
+        Latency table saved alongside the model file, or inside the model dir.
+        """
+        if os.path.isdir(model_path):
+            return os.path.join(model_path, "gear_latency.json")
+        return os.path.splitext(model_path)[0] + "_gear_latency.json"
+
+    @staticmethod
+    def load_latency_table(path: str) -> Dict[str, Dict]:
+        """
+        Load latency table from json file like {"bs": {"1": 2.1, "8": 9.7}, "hw": {"48,320": 3.2}}.
+        """
+        with open(path, "r", encoding="utf-8") as fp:
+            content = json.load(fp)
+
+        return {
+            "bs": {int(k): float(v) for k, v in content.get("bs", {}).items()},
+            "hw": {tuple(int(x) for x in k.split(",")): float(v) for k, v in content.get("hw", {}).items()},
+        }
+
+    @staticmethod
+    def save_latency_table(path: str, latency_table: Dict[str, Dict]):
+        content = {
+            "bs": {str(k): v for k, v in latency_table.get("bs", {}).items()},
+            "hw": {",".join(map(str, k)): v for k, v in latency_table.get("hw", {}).items()},
+        }
+
+        # write to a temp file first, several processes may calibrate the same model at the same time
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(content, fp, indent=4)
+        os.replace(tmp_path, path)
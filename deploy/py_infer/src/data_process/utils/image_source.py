@@ -0,0 +1,202 @@
+"""
+Streaming sources of images for inference.
+
+A source is walked lazily and yields light-weight items, which are decoded into images later by the decode stage:
+    str: path of an image file, decoded by cv_utils.img_read.
+    TarMember: encoded bytes of an image in a tar shard, the shard is read sequentially by the source.
+    VideoSegment: a range of frames of a video, decoded by seeking to the start of the range.
+
+Readers of sources are keyed by the file extension in SOURCE_READERS, files of the other extensions are taken as
+image files.
+"""
+import os
+import tarfile
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+from ...utils import log
+from . import cv_utils
+
+__all__ = [
+    "TarMember",
+    "VideoSegment",
+    "SOURCE_ITEM_TYPES",
+    "SOURCE_READERS",
+    "iter_source",
+    "iter_images",
+    "item_name",
+    "count_images",
+    "batched",
+]
+
+TAR_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+# number of frames kept in each segment of a video, i.e. after frame skipping
+VIDEO_SEGMENT_FRAMES = 64
+
+
+@dataclass
+class TarMember:
+    # name of the member, prefixed by the path of the shard
+    name: str
+    data: bytes
+
+
+@dataclass
+class VideoSegment:
+    path: str
+    # frames in range(start, stop, step) are decoded
+    start: int
+    stop: int
+    step: int = 1
+
+    @property
+    def num_frames(self) -> int:
+        return len(range(self.start, self.stop, self.step))
+
+
+SOURCE_ITEM_TYPES = (str, TarMember, VideoSegment)
+
+
+def iter_tar_shard(path: str, frame_step: int = 1) -> Iterator[TarMember]:
+    """
+    Read the images of a tar shard sequentially, e.g. a shard of WebDataset, members of the other types such as
+    annotations are ignored. Compressed shards(.tar.gz) are read as a stream as well.
+    """
+    try:
+        with tarfile.open(path, "r|*") as shard:
+            for member in shard:
+                if not member.isfile() or not member.name.lower().endswith(TAR_IMAGE_EXTENSIONS):
+                    continue
+                yield TarMember(name=f"{path}/{member.name}", data=shard.extractfile(member).read())
+    except tarfile.TarError as error:
+        log.warning(f"the rest of tar shard {path} is unavailable and skipped: {error}")
+
+
+def iter_video_segments(path: str, frame_step: int = 1) -> Iterator[VideoSegment]:
+    """
+    Split a video into segments of VIDEO_SEGMENT_FRAMES frames taken every frame_step frames. The segments are
+    decoded independently, so that a long video is decoded by several decode workers.
+    """
+    capture = cv2.VideoCapture(path)
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) if capture.isOpened() else 0
+    capture.release()
+    if frame_count <= 0:
+        log.warning(f"video {path} is unavailable and skipped, since its frame count can not be got.")
+        return
+
+    span = VIDEO_SEGMENT_FRAMES * frame_step
+    for start in range(0, frame_count, span):
+        yield VideoSegment(path=path, start=start, stop=min(start + span, frame_count), step=frame_step)
+
+
+def iter_image_file(path: str, frame_step: int = 1) -> Iterator[str]:
+    yield path
+
+
+SOURCE_READERS = {
+    ".tar": iter_tar_shard,
+    ".tgz": iter_tar_shard,
+    ".tar.gz": iter_tar_shard,
+    ".mp4": iter_video_segments,
+    ".avi": iter_video_segments,
+    ".mkv": iter_video_segments,
+    ".mov": iter_video_segments,
+    ".flv": iter_video_segments,
+}
+
+
+def _iter_file(path: str, frame_step: int):
+    extension = ".tar.gz" if path.lower().endswith(".tar.gz") else os.path.splitext(path)[1].lower()
+    reader = SOURCE_READERS.get(extension, iter_image_file)
+    yield from reader(path, frame_step)
+
+
+def iter_source(path: str, frame_step: int = 1) -> Iterator:
+    """
+    Walk the files of path recursively in sorted order, and yield the items of each file. Listing of a big directory
+    is not waited for, and txt files(e.g. labels) are skipped.
+
+    Args:
+        path: an image, tar shard or video file, or a directory containing them.
+        frame_step: take one frame every frame_step frames of videos.
+    """
+    if not os.path.isdir(path):
+        yield from _iter_file(path, frame_step)
+        return
+
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith(".txt"):
+                yield from _iter_file(os.path.join(root, filename), frame_step)
+
+
+def iter_images(item) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    Decode an item of source to (name, image), raise ValueError if it can not be decoded.
+    """
+    if isinstance(item, str):
+        yield item, cv_utils.img_read(item)
+    elif isinstance(item, TarMember):
+        image = cv2.imdecode(np.frombuffer(item.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Error! Cannot load the image of {item.name}")
+        yield item.name, image
+    elif isinstance(item, VideoSegment):
+        yield from _iter_video_frames(item)
+    else:
+        raise ValueError(f"unknown source item: {type(item)}")
+
+
+def _iter_video_frames(segment: VideoSegment) -> Iterator[Tuple[str, np.ndarray]]:
+    capture = cv2.VideoCapture(segment.path)
+    if not capture.isOpened():
+        raise ValueError(f"Error! Cannot open the video {segment.path}")
+    try:
+        if segment.start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, segment.start)
+        stem = os.path.splitext(segment.path)[0]
+        for index in range(segment.start, segment.stop):
+            # skipped frames are grabbed only, without the conversion to image
+            if not capture.grab():
+                break
+            if (index - segment.start) % segment.step:
+                continue
+            ok, frame = capture.retrieve()
+            if ok:
+                yield f"{stem}_frame{index:08d}", frame
+    finally:
+        capture.release()
+
+
+def item_name(item) -> str:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, TarMember):
+        return item.name
+    if isinstance(item, VideoSegment):
+        return f"{item.path}[{item.start}:{item.stop}:{item.step}]"
+    raise ValueError(f"unknown source item: {type(item)}")
+
+
+def count_images(item) -> int:
+    """
+    Number of images of an item before decoding. It is an upper bound for a video segment, since the frame count of
+    a video is estimated from its header, and fewer frames may be decoded.
+    """
+    return item.num_frames if isinstance(item, VideoSegment) else 1
+
+
+def batched(items, batch_size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
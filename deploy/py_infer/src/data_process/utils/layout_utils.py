@@ -0,0 +1,104 @@
+"""
+Utils of the document pipeline, which runs det+rec on the regions of layout instead of the whole page.
+"""
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+# categories of PubLayNet
+LAYOUT_CATEGORIES = {1: "text", 2: "title", 3: "list", 4: "table", 5: "figure"}
+
+# regions of these categories are recognized by det+rec, the others are only located
+OCR_CATEGORIES = ("text", "title", "list", "table")
+
+# white padding around the crop of a region, for better detection of the text near the border
+REGION_PADDING = 10
+
+
+def build_regions(layout_results: List[Dict], score_thresh: float, iou_thresh: float = 0.8) -> List[Dict]:
+    """
+    Convert the layout results of a page to regions of {"type", "bbox": [x0, y0, x1, y1], "score"}. Regions below
+    score_thresh are dropped, and so are the regions overlapping a region of higher score by iou_thresh, e.g. a box
+    predicted as several categories.
+    """
+    regions = []
+    for result in sorted(layout_results, key=lambda x: x["score"], reverse=True):
+        if result["score"] < score_thresh:
+            continue
+        x, y, w, h = result["bbox"]
+        bbox = [x, y, x + w, y + h]
+        if any(_iou(bbox, region["bbox"]) > iou_thresh for region in regions):
+            continue
+        category = LAYOUT_CATEGORIES.get(result["category_id"], str(result["category_id"]))
+        regions.append({"type": category, "bbox": bbox, "score": result["score"]})
+    return regions
+
+
+def _iou(box1, box2) -> float:
+    inter_w = min(box1[2], box2[2]) - max(box1[0], box2[0])
+    inter_h = min(box1[3], box2[3]) - max(box1[1], box2[1])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
+    area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
+    return inter / (area1 + area2 - inter)
+
+
+def sort_regions(regions: List[Dict], page_width: int) -> List[Dict]:
+    """
+    Sort regions in reading order. A region wider than half of the page spans the columns and separates the page
+    into bands. In each band, the regions of the left column are read before the right column, top to bottom.
+    """
+    ordered, band = [], []
+
+    def flush_band():
+        left = [x for x in band if (x["bbox"][0] + x["bbox"][2]) / 2 < page_width / 2]
+        right = [x for x in band if (x["bbox"][0] + x["bbox"][2]) / 2 >= page_width / 2]
+        ordered.extend(sorted(left, key=lambda x: x["bbox"][1]) + sorted(right, key=lambda x: x["bbox"][1]))
+        band.clear()
+
+    for region in sorted(regions, key=lambda x: (x["bbox"][1], x["bbox"][0])):
+        if region["bbox"][2] - region["bbox"][0] > page_width / 2:
+            flush_band()
+            ordered.append(region)
+        else:
+            band.append(region)
+    flush_band()
+    return ordered
+
+
+def crop_region(image: np.ndarray, bbox: List[float], padding: int = REGION_PADDING) -> Tuple[np.ndarray, List[int]]:
+    """
+    Crop the region from the page with white padding, return the crop and the offset of the crop in the page.
+    """
+    img_h, img_w = image.shape[:2]
+    x0, y0 = max(int(bbox[0]), 0), max(int(bbox[1]), 0)
+    x1, y1 = min(int(np.ceil(bbox[2])), img_w), min(int(np.ceil(bbox[3])), img_h)
+    if x1 <= x0 or y1 <= y0:
+        return None, [x0, y0]
+    crop = cv2.copyMakeBorder(
+        image[y0:y1, x0:x1], padding, padding, padding, padding, cv2.BORDER_CONSTANT, value=(255, 255, 255)
+    )
+    return crop, [x0 - padding, y0 - padding]
+
+
+def sort_lines(texts: List[Dict]) -> List[Dict]:
+    """
+    Sort the text lines of a region top to bottom, and left to right for the lines of the same row, i.e. the lines
+    whose vertical center is within half the height of the first line of the row.
+    """
+    ordered, row = [], []
+    row_center, row_half_height = 0.0, 0.0
+    for text in sorted(texts, key=lambda x: min(p[1] for p in x["points"])):
+        ys = [p[1] for p in text["points"]]
+        center = (min(ys) + max(ys)) / 2
+        if row and abs(center - row_center) > row_half_height:
+            ordered.extend(sorted(row, key=lambda x: min(p[0] for p in x["points"])))
+            row = []
+        if not row:
+            row_center, row_half_height = center, (max(ys) - min(ys)) / 2
+        row.append(text)
+    ordered.extend(sorted(row, key=lambda x: min(p[0] for p in x["points"])))
+    return ordered
@@ -22,6 +22,7 @@ class TaskType(Enum):
     DET_REC = 3  # Detection And Detection Model
     DET_CLS_REC = 4  # Detection, Classification and Recognition Model
     LAYOUT = 5  # Layout Model
+    LAYOUT_DET_REC = 6  # Layout, Detection and Recognition Model, det+rec run on the regions of layout
 
 
 SUPPORTED_TASK_BASIC_MODULE = {
@@ -31,4 +32,5 @@ SUPPORTED_TASK_BASIC_MODULE = {
     TaskType.DET_REC: [TaskType.DET, TaskType.REC],
     TaskType.DET_CLS_REC: [TaskType.DET, TaskType.CLS, TaskType.REC],
     TaskType.LAYOUT: [TaskType.LAYOUT],
+    TaskType.LAYOUT_DET_REC: [TaskType.LAYOUT, TaskType.DET, TaskType.REC],
 }
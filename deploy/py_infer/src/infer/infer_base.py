@@ -1,11 +1,18 @@
 import argparse
 import gc
+import os
+import time
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from functools import lru_cache
-from typing import Tuple
+from typing import Dict, Tuple
+
+import numpy as np
 
 from ..core import Model
-from ..data_process import gear_utils
+from ..data_process.utils.gear_planner import GearPlanner
+from ..utils import log
 
 
 class InferBase(metaclass=ABCMeta):
@@ -23,6 +30,7 @@ class InferBase(metaclass=ABCMeta):
 
         self._bs_list: Tuple[int] = tuple()
         self._hw_list: Tuple[Tuple[int]] = tuple()
+        self.gear_planner: GearPlanner = None
 
     def init(self, *, preprocess=True, model=True, postprocess=True):
         if preprocess or model:
@@ -45,6 +53,10 @@ class InferBase(metaclass=ABCMeta):
             self._bs_list = tuple(sorted(self._bs_list))
             self._hw_list = tuple(sorted(self._hw_list, key=lambda x: x[0] * x[1]))
 
+            # only the preprocess plans gears
+            if preprocess:
+                self._init_gear_planner()
+
         if preprocess:
             self._init_preprocess()
 
@@ -55,13 +67,113 @@ class InferBase(metaclass=ABCMeta):
             self.free_model()
 
         if model:
-            if isinstance(self.model, dict):
-                for _model in self.model.values():
-                    _model.warmup()
-            elif isinstance(self.model, Model):
-                self.model.warmup()
-            else:
-                pass
+            self.warmup()
+
+    def warmup(self):
+        """
+        Warm up every gear of the models, so that no request pays the initialization of a gear. Distinct models,
+        e.g. rec models of different batch sizes, are warmed up in parallel. For a dynamic shape model, the gears
+        are the representative image sizes set by --warmup_shapes.
+        """
+        if isinstance(self.model, dict):
+            models = list({id(_model): _model for _model in self.model.values()}.values())
+        elif isinstance(self.model, Model):
+            models = [self.model]
+        else:
+            return
+
+        task_name_map = {
+            "TextDetector": "det",
+            "TextClassifier": "cls",
+            "TextRecognizer": "rec",
+            "LayoutPredictor": "layout",
+        }
+        image_sizes = (getattr(self.args, "warmup_shapes", None) or {}).get(task_name_map[self.__class__.__name__], ())
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=len(models)) as executor:
+            costs = list(executor.map(lambda _model: _model.warmup(self._bs_list, image_sizes), models))
+        for _model, cost in zip(models, costs):
+            cost_info = ", ".join(f"{shape}: {value:.2f}" for shape, value in cost.items())
+            log.info(f"Warmup cost(ms) of {_model.model_path}: {cost_info}")
+        log.info(
+            f"{self.__class__.__name__} is warmed up on {sum(len(cost) for cost in costs)} gears in "
+            f"{time.time() - start:.2f}s."
+        )
+
+    def _create_model(self, model_path: str) -> Model:
+        return Model(
+            backend=self.args.backend,
+            device=self.args.device,
+            model_path=model_path,
+            device_id=self.args.device_id,
+            intra_op_threads=getattr(self.args, "intra_op_threads", 0),
+            inter_op_threads=getattr(self.args, "inter_op_threads", 0),
+        )
+
+    def _init_gear_planner(self):
+        """
+        Load the gear latency table saved alongside the model, or measure it if gear_calibration is set.
+        Without the table, the cost of gears is estimated by their sizes.
+        """
+        model_path_map = {
+            "TextDetector": self.args.det_model_path,
+            "TextClassifier": self.args.cls_model_path,
+            "TextRecognizer": self.args.rec_model_path,
+            "LayoutPredictor": self.args.layout_model_path,
+        }
+        latency_table = None
+        if len(self._bs_list) > 1 or len(self._hw_list) > 1:
+            table_path = GearPlanner.get_latency_table_path(model_path_map[self.__class__.__name__])
+            calibration = getattr(self.args, "gear_calibration", False) and not os.path.isfile(table_path)
+            # every preprocess instance inits the planner, only the first one to get the lock measures the latency
+            with GearPlanner.calibration_lock() if calibration else nullcontext():
+                if os.path.isfile(table_path):
+                    latency_table = GearPlanner.load_latency_table(table_path)
+                elif calibration:
+                    latency_table = self._measure_gear_latency()
+                    try:
+                        GearPlanner.save_latency_table(table_path, latency_table)
+                        log.info(f"Gear latency table is saved to {table_path}.")
+                    except OSError as e:
+                        log.warning(f"Save gear latency table to {table_path} failed: {e}")
+
+        self.gear_planner = GearPlanner(self._bs_list, self._hw_list, latency_table)
+
+    def _measure_gear_latency(self, repeat: int = 5) -> Dict[str, Dict]:
+        """
+        Measure the latency(ms) of every batch-size gear and HxW gear with dummy inputs.
+        Only single input models of NCHW format are measured.
+        """
+        models = self.model if isinstance(self.model, dict) else {bs: self.model for bs in self._bs_list}
+        any_model = next(iter(models.values()))
+        if any_model.input_num != 1 or len(any_model.input_shape[0]) != 4:
+            return {}
+
+        _, channel, height, width = any_model.input_shape[0]
+        default_hw = self._hw_list[0] if self._hw_list else (height, width)
+        if -1 in default_hw:
+            return {}
+
+        def _latency(bs, hw):
+            model = models[bs] if bs in models else models[-1]
+            dummy_input = [np.zeros((bs, channel, *hw), dtype=any_model.input_dtype[0])]
+            model.infer(dummy_input)  # compile or load the shape first
+            costs = []
+            for _ in range(repeat):
+                start = time.time()
+                model.infer(dummy_input)
+                costs.append((time.time() - start) * 1000)
+            return float(np.median(costs))
+
+        latency_table = {"bs": {}, "hw": {}}
+        if len(self._bs_list) > 1:
+            latency_table["bs"] = {bs: _latency(bs, default_hw) for bs in self._bs_list}
+        if len(self._hw_list) > 1:
+            latency_table["hw"] = {hw: _latency(self._bs_list[0], hw) for hw in self._hw_list}
+
+        log.info(f"Gear latency(ms) of {self.__class__.__name__}: {latency_table}")
+        return latency_table
 
     @abstractmethod
     def _init_preprocess(self):
@@ -97,7 +209,7 @@ class InferBase(metaclass=ABCMeta):
 
     @lru_cache()
     def _get_batch_matched_hw(self, img_hw_list: Tuple[Tuple[int]]) -> Tuple[int]:
-        resized_hw_list = [gear_utils.get_matched_gear_hw(hw, self._hw_list) for hw in img_hw_list]
+        resized_hw_list = [self.gear_planner.match_hw(hw) for hw in img_hw_list]
         max_hw = max(resized_hw_list, key=lambda x: x[0] * x[1])
 
         return max_hw
@@ -2,7 +2,7 @@ from typing import Dict, List, Tuple
 
 import numpy as np
 
-from ..core import Model, ShapeType
+from ..core import ShapeType
 from ..data_process import build_postprocess, build_preprocess, cv_utils, gear_utils
 from .infer_base import InferBase
 
@@ -15,12 +15,7 @@ class TextClassifier(InferBase):
         self.preprocess_ops = build_preprocess(self.args.cls_config_path, self.requires_gear_hw)
 
     def _init_model(self):
-        self.model = Model(
-            backend=self.args.backend,
-            device=self.args.device,
-            model_path=self.args.cls_model_path,
-            device_id=self.args.device_id,
-        )
+        self.model = self._create_model(self.args.cls_model_path)
 
         shape_type, shape_value = self.model.get_shape_details()
 
@@ -71,7 +66,7 @@ class TextClassifier(InferBase):
 
     def preprocess(self, image: List[np.ndarray]) -> Tuple[List[int], List[Dict]]:
         num_image = len(image)
-        batch_list = gear_utils.get_matched_gear_bs(num_image, self._bs_list)
+        batch_list = self.gear_planner.plan_batches(num_image)
         start_index = 0
         split_bs = []
         split_data = []
@@ -2,8 +2,8 @@ from typing import Dict, List
 
 import numpy as np
 
-from ..core import Model, ShapeType
-from ..data_process import build_postprocess, build_preprocess, cv_utils, gear_utils
+from ..core import ShapeType
+from ..data_process import build_postprocess, build_preprocess, cv_utils
 from .infer_base import InferBase
 
 
@@ -15,12 +15,7 @@ class TextDetector(InferBase):
         self.preprocess_ops = build_preprocess(self.args.det_config_path, self.requires_gear_hw)
 
     def _init_model(self):
-        self.model = Model(
-            backend=self.args.backend,
-            device=self.args.device,
-            model_path=self.args.det_model_path,
-            device_id=self.args.device_id,
-        )
+        self.model = self._create_model(self.args.det_model_path)
 
         shape_type, shape_value = self.model.get_shape_details()
 
@@ -71,7 +66,7 @@ class TextDetector(InferBase):
 
     def preprocess(self, image: np.ndarray) -> Dict:
         if self.requires_gear_hw:
-            target_size = gear_utils.get_matched_gear_hw(cv_utils.get_hw_of_img(image), self._hw_list)
+            target_size = self.gear_planner.match_hw(cv_utils.get_hw_of_img(image))
             data = self.preprocess_ops([image], target_size=target_size)
         else:
             data = self.preprocess_ops([image])
@@ -17,9 +17,7 @@ class LayoutPredictor(InferBase):
         self.model: Dict[int, Model] = {}
 
     def __load_model(self, filename):
-        model = Model(
-            backend=self.args.backend, device=self.args.device, model_path=filename, device_id=self.args.device_id
-        )
+        model = self._create_model(filename)
         shape_type, shape_value = model.get_shape_details()
 
         # Only check inputs[0] currently
@@ -99,7 +97,7 @@ class LayoutPredictor(InferBase):
 
     def preprocess(self, image: List[np.ndarray]) -> Tuple[List[int], List[Dict]]:
         num_image = len(image)
-        batch_list = gear_utils.get_matched_gear_bs(num_image, self._bs_list)
+        batch_list = self.gear_planner.plan_batches(num_image)
         start_index = 0
         split_bs = []
         split_data = []
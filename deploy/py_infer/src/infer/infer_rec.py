@@ -14,9 +14,7 @@ class TextRecognizer(InferBase):
         self.model: Dict[int, Model] = {}
 
     def __load_model(self, filename):
-        model = Model(
-            backend=self.args.backend, device=self.args.device, model_path=filename, device_id=self.args.device_id
-        )
+        model = self._create_model(filename)
         shape_type, shape_value = model.get_shape_details()
 
         # Only check inputs[0] currently
@@ -84,30 +82,39 @@ class TextRecognizer(InferBase):
     def get_params(self):
         return {"rec_batch_num": self._bs_list}
 
-    def __call__(self, images: List[np.ndarray]) -> List:
-        split_bs, split_data = self.preprocess(images)
+    def __call__(self, images: List[np.ndarray]) -> Dict:
+        order = self.get_sorted_indices(images)
+        split_bs, split_data = self.preprocess([images[i] for i in order])
         split_pred = [self.model_infer(data) for data in split_data]
-        outputs = []
+        texts, confs = [], []
         for bs, pred in zip(split_bs, split_pred):
             output = self.postprocess(pred, bs)
-            outputs.extend(output)
-
-        # TODO: merge outputs from different dynamic batch_size
-        return outputs
+            texts.extend(output["texts"])
+            confs.extend(output["confs"])
+
+        # restore the input order
+        inverse = np.argsort(order)
+        return {"texts": [texts[i] for i in inverse], "confs": [confs[i] for i in inverse]}
+
+    @staticmethod
+    def get_sorted_indices(images: List[np.ndarray]) -> np.ndarray:
+        """
+        Indices sorting the images by aspect ratio (w/h), so that the images split into the same batch have similar
+        widths and the batch is not padded to the width of its widest random member.
+        """
+        wh_ratios = [img.shape[1] / float(img.shape[0]) for img in images]
+        return np.argsort(np.array(wh_ratios), kind="stable")
 
     def preprocess(self, image: List[np.ndarray]) -> Tuple[List[int], List[Dict]]:
+        """
+        Split the images into gear batches and preprocess them. Images are split in the given order, so sort them
+        with get_sorted_indices beforehand to reduce the padding of each batch.
+        """
         num_image = len(image)
-        batch_list = gear_utils.get_matched_gear_bs(num_image, self._bs_list)
+        batch_list = self.gear_planner.plan_batches(num_image)
         start_index = 0
         split_bs = []
         split_data = []
-        width_list = []
-        width_list_indices = []
-
-        if not self.requires_gear_hw:
-            for img in image:
-                width_list.append(img.shape[1] / float(img.shape[0]))
-            width_list_indices = np.argsort(np.array(width_list))
 
         for batch in batch_list:
             upper_bound = min(start_index + batch, num_image)
@@ -119,10 +126,9 @@ class TextRecognizer(InferBase):
             else:
                 img_h, img_w = 48, 320
                 max_wh_ratio = img_w / img_h
-                for index in range(start_index, upper_bound):
-                    h, w = image[width_list_indices[index]].shape[0:2]
-                    wh_ratio = w * 1.0 / h
-                    max_wh_ratio = max(max_wh_ratio, wh_ratio)
+                for img in split_input:
+                    h, w = img.shape[0:2]
+                    max_wh_ratio = max(max_wh_ratio, w * 1.0 / h)
                 split_output = self.preprocess_ops(split_input, max_wh_ratio=max_wh_ratio)
 
             if self.requires_gear_bs:
@@ -1,4 +1,5 @@
 import argparse
+import importlib.util
 import itertools
 import os
 
@@ -10,6 +11,24 @@ def str2bool(v):
     return v.lower() in ("true", "t", "1")
 
 
+def parse_warmup_shapes(v):
+    """
+    parse representative image sizes of dynamic shape models like "det:736x1280,960x960;rec:48x320" to
+    {"det": [(736, 1280), (960, 960)], "rec": [(48, 320)]}
+    """
+    warmup_shapes = {}
+    try:
+        for item in filter(None, v.split(";")):
+            task, sizes = item.split(":")
+            warmup_shapes[task.strip()] = [tuple(int(x) for x in size.split("x")) for size in sizes.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"warmup_shapes must be like 'det:736x1280,960x960;rec:48x320', but got {v}")
+    for task, sizes in warmup_shapes.items():
+        if task not in ("det", "cls", "rec", "layout") or any(len(size) != 2 or min(size) < 1 for size in sizes):
+            raise argparse.ArgumentTypeError(f"invalid warmup shapes of {task}: {sizes}")
+    return warmup_shapes
+
+
 def get_args():
     """
     command line parameters for inference
@@ -19,18 +38,44 @@ def get_args():
         "--input_images_dir",
         type=str,
         required=True,
-        help="Image or folder path for inference",
+        help="Path of image, tar shard(.tar, .tar.gz), video, or folder containing them recursively for inference. "
+        "They are streamed into the pipeline, and decoded in DecodeNode.",
+    )
+    parser.add_argument(
+        "--video_frame_step",
+        type=int,
+        default=1,
+        required=False,
+        help="Infer one frame every video_frame_step frames of videos in input_images_dir.",
     )
     parser.add_argument(
         "--backend",
         type=str.lower,
         default="lite",
         required=False,
-        choices=["lite"],
+        choices=["lite", "onnx"],
         help="Inference backend type.",
     )
-    parser.add_argument("--device", type=str, default="Ascend", required=False, choices=["Ascend"], help="Device type.")
+    parser.add_argument(
+        "--device", type=str, default="Ascend", required=False, choices=["Ascend", "CPU"], help="Device type."
+    )
     parser.add_argument("--device_id", type=int, default=0, required=False, help="Device id.")
+    parser.add_argument(
+        "--executor",
+        type=str,
+        default="multiprocess",
+        choices=["multiprocess", "inproc"],
+        required=False,
+        help="Executor of pipeline. multiprocess runs every stage in separate processes for throughput, inproc runs "
+        "all stages on a thread pool in one process for low latency of small requests.",
+    )
+    parser.add_argument(
+        "--inproc_threads",
+        type=int,
+        default=4,
+        required=False,
+        help="Number of threads of the inproc executor.",
+    )
     parser.add_argument(
         "--parallel_num",
         type=int,
@@ -38,6 +83,60 @@ def get_args():
         required=False,
         help="Number of parallel in each stage of pipeline parallelism.",
     )
+    parser.add_argument(
+        "--core_budget",
+        type=int,
+        default=0,
+        required=False,
+        help="Max total number of node instances, except HandoutNode and CollectNode. If positive, the pipeline is "
+        "calibrated on calibration_images images, and the instances are allocated to balance the stages.",
+    )
+    parser.add_argument(
+        "--calibration_images",
+        type=int,
+        default=16,
+        required=False,
+        help="Number of images from input_images_dir to calibrate the pipeline topology with, if core_budget is set.",
+    )
+    parser.add_argument(
+        "--rebalance_interval",
+        type=float,
+        default=0,
+        required=False,
+        help="Interval(seconds) to move node instances from idle stages to the busiest stage at runtime, each stage "
+        "keeps a standby instance for it. Disabled if 0.",
+    )
+    parser.add_argument(
+        "--intra_op_threads",
+        type=int,
+        default=0,
+        required=False,
+        help="Number of threads used within each operator on CPU device, 0 means the default of the backend.",
+    )
+    parser.add_argument(
+        "--inter_op_threads",
+        type=int,
+        default=0,
+        required=False,
+        help="Number of threads used to run independent operators in parallel on CPU device, "
+        "0 means the default of the backend.",
+    )
+    parser.add_argument(
+        "--gear_calibration",
+        type=str2bool,
+        default=False,
+        required=False,
+        help="Whether measure the latency of every shape gear of models at init, if there is no gear latency table "
+        "saved alongside the model. The table is saved for later runs, and used to choose the gears with least cost.",
+    )
+    parser.add_argument(
+        "--warmup_shapes",
+        type=parse_warmup_shapes,
+        default=None,
+        required=False,
+        help="Representative image sizes(HxW) to warm up for dynamic shape models, e.g. "
+        "'det:736x1280,960x960;rec:48x320'. Models with shape gears are warmed up on all gears.",
+    )
     parser.add_argument(
         "--precision_mode", type=str, default=None, choices=["fp16", "fp32"], required=False, help="Precision mode."
     )
@@ -77,6 +176,14 @@ def get_args():
     parser.add_argument(
         "--rec_batch_num", type=int, default=6, required=False, help="Batch size for recognition model."
     )
+    parser.add_argument(
+        "--rec_batch_max_wait",
+        type=float,
+        default=0,
+        required=False,
+        help="Max time(seconds) to wait for gathering sub images from several images into one batch for the "
+        "recognition model in det+rec pipeline. Sub images of each image are batched separately if 0.",
+    )
     parser.add_argument(
         "--character_dict_path", type=str, required=False, help="Character dict file path for recognition models."
     )
@@ -86,6 +193,13 @@ def get_args():
         "--layout_model_name_or_config", type=str, required=False, help="Layout model name or config file path."
     )
     parser.add_argument("--layout_batch_num", type=int, default=1, required=False, help="Batch size for layout model.")
+    parser.add_argument(
+        "--layout_score_thresh",
+        type=float,
+        default=0.5,
+        required=False,
+        help="Min score of the layout regions fed to det+rec, when layout, det and rec models are all set.",
+    )
 
     parser.add_argument(
         "--res_save_dir",
@@ -95,6 +209,30 @@ def get_args():
         help="Saving dir for inference results.",
     )
 
+    parser.add_argument(
+        "--result_sink",
+        type=str,
+        default="txt",
+        choices=["txt", "jsonl", "parquet"],
+        required=False,
+        help="Format of the result file in res_save_dir. Results are written incrementally as images are finished. "
+        "parquet requires pyarrow.",
+    )
+    parser.add_argument(
+        "--sink_flush_size",
+        type=int,
+        default=256,
+        required=False,
+        help="Number of results buffered before writing them to the result file.",
+    )
+    parser.add_argument(
+        "--vis_workers",
+        type=int,
+        default=2,
+        required=False,
+        help="Number of threads drawing and saving the visualization and crops of results.",
+    )
+
     parser.add_argument(
         "--input_array_save_dir",
         type=str,
@@ -115,6 +253,20 @@ def get_args():
     parser.add_argument(
         "--crop_save_dir", type=str, required=False, help="Saving dir for images cropped of detection results."
     )
+    parser.add_argument(
+        "--trace_save_path",
+        type=str,
+        required=False,
+        help="Saving path of the Chrome trace json of the pipeline, with the wait, process and send-blocked spans of "
+        "every node instance. Disabled if not set.",
+    )
+    parser.add_argument(
+        "--trace_buffer_size",
+        type=int,
+        default=100000,
+        required=False,
+        help="Number of latest spans kept by each node instance for the trace.",
+    )
     parser.add_argument(
         "--show_log", type=str2bool, default=False, required=False, help="Whether show log when inferring."
     )
@@ -153,6 +305,7 @@ def update_task_info(args):
         (True, False, True, False): TaskType.DET_REC,
         (True, True, True, False): TaskType.DET_CLS_REC,
         (False, False, False, True): TaskType.LAYOUT,
+        (True, False, True, True): TaskType.LAYOUT_DET_REC,
     }
 
     task_order = (det, cls, rec, layout)
@@ -166,7 +319,8 @@ def update_task_info(args):
         }
 
         raise ValueError(
-            f"Only support det, cls, rec, det+rec and det+cls+rec, but got {unsupported_task_map[task_order]}. "
+            "Only support det, cls, rec, det+rec, det+cls+rec, layout and layout+det+rec, "
+            f"but got {unsupported_task_map.get(task_order, 'the other combination')}. "
             f"Please check model_path!"
         )
 
@@ -187,7 +341,9 @@ def check_and_update_args(args):
     check parameters
     """
     if not args.input_images_dir or not os.path.exists(args.input_images_dir):
-        raise ValueError("input_images_dir must be dir containing multiple images or path of single image.")
+        raise ValueError(
+            "input_images_dir must be dir containing multiple images, or path of single image, tar shard or video."
+        )
 
     if args.det_model_path and not args.det_model_name_or_config:
         raise ValueError("det_model_name_or_config can't be emtpy when set det_model_path for detection.")
@@ -240,11 +396,39 @@ def check_and_update_args(args):
         "rec_batch_num": args.rec_batch_num,
         "cls_batch_num": args.cls_batch_num,
         "layout_batch_num": args.layout_batch_num,
+        "calibration_images": args.calibration_images,
+        "trace_buffer_size": args.trace_buffer_size,
+        "inproc_threads": args.inproc_threads,
+        "video_frame_step": args.video_frame_step,
+        "sink_flush_size": args.sink_flush_size,
+        "vis_workers": args.vis_workers,
     }
     for name, value in need_check_positive.items():
         if value < 1:
             raise ValueError(f"{name} must be positive, but got {value}.")
 
+    if args.result_sink == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("pyarrow is required for the parquet result sink, please install it first.")
+
+    if args.backend == "onnx" and args.device != "CPU":
+        raise ValueError(f"onnx backend only supports CPU device, but got {args.device}.")
+
+    need_check_not_negative = {
+        "intra_op_threads": args.intra_op_threads,
+        "inter_op_threads": args.inter_op_threads,
+        "core_budget": args.core_budget,
+        "rebalance_interval": args.rebalance_interval,
+    }
+    for name, value in need_check_not_negative.items():
+        if value < 0:
+            raise ValueError(f"{name} must not be negative, but got {value}.")
+
+    if not 0 <= args.layout_score_thresh <= 1:
+        raise ValueError(f"layout_score_thresh must be in [0, 1], but got {args.layout_score_thresh}.")
+
+    if args.rec_batch_max_wait < 0:
+        raise ValueError(f"rec_batch_max_wait must not be negative, but got {args.rec_batch_max_wait}.")
+
     need_check_dir_not_same = {
         "input_images_dir": args.input_images_dir,
         "crop_save_dir": args.crop_save_dir,
@@ -269,3 +453,5 @@ def init_save_dir(args):
         save_path_init(args.vis_det_save_dir)
     if args.save_log_dir:
         save_path_init(args.save_log_dir, exist_ok=True)
+    if args.trace_save_path and os.path.dirname(args.trace_save_path):
+        save_path_init(os.path.dirname(args.trace_save_path), exist_ok=True)
@@ -1,3 +1,4 @@
-from .parallel_pipeline import ParallelPipeline
+from .inproc_pipeline import InprocPipeline
+from .parallel_pipeline import ParallelPipeline, calibrate_topology
 
-__all__ = ["ParallelPipeline"]
+__all__ = ["InprocPipeline", "ParallelPipeline", "calibrate_topology"]
@@ -1,3 +1,3 @@
-from .message_data import ProfilingData, StopSign
+from .message_data import ProfilingData, StopSign, TaskProfilingData
 from .module_data import ModuleConnectDesc, ModuleDesc, ModuleInitArgs
 from .process_data import ProcessData, StopData
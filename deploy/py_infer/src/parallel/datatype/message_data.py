@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -14,3 +14,16 @@ class ProfilingData:
     process_cost_time: float = 0.0
     send_cost_time: float = 0.0
     image_total: int = -1
+
+
+@dataclass
+class TaskProfilingData:
+    """
+    profiling data of a finished task, sent by CollectNode before the task result in serving mode
+    """
+
+    taskid: int = 0
+    # process cost(seconds) of each stage, one dict for each piece of data collected for the task
+    stage_cost: list = field(default_factory=lambda: [])
+    # (number of valid samples, batch size fed to the model) of each batch, keyed by stage
+    batch_fill: dict = field(default_factory=lambda: {})
@@ -28,6 +28,8 @@ class ModuleInitArgs:
 class ModuleDesc:
     module_name: str
     module_count: int
+    # instances initialized but inactive, for activating at runtime
+    standby_count: int = 0
 
 
 @dataclass
@@ -14,11 +14,17 @@ class ProcessData:
     # image basic info
     image_path: List[str] = field(default_factory=lambda: [])
     frame: List[np.ndarray] = field(default_factory=lambda: [])
+    # items of streaming source to be decoded by DecodeNode, e.g. paths, members of tar shards and segments of videos
+    source_items: list = field(default_factory=lambda: [])
 
     # sub image of detection box, for det (+ cls) + rec
     sub_image_total: int = 0  # len(sub_image_list_0) + len(sub_image_list_1) + ...
     sub_image_list: list = field(default_factory=lambda: [])
     sub_image_size: int = 0  # len of sub_image_list
+    sub_image_index: List[int] = field(default_factory=lambda: [])  # index of each sub image in the detection result
+
+    # region of layout for layout+det+rec, with the offset of its crop in the page, det+rec run on the crop in frame
+    layout_region: Dict = None
 
     # data for preprocess -> infer -> postprocess
     data: Union[np.ndarray, List[np.ndarray], Dict] = None
@@ -29,12 +35,29 @@ class ProcessData:
     # the images fed into the ocr system in the same call, share the same taskid
     taskid: int = 0
 
-    # number of images shared the same taskid
+    # number of images shared the same taskid, 0 for a task of streaming source until its end
     task_images_num: int = 0
 
+    # the end of a task of streaming source, carrying the number of images of the task in task_images_num
+    task_end: bool = False
+
+    # number of images of the task counted by the sender but not decoded, e.g. the frames beyond the real end of a
+    # video whose frame count is an estimate, or unavailable images. It is taken off the images of the task
+    images_undecoded: int = 0
+
     # data type: raw input is string path or np.ndarray. 0: string path, 1: np.ndarray
     data_type: int = 0
 
+    # sub images of several images aggregated into one batch for rec, each item is the ProcessData of one image
+    # holding its own part of sub images and infer_result
+    batch_items: list = field(default_factory=lambda: [])
+
+    # process cost(seconds) of each stage the data passed, keyed by module name
+    stage_cost: Dict[str, float] = field(default_factory=lambda: {})
+
+    # (number of valid samples, batch size fed to the model), keyed by module name of the preprocess
+    batch_fill: Dict[str, tuple] = field(default_factory=lambda: {})
+
 
 @dataclass
 class StopData:
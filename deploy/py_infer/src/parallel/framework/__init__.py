@@ -1,3 +1,5 @@
+from .autoscaler import Topology, plan_module_counts, report_topology
 from .module_base import ModuleBase
 from .module_manager import ModuleManager
 from .pipeline_manager import ParallelPipelineManager
+from .result_sink import RESULT_SINKS, VisWorkerPool
@@ -0,0 +1,129 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from ...utils import log, safe_div
+
+# nodes which must have exactly one instance, and are not counted in the core budget
+FIXED_MODULES = ("HandoutNode", "CollectNode")
+
+
+@dataclass
+class Topology:
+    # number of active instances of each module
+    module_counts: Dict[str, int] = field(default_factory=lambda: {})
+    # FPS predicted by the process cost per image of the bottleneck module
+    predicted_fps: float = 0.0
+
+
+def predict_fps(stage_costs: Dict[str, float], module_counts: Dict[str, int]) -> float:
+    """
+    Throughput of a pipeline is bounded by its slowest stage, which processes count/cost images per second.
+    """
+    fps_list = [safe_div(module_counts.get(name, 1), cost) for name, cost in stage_costs.items() if cost > 0]
+    return min(fps_list) if fps_list else 0.0
+
+
+def plan_module_counts(stage_costs: Dict[str, float], core_budget: int) -> Topology:
+    """
+    Allocate instances to modules within core_budget, so that the throughput of the slowest stage is maximized.
+
+    Args:
+        stage_costs: process cost(seconds) per image of each module, excluding the time waiting for sending.
+        core_budget: max total number of instances of the modules other than FIXED_MODULES.
+    """
+    scalable = [name for name in stage_costs if name not in FIXED_MODULES]
+    if core_budget < len(scalable):
+        raise ValueError(f"core_budget must be at least {len(scalable)} for {scalable}, but got {core_budget}.")
+
+    module_counts = {name: 1 for name in stage_costs}
+    # adding an instance to the bottleneck one at a time is optimal for maximizing min(count / cost)
+    for _ in range(core_budget - len(scalable)):
+        bottleneck = max(scalable, key=lambda name: safe_div(stage_costs[name], module_counts[name]))
+        module_counts[bottleneck] += 1
+
+    return Topology(module_counts=module_counts, predicted_fps=predict_fps(stage_costs, module_counts))
+
+
+def report_topology(topology: Topology, stage_costs: Dict[str, float]):
+    for name, count in topology.module_counts.items():
+        log.info(
+            f"{name}: {count} instance(s), process cost per image {stage_costs.get(name, 0) * 1000:.2f} ms, "
+            f"stage FPS {predict_fps({name: stage_costs.get(name, 0)}, topology.module_counts):.2f}"
+        )
+    info = f"Pipeline topology: {topology.module_counts}, predicted FPS: {topology.predicted_fps:.2f}"
+    print(info)
+    log.info(info)
+
+
+class RuntimeRebalancer:
+    """
+    Move active instances from the most idle module to the busiest one while the pipeline is running.
+
+    Every module may have standby instances, which are initialized but do not fetch data until activated. Every
+    `interval` seconds, the busy ratio of each module is measured by the increase of the process cost of its
+    instances. If the busiest module is busier than `high_watermark` and has a standby instance, it is activated,
+    and an instance of the most idle module is deactivated if that module is less busy than `low_watermark`, so that
+    the number of active instances stays within the core budget.
+    """
+
+    def __init__(
+        self,
+        modules: Dict[str, List],
+        core_budget: int,
+        interval: float,
+        high_watermark: float = 0.8,
+        low_watermark: float = 0.4,
+    ):
+        self.modules = {name: instances for name, instances in modules.items() if name not in FIXED_MODULES}
+        self.core_budget = core_budget
+        self.interval = interval
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.last_time = time.time()
+        self.last_busy = self._busy_time()
+
+    def _busy_time(self) -> Dict[str, float]:
+        return {
+            name: sum(x.process_cost.value - x.send_cost.value for x in instances)
+            for name, instances in self.modules.items()
+        }
+
+    def _active(self, name) -> List:
+        return [x for x in self.modules[name] if x.active.value]
+
+    def _standby(self, name) -> List:
+        return [x for x in self.modules[name] if not x.active.value]
+
+    def step(self):
+        now = time.time()
+        if now - self.last_time < self.interval:
+            return
+
+        busy = self._busy_time()
+        busy_ratio = {
+            name: safe_div(busy[name] - self.last_busy[name], (now - self.last_time) * max(len(self._active(name)), 1))
+            for name in self.modules
+        }
+        self.last_time, self.last_busy = now, busy
+
+        busiest = max(busy_ratio, key=busy_ratio.get)
+        if busy_ratio[busiest] < self.high_watermark or not self._standby(busiest):
+            return
+
+        active_total = sum(len(self._active(name)) for name in self.modules)
+        if active_total >= self.core_budget:
+            idle_candidates = [
+                name
+                for name in self.modules
+                if name != busiest and len(self._active(name)) > 1 and busy_ratio[name] < self.low_watermark
+            ]
+            if not idle_candidates:
+                return
+            idlest = min(idle_candidates, key=busy_ratio.get)
+            self._active(idlest)[-1].active.value = False
+            log.info(f"Rebalance: deactivate an instance of {idlest}, busy ratio {busy_ratio[idlest]:.2f}.")
+
+        self._standby(busiest)[0].active.value = True
+        log.info(f"Rebalance: activate an instance of {busiest}, busy ratio {busy_ratio[busiest]:.2f}.")
+        log.info(f"Rebalance: active instances {({name: len(self._active(name)) for name in self.modules})}.")
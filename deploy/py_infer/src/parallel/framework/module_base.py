@@ -1,11 +1,12 @@
 import os.path
 import time
 from abc import abstractmethod
-from ctypes import c_longdouble
-from multiprocessing import Manager
+from ctypes import c_bool, c_double
+from multiprocessing import Value
 
 from ...utils import log
-from ..datatype import ModuleInitArgs, ProfilingData, StopData
+from ..datatype import ModuleInitArgs, ProcessData, ProfilingData, StopData
+from .tracer import SpanTracer
 
 
 class ModuleBase(object):
@@ -19,8 +20,14 @@ class ModuleBase(object):
         self.msg_queue = msg_queue
         self.input_queue = None
         self.output_queue = None
-        self.send_cost = Manager().Value(typecode=c_longdouble, value=0)
-        self.process_cost = Manager().Value(typecode=c_longdouble, value=0)
+        # shared memory written by the instance process only, and read by the pipeline process
+        self.send_cost = Value(c_double, 0, lock=False)
+        self.process_cost = Value(c_double, 0, lock=False)
+        self.process_start_time = 0.0
+        self.trace_save_path = getattr(args, "trace_save_path", None)
+        self.tracer = SpanTracer(getattr(args, "trace_buffer_size", 100000)) if self.trace_save_path else None
+        # a standby instance is initialized, but does not fetch data until activated
+        self.active = Value(c_bool, True)
 
     def assign_init_args(self, init_args: ModuleInitArgs):
         self.pipeline_name = init_args.pipeline_name
@@ -48,20 +55,39 @@ class ModuleBase(object):
         while self.stop_manager.value:
             continue
 
+        wait_start_time = time.time()
         while True:
             time.sleep(self.args.node_fetch_interval)
             if self.stop_manager.value:
                 break
+            if not self.active.value:
+                # flush the data held by the instance, once it is deactivated
+                self.call_idle_process()
+                time.sleep(self.args.node_fetch_interval)
+                wait_start_time = time.time()
+                continue
             if self.input_queue.empty():
+                self.call_idle_process()
                 time.sleep(self.args.node_fetch_interval)
                 continue
             else:
                 data = self.input_queue.get(block=True)
+            if self.tracer:
+                self.tracer.add("wait", wait_start_time, time.time())
             self.call_process(data)
+            wait_start_time = time.time()
+
+        self.finalize()
+        if self.tracer:
+            self.tracer.flush(
+                f"{self.trace_save_path}.{self.module_name}.{self.instance_id}.part",
+                f"{self.module_name} instance {self.instance_id}",
+            )
 
     def call_process(self, send_data=None):
         if send_data is not None or self.without_input_queue:
             start_time = time.time()
+            self.process_start_time = start_time
             try:
                 self.process(send_data)
             except Exception as error:
@@ -69,13 +95,36 @@ class ModuleBase(object):
                 image_path = [os.path.basename(filename) for filename in send_data.image_path]
                 log.exception(f"ERROR occurred in {self.module_name} module for {', '.join(image_path)}: {error}.")
 
-            cost_time = time.time() - start_time
-            self.process_cost.value += cost_time
+            end_time = time.time()
+            self.process_cost.value += end_time - start_time
+            if self.tracer:
+                self.tracer.add("process", start_time, end_time, self._trace_args(send_data))
+
+    def call_idle_process(self):
+        self.process_start_time = time.time()
+        try:
+            self.idle_process()
+        except Exception as error:
+            self.process(StopData(exception=True))
+            log.exception(f"ERROR occurred in {self.module_name} module when idle: {error}.")
 
     @abstractmethod
     def process(self, input_data):
         pass
 
+    def idle_process(self):
+        """
+        Called when there is no input data. Modules holding buffered data can override it, e.g. to flush on timeout.
+        """
+        pass
+
+    def finalize(self):
+        """
+        Called in the process of the instance once the pipeline stops. Modules holding buffered outputs can override
+        it, e.g. to flush the results not written yet.
+        """
+        pass
+
     @abstractmethod
     def init_self_args(self):
         self.msg_queue.put(f"{self.__class__.__name__} instance id {self.instance_id} init complete")
@@ -85,9 +134,29 @@ class ModuleBase(object):
         if self.is_stop:
             return
         start_time = time.time()
+        if isinstance(output_data, ProcessData):
+            # a new dict, since the shallow copies of the input data share the same one
+            output_data.stage_cost = {**output_data.stage_cost, self.module_name: start_time - self.process_start_time}
         self.output_queue.put(output_data, block=True)
-        cost_time = time.time() - start_time
-        self.send_cost.value += cost_time
+        end_time = time.time()
+        self.send_cost.value += end_time - start_time
+        if self.tracer:
+            # time blocked by the full queue of the next module
+            self.tracer.add("send", start_time, end_time, self._trace_args(output_data))
+
+    @staticmethod
+    def _trace_args(data):
+        if not isinstance(data, ProcessData):
+            return {"type": type(data).__name__}
+        items = data.batch_items or [data]
+        return {"taskid": sorted({item.taskid for item in items}), "images": list(data.image_path)}
+
+    def record_batch_fill(self, output_data, valid_size):
+        """
+        Record the number of valid samples and the batch size fed to the model, i.e. after padding to the gear.
+        """
+        batch_size = output_data.data["net_inputs"][0].shape[0]
+        output_data.batch_fill = {**output_data.batch_fill, self.module_name: (valid_size, batch_size)}
 
     def get_module_name(self):
         return self.module_name
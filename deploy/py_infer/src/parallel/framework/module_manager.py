@@ -1,6 +1,7 @@
+import time
 from collections import defaultdict, namedtuple
 from ctypes import c_bool
-from multiprocessing import Manager, Process, Queue
+from multiprocessing import Manager, Process, Queue, Value
 
 from ...utils import log
 from ..datatype.module_data import ModuleInitArgs, ModulesInfo
@@ -11,11 +12,12 @@ OutputRegisterInfo = namedtuple("OutputRegisterInfo", ["pipeline_name", "module_
 
 class ModuleManager:
     MODULE_QUEUE_MAX_SIZE = 16
+    PROCESS_EXIT_TIMEOUT = 1.0
 
     def __init__(self, msg_queue: Queue, task_queue: Queue, result_queue: Queue, args):
         self.pipeline_map = defaultdict(lambda: defaultdict(ModulesInfo))
         self.msg_queue = msg_queue
-        self.stop_manager = Manager().Value(c_bool, True)
+        self.stop_manager = Value(c_bool, True, lock=False)
         self.args = args
         self.pipeline_name = ""
         self.process_list = []
@@ -46,9 +48,10 @@ class ModuleManager:
             log.info("+++++++++++++++++++++++++++++++++++++")
             module_count = default_count if module_desc.module_count == -1 else module_desc.module_count
             module_info = ModulesInfo()
-            for instance_id in range(module_count):
+            for instance_id in range(module_count + module_desc.standby_count):
                 module_instance = processor_initiator(module_desc.module_name)(self.args, self.msg_queue)
                 self.init_module_instance(module_instance, instance_id, pipeline_name, module_desc.module_name)
+                module_instance.active.value = instance_id < module_count
 
                 module_info.module_list.append(module_instance)
             modules_info_dict[module_desc.module_name] = module_info
@@ -136,8 +139,10 @@ class ModuleManager:
                 for module in modules_info_dict[module_name].module_list:
                     self.stop_module(module=module)
 
-        # release all resource
+        # give the instances a moment to exit by themselves and flush their traces, then release all resource
+        deadline = time.time() + self.PROCESS_EXIT_TIMEOUT
         for process in self.process_list:
+            process.join(timeout=max(deadline - time.time(), 0))
             if process.is_alive():
                 process.kill()
 
@@ -7,19 +7,24 @@ from multiprocessing import Manager, Process, Queue
 from ...infer import SUPPORTED_TASK_BASIC_MODULE
 from ...utils import log, safe_div
 from ..datatype import ModuleConnectDesc, ModuleDesc, StopSign
-from ..framework import ModuleManager
 from ..module import MODEL_DICT
+from .autoscaler import FIXED_MODULES, RuntimeRebalancer, Topology
+from .module_manager import ModuleManager
+from .tracer import merge_trace_parts
 
 
 class ParallelPipelineManager:
     TASK_QUEUE_SIZE = 32
 
-    def __init__(self, args: argparse.Namespace):
+    def __init__(self, args: argparse.Namespace, topology: Topology = None):
         self.args = args
+        self.topology = topology
         self.input_queue = Queue(self.TASK_QUEUE_SIZE)
         self.result_queue = Queue(self.TASK_QUEUE_SIZE)
         self.process = Process(target=self._build_pipeline_kernel)
         self.module_params = Manager().dict()
+        # process cost per image of each module, and FPS, filled when the pipeline stops
+        self.profiling_result = Manager().dict()
 
     def start_pipeline(self):
         self.process.start()
@@ -37,29 +42,43 @@ class ParallelPipelineManager:
             rst_data = None
         return rst_data
 
+    def get_result(self, timeout=None):
+        """
+        block until a result is available, raise queue.Empty if no result in timeout seconds
+        """
+        return self.result_queue.get(block=True, timeout=timeout)
+
     def _build_pipeline_kernel(self):
         """
         build and register pipeline
         """
         task_type = self.args.task_type
         parallel_num = self.args.parallel_num
-        module_desc_list = [ModuleDesc("HandoutNode", 1), ModuleDesc("DecodeNode", parallel_num)]
+        module_counts = self.topology.module_counts if self.topology else {}
+        # with runtime rebalancing, each module has a standby instance for activating
+        rebalance_interval = getattr(self.args, "rebalance_interval", 0)
+        standby_count = 1 if rebalance_interval > 0 else 0
 
+        module_count_list = [("HandoutNode", 1), ("DecodeNode", parallel_num)]
         module_order = SUPPORTED_TASK_BASIC_MODULE[task_type]
-
         for model_name in module_order:
-            model_name = model_name
             for name, count in MODEL_DICT.get(model_name, []):
-                module_desc_list.append(ModuleDesc(name, count * parallel_num))
-
-        module_desc_list.append(ModuleDesc("CollectNode", 1))
+                module_count_list.append((name, count * parallel_num))
+        module_count_list.append(("CollectNode", 1))
+
+        module_desc_list = []
+        for name, count in module_count_list:
+            if name in FIXED_MODULES:
+                module_desc_list.append(ModuleDesc(name, count))
+            else:
+                module_desc_list.append(ModuleDesc(name, module_counts.get(name, count), standby_count))
         module_connect_desc_list = []
         for i in range(len(module_desc_list) - 1):
             module_connect_desc_list.append(
                 ModuleConnectDesc(module_desc_list[i].module_name, module_desc_list[i + 1].module_name)
             )
 
-        module_size = sum(desc.module_count for desc in module_desc_list)
+        module_size = sum(desc.module_count + desc.standby_count for desc in module_desc_list)
         log.info(f"module_size: {module_size}")
         msg_queue = Queue(module_size)
 
@@ -85,14 +104,26 @@ class ParallelPipelineManager:
 
         manager.stop_manager.value = False
 
+        rebalancer = None
+        if rebalance_interval > 0:
+            modules = {name: info.module_list for name, info in manager.pipeline_map[str(os.getpid())].items()}
+            core_budget = getattr(self.args, "core_budget", 0) or sum(
+                desc.module_count for desc in module_desc_list if desc.module_name not in FIXED_MODULES
+            )
+            rebalancer = RuntimeRebalancer(modules, core_budget, rebalance_interval)
+
         start_time = time.time()
 
         while not manager.stop_manager.value:
             time.sleep(self.args.node_fetch_interval)
+            if rebalancer:
+                rebalancer.step()
 
         cost_time = time.time() - start_time
 
         manager.deinit_pipeline_module()
+        if getattr(self.args, "trace_save_path", None):
+            merge_trace_parts(self.args.trace_save_path)
         # collect the profiling data
         profiling_data = defaultdict(lambda: [0, 0])
         image_total = 0
@@ -109,9 +140,16 @@ class ParallelPipelineManager:
                 f"total cost {cost_time:.2f}s, FPS: "
                 f"{safe_div(image_total, cost_time):.2f}"
             )
+            if self.topology:
+                perf_info += f", predicted FPS: {self.topology.predicted_fps:.2f}"
             print(perf_info)
             log.info(perf_info)
 
+            self.profiling_result.update(
+                stage_costs={name: safe_div(data[0] - data[1], image_total) for name, data in profiling_data.items()},
+                fps=safe_div(image_total, cost_time),
+            )
+
         msg_queue.close()
         msg_queue.join_thread()
 
@@ -0,0 +1,158 @@
+import json
+import os
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from ...utils import log
+
+__all__ = ["ResultSink", "TextResultSink", "JsonlResultSink", "ParquetResultSink", "RESULT_SINKS", "VisWorkerPool"]
+
+
+class ResultSink:
+    """
+    Write the results of images incrementally while the pipeline is running. Results are buffered and written in
+    batches of flush_size, so that the results of a long run are not held in memory until the end.
+    """
+
+    extension = ""
+
+    def __init__(self, save_path_stem: str, flush_size: int = 256):
+        self.save_path = save_path_stem + self.extension
+        self.flush_size = flush_size
+        self.buffer: List[Tuple[str, object]] = []
+        self.result_total = 0
+
+    def write(self, image_name: str, result):
+        self.buffer.append((image_name, result))
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        self._write_batch(self.buffer)
+        self.result_total += len(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self._close()
+        log.info(f"save {self.result_total} infer results to {self.save_path} successfully")
+
+    def _write_batch(self, batch: List[Tuple[str, object]]):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class _FileResultSink(ResultSink):
+    """
+    Append lines to the save file, which is opened at the first flush in the process writing it.
+    """
+
+    def __init__(self, save_path_stem: str, flush_size: int = 256):
+        super().__init__(save_path_stem, flush_size)
+        self.file = None
+
+    def _format(self, image_name: str, result) -> str:
+        raise NotImplementedError
+
+    def _write_batch(self, batch: List[Tuple[str, object]]):
+        if self.file is None:
+            flags, modes = os.O_WRONLY | os.O_CREAT | os.O_APPEND, stat.S_IWUSR | stat.S_IRUSR | stat.S_IRGRP
+            self.file = os.fdopen(os.open(self.save_path, flags, modes), "w")
+        self.file.write("".join(self._format(image_name, result) for image_name, result in batch))
+        self.file.flush()
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class TextResultSink(_FileResultSink):
+    """
+    Lines of "basename\\tjson of result", same as the format written by safe_list_writer.
+    """
+
+    extension = ".txt"
+
+    def _format(self, image_name: str, result) -> str:
+        return os.path.basename(image_name) + "\t" + json.dumps(result, ensure_ascii=False) + "\n"
+
+
+class JsonlResultSink(_FileResultSink):
+    """
+    Lines of {"image": path of image, "result": result}.
+    """
+
+    extension = ".jsonl"
+
+    def _format(self, image_name: str, result) -> str:
+        return json.dumps({"image": image_name, "result": result}, ensure_ascii=False) + "\n"
+
+
+class ParquetResultSink(ResultSink):
+    """
+    A parquet file of columns image(path of image) and result(json of result), each flush is written as a row group.
+    pyarrow is required.
+    """
+
+    extension = ".parquet"
+
+    def __init__(self, save_path_stem: str, flush_size: int = 256):
+        super().__init__(save_path_stem, flush_size)
+        self.writer = None
+
+    def _write_batch(self, batch: List[Tuple[str, object]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table(
+            {
+                "image": [image_name for image_name, _ in batch],
+                "result": [json.dumps(result, ensure_ascii=False) for _, result in batch],
+            },
+            schema=pa.schema([("image", pa.string()), ("result", pa.string())]),
+        )
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.save_path, table.schema)
+        if batch:
+            self.writer.write_table(table)
+
+    def _close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+RESULT_SINKS: Dict[str, type] = {
+    "txt": TextResultSink,
+    "jsonl": JsonlResultSink,
+    "parquet": ParquetResultSink,
+}
+
+
+class VisWorkerPool:
+    """
+    Run the visualization of results on a thread pool, so that drawing and encoding images do not stall the caller.
+    At most max_pending jobs are queued, submit blocks beyond that to bound the images held in memory.
+    """
+
+    def __init__(self, workers: int, max_pending: int = 0):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vis_worker")
+        self.pending = threading.BoundedSemaphore(max_pending or 2 * workers)
+
+    def submit(self, func, *args):
+        self.pending.acquire()
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self.pending.release()
+        if future.exception():
+            log.error(f"visualization failed: {future.exception()}")
+
+    def close(self):
+        self.executor.shutdown(wait=True)
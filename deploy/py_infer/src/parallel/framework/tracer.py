@@ -0,0 +1,55 @@
+import glob
+import json
+import os
+from collections import deque
+
+from ...utils import log
+
+__all__ = ["SpanTracer", "merge_trace_parts"]
+
+
+class SpanTracer:
+    """
+    Record spans of a module instance in a process-local ring buffer, and dump them as Chrome trace events.
+
+    The latest `capacity` spans are kept, so tracing a long run costs bounded memory and no inter-process
+    communication until the buffer is flushed at stop.
+    """
+
+    def __init__(self, capacity: int = 100000):
+        self.spans = deque(maxlen=capacity)
+
+    def add(self, name: str, start: float, end: float, args: dict = None):
+        self.spans.append((name, start, end, args))
+
+    def flush(self, path: str, process_name: str):
+        """
+        Write the spans of this process to `path`, as a list of Chrome trace events.
+        """
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": process_name}}]
+        for name, start, end, args in self.spans:
+            event = {"name": name, "ph": "X", "pid": pid, "tid": 0, "ts": start * 1e6, "dur": (end - start) * 1e6}
+            if args:
+                event["args"] = args
+            events.append(event)
+
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(events, fp)
+
+
+def merge_trace_parts(trace_save_path: str):
+    """
+    Merge the trace parts flushed by every module instance into one Chrome trace file, which can be opened by
+    chrome://tracing or https://ui.perfetto.dev.
+    """
+    part_paths = sorted(glob.glob(f"{trace_save_path}.*.part"))
+    events = []
+    for path in part_paths:
+        with open(path, "r", encoding="utf-8") as fp:
+            events.extend(json.load(fp))
+        os.remove(path)
+
+    with open(trace_save_path, "w", encoding="utf-8") as fp:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+    log.info(f"save pipeline trace of {len(part_paths)} module instances to {trace_save_path}")
@@ -0,0 +1,436 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Union
+
+import cv2
+import numpy as np
+
+from ..data_process.utils import cv_utils, image_source, layout_utils
+from ..infer import LayoutPredictor, TaskType, TextClassifier, TextDetector, TextRecognizer
+from ..utils import log, safe_div, visual_utils
+from .datatype import TaskProfilingData
+from .framework.result_sink import RESULT_SINKS
+from .module.common.collect_node import RESULTS_SAVE_FILENAME
+
+
+class InprocPipeline:
+    """
+    Run the pipeline on a thread pool in the current process, as an alternative to ParallelPipeline without process
+    hops and pickling between nodes, for low latency of small requests.
+
+    Each image (or each batch of images for cls, rec and layout) is processed by one thread through all stages. The
+    pre/postprocess of different images run concurrently, and the calls of each model are serialized by a lock and
+    release the GIL, so the det postprocess of an image overlaps the det inference of the next one. It has the same
+    interface as ParallelPipeline.
+    """
+
+    CLS_THRESH = 0.9
+    REC_THRESH = 0.5
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.task_type = args.task_type
+        self.serving_mode = getattr(args, "serving_mode", False)
+        self.result_queue = queue.Queue()
+
+        self.text_detector = None
+        self.text_classifier = None
+        self.text_recognizer = None
+        self.layout_predictor = None
+        self.model_locks = defaultdict(threading.Lock)
+
+        self.executor = None
+        self.futures = []
+        self.lock = threading.Lock()
+        self.task_remaining = {}
+        self.task_results = defaultdict(dict)
+        self.task_stage_cost = defaultdict(list)
+        # results are written to the sink once finished, except in serving mode
+        self.result_sink = None
+        if not self.serving_mode:
+            self.result_sink = RESULT_SINKS[getattr(args, "result_sink", "txt")](
+                os.path.join(args.res_save_dir, os.path.splitext(RESULTS_SAVE_FILENAME[self.task_type])[0]),
+                getattr(args, "sink_flush_size", 256),
+            )
+        # results of finished tasks are put to the result queue, unless they are only written to the sink
+        self.return_results = getattr(args, "return_results", True)
+        self.stage_cost_total = defaultdict(float)
+        self.latency_list = []
+        self.image_total = 0
+        self.array_total = 0
+        self.start_time = 0.0
+
+    def start_pipeline(self):
+        """
+        load and warm up the models of all tasks in parallel, it blocks until all models are ready
+        """
+        infer_classes = {
+            "text_detector": (
+                TextDetector,
+                (TaskType.DET, TaskType.DET_REC, TaskType.DET_CLS_REC, TaskType.LAYOUT_DET_REC),
+            ),
+            "text_classifier": (TextClassifier, (TaskType.CLS, TaskType.DET_CLS_REC)),
+            "text_recognizer": (
+                TextRecognizer,
+                (TaskType.REC, TaskType.DET_REC, TaskType.DET_CLS_REC, TaskType.LAYOUT_DET_REC),
+            ),
+            "layout_predictor": (LayoutPredictor, (TaskType.LAYOUT, TaskType.LAYOUT_DET_REC)),
+        }
+
+        def _init(name, infer_class):
+            infer = infer_class(self.args)
+            infer.init(preprocess=True, model=True, postprocess=True)
+            setattr(self, name, infer)
+
+        with ThreadPoolExecutor(max_workers=len(infer_classes)) as executor:
+            futures = [
+                executor.submit(_init, name, infer_class)
+                for name, (infer_class, task_types) in infer_classes.items()
+                if self.task_type in task_types
+            ]
+            for future in futures:
+                future.result()
+
+        self.executor = ThreadPoolExecutor(max_workers=self.args.inproc_threads, thread_name_prefix="inproc_pipeline")
+        self.start_time = time.time()
+
+    def stop_pipeline(self):
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        self.executor.shutdown()
+        cost_time = time.time() - self.start_time
+
+        if self.result_sink:
+            self.result_sink.close()
+
+        if self.image_total > 0:
+            self.profiling()
+            latency_ms = np.array(self.latency_list) * 1000
+            perf_info = (
+                f"Number of images: {self.image_total}, "
+                f"total cost {cost_time:.2f}s, FPS: "
+                f"{safe_div(self.image_total, cost_time):.2f}, "
+                f"latency p50 {np.percentile(latency_ms, 50):.2f} ms, p99 {np.percentile(latency_ms, 99):.2f} ms"
+            )
+            print(perf_info)
+            log.info(perf_info)
+
+    def fetch_result(self):
+        try:
+            return self.result_queue.get(block=False)
+        except queue.Empty:
+            return None
+
+    def get_result(self, timeout=None):
+        """
+        block until a result is available, raise queue.Empty if no result in timeout seconds
+        """
+        return self.result_queue.get(block=True, timeout=timeout)
+
+    def infer_for_images(self, input_images_dir, task_id=0):
+        self.send_image(input_images_dir, task_id)
+
+    def infer_for_array(self, input_array, task_id=0):
+        self.send_array(input_array, task_id)
+
+    def send_image(self, images: Union[str, List[str]], task_id=0):
+        if isinstance(images, (tuple, list)):
+            source_items = list(images)
+        elif os.path.exists(images):
+            source_items = image_source.iter_source(images, getattr(self.args, "video_frame_step", 1))
+        else:
+            raise ValueError("images must be a image path, dir or list of image paths.")
+
+        # hold the task while its source is walked, so that it is not finished by the batches submitted so far
+        with self.lock:
+            self.task_remaining[task_id] = self.task_remaining.get(task_id, 0) + 1
+        for batch_items in image_source.batched(source_items, self._batch_num()):
+            # the source is read ahead of the processing by a bounded number of batches
+            self._wait_inflight(2 * self.args.inproc_threads)
+            self._submit([image_source.item_name(x) for x in batch_items], batch_items, task_id)
+        self._release(task_id, 1)
+
+    def send_array(self, images: Union[np.ndarray, List[np.ndarray]], task_id=0):
+        images = [images] if isinstance(images, np.ndarray) else list(images)
+        if not cv_utils.check_type_in_container(images, np.ndarray):
+            raise ValueError("unknown input data, images should be np.ndarray, or tuple&list contain np.ndarray")
+
+        image_names = []
+        for i, image in enumerate(images):
+            if self.args.input_array_save_dir:
+                image_name = os.path.join(self.args.input_array_save_dir, f"input_array_{self.array_total}.jpg")
+                cv_utils.img_write(image_name, image)
+            else:
+                image_name = str(i)
+            image_names.append(image_name)
+            self.array_total += 1
+        self._submit(image_names, images, task_id)
+
+    def _batch_num(self) -> int:
+        # det is run on a single image, the others are run on a batch of images
+        if self.task_type in (TaskType.CLS, TaskType.REC, TaskType.LAYOUT):
+            infer = self.text_classifier or self.text_recognizer or self.layout_predictor
+            return max(infer.gear_planner.bs_list)
+        return 1
+
+    def _wait_inflight(self, limit: int):
+        self.futures = [future for future in self.futures if not future.done()]
+        if len(self.futures) >= limit:
+            wait(self.futures, return_when=FIRST_COMPLETED)
+
+    def _submit(self, image_names: List[str], images: List, task_id):
+        if not images:
+            return
+        batch_num = self._batch_num()
+        with self.lock:
+            self.task_remaining[task_id] = self.task_remaining.get(task_id, 0) + len(images)
+        self.futures = [future for future in self.futures if not future.done()]
+        for i in range(0, len(images), batch_num):
+            future = self.executor.submit(
+                self._process, image_names[i : i + batch_num], images[i : i + batch_num], task_id, time.time()
+            )
+            self.futures.append(future)
+
+    def _timed(self, stage_cost: Dict[str, float], name: str, func, *args):
+        start = time.time()
+        output = func(*args)
+        stage_cost[name] = stage_cost.get(name, 0.0) + time.time() - start
+        return output
+
+    def _model_infer(self, stage_cost: Dict[str, float], name: str, infer, data):
+        # the model of each task is called by one thread at a time
+        with self.model_locks[name]:
+            return self._timed(stage_cost, name, infer.model_infer, data)
+
+    def _process(self, image_names: List[str], images: List, task_id, submit_time: float):
+        stage_cost, results = {}, {}
+        try:
+            for names, frames in self._decode_batches(image_names, images, stage_cost):
+                batch_results = self._infer(frames, names, stage_cost)
+                for image_name, image in zip(names, frames):
+                    self._vis_results(image_name, image, batch_results[image_name])
+                results.update(batch_results)
+        except Exception as error:
+            # the other images of the task are still finished, the failed ones are missing in the task result
+            log.error(f"inference of {', '.join(image_names)} failed: {error}")
+        self._finish(image_names, results, stage_cost, task_id, submit_time)
+
+    def _decode_batches(self, image_names: List[str], images: List, stage_cost: Dict[str, float]):
+        """
+        Yield the decoded images in batches of the model. An item of source may be decoded to several images, e.g. a
+        segment of video, each batch is inferred once decoded to keep the memory bounded.
+        """
+        batch_num = self._batch_num()
+        names, frames = [], []
+        for image_name, image in self._decode(image_names, images, stage_cost):
+            names.append(image_name)
+            frames.append(image)
+            if len(frames) == batch_num:
+                yield names, frames
+                names, frames = [], []
+        if frames:
+            yield names, frames
+
+    def _decode(self, image_names: List[str], images: List, stage_cost: Dict[str, float]):
+        for image_name, image in zip(image_names, images):
+            if isinstance(image, np.ndarray):
+                yield image_name, image
+                continue
+            decoded = image_source.iter_images(image)
+            while True:
+                try:
+                    output = self._timed(stage_cost, "DecodeNode", next, decoded)
+                except StopIteration:
+                    break
+                except ValueError:
+                    log.info(f"{image_name} is unavailable and skipped")
+                    break
+                yield output
+
+    def _infer(self, frames: List[np.ndarray], names: List[str], stage_cost: Dict[str, float]) -> Dict:
+        if self.task_type in (TaskType.DET, TaskType.DET_REC, TaskType.DET_CLS_REC):
+            return {names[0]: self._infer_det_pipeline(frames[0], stage_cost)}  # bs=1 for det
+        if self.task_type == TaskType.CLS:
+            angles, scores = self._infer_cls(frames, stage_cost)
+            return {name: (angle, score) for name, angle, score in zip(names, angles, scores)}
+        if self.task_type == TaskType.REC:
+            texts, _ = self._infer_rec(frames, stage_cost)
+            return dict(zip(names, texts))
+        if self.task_type == TaskType.LAYOUT:
+            return self._infer_layout(frames, names, stage_cost)
+        if self.task_type == TaskType.LAYOUT_DET_REC:
+            return self._infer_document(frames, names, stage_cost)
+        raise NotImplementedError("Task type do not support.")
+
+    def _infer_det_pipeline(self, image: np.ndarray, stage_cost: Dict[str, float]) -> List:
+        detector = self.text_detector
+        data = self._timed(stage_cost, "DetPreNode", detector.preprocess, image)
+        pred = self._model_infer(stage_cost, "DetInferNode", detector, data)
+        boxes = self._timed(stage_cost, "DetPostNode", detector.postprocess, pred, data["shape_list"])
+        boxes = [box.tolist() for box in boxes]
+        if self.task_type == TaskType.DET or not boxes:
+            return boxes
+
+        sub_images = cv_utils.crop_boxes_from_image(image, np.array(boxes))
+        if self.task_type == TaskType.DET_CLS_REC:
+            angles, scores = self._infer_cls(sub_images, stage_cost)
+            for i, (angle, score) in enumerate(zip(angles, scores)):
+                if "180" == angle and score > self.CLS_THRESH:
+                    sub_images[i] = cv2.rotate(sub_images[i], cv2.ROTATE_180)
+
+        texts, confs = self._infer_rec(sub_images, stage_cost)
+        results = []
+        for box, text, conf in zip(boxes, texts, confs):
+            if conf > self.REC_THRESH:
+                result = {"transcription": text, "points": box}
+                if self.args.result_contain_score:
+                    result["score"] = str(conf)
+                results.append(result)
+        return results
+
+    def _infer_cls(self, images: List[np.ndarray], stage_cost: Dict[str, float]):
+        classifier = self.text_classifier
+        split_bs, split_data = self._timed(stage_cost, "ClsPreNode", classifier.preprocess, images)
+        angles, scores = [], []
+        for batch, data in zip(split_bs, split_data):
+            pred = self._model_infer(stage_cost, "ClsInferNode", classifier, data)
+            output = self._timed(stage_cost, "ClsInferNode", classifier.postprocess, pred, batch)
+            angles.extend(output["angles"])
+            scores.extend(np.array(output["scores"]).tolist())
+        return angles, scores
+
+    def _infer_rec(self, images: List[np.ndarray], stage_cost: Dict[str, float]):
+        recognizer = self.text_recognizer
+        order = recognizer.get_sorted_indices(images)
+        split_bs, split_data = self._timed(stage_cost, "RecPreNode", recognizer.preprocess, [images[i] for i in order])
+        texts, confs = [], []
+        for batch, data in zip(split_bs, split_data):
+            pred = self._model_infer(stage_cost, "RecInferNode", recognizer, data)
+            output = self._timed(stage_cost, "RecPostNode", recognizer.postprocess, pred, batch)
+            texts.extend(output["texts"])
+            confs.extend(output["confs"])
+
+        # restore the input order
+        inverse = np.argsort(order)
+        return [texts[i] for i in inverse], [confs[i] for i in inverse]
+
+    def _infer_layout(self, images: List[np.ndarray], names: List[str], stage_cost: Dict[str, float]) -> Dict:
+        predictor = self.layout_predictor
+        split_bs, split_data = self._timed(stage_cost, "LayoutPreNode", predictor.preprocess, images)
+        results = {name: [] for name in names}
+        start = 0
+        for batch, data in zip(split_bs, split_data):
+            pred = self._model_infer(stage_cost, "LayoutInferNode", predictor, data)
+            net_inputs = data["net_inputs"]
+            output = self._timed(
+                stage_cost,
+                "LayoutPostNode",
+                predictor.postprocess,
+                pred[0],
+                net_inputs[0].shape,
+                names[start : start + batch],
+                net_inputs[2],
+                net_inputs[3],
+                net_inputs[4],
+            )
+            for result in output:
+                results[result.pop("image_id")].append(result)
+            start += batch
+        return results
+
+    def _infer_document(self, images: List[np.ndarray], names: List[str], stage_cost: Dict[str, float]) -> Dict:
+        """
+        Run det+rec on the crop of each text region of layout, the regions of each page are in reading order.
+        """
+        layout_results = self._infer_layout(images, names, stage_cost)
+        score_thresh = getattr(self.args, "layout_score_thresh", 0.5)
+        results = {}
+        for name, image in zip(names, images):
+            regions = layout_utils.build_regions(layout_results[name], score_thresh)
+            regions = layout_utils.sort_regions(regions, cv_utils.get_hw_of_img(image)[1])
+            for region in regions:
+                texts = []
+                if region["type"] in layout_utils.OCR_CATEGORIES:
+                    crop, offset = layout_utils.crop_region(image, region["bbox"])
+                    if crop is not None:
+                        texts = self._infer_det_pipeline(crop, stage_cost)
+                    for text in texts:
+                        text["points"] = (np.array(text["points"]).reshape(-1, 2) + offset).tolist()
+                region["bbox"] = [round(x, 3) for x in region["bbox"]]
+                region["texts"] = layout_utils.sort_lines(texts)
+            results[name] = regions
+        return results
+
+    def _vis_results(self, image_name: str, image: np.ndarray, result: List):
+        if not (self.args.crop_save_dir or self.args.vis_pipeline_save_dir or self.args.vis_det_save_dir):
+            return
+        filename = os.path.splitext(os.path.basename(image_name))[0]
+        # crops and det visualizations of arrays are saved only if input_array_save_dir is set, like CollectNode
+        is_file = os.path.isfile(image_name)
+
+        if self.args.crop_save_dir and is_file:
+            box_list = [np.array(x["points"]).reshape(-1, 2) for x in result]
+            for i, crop in enumerate(visual_utils.vis_crop(image, box_list)):
+                cv_utils.img_write(os.path.join(self.args.crop_save_dir, f"{filename}_crop_{i}.jpg"), crop)
+
+        if self.args.vis_pipeline_save_dir:
+            box_list = [np.array(x["points"]).reshape(-1, 2) for x in result]
+            text_list = [x["transcription"] for x in result]
+            box_text = visual_utils.vis_bbox_text(image, box_list, text_list, font_path=self.args.vis_font_path)
+            cv_utils.img_write(os.path.join(self.args.vis_pipeline_save_dir, f"{filename}.jpg"), box_text)
+
+        if self.args.vis_det_save_dir and is_file:
+            box_list = [np.array(x).reshape(-1, 2) for x in result]
+            box_line = visual_utils.vis_bbox(image, box_list, [255, 255, 0], 2)
+            cv_utils.img_write(os.path.join(self.args.vis_det_save_dir, f"{filename}.jpg"), box_line)
+
+    def _finish(self, image_names: List[str], results: Dict, stage_cost: Dict[str, float], task_id, submit_time):
+        latency = time.time() - submit_time
+        with self.lock:
+            if self.return_results:
+                self.task_results[task_id].update(results)
+            if self.serving_mode:
+                self.task_stage_cost[task_id].append(stage_cost)
+            if self.result_sink:
+                for image_name, result in results.items():
+                    self.result_sink.write(image_name, result)
+            for name, cost in stage_cost.items():
+                self.stage_cost_total[name] += cost
+            self.latency_list.extend([latency] * len(results))
+            self.image_total += len(results)
+            for image_name in results:
+                log.info(f"{image_name} is finished.")
+
+        self._release(task_id, len(image_names))
+
+    def _release(self, task_id, count: int):
+        """
+        Release count items of the task, and put the result of the task once all its items are released.
+        """
+        with self.lock:
+            self.task_remaining[task_id] -= count
+            if self.task_remaining[task_id]:
+                return
+            self.task_remaining.pop(task_id)
+            task_result = self.task_results.pop(task_id, {})
+            task_stage_cost = self.task_stage_cost.pop(task_id, [])
+
+        if self.serving_mode:
+            self.result_queue.put(TaskProfilingData(taskid=task_id, stage_cost=task_stage_cost))
+        if self.return_results:
+            self.result_queue.put({task_id: task_result})
+
+    def profiling(self):
+        e2e_cost_time_per_image = 0
+        for name, cost in self.stage_cost_total.items():
+            process_avg = safe_div(cost * 1000, self.image_total)
+            e2e_cost_time_per_image += process_avg
+            log.info(f"{name} cost total {cost:.2f} s, process avg cost {process_avg:.2f} ms")
+            log.info("----------------------------------------------------")
+        log.info(f"e2e cost time per image {e2e_cost_time_per_image}ms")
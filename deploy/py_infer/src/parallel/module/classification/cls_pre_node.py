@@ -37,6 +37,7 @@ class ClsPreNode(ModuleBase):
         # len(images) <= cls_batch_num, so len(split_data) == 1
         send_data = copy.copy(input_data)
         send_data.data = split_data[0]
+        self.record_batch_fill(send_data, len(images))
 
         self.send_to_next_module(send_data)
 
@@ -47,12 +48,17 @@ class ClsPreNode(ModuleBase):
 
         split_sub_images = gear_utils.split_by_size(sub_images, split_sub_bs)
         split_sub_results = gear_utils.split_by_size(sub_results, split_sub_bs)
+        split_sub_index = gear_utils.split_by_size(input_data.sub_image_index, split_sub_bs)
 
-        for split_image, split_data, split_result in zip(split_sub_images, split_sub_data, split_sub_results):
+        for split_image, split_data, split_result, split_index in zip(
+            split_sub_images, split_sub_data, split_sub_results, split_sub_index
+        ):
             send_data = copy.copy(input_data)
             send_data.sub_image_size = len(split_image)
             send_data.sub_image_list = split_image
             send_data.infer_result = split_result
+            send_data.sub_image_index = split_index
             send_data.data = split_data
+            self.record_batch_fill(send_data, len(split_image))
 
             self.send_to_next_module(send_data)
@@ -1,15 +1,16 @@
 import os
 from collections import defaultdict
 from ctypes import c_uint64
-from multiprocessing import Manager
+from multiprocessing import Value
 
 import numpy as np
 
-from ....data_process.utils import cv_utils
+from ....data_process.utils import cv_utils, layout_utils
 from ....infer import TaskType
-from ....utils import log, safe_list_writer, visual_utils
-from ...datatype import ProcessData, ProfilingData, StopData
-from ...framework import ModuleBase
+from ....utils import log, visual_utils
+from ...datatype import ProcessData, ProfilingData, StopData, TaskProfilingData
+from ...framework.module_base import ModuleBase
+from ...framework.result_sink import RESULT_SINKS, VisWorkerPool
 
 RESULTS_SAVE_FILENAME = {
     TaskType.DET: "det_results.txt",
@@ -18,6 +19,7 @@ RESULTS_SAVE_FILENAME = {
     TaskType.DET_REC: "pipeline_results.txt",
     TaskType.DET_CLS_REC: "pipeline_results.txt",
     TaskType.LAYOUT: "layout_results.txt",
+    TaskType.LAYOUT_DET_REC: "document_results.txt",
 }
 
 
@@ -26,11 +28,32 @@ class CollectNode(ModuleBase):
         super().__init__(args, msg_queue)
         self.image_sub_remaining = defaultdict(defaultdict)
         self.image_pipeline_res = defaultdict(defaultdict)
+        self.image_sub_index = defaultdict(lambda: defaultdict(list))
+        # regions of pages in layout+det+rec, {"remaining": number of unfinished regions, "regions": {index: region}}
+        self.page_regions = defaultdict(dict)
         self.infer_size = defaultdict(int)
-        self.image_total = Manager().Value(c_uint64, 0)
+        self.image_total = Value(c_uint64, 0, lock=False)
         self.task_type = args.task_type
         self.res_save_dir = args.res_save_dir
         self.save_filename = RESULTS_SAVE_FILENAME[self.task_type]
+        # in serving mode, send the profiling data of each task before its result, and release finished tasks
+        self.serving_mode = getattr(args, "serving_mode", False)
+        self.task_profiling = defaultdict(TaskProfilingData)
+        # number of images of the tasks of streaming source, known at the end of each task
+        self.task_images_total = {}
+        # number of images counted for each task but not decoded, reported by DecodeNode
+        self.task_images_undecoded = defaultdict(int)
+        # the result of each image is written to the sink once finished, except in serving mode
+        self.result_sink = None
+        if not self.serving_mode:
+            self.result_sink = RESULT_SINKS[getattr(args, "result_sink", "txt")](
+                os.path.join(self.res_save_dir, os.path.splitext(self.save_filename)[0]),
+                getattr(args, "sink_flush_size", 256),
+            )
+        # results of finished tasks are sent to the result queue, unless they are only written to the sink
+        self.return_results = getattr(args, "return_results", True)
+        # created in the process of the instance at the first visualization
+        self.vis_pool = None
 
     def init_self_args(self):
         super().init_self_args()
@@ -38,11 +61,11 @@ class CollectNode(ModuleBase):
     def _collect_stop(self, input_data):
         self.image_total.value = input_data.image_total
 
-    def _vis_results(self, image_name, image, taskid, data_type):
+    def _vis_results(self, image_name, image, result, data_type):
         if self.args.crop_save_dir and (data_type == 0 or (data_type == 1 and self.args.input_array_save_dir)):
             basename = os.path.basename(image_name)
             filename = os.path.join(self.args.crop_save_dir, os.path.splitext(basename)[0])
-            box_list = [np.array(x["points"]).reshape(-1, 2) for x in self.image_pipeline_res[taskid][image_name]]
+            box_list = [np.array(x["points"]).reshape(-1, 2) for x in result]
             crop_list = visual_utils.vis_crop(image, box_list)
             for i, crop in enumerate(crop_list):
                 cv_utils.img_write(filename + "_crop_" + str(i) + ".jpg", crop)
@@ -50,34 +73,57 @@ class CollectNode(ModuleBase):
         if self.args.vis_pipeline_save_dir:
             basename = os.path.basename(image_name)
             filename = os.path.join(self.args.vis_pipeline_save_dir, os.path.splitext(basename)[0])
-            box_list = [np.array(x["points"]).reshape(-1, 2) for x in self.image_pipeline_res[taskid][image_name]]
-            text_list = [x["transcription"] for x in self.image_pipeline_res[taskid][image_name]]
+            box_list = [np.array(x["points"]).reshape(-1, 2) for x in result]
+            text_list = [x["transcription"] for x in result]
             box_text = visual_utils.vis_bbox_text(image, box_list, text_list, font_path=self.args.vis_font_path)
             cv_utils.img_write(filename + ".jpg", box_text)
 
         if self.args.vis_det_save_dir and (data_type == 0 or (data_type == 1 and self.args.input_array_save_dir)):
             basename = os.path.basename(image_name)
             filename = os.path.join(self.args.vis_det_save_dir, os.path.splitext(basename)[0])
-            box_list = [np.array(x).reshape(-1, 2) for x in self.image_pipeline_res[taskid][image_name]]
+            box_list = [np.array(x).reshape(-1, 2) for x in result]
             box_line = visual_utils.vis_bbox(image, box_list, [255, 255, 0], 2)
             cv_utils.img_write(filename + ".jpg", box_line)
 
         log.info(f"{image_name} is finished.")
 
-    def final_text_save(self):
-        rst_dict = dict()
-        for rst in self.image_pipeline_res.values():
-            rst_dict.update(rst)
-        save_filename = os.path.join(self.res_save_dir, self.save_filename)
-        safe_list_writer(rst_dict, save_filename)
-        log.info(f"save infer result to {save_filename} successfully")
+    def _finish_image(self, taskid, image_path, frame, data_type):
+        """
+        Write the result of a finished image to the sink, and visualize it on the vis workers. The result is released
+        at once if the results of tasks are not returned.
+        """
+        self.infer_size[taskid] += 1
+        self._restore_sub_order(taskid, image_path)
+        result = self.image_pipeline_res[taskid][image_path]
+        if frame is not None:
+            if self.vis_pool is None:
+                self.vis_pool = VisWorkerPool(getattr(self.args, "vis_workers", 2))
+            self.vis_pool.submit(self._vis_results, image_path, frame, result, data_type)
+        if self.result_sink:
+            self.result_sink.write(image_path, result)
+        if not self.return_results:
+            self.image_pipeline_res[taskid].pop(image_path)
+
+    def close_sinks(self):
+        if self.vis_pool:
+            self.vis_pool.close()
+            self.vis_pool = None
+        if self.result_sink:
+            self.result_sink.close()
+            self.result_sink = None
+
+    def finalize(self):
+        # flush the results written so far, if the pipeline stops before all images are finished
+        self.close_sinks()
 
     def _collect_results(self, input_data: ProcessData):
         taskid = input_data.taskid
         if self.task_type in (TaskType.DET_REC, TaskType.DET_CLS_REC):
             image_path = input_data.image_path[0]  # bs=1
-            for result in input_data.infer_result:
+            sub_image_index = input_data.sub_image_index or range(len(input_data.infer_result))
+            for result, index in zip(input_data.infer_result, sub_image_index):
                 if result[-1] > 0.5:
+                    self.image_sub_index[taskid][image_path].append(index)
                     if self.args.result_contain_score:
                         self.image_pipeline_res[taskid][image_path].append(
                             {"transcription": result[-2], "points": result[:-2], "score": str(result[-1])}
@@ -94,6 +140,9 @@ class CollectNode(ModuleBase):
         elif self.task_type in (TaskType.REC, TaskType.CLS):
             for image_path, infer_result in zip(input_data.image_path, input_data.infer_result):
                 self.image_pipeline_res[taskid][image_path] = infer_result
+        elif self.task_type == TaskType.LAYOUT_DET_REC:
+            self._collect_region(input_data)
+            return
         elif self.task_type == TaskType.LAYOUT:
             for infer_result in input_data.infer_result:
                 image_path = infer_result.pop("image_id")
@@ -106,43 +155,141 @@ class CollectNode(ModuleBase):
 
         self._update_remaining(input_data)
 
+    def _collect_region(self, input_data: ProcessData):
+        """
+        Collect the text lines of a region in layout+det+rec, lines are mapped back to the page by the offset of the
+        crop. A page is finished once all its regions are finished, with the regions in reading order.
+        """
+        taskid = input_data.taskid
+        image_path = input_data.image_path[0]  # bs=1
+        region = input_data.layout_region
+        page = self.page_regions[taskid].setdefault(
+            image_path, {"remaining": region["total"] if region else 0, "regions": {}}
+        )
+        if region:
+            index = region["index"]
+            if index not in page["regions"]:
+                page["regions"][index] = {
+                    "type": region["type"],
+                    "bbox": [round(x, 3) for x in region["bbox"]],
+                    "score": region["score"],
+                    "texts": [],
+                }
+            texts = page["regions"][index]["texts"]
+            for result in input_data.infer_result:
+                if result[-1] > 0.5:
+                    points = (np.array(result[:-2]).reshape(-1, 2) + region["offset"]).tolist()
+                    text = {"transcription": result[-2], "points": points}
+                    if self.args.result_contain_score:
+                        text["score"] = str(result[-1])
+                    texts.append(text)
+
+            # a region is finished once all its sub images are recognized
+            key = (image_path, index)
+            remaining = self.image_sub_remaining[taskid].get(key, input_data.sub_image_total)
+            remaining -= input_data.sub_image_size
+            if remaining:
+                self.image_sub_remaining[taskid][key] = remaining
+                return
+            self.image_sub_remaining[taskid].pop(key, None)
+            page["regions"][index]["texts"] = layout_utils.sort_lines(texts)
+            page["remaining"] -= 1
+            if page["remaining"]:
+                return
+
+        self.page_regions[taskid].pop(image_path)
+        self.image_pipeline_res[taskid][image_path] = [page["regions"][i] for i in sorted(page["regions"])]
+        self._finish_image(taskid, image_path, None, input_data.data_type)
+
+    def _restore_sub_order(self, taskid, image_path):
+        """
+        Sub images may be recognized out of order, e.g. sorted by aspect ratio or in different batches.
+        Restore the detection order of the results of an image once it is finished.
+        """
+        sub_image_index = self.image_sub_index[taskid].pop(image_path, None)
+        if sub_image_index:
+            results = self.image_pipeline_res[taskid][image_path]
+            order = sorted(range(len(results)), key=lambda i: sub_image_index[i])
+            self.image_pipeline_res[taskid][image_path] = [results[i] for i in order]
+
     def _update_remaining(self, input_data: ProcessData):
         taskid = input_data.taskid
         data_type = input_data.data_type
+        # frames are kept by the previous nodes only for visualization
+        frame_list = input_data.frame or [None] * len(input_data.image_path)
         if self.task_type in (TaskType.DET_REC, TaskType.DET_CLS_REC):  # with sub image
             for idx, image_path in enumerate(input_data.image_path):
                 if image_path in self.image_sub_remaining[taskid]:
                     self.image_sub_remaining[taskid][image_path] -= input_data.sub_image_size
                     if not self.image_sub_remaining[taskid][image_path]:
                         self.image_sub_remaining[taskid].pop(image_path)
-                        self.infer_size[taskid] += 1
-                        self._vis_results(
-                            image_path, input_data.frame[idx], taskid, data_type
-                        ) if input_data.frame else ...
+                        self._finish_image(taskid, image_path, frame_list[idx], data_type)
                 else:
                     remaining = input_data.sub_image_total - input_data.sub_image_size
                     if remaining:
                         self.image_sub_remaining[taskid][image_path] = remaining
                     else:
-                        self.infer_size[taskid] += 1
-                        self._vis_results(
-                            image_path, input_data.frame[idx], taskid, data_type
-                        ) if input_data.frame else ...
+                        self._finish_image(taskid, image_path, frame_list[idx], data_type)
         else:  # without sub image
             for idx, image_path in enumerate(input_data.image_path):
-                self.infer_size[taskid] += 1
-                self._vis_results(image_path, input_data.frame[idx], taskid, data_type) if input_data.frame else ...
+                self._finish_image(taskid, image_path, frame_list[idx], data_type)
 
-    def process(self, input_data):
-        if isinstance(input_data, ProcessData):
-            taskid = input_data.taskid
-            if input_data.taskid not in self.image_sub_remaining.keys():
-                self.image_sub_remaining[input_data.taskid] = defaultdict(int)
-            if input_data.taskid not in self.image_pipeline_res.keys():
-                self.image_pipeline_res[input_data.taskid] = defaultdict(list)
+    def _collect_profiling(self, input_data: ProcessData, batch_data: ProcessData):
+        profiling = self.task_profiling[input_data.taskid]
+        profiling.taskid = input_data.taskid
+        # stages after the aggregation of a batch are recorded in the batch, not in its items
+        profiling.stage_cost.append({**input_data.stage_cost, **batch_data.stage_cost})
+        # the fill of an aggregated batch is counted once, for the task of its first item
+        if batch_data is input_data or input_data is batch_data.batch_items[0]:
+            for name, fill in {**input_data.batch_fill, **batch_data.batch_fill}.items():
+                profiling.batch_fill.setdefault(name, []).append(fill)
+
+    def _release_task(self, taskid):
+        for task_dict in (
+            self.image_sub_remaining,
+            self.image_pipeline_res,
+            self.image_sub_index,
+            self.page_regions,
+            self.task_profiling,
+            self.task_images_total,
+            self.task_images_undecoded,
+        ):
+            task_dict.pop(taskid, None)
+
+    def _process_single(self, input_data: ProcessData, batch_data: ProcessData):
+        taskid = input_data.taskid
+        if input_data.taskid not in self.image_sub_remaining.keys():
+            self.image_sub_remaining[input_data.taskid] = defaultdict(int)
+        if input_data.taskid not in self.image_pipeline_res.keys():
+            self.image_pipeline_res[input_data.taskid] = defaultdict(list)
+        if input_data.task_end:
+            self.task_images_total[taskid] = input_data.task_images_num
+        elif input_data.images_undecoded:
+            self.task_images_undecoded[taskid] += input_data.images_undecoded
+        else:
+            if self.serving_mode:
+                self._collect_profiling(input_data, batch_data)
             self._collect_results(input_data)
-            if self.infer_size[taskid] == input_data.task_images_num:
+        if taskid in self.task_images_total:
+            images_total = self.task_images_total[taskid]
+        else:
+            # the number of images of a task of streaming source is unknown until its end is received
+            images_total = input_data.task_images_num or None
+        if images_total is not None:
+            images_total -= self.task_images_undecoded[taskid]
+        if self.infer_size[taskid] == images_total:
+            if self.serving_mode:
+                self.send_to_next_module(self.task_profiling[taskid])
+            if self.return_results:
                 self.send_to_next_module({taskid: self.image_pipeline_res[taskid]})
+            # results of the task have been written to the sink
+            self._release_task(taskid)
+
+    def process(self, input_data):
+        if isinstance(input_data, ProcessData):
+            # a batch aggregated across images carries the data of each image (and task) in batch_items
+            for item in input_data.batch_items or [input_data]:
+                self._process_single(item, input_data)
 
         elif isinstance(input_data, StopData):
             self._collect_stop(input_data)
@@ -153,7 +300,7 @@ class CollectNode(ModuleBase):
 
         infer_size_sum = sum(self.infer_size.values())
         if self.image_total.value and infer_size_sum == self.image_total.value:
-            self.final_text_save()
+            self.close_sinks()
             self.stop_manager.value = True
 
     def stop(self):
@@ -1,6 +1,8 @@
-from ....data_process.utils import cv_utils
+import copy
+
+from ....data_process.utils import image_source
 from ....utils import log
-from ...datatype import StopData
+from ...datatype import ProcessData, StopData
 from ...framework import ModuleBase
 
 
@@ -28,15 +30,47 @@ class DecodeNode(ModuleBase):
             self.avail_image_total += len(input_data.frame)
             self.send_to_next_module(input_data)
         else:
-            img_read, img_path_read = [], []
-            for image_path in input_data.image_path:
-                try:
-                    img_read.append(cv_utils.img_read(image_path))
+            self.decode_source_items(input_data)
+
+    def decode_source_items(self, input_data):
+        """
+        Decode the items of input data. An item may be decoded to several images, e.g. a segment of video, the images
+        are sent in batches of the input size once decoded, so that the memory held by the node is bounded.
+        The images counted for the task but not decoded are reported to CollectNode, for the task to be finished.
+        """
+        source_items = input_data.source_items or input_data.image_path
+        batch_size = len(source_items)
+        img_read, img_path_read = [], []
+        images_undecoded = 0
+        for item in source_items:
+            images_undecoded += image_source.count_images(item)
+            try:
+                for image_path, image in image_source.iter_images(item):
+                    images_undecoded -= 1
+                    img_read.append(image)
                     img_path_read.append(image_path)
-                    self.avail_image_total += 1
-                except ValueError:
-                    log.info(f"{image_path} is unavailable and skipped")
-                    continue
-            input_data.frame = img_read
-            input_data.image_path = img_path_read
-            self.send_to_next_module(input_data)
+                    if len(img_read) == batch_size:
+                        self._send_images(input_data, img_read, img_path_read)
+                        img_read, img_path_read = [], []
+            except ValueError:
+                log.info(f"{image_source.item_name(item)} is unavailable and skipped")
+                continue
+        if img_read:
+            self._send_images(input_data, img_read, img_path_read)
+        if images_undecoded:
+            self.send_to_next_module(
+                ProcessData(
+                    skip=True,
+                    taskid=input_data.taskid,
+                    task_images_num=input_data.task_images_num,
+                    images_undecoded=images_undecoded,
+                )
+            )
+
+    def _send_images(self, input_data, img_read, img_path_read):
+        send_data = copy.copy(input_data)
+        send_data.frame = img_read
+        send_data.image_path = img_path_read
+        send_data.source_items = []
+        self.avail_image_total += len(img_read)
+        self.send_to_next_module(send_data)
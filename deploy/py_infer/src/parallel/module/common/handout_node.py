@@ -3,7 +3,7 @@ import os
 import cv2
 import numpy as np
 
-from ....data_process.utils import cv_utils
+from ....data_process.utils import cv_utils, image_source
 from ....utils import log
 from ...datatype import ProcessData, StopData, StopSign
 from ...framework.module_base import ModuleBase
@@ -21,6 +21,9 @@ class HandoutNode(ModuleBase):
         if isinstance(input_mix_data, StopSign):
             data = self.process_stop_sign()
             self.send_to_next_module(data)
+        elif isinstance(input_mix_data, ProcessData):
+            # built by the sender, e.g. the end of a task of streaming source
+            self.send_to_next_module(input_mix_data)
         elif isinstance(input_mix_data, np.ndarray):
             input_data, info_data = input_mix_data
             data = self.process_image_array([input_data])
@@ -32,15 +35,16 @@ class HandoutNode(ModuleBase):
             input_data, info_data = input_mix_data
             if len(input_data) == 0:
                 return
-            if cv_utils.check_type_in_container(input_data, str):
+            if cv_utils.check_type_in_container(input_data, image_source.SOURCE_ITEM_TYPES):
                 data = self.process_image_path(input_data)
                 data.data_type = 0
             elif cv_utils.check_type_in_container(input_data, np.ndarray):
-                data = self.process_image_array(input_data)
+                data = self.process_image_array(input_data, info_data[2] if len(info_data) > 2 else 0)
                 data.data_type = 1
             else:
                 raise ValueError(
-                    "unknown input data, input_data should be StopSign, or tuple&list contains str or np.ndarray"
+                    "unknown input data, input_data should be StopSign, or tuple&list contains str, items of "
+                    "streaming source or np.ndarray"
                 )
             data.task_images_num = info_data[0]
             data.taskid = info_data[1]
@@ -48,18 +52,20 @@ class HandoutNode(ModuleBase):
         else:
             raise ValueError(f"unknown input data: {type(input_mix_data)}")
 
-    def process_image_path(self, image_path_list):
+    def process_image_path(self, source_items):
         """
-        image_folder: List[str], path to images
+        source_items: List[str] of path to images, or items of streaming source, which are decoded in DecodeNode
         """
+        image_path_list = [image_source.item_name(x) for x in source_items]
         log.info(f"sending {', '.join([os.path.basename(x) for x in image_path_list])} to pipleine")
-        data = ProcessData(image_path=image_path_list)
-        self.image_total += len(image_path_list)
+        data = ProcessData(image_path=image_path_list, source_items=list(source_items))
+        self.image_total += sum(image_source.count_images(x) for x in source_items)
         return data
 
-    def process_image_array(self, image_array_list):
+    def process_image_array(self, image_array_list, offset=0):
         """
         image_array_list: List[np.ndarray], array of images
+        offset: index of the first image of image_array_list in its task, the arrays are named by their index
         """
         frames = []
         array_save_path = []
@@ -78,7 +84,7 @@ class HandoutNode(ModuleBase):
                 log.info(f"sending array(saved at {image_path}) to pipleine")
                 array_save_path.append(image_path)
             else:
-                array_save_path.append(str(i))
+                array_save_path.append(str(offset + i))
             frames.append(image_array_list[i])
 
             self.image_total += 1
@@ -30,16 +30,13 @@ class DetPostNode(ModuleBase):
 
         input_data.infer_result = infer_res_list
 
-        if self.task_type in (TaskType.DET_REC, TaskType.DET_CLS_REC):
+        if self.task_type in (TaskType.DET_REC, TaskType.DET_CLS_REC, TaskType.LAYOUT_DET_REC):
             input_data.sub_image_total = len(infer_res_list)
             input_data.sub_image_size = len(infer_res_list)
 
             image = input_data.frame[0]  # bs=1 for det
-            sub_image_list = []
-            for box in infer_res_list:
-                sub_image = cv_utils.crop_box_from_image(image, np.array(box))
-                sub_image_list.append(sub_image)
-            input_data.sub_image_list = sub_image_list
+            input_data.sub_image_list = cv_utils.crop_boxes_from_image(image, np.array(infer_res_list))
+            input_data.sub_image_index = list(range(len(infer_res_list)))
 
         input_data.data = None
 
@@ -1,4 +1,7 @@
-from ....infer import LayoutPredictor
+import copy
+
+from ....data_process.utils import cv_utils, layout_utils
+from ....infer import LayoutPredictor, TaskType
 from ...framework import ModuleBase
 
 
@@ -24,6 +27,44 @@ class LayoutPostNode(ModuleBase):
         output = self.layout_predictor.postprocess(
             data["pred"][0], data["img_shape"], data["image_ids"], data["hw_ori"], data["hw_scale"], data["pad"]
         )
-        input_data.infer_result = output
         input_data.data = None
-        self.send_to_next_module(input_data)
+        if self.task_type == TaskType.LAYOUT_DET_REC:
+            self.send_regions(input_data, output)
+        else:
+            input_data.infer_result = output
+            self.send_to_next_module(input_data)
+
+    def send_regions(self, input_data, output):
+        """
+        Fan out the regions of each page in reading order, the crop of each text region is sent to det+rec, and the
+        other regions are sent with skip. A page without region is sent once with skip, to be finished in CollectNode.
+        """
+        score_thresh = getattr(self.args, "layout_score_thresh", 0.5)
+        for image_path, image in zip(input_data.image_path, input_data.frame):
+            page_results = [x for x in output if x["image_id"] == image_path]
+            regions = layout_utils.build_regions(page_results, score_thresh)
+            regions = layout_utils.sort_regions(regions, cv_utils.get_hw_of_img(image)[1])
+            for index, region in enumerate(regions):
+                crop, offset = None, [0, 0]
+                if region["type"] in layout_utils.OCR_CATEGORIES:
+                    crop, offset = layout_utils.crop_region(image, region["bbox"])
+                self.send_to_next_module(
+                    self._region_data(
+                        input_data,
+                        image_path,
+                        crop,
+                        {**region, "index": index, "total": len(regions), "offset": offset},
+                    )
+                )
+            if not regions:
+                self.send_to_next_module(self._region_data(input_data, image_path, None, None))
+
+    @staticmethod
+    def _region_data(input_data, image_path, crop, region):
+        region_data = copy.copy(input_data)
+        region_data.image_path = [image_path]
+        region_data.frame = [crop] if crop is not None else []
+        region_data.skip = crop is None
+        region_data.infer_result = []
+        region_data.layout_region = region
+        return region_data
@@ -1,5 +1,6 @@
-from ....infer import LayoutPredictor
-from ...datatype import ProcessData
+import copy
+
+from ....infer import LayoutPredictor, TaskType
 from ...framework import ModuleBase
 
 
@@ -27,9 +28,10 @@ class LayoutPreNode(ModuleBase):
         images = input_data.frame
         _, split_data = self.layout_predictor.preprocess(images)
 
-        send_data = ProcessData(
-            data=split_data[0],
-            image_path=input_data.image_path,
-        )
+        send_data = copy.copy(input_data)
+        send_data.data = split_data[0]
+        # the pages are kept for cropping the regions in layout+det+rec
+        if self.task_type != TaskType.LAYOUT_DET_REC:
+            send_data.frame = []
 
         self.send_to_next_module(send_data)
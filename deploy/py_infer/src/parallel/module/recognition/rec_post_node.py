@@ -28,7 +28,9 @@ class RecPostNode(ModuleBase):
         else:
             texts = output["texts"]
             confs = output["confs"]
-            for result, text, conf in zip(input_data.infer_result, texts, confs):
+            # sub images aggregated from several images are routed back to the item of each image
+            infer_result = [result for item in input_data.batch_items for result in item.infer_result]
+            for result, text, conf in zip(infer_result or input_data.infer_result, texts, confs):
                 result.append(text)
                 result.append(conf)
 
@@ -1,7 +1,9 @@
 import copy
+import time
 
 from ....data_process.utils import gear_utils
 from ....infer import TaskType, TextRecognizer
+from ...datatype import ProcessData, StopData
 from ...framework import ModuleBase
 
 
@@ -10,12 +12,20 @@ class RecPreNode(ModuleBase):
         super(RecPreNode, self).__init__(args, msg_queue)
         self.text_recognizer = None
         self.task_type = self.args.task_type
+        # micro-batching of sub images across images, enabled if rec_batch_max_wait > 0
+        self.batch_max_wait = getattr(self.args, "rec_batch_max_wait", 0)
+        self.batch_max_size = 0
+        self.pending_items = []
+        self.pending_size = 0
+        self.pending_deadline = 0.0
 
     def init_self_args(self):
         self.text_recognizer = TextRecognizer(self.args)
         self.text_recognizer.init(preprocess=True, model=False, postprocess=False)
         super().init_self_args()
-        return self.text_recognizer.get_params()
+        params = self.text_recognizer.get_params()
+        self.batch_max_size = max(params["rec_batch_num"])
+        return params
 
     def process(self, input_data):
         """
@@ -23,35 +33,132 @@ class RecPreNode(ModuleBase):
         If use dynamic model, the batch size will be the size of whole sub images list
         """
         if input_data.skip:
+            # flush before the stop sign, so that no sub image is left behind. The other skipped data, i.e. images
+            # without text and the ends of tasks, pass the pending sub images, since CollectNode does not rely on
+            # their order, and draining a partial batch for each of them would defeat the aggregation.
+            if isinstance(input_data, StopData):
+                self.flush_pending()
             self.send_to_next_module(input_data)
+            self.idle_process()
             return
 
         if self.task_type == TaskType.REC:
             self.process_with_single_rec(input_data)
+        elif self.batch_max_wait > 0:
+            self.aggregate_with_det_rec(input_data)
         else:
             self.process_with_det_rec(input_data)
 
+    def idle_process(self):
+        if self.pending_items and time.time() >= self.pending_deadline:
+            self.flush_pending()
+
     def process_with_single_rec(self, input_data):
         images = input_data.frame
         _, split_data = self.text_recognizer.preprocess(images)
 
         send_data = copy.copy(input_data)
         send_data.data = split_data[0]
+        self.record_batch_fill(send_data, len(images))
 
         self.send_to_next_module(send_data)
 
+    def sort_sub_images(self, input_data):
+        """
+        Sort the sub images by aspect ratio, so that each batch is padded to the width of similar sub images.
+        The index of each sub image is carried along, for CollectNode to restore the detection order.
+        """
+        order = self.text_recognizer.get_sorted_indices(input_data.sub_image_list)
+        sub_index = input_data.sub_image_index or list(range(len(order)))
+        sub_images = [input_data.sub_image_list[i] for i in order]
+        sub_results = [input_data.infer_result[i] for i in order]
+        sub_index = [sub_index[i] for i in order]
+        return sub_images, sub_results, sub_index
+
     def process_with_det_rec(self, input_data):
-        sub_images = input_data.sub_image_list
-        sub_results = input_data.infer_result
+        sub_images, sub_results, sub_index = self.sort_sub_images(input_data)
 
         split_sub_bs, split_sub_data = self.text_recognizer.preprocess(sub_images)
 
         split_sub_images = gear_utils.split_by_size(sub_images, split_sub_bs)
         split_sub_results = gear_utils.split_by_size(sub_results, split_sub_bs)
+        split_sub_index = gear_utils.split_by_size(sub_index, split_sub_bs)
 
-        for split_image, split_data, split_result in zip(split_sub_images, split_sub_data, split_sub_results):
+        for split_image, split_data, split_result, split_index in zip(
+            split_sub_images, split_sub_data, split_sub_results, split_sub_index
+        ):
             send_data = copy.copy(input_data)
             send_data.sub_image_size = len(split_image)
             send_data.infer_result = split_result
+            send_data.sub_image_index = split_index
             send_data.data = split_data
+            self.record_batch_fill(send_data, len(split_image))
+            self.send_to_next_module(send_data)
+
+    def aggregate_with_det_rec(self, input_data):
+        """
+        Gather the sub images of several images until the largest batch size of the rec model is filled or
+        `rec_batch_max_wait` seconds passed since the first pending sub image, so that the rec model runs on
+        full batches instead of padding the few sub images of each image.
+        """
+        sub_images, sub_results, sub_index = self.sort_sub_images(input_data)
+        start = 0
+        while start < len(sub_images):
+            size = min(self.batch_max_size - self.pending_size, len(sub_images) - start)
+            item = copy.copy(input_data)
+            item.sub_image_list = sub_images[start : start + size]
+            item.infer_result = sub_results[start : start + size]
+            item.sub_image_index = sub_index[start : start + size]
+            item.sub_image_size = size
+            if not self.pending_items:
+                self.pending_deadline = time.time() + self.batch_max_wait
+            self.pending_items.append(item)
+            self.pending_size += size
+            start += size
+            if self.pending_size >= self.batch_max_size:
+                self.flush_pending()
+
+        self.idle_process()
+
+    def flush_pending(self):
+        if not self.pending_items:
+            return
+        items, self.pending_items, self.pending_size = self.pending_items, [], 0
+
+        sub_images = [sub_image for item in items for sub_image in item.sub_image_list]
+        split_sub_bs, split_sub_data = self.text_recognizer.preprocess(sub_images)
+
+        # the rec model may split the aggregated sub images into several gear batches,
+        # items are regrouped accordingly and an item crossing two batches is split in two
+        for batch_size, split_data in zip(split_sub_bs, split_sub_data):
+            batch_items = []
+            remaining = batch_size
+            while remaining:
+                item = items[0]
+                if item.sub_image_size <= remaining:
+                    batch_items.append(items.pop(0))
+                    remaining -= item.sub_image_size
+                else:
+                    head = copy.copy(item)
+                    head.sub_image_list = item.sub_image_list[:remaining]
+                    head.infer_result = item.infer_result[:remaining]
+                    head.sub_image_index = item.sub_image_index[:remaining]
+                    head.sub_image_size = remaining
+                    item.sub_image_list = item.sub_image_list[remaining:]
+                    item.infer_result = item.infer_result[remaining:]
+                    item.sub_image_index = item.sub_image_index[remaining:]
+                    item.sub_image_size -= remaining
+                    batch_items.append(head)
+                    remaining = 0
+
+            for item in batch_items:
+                item.sub_image_list = []
+                item.data = None
+            send_data = ProcessData(
+                image_path=[path for item in batch_items for path in item.image_path],
+                sub_image_size=batch_size,
+                data=split_data,
+                batch_items=batch_items,
+            )
+            self.record_batch_fill(send_data, batch_size)
             self.send_to_next_module(send_data)
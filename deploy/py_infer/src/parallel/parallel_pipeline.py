@@ -1,18 +1,23 @@
 import argparse
+import copy
+import itertools
 import os
+from typing import List, Union
 
 import numpy as np
 import tqdm
 
-from ..data_process.utils import cv_utils
+from ..data_process.utils import cv_utils, image_source
 from ..infer import TaskType
-from .framework import ParallelPipelineManager
+from ..utils import log
+from .datatype import ProcessData
+from .framework import ParallelPipelineManager, Topology, plan_module_counts, report_topology
 
 
 class ParallelPipeline:
-    def __init__(self, args: argparse.Namespace):
+    def __init__(self, args: argparse.Namespace, topology: Topology = None):
         self.args = args
-        self.pipeline_manager = ParallelPipelineManager(args)
+        self.pipeline_manager = ParallelPipelineManager(args, topology)
         self.input_queue = self.pipeline_manager.input_queue
         self.infer_params = {}
 
@@ -29,12 +34,15 @@ class ParallelPipeline:
     def fetch_result(self):
         return self.pipeline_manager.fetch_result()
 
-    def send_image(self, images: str, task_id=0):
+    def get_result(self, timeout=None):
+        return self.pipeline_manager.get_result(timeout)
+
+    def send_image(self, images: Union[str, List[str]], task_id=0):
         """
         send image to input queue for pipeline
         """
-        if not (os.path.isdir(images) or os.path.isfile(images)):
-            raise ValueError("images must be a image path or dir.")
+        if not (isinstance(images, (tuple, list)) or os.path.isdir(images) or os.path.isfile(images)):
+            raise ValueError("images must be a image path, dir or list of image paths.")
 
         # det, det(+cls)+rec
         batch_num = 1
@@ -48,18 +56,25 @@ class ParallelPipeline:
         self._send_batch_image(images, batch_num, task_id)
 
     def _send_batch_image(self, images, batch_num, task_id):
-        if os.path.isdir(images):
-            show_progressbar = not self.args.show_log
-            input_image_list = [os.path.join(images, path) for path in os.listdir(images) if not path.endswith(".txt")]
-            images_num = len(input_image_list)
-            for i in (
-                tqdm.tqdm(range(images_num), desc="send image to pipeline") if show_progressbar else range(images_num)
-            ):
-                if i % batch_num == 0:
-                    batch_images = input_image_list[i : i + batch_num]
-                    self.input_queue.put((batch_images, (images_num, task_id)), block=True)
+        show_progressbar = not self.args.show_log
+        if isinstance(images, (tuple, list)):
+            source_items = list(images)
+            items_total = len(source_items)
+            images_num = sum(image_source.count_images(x) for x in source_items)
         else:
-            self.input_queue.put([[images], (1, task_id)], block=True)
+            # a streaming source is walked while sending, the number of images is known once it is exhausted
+            source_items = image_source.iter_source(images, getattr(self.args, "video_frame_step", 1))
+            items_total, images_num = None, 0
+        if show_progressbar:
+            source_items = tqdm.tqdm(source_items, total=items_total, desc="send image to pipeline")
+
+        sent_num = 0
+        for batch_items in image_source.batched(source_items, batch_num):
+            self.input_queue.put((batch_items, (images_num, task_id)), block=True)
+            sent_num += sum(image_source.count_images(x) for x in batch_items)
+        if not images_num:
+            end_data = ProcessData(skip=True, task_end=True, taskid=task_id, task_images_num=sent_num)
+            self.input_queue.put(end_data, block=True)
 
     def infer_for_array(self, input_array, task_id=0):
         self.infer_params = dict(**self.pipeline_manager.module_params)
@@ -89,4 +104,37 @@ class ParallelPipeline:
         for i in tqdm.tqdm(range(images_num), desc="send image to pipeline") if show_progressbar else range(images_num):
             if i % batch_num == 0:
                 batch_images = images[i : i + batch_num]
-                self.input_queue.put([batch_images, (images_num, task_id)], block=True)
+                # the offset of the batch in the images, so that the arrays are named by their index in the task
+                self.input_queue.put([batch_images, (images_num, task_id, i)], block=True)
+
+
+def calibrate_topology(args: argparse.Namespace) -> Topology:
+    """
+    Run the pipeline with the default instance counts on the first calibration_images items of input_images_dir,
+    and allocate the instances of each module within core_budget by the measured process cost per image.
+    """
+    images = list(
+        itertools.islice(
+            image_source.iter_source(args.input_images_dir, getattr(args, "video_frame_step", 1)),
+            args.calibration_images,
+        )
+    )
+
+    calib_args = copy.copy(args)
+    calib_args.rebalance_interval = 0
+    for name in ("crop_save_dir", "vis_det_save_dir", "vis_pipeline_save_dir", "input_array_save_dir"):
+        setattr(calib_args, name, None)
+
+    log.info(f"Calibrating pipeline topology with {sum(image_source.count_images(x) for x in images)} images.")
+    pipeline = ParallelPipeline(calib_args)
+    pipeline.start_pipeline()
+    pipeline.infer_for_images(images, task_id=0)
+    pipeline.stop_pipeline()
+
+    stage_costs = dict(pipeline.pipeline_manager.profiling_result.get("stage_costs", {}))
+    if not stage_costs:
+        raise ValueError("Calibration of pipeline topology failed, no image is processed.")
+
+    topology = plan_module_counts(stage_costs, args.core_budget)
+    report_topology(topology, stage_costs)
+    return topology
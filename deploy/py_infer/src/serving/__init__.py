@@ -0,0 +1,12 @@
+from .http_server import OCRHttpServer
+from .metrics import ServingMetrics
+from .pipeline_service import PipelineNotReadyError, PipelineService, ServerBusyError, StubPipeline
+
+__all__ = [
+    "OCRHttpServer",
+    "ServingMetrics",
+    "PipelineService",
+    "ServerBusyError",
+    "PipelineNotReadyError",
+    "StubPipeline",
+]
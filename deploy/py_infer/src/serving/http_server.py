@@ -0,0 +1,233 @@
+import asyncio
+import base64
+import json
+import time
+from typing import Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+from ..utils import log
+from .metrics import ServingMetrics
+from .pipeline_service import PipelineNotReadyError, PipelineService, ServerBusyError
+
+__all__ = ["OCRHttpServer"]
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _to_jsonable(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+
+def decode_images(body: bytes, content_type: str) -> List[np.ndarray]:
+    """
+    Decode the images of a request. The body is either an encoded image(e.g. jpg, png), or a json like
+    {"images": [base64 of encoded image, ...]}.
+    """
+    if content_type.startswith("application/json"):
+        try:
+            encoded_list = [base64.b64decode(x) for x in json.loads(body)["images"]]
+        except (ValueError, KeyError, TypeError) as error:
+            raise HttpError(400, f"invalid json body: {error}")
+    else:
+        encoded_list = [body]
+
+    images = []
+    for i, encoded in enumerate(encoded_list):
+        image = cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise HttpError(400, f"image {i} of the request can not be decoded.")
+        images.append(image)
+    if not images:
+        raise HttpError(400, "no image in the request.")
+    return images
+
+
+class OCRHttpServer:
+    """
+    An asyncio HTTP/1.1 front-end serving several pipelines side by side.
+
+    Routes:
+        POST /v1/pipelines/{name}/infer: infer the images in the body, see `decode_images`.
+        GET /v1/pipelines: names, readiness and queue depth of pipelines.
+        GET /metrics: metrics in Prometheus text format.
+        GET /health: 200 if the server is serving.
+        GET /ready: 200 if all pipelines are warmed up and ready for traffic, otherwise 503.
+
+    The server listens while the pipelines load and warm up their models, requests to a pipeline which is not
+    ready yet are rejected with 503.
+
+    Args:
+        services: pipeline services keyed by name.
+        metrics: metrics shared by the pipeline services.
+        request_timeout: seconds to wait for the result of a request, 504 is returned after that.
+        max_body_size: max bytes of a request body.
+    """
+
+    def __init__(
+        self,
+        services: Dict[str, PipelineService],
+        metrics: ServingMetrics,
+        request_timeout: float = 30.0,
+        max_body_size: int = 64 * 1024 * 1024,
+    ):
+        self.services = services
+        self.metrics = metrics
+        self.request_timeout = request_timeout
+        self.max_body_size = max_body_size
+        self.server = None
+
+    async def start(self, host: str, port: int):
+        loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        log.info(f"server is listening on {host}:{port} with pipelines: {', '.join(self.services)}")
+        # start pipelines side by side in executor, since it blocks until all models are loaded and warmed up
+        await asyncio.gather(*[loop.run_in_executor(None, service.start, loop) for service in self.services.values()])
+        log.info("all pipelines are ready.")
+
+    async def serve_forever(self, host: str, port: int):
+        await self.start(host, port)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self.server:
+            self.server.close()
+        for service in self.services.values():
+            service.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                code, content_type, content = await self._dispatch(method, path, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, code, content_type, content, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HttpError as error:
+            self._write_response(writer, error.code, "application/json", self._error_body(error), False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "invalid request line.")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            raise HttpError(400, f"invalid content-length {headers['content-length']}.")
+        if length < 0:
+            raise HttpError(400, f"invalid content-length {length}.")
+        if length > self.max_body_size:
+            raise HttpError(413, f"request body exceeds {self.max_body_size} bytes.")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?")[0], headers, body
+
+    async def _dispatch(self, method: str, path: str, headers: Dict, body: bytes) -> Tuple[int, str, bytes]:
+        parts = [x for x in path.split("/") if x]
+        if parts == ["health"]:
+            return 200, "text/plain", b"ok"
+        if parts == ["ready"]:
+            content = {name: service.ready for name, service in self.services.items()}
+            code = 200 if all(content.values()) else 503
+            return code, "application/json", json.dumps(content).encode()
+        if parts == ["metrics"]:
+            return 200, "text/plain; version=0.0.4", self.metrics.render().encode()
+        if parts == ["v1", "pipelines"]:
+            content = {
+                name: {"ready": service.ready, "queue_depth": service.queue_depth}
+                for name, service in self.services.items()
+            }
+            return 200, "application/json", json.dumps(content).encode()
+        if len(parts) == 4 and parts[:2] == ["v1", "pipelines"] and parts[3] == "infer":
+            if method != "POST":
+                return 405, "application/json", self._error_body(HttpError(405, "only POST is allowed."))
+            return await self._infer(parts[2], headers, body)
+        return 404, "application/json", self._error_body(HttpError(404, f"unknown path {path}."))
+
+    async def _infer(self, name: str, headers: Dict, body: bytes) -> Tuple[int, str, bytes]:
+        if name not in self.services:
+            return 404, "application/json", self._error_body(HttpError(404, f"unknown pipeline {name}."))
+
+        start_time = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            images = await loop.run_in_executor(None, decode_images, body, headers.get("content-type", ""))
+            results = await self.services[name].infer(images, self.request_timeout)
+            code, content = 200, json.dumps({"results": results}, default=_to_jsonable).encode()
+        except HttpError as error:
+            code, content = error.code, self._error_body(error)
+        except ServerBusyError as error:
+            code, content = 429, self._error_body(HttpError(429, str(error)))
+        except PipelineNotReadyError as error:
+            code, content = 503, self._error_body(HttpError(503, str(error)))
+        except asyncio.TimeoutError:
+            code, content = 504, self._error_body(HttpError(504, f"no result in {self.request_timeout}s."))
+        except Exception as error:
+            log.error(f"infer failed for pipeline {name}: {error}")
+            code, content = 500, self._error_body(HttpError(500, str(error)))
+
+        self.metrics.requests.inc(name, str(code))
+        if code == 200:
+            self.metrics.request_latency.observe(name, value=time.time() - start_time)
+        return code, "application/json", content
+
+    @staticmethod
+    def _error_body(error: HttpError) -> bytes:
+        return json.dumps({"error": error.message}).encode()
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, code: int, content_type: str, content: bytes, keep_alive: bool):
+        header = (
+            f"HTTP/1.1 {code} {_REASONS.get(code, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(content)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(header.encode("latin-1") + content)
@@ -0,0 +1,144 @@
+import bisect
+import threading
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+__all__ = ["Counter", "Gauge", "Histogram", "ServingMetrics"]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+
+def _format_labels(label_names: Sequence[str], label_values: Tuple, extra: str = "") -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self.values = defaultdict(float)
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def _samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.label_names, labels)} {value}" for labels, value in items]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, *label_values, value: float):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count of each bucket, sum, count]
+        self.values = {}
+
+    def observe(self, *label_values, value: float):
+        with self.lock:
+            if label_values not in self.values:
+                self.values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            bucket_counts, _, _ = data = self.values[label_values]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                bucket_counts[index] += 1
+            data[1] += value
+            data[2] += 1
+
+    def _samples(self):
+        samples = []
+        with self.lock:
+            items = [(labels, (list(data[0]), data[1], data[2])) for labels, data in self.values.items()]
+        for labels, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, labels, f'le="{bound}"')
+                samples.append(f"{self.name}_bucket{le} {cumulative}")
+            le_inf = _format_labels(self.label_names, labels, 'le="+Inf"')
+            samples.append(f"{self.name}_bucket{le_inf} {count}")
+            samples.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            samples.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return samples
+
+
+class ServingMetrics:
+    """
+    Metrics of the inference server, rendered in Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.requests = Counter("ocr_requests_total", "Number of requests by response code.", ("pipeline", "code"))
+        self.queue_depth = Gauge("ocr_queue_depth", "Number of requests admitted and not finished.", ("pipeline",))
+        self.request_latency = Histogram(
+            "ocr_request_latency_seconds", "End-to-end latency of requests.", ("pipeline",)
+        )
+        self.stage_latency = Histogram(
+            "ocr_stage_latency_seconds", "Process latency of each pipeline stage.", ("pipeline", "stage")
+        )
+        self.batch_fill = Histogram(
+            "ocr_batch_fill_ratio",
+            "Ratio of valid samples in the batches fed to the model.",
+            ("pipeline", "stage"),
+            buckets=RATIO_BUCKETS,
+        )
+        self.pipeline_ready = Gauge(
+            "ocr_pipeline_ready", "1 if the models of the pipeline are loaded and warmed up.", ("pipeline",)
+        )
+        self.pipeline_startup = Gauge(
+            "ocr_pipeline_startup_seconds", "Seconds to load and warm up the models of the pipeline.", ("pipeline",)
+        )
+
+    def observe_task_profiling(self, pipeline: str, stage_cost: List[Dict[str, float]], batch_fill: Dict):
+        for costs in stage_cost:
+            for stage, cost in costs.items():
+                self.stage_latency.observe(pipeline, stage, value=cost)
+        for stage, fills in batch_fill.items():
+            for valid_size, batch_size in fills:
+                self.batch_fill.observe(pipeline, stage, value=valid_size / max(batch_size, 1))
+
+    def render(self) -> str:
+        lines = []
+        for metric in (
+            self.requests,
+            self.queue_depth,
+            self.request_latency,
+            self.stage_latency,
+            self.batch_fill,
+            self.pipeline_ready,
+            self.pipeline_startup,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,177 @@
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+import numpy as np
+
+from ..utils import log
+from .metrics import ServingMetrics
+
+__all__ = ["ServerBusyError", "PipelineNotReadyError", "PipelineService", "StubPipeline"]
+
+
+class ServerBusyError(Exception):
+    """
+    raised when the number of pending requests of a pipeline reaches the limit
+    """
+
+    pass
+
+
+class PipelineNotReadyError(Exception):
+    """
+    raised when a request comes before the pipeline finishes loading and warming up its models
+    """
+
+    pass
+
+
+class PipelineService:
+    """
+    Serve one pipeline for asyncio requests.
+
+    Each request gets a task id and a future. The results sent by CollectNode are read from the result queue of
+    the pipeline by a reader thread, which resolves the future of the task in the event loop, so no request polls
+    for its result.
+
+    Args:
+        name: pipeline name used in urls and metrics.
+        pipeline: ParallelPipeline started in serving mode, or StubPipeline.
+        metrics: metrics shared by all pipelines of the server.
+        max_queue_depth: max number of pending requests, more requests are rejected with ServerBusyError.
+    """
+
+    def __init__(self, name: str, pipeline, metrics: ServingMetrics, max_queue_depth: int = 64):
+        self.name = name
+        self.pipeline = pipeline
+        self.metrics = metrics
+        self.max_queue_depth = max_queue_depth
+        self.task_ids = itertools.count()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.loop = None
+        self.reader = None
+        self.stopped = False
+        # set after the models are loaded and warmed up on all gears
+        self.ready = False
+        self.metrics.pipeline_ready.set(self.name, value=0)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        start the pipeline, it blocks until the models of all nodes are loaded and warmed up
+        """
+        start_time = time.time()
+        self.loop = loop
+        self.pipeline.start_pipeline()
+        self.reader = threading.Thread(target=self._read_results, name=f"{self.name}-result-reader", daemon=True)
+        self.reader.start()
+        self.ready = True
+        startup_time = time.time() - start_time
+        self.metrics.pipeline_ready.set(self.name, value=1)
+        self.metrics.pipeline_startup.set(self.name, value=startup_time)
+        log.info(f"pipeline {self.name} is ready in {startup_time:.2f}s.")
+
+    def stop(self):
+        self.stopped = True
+        if self.reader:
+            self.reader.join()
+        self.pipeline.stop_pipeline()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.pending)
+
+    async def infer(self, images: List[np.ndarray], timeout: float):
+        """
+        infer a list of images, return the results in the same order
+        """
+        if not self.ready:
+            raise PipelineNotReadyError(f"pipeline {self.name} is warming up.")
+        if len(self.pending) >= self.max_queue_depth:
+            raise ServerBusyError(f"pipeline {self.name} has {len(self.pending)} pending requests.")
+
+        task_id = next(self.task_ids)
+        future = self.loop.create_future()
+        self.pending[task_id] = future
+        self.metrics.queue_depth.set(self.name, value=len(self.pending))
+        try:
+            # the input queue of the pipeline may block when it is full
+            await self.loop.run_in_executor(None, self.pipeline.infer_for_array, images, task_id)
+            result = await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(task_id, None)
+            self.metrics.queue_depth.set(self.name, value=len(self.pending))
+
+        # the keys are the indices of images in the request
+        return [result[key] for key in sorted(result, key=int)]
+
+    def _read_results(self):
+        while not self.stopped:
+            try:
+                rst = self.pipeline.get_result(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if isinstance(rst, dict):
+                for task_id, result in rst.items():
+                    self.loop.call_soon_threadsafe(self._set_result, task_id, result)
+            else:  # TaskProfilingData
+                self.metrics.observe_task_profiling(self.name, rst.stage_cost, rst.batch_fill)
+
+    def _set_result(self, task_id, result):
+        future = self.pending.get(task_id)
+        # the request may be timeout already
+        if future is not None and not future.done():
+            future.set_result(result)
+
+
+class StubPipeline:
+    """
+    A pipeline without models for testing the server locally. Every image gets one fake text box covering the whole
+    image after `latency` seconds, and images of a request are batched by `batch_num` in the profiling data. Starting
+    takes `startup_latency` seconds like loading and warming up models.
+    """
+
+    def __init__(self, latency: float = 0.01, batch_num: int = 8, startup_latency: float = 0.0):
+        self.latency = latency
+        self.startup_latency = startup_latency
+        self.batch_num = batch_num
+        self.result_queue = queue.Queue()
+        self.timers = []
+
+    def start_pipeline(self):
+        # loading and warming up of models
+        time.sleep(self.startup_latency)
+
+    def stop_pipeline(self):
+        for timer in self.timers:
+            timer.cancel()
+
+    def infer_for_array(self, images, task_id=0):
+        images = [images] if isinstance(images, np.ndarray) else images
+        timer = threading.Timer(self.latency, self._send_result, args=(images, task_id))
+        self.timers = [t for t in self.timers if t.is_alive()] + [timer]
+        timer.start()
+
+    def _send_result(self, images, task_id):
+        result = {}
+        for i, image in enumerate(images):
+            h, w = image.shape[:2]
+            result[str(i)] = [{"transcription": "stub", "points": [[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]]}]
+
+        batch_fill = [
+            (min(self.batch_num, len(images) - i), self.batch_num) for i in range(0, len(images), self.batch_num)
+        ]
+        profiling = SimpleNamespace(
+            taskid=task_id,
+            stage_cost=[{"StubNode": self.latency} for _ in images],
+            batch_fill={"StubNode": batch_fill},
+        )
+        self.result_queue.put(profiling)
+        self.result_queue.put({task_id: result})
+
+    def get_result(self, timeout=None):
+        return self.result_queue.get(block=True, timeout=timeout)
@@ -0,0 +1,24 @@
+# benchmark the multiprocess and inproc executors of infer.py on the same images,
+# each run prints "Number of images: ..., total cost ..., FPS: ..." and inproc also prints the latency p50/p99
+MODEL_PATH_DET="path/to/det/model"
+MODEL_CONFIG_DET="path/to/det/config"
+MODEL_PATH_REC="path/to/rec/model"
+MODEL_CONFIG_REC="path/to/rec/config"
+DICT_PATH="path/to/dict"
+INPUT_IMAGES_DIR="path/to/images"
+
+RES_SAVE_DIR=deploy/py_infer/test/temp
+
+for EXECUTOR in multiprocess inproc; do
+    echo "executor: $EXECUTOR"
+    python deploy/py_infer/infer.py \
+        --input_images_dir=$INPUT_IMAGES_DIR \
+        --det_model_path=$MODEL_PATH_DET \
+        --det_model_name_or_config=$MODEL_CONFIG_DET \
+        --rec_model_path=$MODEL_PATH_REC \
+        --rec_model_name_or_config=$MODEL_CONFIG_REC \
+        --character_dict_path=$DICT_PATH \
+        --res_save_dir=$RES_SAVE_DIR/$EXECUTOR \
+        --node_fetch_interval=0.001 \
+        --executor=$EXECUTOR
+done
@@ -83,6 +83,16 @@ python deploy/py_infer/example/ocr_infer_server.py \
     --node_fetch_interval=0.001 \
     --show_log=True
 
+### --------------- ocr_http_server --------------------
+# ocr_http_server, stub pipelines without models
+python deploy/py_infer/example/ocr_http_server.py --stub_pipelines=ocr,layout --port=8000 &
+SERVER_PID=$!
+sleep 2
+curl --data-binary @deploy/py_infer/example/dataset/det/example1.png http://127.0.0.1:8000/v1/pipelines/ocr/infer
+curl --data-binary @deploy/py_infer/example/dataset/det/example2.png http://127.0.0.1:8000/v1/pipelines/layout/infer
+curl http://127.0.0.1:8000/metrics
+kill $SERVER_PID
+
 ### --------------- infer --------------------
 
 # infer, det+cls+rec, thirdparty
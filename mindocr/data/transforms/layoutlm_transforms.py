@@ -114,10 +114,10 @@ class VQATokenLabelEncode:
         token_bboxes = []
         x1, y1, x2, y2 = bbox
         unit_w = (x2 - x1) / len(text)
-        for idx, word in enumerate(words):
+        for word, word_ids in zip(words, tokenizer.batch_tokenize_to_ids(words)):
             curr_w = len(word) * unit_w
             word_bbox = [x1, y1, x1 + curr_w, y2]
-            token_bboxes.extend([word_bbox] * len(tokenizer.tokenize(word)))
+            token_bboxes.extend([word_bbox] * len(word_ids))
             x1 += (len(word) + 1) * unit_w
         return token_bboxes
 
@@ -148,9 +148,7 @@ class VQATokenLabelEncode:
         for i in range(len(res) - 1):
             for j in range(i, 0, -1):
                 if abs(res[j + 1]["bbox"][1] - res[j]["bbox"][1]) < 20 and (res[j + 1]["bbox"][0] < res[j]["bbox"][0]):
-                    tmp = copy.deepcopy(res[j])
-                    res[j] = copy.deepcopy(res[j + 1])
-                    res[j + 1] = copy.deepcopy(tmp)
+                    res[j], res[j + 1] = res[j + 1], res[j]
                 else:
                     break
         return res
@@ -159,9 +157,9 @@ class VQATokenLabelEncode:
         # load bbox and label info
         ocr_info = self._load_ocr_info(data)
 
-        for idx in range(len(ocr_info)):
-            if "bbox" not in ocr_info[idx]:
-                ocr_info[idx]["bbox"] = self.trans_poly_to_bbox(ocr_info[idx]["points"])
+        for info in ocr_info:
+            if "bbox" not in info:
+                info["bbox"] = self.trans_poly_to_bbox(info["points"])
 
         if self.order_method == "tb-yx":
             ocr_info = self.order_by_tbyx(ocr_info)
@@ -173,8 +171,9 @@ class VQATokenLabelEncode:
 
         height, width, _ = data["image"].shape
 
-        words_list = []
-        bbox_list = []
+        # the boxes of the tokens, each box of a segment is repeated for its tokens
+        box_list = []
+        box_repeats = []
         input_ids_list = []
         token_type_ids_list = []
         segment_offset_id = []
@@ -188,47 +187,47 @@ class VQATokenLabelEncode:
             entity_id_to_index_map = {}
             empty_entity = set()
 
-        data["ocr_info"] = copy.deepcopy(ocr_info)
+        # the infos are not modified below
+        data["ocr_info"] = ocr_info
 
+        segments = []
         for info in ocr_info:
             text = info["transcription"]
             if len(text) <= 0:
                 continue
             if train_re:
                 # for re
-                if len(text) == 0:
-                    empty_entity.add(info["id"])
-                    continue
                 id2label[info["id"]] = info["label"]
                 relations.extend([tuple(sorted(link)) for link in info["linking"]])
-            # smooth_box
-            info["bbox"] = self.trans_poly_to_bbox(info["points"])
-
-            encode_res = self.tokenizer.encode(
-                text, pad_to_max_seq_len=False, return_attention_mask=True, return_token_type_ids=True
-            )
+            segments.append(info)
 
+        # tokenize all the segments of the page at once, the repeated texts are tokenized once
+        batch_ids = self.tokenizer.batch_tokenize_to_ids([info["transcription"] for info in segments])
+        for info, ids in zip(segments, batch_ids):
+            input_ids = self.tokenizer.build_inputs_with_special_tokens(ids)
+            token_type_ids = self.tokenizer.create_token_type_ids_from_sequences(ids)
             if not self.add_special_ids:
                 # TODO: use tok.all_special_ids to remove
-                encode_res["input_ids"] = encode_res["input_ids"][1:-1]
-                encode_res["token_type_ids"] = encode_res["token_type_ids"][1:-1]
-                encode_res["attention_mask"] = encode_res["attention_mask"][1:-1]
+                input_ids = input_ids[1:-1]
+                token_type_ids = token_type_ids[1:-1]
 
+            # smooth_box
+            bbox = self.trans_poly_to_bbox(info["points"])
             if self.use_textline_bbox_info:
-                bbox = [info["bbox"]] * len(encode_res["input_ids"])
+                boxes, repeats = [bbox], [len(input_ids)]
             else:
-                bbox = self.split_bbox(info["bbox"], info["transcription"], self.tokenizer)
-            if len(bbox) <= 0:
+                boxes = self.split_bbox(bbox, info["transcription"], self.tokenizer)
+                repeats = [1] * len(boxes)
+            if sum(repeats) <= 0:
                 continue
-            bbox = self._smooth_box(bbox, height, width)
             if self.add_special_ids:
-                bbox.insert(0, [0, 0, 0, 0])
-                bbox.append([0, 0, 0, 0])
+                boxes = [[0, 0, 0, 0]] + boxes + [[0, 0, 0, 0]]
+                repeats = [1] + repeats + [1]
 
             # parse label
             if not self.infer_mode:
                 label = info["label"]
-                gt_label = self._parse_label(label, encode_res)
+                gt_label = self._parse_label(label, len(input_ids))
 
             # construct entities for re
             if train_re:
@@ -238,7 +237,7 @@ class VQATokenLabelEncode:
                     entities.append(
                         {
                             "start": len(input_ids_list),
-                            "end": len(input_ids_list) + len(encode_res["input_ids"]),
+                            "end": len(input_ids_list) + len(input_ids),
                             "label": label.upper(),
                         }
                     )
@@ -246,23 +245,24 @@ class VQATokenLabelEncode:
                 entities.append(
                     {
                         "start": len(input_ids_list),
-                        "end": len(input_ids_list) + len(encode_res["input_ids"]),
+                        "end": len(input_ids_list) + len(input_ids),
                         "label": "O",
                     }
                 )
-            input_ids_list.extend(encode_res["input_ids"])
-            token_type_ids_list.extend(encode_res["token_type_ids"])
-            bbox_list.extend(bbox)
-            words_list.append(text)
+            input_ids_list.extend(input_ids)
+            token_type_ids_list.extend(token_type_ids)
+            box_list.extend(boxes)
+            box_repeats.extend(repeats)
             segment_offset_id.append(len(input_ids_list))
             if not self.infer_mode:
                 gt_label_list.extend(gt_label)
 
-        data["input_ids"] = input_ids_list
-        data["token_type_ids"] = token_type_ids_list
-        data["bbox"] = bbox_list
-        data["attention_mask"] = [1] * len(input_ids_list)
-        data["labels"] = gt_label_list
+        bbox = np.repeat(np.array(box_list, dtype=np.float64).reshape(-1, 4), box_repeats, axis=0)
+        data["input_ids"] = np.array(input_ids_list, dtype=np.int64)
+        data["token_type_ids"] = np.array(token_type_ids_list, dtype=np.int64)
+        data["bbox"] = self._smooth_box(bbox, height, width)
+        data["attention_mask"] = np.ones(len(input_ids_list), dtype=np.int64)
+        data["labels"] = np.array(gt_label_list, dtype=np.int64)
         data["segment_offset_id"] = segment_offset_id
         data["tokenizer_params"] = dict(
             padding_side=self.tokenizer.padding_side,
@@ -280,10 +280,10 @@ class VQATokenLabelEncode:
 
     @staticmethod
     def trans_poly_to_bbox(poly):
-        x1 = int(np.min([p[0] for p in poly]))
-        x2 = int(np.max([p[0] for p in poly]))
-        y1 = int(np.min([p[1] for p in poly]))
-        y2 = int(np.max([p[1] for p in poly]))
+        x1 = int(min(p[0] for p in poly))
+        x2 = int(max(p[0] for p in poly))
+        y1 = int(min(p[1] for p in poly))
+        y2 = int(max(p[1] for p in poly))
         return [x1, y1, x2, y2]
 
     def _load_ocr_info(self, data):
@@ -294,21 +294,20 @@ class VQATokenLabelEncode:
 
     @staticmethod
     def _smooth_box(bboxes, height, width):
-        bboxes = np.array(bboxes)
+        bboxes = np.array(bboxes, dtype=np.float64).reshape(-1, 4)
         bboxes[:, 0] = bboxes[:, 0] * 1000 / width
         bboxes[:, 2] = bboxes[:, 2] * 1000 / width
         bboxes[:, 1] = bboxes[:, 1] * 1000 / height
         bboxes[:, 3] = bboxes[:, 3] * 1000 / height
-        bboxes = bboxes.astype("int64").tolist()
-        return bboxes
+        return bboxes.astype(np.int64)
 
-    def _parse_label(self, label, encode_res):
+    def _parse_label(self, label, num_tokens):
         gt_label = []
         if label.lower() in ["other", "others", "ignore"]:
-            gt_label.extend([0] * len(encode_res["input_ids"]))
+            gt_label.extend([0] * num_tokens)
         else:
             gt_label.append(self.label2id_map[("b-" + label).upper()])
-            gt_label.extend([self.label2id_map[("i-" + label).upper()]] * (len(encode_res["input_ids"]) - 1))
+            gt_label.extend([self.label2id_map[("i-" + label).upper()]] * (num_tokens - 1))
         return gt_label
 
 
@@ -335,6 +334,13 @@ class VQATokenPad:
         self.pad_token_label_id = nn.CrossEntropyLoss().ignore_index
         self.infer_mode = infer_mode
 
+    @staticmethod
+    def _pad(values, difference, pad_value, padding_side):
+        """Pad the values of the tokens along the first dim."""
+        values = np.asarray(values, dtype=np.int64)
+        pad_width = [(0, difference) if padding_side == "right" else (difference, 0)] + [(0, 0)] * (values.ndim - 1)
+        return np.pad(values, pad_width, constant_values=pad_value)
+
     def __call__(self, data):
         needs_to_be_padded = self.pad_to_max_seq_len and len(data["input_ids"]) < self.max_seq_len
 
@@ -345,32 +351,24 @@ class VQATokenPad:
                 tokenizer_params = dict(padding_side="right", pad_token_type_id=0, pad_token_id=1)
 
             difference = self.max_seq_len - len(data["input_ids"])
-            if tokenizer_params["padding_side"] == "right":
+            padding_side = tokenizer_params["padding_side"]
+            if padding_side in ["right", "left"]:
                 if self.return_attention_mask:
-                    data["attention_mask"] = [1] * len(data["input_ids"]) + [0] * difference
-                if self.return_token_type_ids:
-                    data["token_type_ids"] = (
-                        data["token_type_ids"] + [tokenizer_params["pad_token_type_id"]] * difference
+                    data["attention_mask"] = self._pad(
+                        np.ones(len(data["input_ids"]), dtype=np.int64), difference, 0, padding_side
                     )
-                if self.return_special_tokens_mask:
-                    data["special_tokens_mask"] = data["special_tokens_mask"] + [1] * difference
-                data["input_ids"] = data["input_ids"] + [tokenizer_params["pad_token_id"]] * difference
-                if not self.infer_mode:
-                    data["labels"] = data["labels"] + [self.pad_token_label_id] * difference
-                data["bbox"] = data["bbox"] + [[0, 0, 0, 0]] * difference
-            elif tokenizer_params["padding_side"] == "left":
-                if self.return_attention_mask:
-                    data["attention_mask"] = [0] * difference + [1] * len(data["input_ids"])
                 if self.return_token_type_ids:
-                    data["token_type_ids"] = [tokenizer_params["pad_token_type_id"]] * difference + data[
-                        "token_type_ids"
-                    ]
+                    data["token_type_ids"] = self._pad(
+                        data["token_type_ids"], difference, tokenizer_params["pad_token_type_id"], padding_side
+                    )
                 if self.return_special_tokens_mask:
-                    data["special_tokens_mask"] = [1] * difference + data["special_tokens_mask"]
-                data["input_ids"] = [tokenizer_params["pad_token_id"]] * difference + data["input_ids"]
+                    data["special_tokens_mask"] = self._pad(data["special_tokens_mask"], difference, 1, padding_side)
+                data["input_ids"] = self._pad(
+                    data["input_ids"], difference, tokenizer_params["pad_token_id"], padding_side
+                )
                 if not self.infer_mode:
-                    data["labels"] = [self.pad_token_label_id] * difference + data["labels"]
-                data["bbox"] = [[0, 0, 0, 0]] * difference + data["bbox"]
+                    data["labels"] = self._pad(data["labels"], difference, self.pad_token_label_id, padding_side)
+                data["bbox"] = self._pad(np.reshape(data["bbox"], (-1, 4)), difference, 0, padding_side)
         else:
             if self.return_attention_mask:
                 data["attention_mask"] = [1] * len(data["input_ids"])
@@ -1,4 +1,5 @@
 import bisect
+import functools
 import io
 import itertools
 import logging
@@ -58,28 +59,41 @@ def _is_nonnormalized_numeric(char):
     return False
 
 
+def _build_normalize_table():
+    """Build the translation table of `normalize_chars` from the code point of each non-normalized character."""
+    table = {0xF979: "凉"}  # https://www.zhihu.com/question/20697984
+    for start, end in (
+            (0xFF00, 0xFFEF),
+            (0xFE50, 0xFE6B),
+            (0x3358, 0x33FF),
+            (0x249C, 0x24E9),
+            (0x3200, 0x32FF),
+            (0x2460, 0x249B),
+            (0x24EA, 0x24FF),
+            (0x2776, 0x2793),
+            (0x2160, 0x217F),
+    ):
+        for cp in range(start, end + 1):
+            char = chr(cp)
+            if _is_nonnormalized_char(char):
+                table[cp] = unicodedata.normalize("NFKC", char)
+            elif _is_nonnormalized_numeric(char):
+                table[cp] = " " + str(int(unicodedata.numeric(char))) + " "
+    return table
+
+
+_NORMALIZE_TABLE = _build_normalize_table()
+
+
 def normalize_chars(text):
     """
     Normalize the text for multiligual and chinese models. Unicode range:
     https://www.ling.upenn.edu/courses/Spring_2003/ling538/UnicodeRanges.html
     """
-    output = []
-    for char in text:
-        if _is_nonnormalized_char(char):
-            for c in unicodedata.normalize("NFKC", char):
-                output.append(c)
-        elif _is_nonnormalized_numeric(char):
-            output.append(" ")
-            for c in str(int(unicodedata.numeric(char))):
-                output.append(c)
-            output.append(" ")
-        elif ord(char) == 0xF979:  # https://www.zhihu.com/question/20697984
-            output.append("凉")
-        else:
-            output.append(char)
-    return "".join(output)
+    return text.translate(_NORMALIZE_TABLE)
 
 
+@functools.lru_cache(maxsize=None)
 def _is_control(char):
     """Checks whether `chars` is a control character."""
     # These are technically control characters but we count them as whitespace
@@ -92,6 +106,7 @@ def _is_control(char):
     return False
 
 
+@functools.lru_cache(maxsize=None)
 def _is_punctuation(char):
     """Checks whether `chars` is a punctuation character."""
     cp = ord(char)
@@ -107,6 +122,7 @@ def _is_punctuation(char):
     return False
 
 
+@functools.lru_cache(maxsize=None)
 def _is_whitespace(char):
     """
     Checks whether `chars` is a whitespace character.
@@ -142,6 +158,8 @@ class Trie:
 
     def __init__(self):
         self.data = {}
+        # matches the first characters of the words, compiled on the first split after adding words
+        self._first_chars_pattern = None
 
     def add(self, word: str):
         """
@@ -171,6 +189,7 @@ class Trie:
             ref[char] = char in ref and ref[char] or {}
             ref = ref[char]
         ref[""] = 1
+        self._first_chars_pattern = None
 
     def split(self, text: str) -> List[str]:
         """
@@ -193,6 +212,14 @@ class Trie:
         ["[CLS]", " This is a ", "extra_id_100"]
         ```
         """
+        if not text:
+            return []
+        # most texts contain no word of the trie, which is checked at once by the first characters of the words
+        if self._first_chars_pattern is None:
+            self._first_chars_pattern = re.compile("|".join(re.escape(char) for char in self.data) or "(?!)")
+        if not self._first_chars_pattern.search(text):
+            return [text]
+
         # indexes are counted left of the chars index.
         # "hello", index 0, is left of h, index 1 is between h and e.
         # index 5 is right of the "o".
@@ -394,6 +421,7 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
     added_tokens_decoder: Dict[int, str] = {}
     unique_no_split_tokens: List[str] = []
     tokens_trie = Trie()
+    tokenize_cache_size: int = 4096
 
     _decode_use_source_tokenizer = False
 
@@ -411,6 +439,7 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
         self.added_tokens_decoder: Dict[int, str] = {}
         self.unique_no_split_tokens: List[str] = []
         self.tokens_trie = Trie()
+        self._tokenize_cache = OrderedDict()
 
         self._decode_use_source_tokenizer = False
 
@@ -527,6 +556,8 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
             else:
                 trie.add(token)
         self.tokens_trie = trie
+        # the added tokens change the tokenization of the cached strings
+        self._tokenize_cache = OrderedDict()
 
     def prepare_for_tokenization(self, text, is_split_into_words=False, **kwargs):
         """
@@ -567,11 +598,6 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
         Returns:
             `List[str]`: The list of tokens.
         """
-        # Simple mapping string => AddedToken for special tokens with specific tokenization behaviors
-        all_special_tokens_extended = dict(
-            (str(t), t) for t in self.all_special_tokens_extended if isinstance(t, AddedToken)
-        )
-
         text, kwargs = self.prepare_for_tokenization(text, **kwargs)
 
         # TODO: should this be in the base class?
@@ -585,10 +611,16 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
 
         no_split_token = set(self.unique_no_split_tokens)
         tokens = self.tokens_trie.split(text)
+        all_special_tokens_extended = None
 
         # ["This is something", "<special_token_1>", "  else"]
         for i, token in enumerate(tokens):
             if token in no_split_token:
+                if all_special_tokens_extended is None:
+                    # Simple mapping string => AddedToken for special tokens with specific tokenization behaviors
+                    all_special_tokens_extended = dict(
+                        (str(t), t) for t in self.all_special_tokens_extended if isinstance(t, AddedToken)
+                    )
                 tok_extended = all_special_tokens_extended.get(token, None)
                 left = tokens[i - 1] if i > 0 else None
                 right = tokens[i + 1] if i < len(tokens) - 1 else None
@@ -619,6 +651,33 @@ class PretrainedTokenizer(PretrainedTokenizerBase):
         # ["This", " is", " something", "<special_token_1>", "else"]
         return tokenized_text
 
+    def batch_tokenize_to_ids(self, texts: List[str]) -> List[List[int]]:
+        """
+        Converts a batch of strings, e.g. all the text segments of a document page, in sequences of ids without the
+        special tokens. The ids of each string are memoized in a LRU cache of `tokenize_cache_size` strings, since
+        the same strings repeat heavily within and across the batches, e.g. the field names of forms.
+
+        Args:
+            texts (`List[str]`):
+                The sequences to be encoded.
+
+        Returns:
+            `List[List[int]]`: The ids of each sequence.
+        """
+        cache = self._tokenize_cache
+        batch_ids = []
+        for text in texts:
+            ids = cache.get(text)
+            if ids is None:
+                ids = self.convert_tokens_to_ids(self.tokenize(text))
+                cache[text] = ids
+                if len(cache) > self.tokenize_cache_size:
+                    cache.popitem(last=False)
+            else:
+                cache.move_to_end(text)
+            batch_ids.append(list(ids))
+        return batch_ids
+
     def _tokenize(self, text, **kwargs):
         """
         Converts a string in a sequence of tokens (string), using the tokenizer. Split in words for word-based
@@ -1,6 +1,12 @@
+from mindocr.nlp.generation.continuous_batching import ContinuousBatchingScheduler
+from mindocr.nlp.generation.speculative import DraftModelProposer, NGramProposer, SpeculativeDecoder
+from mindocr.nlp.generation.streamers import TextIteratorStreamer, TextStreamer
 from mindocr.nlp.generation.text_generator import GeneratorMixin
 
-from . import text_generator
+from . import continuous_batching, speculative, streamers, text_generator
 
 __all__ = []
 __all__.extend(text_generator.__all__)
+__all__.extend(continuous_batching.__all__)
+__all__.extend(speculative.__all__)
+__all__.extend(streamers.__all__)
@@ -100,21 +100,20 @@ class BeamSearchScorer(BeamScorer):
         self.num_beam_groups = num_beam_groups
         self.group_size = self.num_beams // self.num_beam_groups
 
-        self._is_init = False
-        # self._beam_hyps[i*self.num_beam_groups+j] is the beam_hyps of the j-th group in the i-th mini-batch.
-        # If group_beam_search is not used, the list consists of `batch_size` beam_hyps.
-        self._beam_hyps = [
-            BeamHypotheses(
-                num_beams=self.group_size,
-                length_penalty=self.length_penalty,
-                early_stopping=self.do_early_stopping,
-                max_length=max_length,
-            )
-            for _ in range(batch_size * self.num_beam_groups)
-        ]
+        self.batch_size = batch_size
+
+        # self._beam_hyps holds the n-best lists of all the mini-batches, its (i*self.num_beam_groups+j)-th list is the
+        # one of the j-th group in the i-th mini-batch. If group_beam_search is not used, there are `batch_size` lists.
+        self._beam_hyps = BeamHypotheses(
+            num_beams=self.group_size,
+            length_penalty=self.length_penalty,
+            early_stopping=self.do_early_stopping,
+            max_length=max_length,
+            batch_size=batch_size * self.num_beam_groups,
+        )
         # self._done[i*self.num_beam_groups+j] indicates whether the generation of the beam_hyps of the j-th group
         # in the i-th mini-batch is complete.
-        self._done = np.array([False for _ in range(batch_size * self.num_beam_groups)])
+        self._done = np.zeros(batch_size * self.num_beam_groups, dtype=np.bool_)
 
         if not isinstance(num_beams, int) or num_beams <= 1:
             raise ValueError(
@@ -143,7 +142,7 @@ class BeamSearchScorer(BeamScorer):
         beam_indices=None,
         group_index: Optional[int] = 0,
     ):
-        batch_size = len(self._beam_hyps) // self.num_beam_groups
+        batch_size = self.batch_size
 
         if not batch_size == (input_ids.shape[0] // self.group_size):
             if self.num_beam_groups > 1:
@@ -163,65 +162,72 @@ class BeamSearchScorer(BeamScorer):
         if isinstance(eos_token_id, int):
             eos_token_id = [eos_token_id]
 
-        for batch_idx in range(batch_size):
-            batch_group_idx = batch_idx * self.num_beam_groups + group_index
-            if self._done[batch_group_idx]:
-                if self.num_beams < len(self._beam_hyps[batch_group_idx]):
-                    raise ValueError(f"Batch can only be done if at least {self.num_beams} beams have been generated")
-                if eos_token_id is None or pad_token_id is None:
-                    raise ValueError("Generated beams >= num_beams -> eos_token_id and pad_token have to be defined")
-                # pad the batch
-                next_beam_scores[batch_idx, :] = 0
-                next_beam_tokens[batch_idx, :] = pad_token_id
-                next_beam_indices[batch_idx, :] = 0
-                continue
-
-            # next tokens for this sentence
-            beam_idx = 0
-            cur_len = np.min(np.where(input_ids[beam_idx] == pad_token_id))
-            for beam_token_rank, (next_token, next_score, next_index) in enumerate(
-                zip(next_tokens[batch_idx], next_scores[batch_idx], next_indices[batch_idx])
-            ):
-                batch_beam_idx = batch_idx * self.group_size + next_index
-                # add to generated hypotheses if end of sentence
-                if (eos_token_id is not None) and (next_token in eos_token_id):
-                    # if beam_token does not belong to top num_beams tokens, it should not be added
-                    is_beam_token_worse_than_top_num_beams = beam_token_rank >= self.group_size
-                    if is_beam_token_worse_than_top_num_beams:
-                        continue
-                    if beam_indices is not None:
-                        beam_index = beam_indices[batch_beam_idx]
-                        beam_index = beam_index + (batch_beam_idx,)
-                    else:
-                        beam_index = None
-
-                    self._beam_hyps[batch_group_idx].add(
-                        input_ids[batch_beam_idx].copy(),
-                        next_score,
-                        beam_indices=beam_index,
-                    )
-                else:
-                    # add next predicted token since it is not eos_token
-                    next_beam_scores[batch_idx, beam_idx] = next_score
-                    next_beam_tokens[batch_idx, beam_idx] = next_token
-                    next_beam_indices[batch_idx, beam_idx] = batch_beam_idx
-                    beam_idx += 1
-
-                # once the beam for next step is full, don't add more tokens to it.
-                if beam_idx == self.group_size:
-                    break
-
-            if beam_idx < self.group_size:
-                raise ValueError(
-                    f"At most {self.group_size} tokens in {next_tokens[batch_idx]} can be equal to `eos_token_id:"
-                    f" {eos_token_id}`. Make sure {next_tokens[batch_idx]} are corrected."
-                )
+        batch_group_idx = np.arange(batch_size) * self.num_beam_groups + group_index
+        done = self._done[batch_group_idx]
+        if done.any():
+            if np.any(self._beam_hyps.num_hyps[batch_group_idx[done]] > self.num_beams):
+                raise ValueError(f"Batch can only be done if at least {self.num_beams} beams have been generated")
+            if eos_token_id is None or pad_token_id is None:
+                raise ValueError("Generated beams >= num_beams -> eos_token_id and pad_token have to be defined")
+            # pad the finished batches
+            next_beam_tokens[done] = pad_token_id
+        not_done = np.flatnonzero(~done)
+        if not_done.size == 0:
+            return UserDict(
+                {
+                    "next_beam_scores": next_beam_scores.flatten(),
+                    "next_beam_tokens": next_beam_tokens.flatten(),
+                    "next_beam_indices": next_beam_indices.flatten(),
+                }
+            )
 
-            # Check if we are done so that we can save a pad step if all(done)
-            self._done[batch_group_idx] = self._done[batch_group_idx] or self._beam_hyps[batch_group_idx].is_done(
-                next_scores[batch_idx].max(), cur_len
+        cur_len = np.min(np.where(input_ids[0] == pad_token_id))
+        next_scores = next_scores[not_done]
+        next_tokens = next_tokens[not_done]
+        batch_beam_idx = (not_done * self.group_size)[:, None] + next_indices[not_done]
+        if eos_token_id is None:
+            is_eos = np.zeros(next_tokens.shape, dtype=np.bool_)
+        elif len(eos_token_id) == 1:
+            is_eos = next_tokens == eos_token_id[0]
+        else:
+            is_eos = np.isin(next_tokens, eos_token_id)
+
+        # add the end of sentences to the generated hypotheses in the order of their ranks, those that do not belong
+        # to the top num_beams tokens are not added
+        is_eos_hyp = is_eos[:, : self.group_size]
+        for beam_token_rank in np.flatnonzero(is_eos_hyp.any(axis=0)):
+            rows = np.flatnonzero(is_eos_hyp[:, beam_token_rank])
+            beam_idx = batch_beam_idx[rows, beam_token_rank]
+            if beam_indices is not None:
+                beam_index = [beam_indices[idx] + (idx,) for idx in beam_idx]
+            else:
+                beam_index = None
+            self._beam_hyps.add(
+                batch_group_idx[not_done[rows]],
+                input_ids[beam_idx],
+                next_scores[rows, beam_token_rank],
+                beam_indices=beam_index,
             )
 
+        # the next beams are the top num_beams tokens that are not eos_token
+        is_invalid = is_eos.sum(axis=-1) > self.group_size
+        if is_invalid.any():
+            row = np.argmax(is_invalid)
+            raise ValueError(
+                f"At most {self.group_size} tokens in {next_tokens[row]} can be equal to `eos_token_id:"
+                f" {eos_token_id}`. Make sure {next_tokens[row]} are corrected."
+            )
+        beam_token_rank = np.argsort(is_eos, axis=-1, kind="stable")[:, : self.group_size]
+        beam_token_rank += (np.arange(not_done.size) * next_tokens.shape[-1])[:, None]
+        next_beam_scores[not_done] = next_scores.reshape(-1)[beam_token_rank]
+        next_beam_tokens[not_done] = next_tokens.reshape(-1)[beam_token_rank]
+        next_beam_indices[not_done] = batch_beam_idx.reshape(-1)[beam_token_rank]
+
+        # Check if we are done so that we can save a pad step if all(done)
+        self._done[batch_group_idx[not_done]] = self._beam_hyps.is_done(
+            batch_group_idx[not_done], next_scores.max(axis=-1), cur_len
+        )
+
         return UserDict(
             {
                 "next_beam_scores": next_beam_scores.flatten(),
@@ -239,57 +245,49 @@ class BeamSearchScorer(BeamScorer):
         eos_token_id: Optional[Union[int, List[int]]] = None,
         beam_indices=None,
     ):
-        batch_size = len(self._beam_hyps) // self.num_beam_groups
+        batch_size = self.batch_size
+        beam_hyps = self._beam_hyps
 
         if isinstance(eos_token_id, int):
             eos_token_id = [eos_token_id]
 
         # finalize all open beam hypotheses and add to generated hypotheses
-        for batch_group_idx, beam_hyp in enumerate(self._beam_hyps):
-            if self._done[batch_group_idx]:
-                continue
-
-            # all open beam hypotheses are added to the beam hypothesis
-            # beam hypothesis class automatically keeps the best beams
+        # beam hypothesis class automatically keeps the best beams
+        not_done = np.flatnonzero(~self._done)
+        if not_done.size:
             for index_per_group in range(self.group_size):
-                batch_beam_idx = batch_group_idx * self.group_size + index_per_group
-                final_score = final_beam_scores[batch_beam_idx].item()
-                final_tokens = input_ids[batch_beam_idx]
-                beam_index = beam_indices[batch_beam_idx] if beam_indices is not None else None
-                beam_hyp.add(final_tokens, final_score, beam_indices=beam_index)
-
-        # select the best hypotheses
-        sent_lengths = np.zeros(batch_size * self.num_beam_hyps_to_keep, dtype=np.int32)
-        best = []
-        best_indices = []
-        best_scores = np.zeros(batch_size * self.num_beam_hyps_to_keep, dtype=np.float32)
-
-        # retrieve best hypotheses
-        for i in range(batch_size):
-            beam_hyps_in_batch = self._beam_hyps[i * self.num_beam_groups : (i + 1) * self.num_beam_groups]
-            candidate_beams = [beam for beam_hyp in beam_hyps_in_batch for beam in beam_hyp.beams]
-            sorted_hyps = sorted(candidate_beams, key=lambda x: x[0])
-            for j in range(self.num_beam_hyps_to_keep):
-                best_hyp_tuple = sorted_hyps.pop()
-                best_score = best_hyp_tuple[0]
-                best_hyp = best_hyp_tuple[1]
-                best_index = best_hyp_tuple[2]
-                sent_lengths[self.num_beam_hyps_to_keep * i + j] = len(best_hyp)
-
-                # append hyp to lists
-                best.append(best_hyp)
-
-                # append indices to list
-                best_indices.append(best_index)
-
-                best_scores[i * self.num_beam_hyps_to_keep + j] = best_score
+                batch_beam_idx = not_done * self.group_size + index_per_group
+                beam_index = [beam_indices[idx] for idx in batch_beam_idx] if beam_indices is not None else None
+                beam_hyps.add(
+                    not_done,
+                    input_ids[batch_beam_idx],
+                    final_beam_scores[batch_beam_idx],
+                    beam_indices=beam_index,
+                )
+
+        # select the best hypotheses of each mini-batch among the ones of its groups, the hypotheses with equal scores
+        # are ranked by the order they are kept in
+        num_candidates = self.num_beam_groups * beam_hyps.capacity
+        scores = beam_hyps.scores.reshape(batch_size, num_candidates)
+        is_valid = (np.arange(beam_hyps.capacity) < beam_hyps.num_hyps[:, None]).reshape(batch_size, num_candidates)
+        order = np.lexsort((np.broadcast_to(np.arange(num_candidates), scores.shape), scores, is_valid), axis=-1)
+        best = order[:, ::-1][:, : self.num_beam_hyps_to_keep]
+        best = (np.arange(batch_size)[:, None] * num_candidates + best).reshape(-1)
+
+        sent_lengths = beam_hyps.lengths.reshape(-1)[best].astype(np.int32)
+        best_scores = beam_hyps.scores.reshape(-1)[best].astype(np.float32)
+        best_hyps = beam_hyps.tokens.reshape(-1, beam_hyps.tokens.shape[-1])[best]
+        if beam_hyps.beam_indices is not None:
+            best_indices = beam_hyps.beam_indices.reshape(-1)[best]
+        else:
+            best_indices = None
 
         # prepare for adding eos
         sent_lengths_max = max(sent_lengths) + 1
         sent_max_len = min(sent_lengths_max, max_length) if max_length is not None else sent_lengths_max
         decoded = np.zeros((batch_size * self.num_beam_hyps_to_keep, sent_max_len), dtype=np.int32)
 
-        if best_indices and best_indices[0] is not None:
+        if best_indices is not None and best_indices[0] is not None:
             indices = np.zeros((batch_size * self.num_beam_hyps_to_keep, sent_max_len), dtype=np.int32)
         else:
             indices = None
@@ -302,18 +300,17 @@ class BeamSearchScorer(BeamScorer):
 
         if indices is not None:
             indices.fill(-1)
-
-        # fill with hypotheses and eos_token_id if the latter fits in
-        for i, (hypo, best_idx) in enumerate(zip(best, best_indices)):
-            sent_length = min(decoded.shape[-1], sent_lengths[i])
-            decoded[i, :sent_length] = hypo[:sent_length]
-
-            if indices is not None:
+            for i, best_idx in enumerate(best_indices):
                 indices[i, : len(best_idx)] = best_idx
 
-            if sent_lengths[i] < sent_max_len:
-                # inserting only the first eos_token_id
-                decoded[i, sent_lengths[i]] = eos_token_id[0]
+        # fill with hypotheses and eos_token_id if the latter fits in
+        width = min(sent_max_len, best_hyps.shape[-1])
+        is_token = np.arange(width) < sent_lengths[:, None]
+        decoded[:, :width] = np.where(is_token, best_hyps[:, :width], decoded[:, :width])
+        has_eos = np.flatnonzero(sent_lengths < sent_max_len)
+        if has_eos.size:
+            # inserting only the first eos_token_id
+            decoded[has_eos, sent_lengths[has_eos]] = eos_token_id[0]
 
         return UserDict(
             {
@@ -326,19 +323,37 @@ class BeamSearchScorer(BeamScorer):
 
 class BeamHypotheses:
     """
-    Beam hypotheses maintaining n-best list
+    Beam hypotheses maintaining the n-best lists of a batch.
+
+    The lists are kept in fixed-capacity arrays of `num_beams + 1` hypotheses per batch entry, where a hypothesis is
+    appended in place and the worst one is evicted once a list overflows, so that a step of beam search adds the
+    hypotheses of all the batch entries at once.
     """
 
-    def __init__(self, num_beams: int, length_penalty: float, early_stopping: bool, max_length: Optional[int] = None):
+    def __init__(
+        self,
+        num_beams: int,
+        length_penalty: float,
+        early_stopping: bool,
+        max_length: Optional[int] = None,
+        batch_size: int = 1,
+    ):
         """
-        Initialize n-best list of hypotheses.
+        Initialize n-best lists of hypotheses.
         """
         self.length_penalty = length_penalty
         self.early_stopping = early_stopping
         self.max_length = max_length
         self.num_beams = num_beams
-        self.beams = []
-        self.worst_score = 1e9
+        self.batch_size = batch_size
+        self.capacity = num_beams + 1
+        self.num_hyps = np.zeros(batch_size, dtype=np.int64)
+        self.worst_score = np.full(batch_size, 1e9, dtype=np.float64)
+        self.scores = np.zeros((batch_size, self.capacity), dtype=np.float64)
+        self.lengths = np.zeros((batch_size, self.capacity), dtype=np.int64)
+        # the token ids and the beam indices of the hypotheses are allocated by the first `add`
+        self.tokens = np.zeros((batch_size, self.capacity, 0), dtype=np.int32)
+        self.beam_indices = None
 
         if not isinstance(self.early_stopping, bool) and self.max_length is None:
             raise ValueError(
@@ -348,43 +363,74 @@ class BeamHypotheses:
 
     def __len__(self):
         """
-        Number of hypotheses in the list.
+        Number of n-best lists.
         """
-        return len(self.beams)
+        return self.batch_size
+
+    def _reserve(self, width, dtype):
+        if self.tokens.shape[-1] < width:
+            tokens = np.zeros((self.batch_size, self.capacity, width), dtype=dtype)
+            tokens[..., : self.tokens.shape[-1]] = self.tokens
+            self.tokens = tokens
 
-    def add(self, hyp, sum_logprobs: float, beam_indices=None):
+    def add(self, batch_idx, hyps, sum_logprobs, beam_indices=None):
         """
-        Add a new hypothesis to the list.
+        Add a new hypothesis to each of the lists of `batch_idx`, which are distinct.
         """
-        score = sum_logprobs / (hyp.shape[-1] ** self.length_penalty)
-        if len(self) < self.num_beams or score > self.worst_score:
-            self.beams.append((score, hyp, beam_indices))
-            if len(self) > self.num_beams:
-                sorted_next_scores = sorted([(s, idx) for idx, (s, _, _) in enumerate(self.beams)])
-                del self.beams[sorted_next_scores[0][1]]
-                self.worst_score = sorted_next_scores[1][0]
-            else:
-                self.worst_score = min(score, self.worst_score)
-
-    def is_done(self, best_sum_logprobs: float, cur_len: int) -> bool:
+        scores = np.asarray(sum_logprobs, dtype=np.float64) / (hyps.shape[-1] ** self.length_penalty)
+        is_added = (self.num_hyps[batch_idx] < self.num_beams) | (scores > self.worst_score[batch_idx])
+        batch_idx, hyps, scores = batch_idx[is_added], hyps[is_added], scores[is_added]
+        if batch_idx.size == 0:
+            return
+
+        slots = self.num_hyps[batch_idx]
+        self._reserve(hyps.shape[-1], hyps.dtype)
+        self.scores[batch_idx, slots] = scores
+        self.lengths[batch_idx, slots] = hyps.shape[-1]
+        self.tokens[batch_idx, slots] = 0
+        self.tokens[batch_idx, slots, : hyps.shape[-1]] = hyps
+        if beam_indices is not None or self.beam_indices is not None:
+            if self.beam_indices is None:
+                self.beam_indices = np.full((self.batch_size, self.capacity), None, dtype=object)
+            for i, j in enumerate(np.flatnonzero(is_added)):
+                self.beam_indices[batch_idx[i], slots[i]] = beam_indices[j] if beam_indices is not None else None
+        self.num_hyps[batch_idx] += 1
+
+        # evict the worst hypothesis of the lists that overflow, the first kept of them if several are the worst
+        is_full = self.num_hyps[batch_idx] > self.num_beams
+        full_idx = batch_idx[is_full]
+        if full_idx.size:
+            full_scores = self.scores[full_idx]
+            worst = np.argmin(full_scores, axis=-1)
+            self.worst_score[full_idx] = np.partition(full_scores, 1, axis=-1)[:, 1]
+            kept = np.arange(self.num_beams)
+            kept = kept + (kept >= worst[:, None])
+            self.scores[full_idx, :-1] = np.take_along_axis(full_scores, kept, axis=-1)
+            self.lengths[full_idx, :-1] = np.take_along_axis(self.lengths[full_idx], kept, axis=-1)
+            self.tokens[full_idx, :-1] = self.tokens[full_idx[:, None], kept]
+            if self.beam_indices is not None:
+                self.beam_indices[full_idx, :-1] = np.take_along_axis(self.beam_indices[full_idx], kept, axis=-1)
+            self.num_hyps[full_idx] = self.num_beams
+        open_idx = batch_idx[~is_full]
+        self.worst_score[open_idx] = np.minimum(scores[~is_full], self.worst_score[open_idx])
+
+    def is_done(self, batch_idx, best_sum_logprobs, cur_len: int):
         """
         If there are enough hypotheses and that none of the hypotheses being generated can become better than the worst
-        one in the heap, then we are done with this sentence.
+        one in the heap, then we are done with this sentence. Return whether each of the lists of `batch_idx` is done.
         """
-
-        if len(self) < self.num_beams:
-            return False
+        is_full = self.num_hyps[batch_idx] >= self.num_beams
+        best_sum_logprobs = np.asarray(best_sum_logprobs, dtype=np.float64)
 
         # `True`: stop as soon as at least `num_beams` hypotheses are finished
         if self.early_stopping is True:
-            return True
+            return is_full
 
         # `False`: heuristic compute the best possible score from `cur_len`, even though it is not entirely accurate
         #  when `length_penalty` is positive.
         if self.early_stopping is False:
             highest_attainable_score = best_sum_logprobs / cur_len**self.length_penalty
-            ret = self.worst_score >= highest_attainable_score
-            return ret
+            return is_full & (self.worst_score[batch_idx] >= highest_attainable_score)
 
         # `"never"`: compute the best possible score, depending on the signal of `length_penalty`
         # `length_penalty` > 0.0 -> max denominator is obtained from `max_length`, not from `cur_len` -> min
@@ -395,5 +441,4 @@ class BeamHypotheses:
         # the opposite logic applies here (max `highest_attainable_score` from `cur_len`)
         else:
             highest_attainable_score = best_sum_logprobs / cur_len**self.length_penalty
-        ret = self.worst_score >= highest_attainable_score
-        return ret
+        return is_full & (self.worst_score[batch_idx] >= highest_attainable_score)
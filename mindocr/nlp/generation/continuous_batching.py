@@ -0,0 +1,654 @@
+"""Continuous batching for text generation"""
+import copy
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+import mindspore.common.dtype as mstype
+from mindspore.common.tensor import Tensor
+
+from mindocr.nlp.generation.generation_config import GenerationConfig
+from mindocr.nlp.generation.logits_process import LogitsProcessorList
+from mindocr.nlp.generation.utils import softmax_with_threads
+from mindocr.nlp.utils.paged_kvcache import PrefixCachingBlockAllocator
+
+__all__ = ["ContinuousBatchingScheduler"]
+_logger = logging.getLogger(__name__)
+
+
+class _Request:
+    """A request of generation and its state while it occupies a slot of the batch."""
+
+    def __init__(
+        self,
+        input_ids: np.ndarray,
+        max_length: int,
+        model_kwargs: Dict,
+        future: Future,
+        prefix_key: Optional[Hashable] = None,
+        streamer=None,
+    ):
+        self.input_ids = input_ids
+        self.max_length = max_length
+        self.model_kwargs = model_kwargs
+        self.future = future
+        self.prefix_key = prefix_key
+        self.streamer = streamer
+        self.valid_length = len(input_ids)
+        # number of tokens in the kv cache, the tokens after are fed one per step
+        self.num_cached = 0
+        # preempted requests are moved back to the waiting queue with the tokens generated so far
+        self.preempted = False
+        self.admit_order = -1
+
+
+class ContinuousBatchingScheduler:
+    r"""
+    Iteration-level scheduler of generation requests. The requests are decoded in a batch of `max_batch_size` slots,
+    one token per step. A request leaves its slot as soon as it finishes, and free slots are refilled with queued
+    requests at the step boundaries, so that finished sequences do not burn compute and new requests do not wait for
+    the whole batch to finish.
+
+    With `use_past`, the prompts of the new requests are prefilled into the kv cache of their slots before the step:
+    with `use_kvcache_op`, only the new requests are prefilled, to the slots given by `batch_index`; otherwise the
+    cache is written as a whole, so all the slots are prefilled again with the tokens generated so far.
+    Every slot then decodes at its own position given by `batch_valid_length`.
+
+    With `use_paged_attention`, the kv cache blocks of each request are allocated as it grows, and new requests are
+    admitted only if the blocks of their prompts are free. When the blocks run out while decoding, the latest admitted
+    request is preempted: its blocks are freed and it is queued again in front, to be prefilled with the tokens
+    generated so far once blocks are free.
+
+    With `prefix_cache_bytes` of the model config, the blocks of the prompts and of the finished sequences are kept
+    for reuse. A new request shares the blocks of its longest cached prefix instead of being prefilled, and feeds the
+    tokens after the prefix one per step with the decoding requests. The prefix is keyed by the tokens and the hash of
+    the array model kwargs of the request, e.g. the image, so that several queries about the same image pay for the
+    image and the conversation template once.
+
+    Parameters:
+        model (`GeneratorMixin`):
+            The model to generate with, a decoder-only model.
+        generation_config (`GenerationConfig`, *optional*):
+            The generation configuration shared by the requests, the default config of the model is used if not set.
+            Beam search is not supported.
+        logits_processor (`LogitsProcessorList`, *optional*):
+            Custom logits processors, merged with the processors created from the generation configuration.
+        max_batch_size (`int`, *optional*):
+            Number of slots, which defaults to the batch size of the model, i.e. the batch size of its kv cache.
+        activate_len_bucket (`int`, *optional*, defaults to 0):
+            With `use_past`, the attention of each decode step is limited to the cache positions up to the longest
+            request, rounded up to a multiple of this, through `zactivate_len`. 0 means attending to the whole cache.
+        seed (`int`, *optional*):
+            Seed of sampling.
+        kwargs:
+            Attributes of `generation_config` to update.
+
+    Example:
+        >>> scheduler = model.continuous_batching(max_new_tokens=512)
+        >>> with scheduler:
+        ...     futures = [scheduler.submit(input_ids) for input_ids in prompts]
+        ...     outputs = [future.result() for future in futures]
+    """
+
+    def __init__(
+        self,
+        model,
+        generation_config: Optional[GenerationConfig] = None,
+        logits_processor: Optional[LogitsProcessorList] = None,
+        max_batch_size: Optional[int] = None,
+        activate_len_bucket: int = 0,
+        seed: Optional[int] = None,
+        **kwargs,
+    ):
+        if model.config.is_encoder_decoder:
+            raise ValueError("Continuous batching does not support encoder-decoder models yet!")
+        if generation_config is None:
+            generation_config = GenerationConfig.from_model_config(model.config)
+        generation_config = copy.deepcopy(generation_config)
+        unused_kwargs = generation_config.update(**kwargs)
+        if unused_kwargs:
+            raise ValueError(
+                f"{list(unused_kwargs)} are not attributes of the generation config, "
+                "model kwargs should be passed to `submit` with each request."
+            )
+        if generation_config.num_beams > 1:
+            raise ValueError("Continuous batching does not support beam search yet! Please set num_beams to 1.")
+        if generation_config.pad_token_id is None:
+            generation_config.pad_token_id = 0
+        _logger.info("Generation Config is: %s", generation_config)
+
+        self.model = model
+        self.model.set_train(False)
+        self.generation_config = generation_config
+        self.logits_sampler = model._get_logits_sampler(generation_config, logits_processor)  # pylint: disable=W0212
+        self.logits_processor = model._get_logits_processor(  # pylint: disable=W0212
+            generation_config=generation_config,
+            logits_processor=logits_processor if logits_processor is not None else LogitsProcessorList(),
+        )
+        self.logits_warper = (
+            model._get_logits_warper(generation_config)  # pylint: disable=W0212
+            if generation_config.do_sample
+            else LogitsProcessorList()
+        )
+        self.max_batch_size = max_batch_size or model.config.batch_size
+        self.seq_length = model.config.seq_length
+        self.use_past = generation_config.use_past
+        self.use_kvcache_op = getattr(model.config, "use_kvcache_op", False)
+        self.activate_len_bucket = activate_len_bucket
+        self.block_allocator = None
+        if self.use_past and getattr(model.config, "use_paged_attention", False):
+            self.block_allocator = model._get_block_allocator()  # pylint: disable=W0212
+            self.block_allocator.free_all()
+            # the attended length is a whole number of blocks
+            block_size = self.block_allocator.block_size
+            self.activate_len_bucket = -(-activate_len_bucket // block_size) * block_size
+        self.prefix_caching = isinstance(self.block_allocator, PrefixCachingBlockAllocator)
+        # with the kvcache op or paged attention, the prompts of new requests are prefilled into their own slots
+        self.partial_prefill = self.use_kvcache_op or self.block_allocator is not None
+        if seed is not None:
+            np.random.seed(seed)
+
+        self.slots: List[Optional[_Request]] = [None] * self.max_batch_size
+        self.input_ids = np.full((self.max_batch_size, self.seq_length), generation_config.pad_token_id, dtype=np.int32)
+        self._batch_kwargs = None
+        self._queue = queue.Queue()
+        self._waiting = deque()
+        self._num_admitted = 0
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # futures of the running requests to abort at the next step, e.g. of disconnected clients
+        self._aborted = set()
+        self._abort_lock = threading.Lock()
+
+        self.generated_tokens = 0
+        self.forward_time = 0.0
+        # (reserved, used) kv bytes of the finished requests with paged attention
+        self.kv_bytes = []
+
+    def submit(
+        self,
+        input_ids,
+        max_new_tokens: Optional[int] = None,
+        prefix_key: Optional[Hashable] = None,
+        streamer=None,
+        **model_kwargs,
+    ) -> Future:
+        """
+        Queue a request of generation, return the future of the generated token ids, which include the prompt as
+        the outputs of `generate`.
+
+        Args:
+            input_ids: token ids of the prompt, padding at the end is removed.
+            max_new_tokens: max number of tokens to generate for this request, the generation config is used if not
+                set.
+            prefix_key: key of the inputs other than input_ids to look up the cached prefixes with, which defaults to
+                the hash of the array model kwargs.
+            streamer: the streamer of the request, e.g. [`TextIteratorStreamer`], which is put the prompt once queued
+                and each generated token once sampled, and ended when the request finishes or fails.
+            model_kwargs: model specific kwargs of the request, e.g. image. Array values have a batch dim of 1, and
+                are concatenated with the other requests of the batch.
+        """
+        input_ids = np.reshape(np.array(input_ids, dtype=np.int32), (-1,))
+        valid_length = np.max(np.argwhere(input_ids != self.generation_config.pad_token_id)) + 1
+        input_ids = input_ids[:valid_length]
+
+        if max_new_tokens is None:
+            max_new_tokens = self.generation_config.max_new_tokens
+        max_length = self.generation_config.max_length if max_new_tokens is None else valid_length + max_new_tokens
+        max_length = min(max_length, self.seq_length)
+        if valid_length >= max_length:
+            raise ValueError(
+                f"the input_ids length {valid_length} exceeds the max length config {max_length}."
+                f"check your inputs and set max_length larger than your inputs length."
+            )
+        if (
+            self.block_allocator is not None
+            and self.block_allocator.blocks_needed(max_length) >= self.block_allocator.num_blocks
+        ):
+            raise ValueError(
+                f"max length {max_length} needs {self.block_allocator.blocks_needed(max_length)} kv cache blocks, "
+                f"which exceeds the num_blocks {self.block_allocator.num_blocks} of the model config."
+            )
+
+        if self.prefix_caching and prefix_key is None:
+            prefix_key = self._hash_arrays(model_kwargs)
+
+        future = Future()
+        if streamer is not None:
+            streamer.put(input_ids[None])
+        self._queue.put(_Request(input_ids, max_length, model_kwargs, future, prefix_key, streamer))
+        self._wakeup.set()
+        return future
+
+    def abort(self, future: Future):
+        """
+        Abort the request of future, e.g. when its client disconnects. A queued request is cancelled, and a running
+        request leaves its slot at the next step, with its future failed with `CancelledError`. Its streamer is ended.
+        """
+        if future.cancel() or future.done():
+            return
+        with self._abort_lock:
+            self._aborted.add(future)
+        self._wakeup.set()
+
+    @property
+    def num_active(self) -> int:
+        return sum(request is not None for request in self.slots)
+
+    def has_pending(self) -> bool:
+        return self.num_active > 0 or len(self._waiting) > 0 or not self._queue.empty()
+
+    def step(self) -> int:
+        """
+        Refill the free slots with queued requests and generate one token for every active request. Finished requests
+        leave their slots with their futures done. Return the number of tokens generated.
+        """
+        new_slots = self._refill()
+        if self.block_allocator is not None:
+            new_slots = self._reserve_blocks(new_slots)
+        active = [i for i, request in enumerate(self.slots) if request is not None]
+        if not active:
+            return 0
+
+        forward_time = time.time()
+        if self.use_past:
+            # the requests reusing a cached prefix are not prefilled
+            prefill_slots = [i for i in new_slots if self.slots[i].num_cached == 0]
+            if prefill_slots:
+                self._prefill(prefill_slots if self.partial_prefill else list(range(self.max_batch_size)))
+        # every slot feeds the token at its position, which is the last token unless a prompt is being fed
+        positions = np.zeros((self.max_batch_size,), dtype=np.int32)
+        for i in active:
+            request = self.slots[i]
+            positions[i] = (
+                min(request.num_cached, request.valid_length - 1) if self.use_past else request.valid_length - 1
+            )
+        valid_length = positions + 1
+        current_index = [positions[i] + i * self.seq_length for i in range(self.max_batch_size)]
+        if self.use_past:
+            res = self._decode(current_index, valid_length)
+        else:
+            model_inputs = self.model.prepare_inputs_for_generation(
+                self.input_ids, current_index=current_index, **self._get_batch_kwargs()
+            )
+            res = self.model(**model_inputs)  # pylint: disable=E1102
+        self.forward_time += time.time() - forward_time
+
+        generating = [i for i in active if positions[i] == self.slots[i].valid_length - 1]
+        is_finished = [i not in generating for i in range(self.max_batch_size)]
+        probs, p_args = self._process_outputs(res, current_index, is_finished)
+        p_norms = softmax_with_threads(probs, is_finished) if self.generation_config.do_sample else None
+        for i in active:
+            self.slots[i].num_cached = positions[i] + 1
+        for i in generating:
+            if p_norms is not None:
+                target_index = np.random.choice(len(probs[i]), p=p_norms[i])
+            else:
+                target_index = np.argmax(probs[i])
+            self._append_token(i, p_args[i][target_index])
+        self.generated_tokens += len(generating)
+        return len(generating)
+
+    def run_until_complete(self):
+        """Step until all the submitted requests are finished."""
+        while self.has_pending():
+            self.step()
+
+    def start(self):
+        """Serve the submitted requests on a background thread, until `stop` is called."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._serve, name="continuous_batching", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after the submitted requests are finished."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _serve(self):
+        total_time = time.time()
+        while True:
+            if not self.has_pending():
+                if self._stop.is_set():
+                    break
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                self.step()
+            except Exception as e:  # pylint: disable=W0703
+                _logger.exception("Generation step failed, the active requests are aborted.")
+                self._abort_active(e)
+        total_time = time.time() - total_time
+        _logger.info(
+            "total time: %s s; forward time: %s s; generated tokens: %s tokens; generate speed: %s tokens/s",
+            total_time,
+            self.forward_time,
+            self.generated_tokens,
+            self.generated_tokens / total_time,
+        )
+        if self.kv_bytes:
+            reserved, used = np.sum(self.kv_bytes, axis=0)
+            _logger.info(
+                "kv cache of %s requests: %s bytes reserved by blocks, %s bytes used, %s bytes reserved without paging",
+                len(self.kv_bytes),
+                reserved,
+                used,
+                len(self.kv_bytes) * self.seq_length * self.block_allocator.bytes_per_token,
+            )
+        if self.prefix_caching:
+            stats = self.block_allocator.stats()
+            _logger.info(
+                "prefix cache: %s of %s requests hit, %s of %s prompt tokens reused, hit rate: %.4f, %s blocks cached",
+                stats["hits"],
+                stats["queries"],
+                stats["hit_tokens"],
+                stats["query_tokens"],
+                self.block_allocator.hit_rate,
+                stats["cached_blocks"],
+            )
+
+    def _refill(self) -> List[int]:
+        """Move waiting requests into the free slots in order, return the refilled slots."""
+        queued = []
+        while not self._queue.empty():
+            queued.append(self._queue.get_nowait())
+        if queued:
+            self.model._prefetch_model_kwargs([request.model_kwargs for request in queued])  # pylint: disable=W0212
+            self._waiting.extend(queued)
+        self._drop_aborted()
+        new_slots = []
+        # parents of the blocks of the prompts prefilled in this step
+        prefilling = set()
+        for i in range(self.max_batch_size):
+            while self.slots[i] is None and self._waiting:
+                request = self._waiting[0]
+                # admit the request only if the blocks of its prompt and the next token are free
+                if self.block_allocator is not None and not self.block_allocator.can_allocate(
+                    request, request.valid_length + 1
+                ):
+                    break
+                # a request extending the prompt of a request prefilled in this step waits to reuse it
+                if self.prefix_caching:
+                    keys = self.block_allocator.prefix_keys(request.input_ids[:-1], request.prefix_key)
+                    num_cached_blocks = self.block_allocator.num_cached_blocks(keys)
+                    if num_cached_blocks < len(keys) and keys[num_cached_blocks][0] in prefilling:
+                        break
+                self._waiting.popleft()
+                # skip the requests cancelled while queued
+                if not request.preempted and not request.future.set_running_or_notify_cancel():
+                    if request.streamer is not None:
+                        request.streamer.end()
+                    continue
+                request.num_cached = 0
+                if self.prefix_caching:
+                    request.num_cached = self.block_allocator.match_prefix(
+                        request,
+                        request.input_ids,
+                        request.prefix_key,
+                        self.model._min_reused_prefix_length(**request.model_kwargs),  # pylint: disable=W0212
+                    )
+                    if request.num_cached == 0:
+                        prefilling.update(key[0] for key in keys)
+                if self.block_allocator is not None:
+                    self.block_allocator.allocate(request, request.valid_length)
+                request.admit_order = self._num_admitted
+                self._num_admitted += 1
+                self.slots[i] = request
+                self.input_ids[i] = self.generation_config.pad_token_id
+                self.input_ids[i, : request.valid_length] = request.input_ids
+                if self.logits_sampler is not None:
+                    self.logits_sampler.set_sequence(i, request.input_ids)
+                new_slots.append(i)
+        if new_slots:
+            self._batch_kwargs = None
+        return new_slots
+
+    def _reserve_blocks(self, new_slots: List[int]) -> List[int]:
+        """
+        Make sure the blocks of every active request hold its tokens, preempting the latest admitted requests if the
+        free blocks run out. Return the new slots which are not preempted.
+        """
+        allocator = self.block_allocator
+        for i in sorted(range(self.max_batch_size), key=lambda x: self.slots[x].admit_order if self.slots[x] else -1):
+            request = self.slots[i]
+            if request is None:
+                continue
+            while not allocator.can_allocate(request, request.valid_length):
+                latest = max(
+                    (x for x in range(self.max_batch_size) if self.slots[x] is not None),
+                    key=lambda x: self.slots[x].admit_order,
+                )
+                self._preempt(latest)
+                if latest == i:
+                    break
+            if self.slots[i] is not None:
+                allocator.allocate(request, request.valid_length)
+        return [i for i in new_slots if self.slots[i] is not None]
+
+    def _preempt(self, slot: int):
+        request = self.slots[slot]
+        _logger.debug("Out of kv cache blocks, preempt the request of slot %s at length %s", slot, request.valid_length)
+        request.input_ids = self.input_ids[slot, : request.valid_length].copy()
+        request.preempted = True
+        request.num_cached = 0
+        self._waiting.appendleft(request)
+        self.block_allocator.free(request)
+        self.slots[slot] = None
+        self.input_ids[slot] = self.generation_config.pad_token_id
+        self._batch_kwargs = None
+
+    def _get_batch_kwargs(self, slots: Optional[List[int]] = None) -> Dict:
+        """
+        Concatenate the model kwargs of the requests in slots, the values of free slots are filled with zeros. The
+        kwargs of the whole batch are cached until the slots change.
+        """
+        if slots is None:
+            if self._batch_kwargs is None:
+                self._batch_kwargs = self._get_batch_kwargs(list(range(self.max_batch_size)))
+            return self._batch_kwargs
+
+        requests = [self.slots[i] for i in slots]
+        keys = {key for request in requests if request is not None for key in request.model_kwargs}
+        batch_kwargs = {}
+        for key in keys:
+            values = [request.model_kwargs.get(key) if request is not None else None for request in requests]
+            example = next(value for value in values if value is not None)
+            if not isinstance(example, np.ndarray):
+                batch_kwargs[key] = example
+                continue
+            values = [value if value is not None else np.zeros_like(example) for value in values]
+            batch_kwargs[key] = np.concatenate(values, axis=0)
+        return batch_kwargs
+
+    @staticmethod
+    def _hash_arrays(model_kwargs: Dict) -> Optional[str]:
+        """Hash of the array model kwargs, e.g. the image, as the key of the cached prefixes."""
+        arrays = [(key, value) for key, value in sorted(model_kwargs.items()) if isinstance(value, np.ndarray)]
+        if not arrays:
+            return None
+        sha1 = hashlib.sha1()
+        for key, value in arrays:
+            sha1.update(f"{key}{value.shape}{value.dtype}".encode())
+            sha1.update(np.ascontiguousarray(value).tobytes())
+        return sha1.hexdigest()
+
+    def _prefill(self, slots: List[int]):
+        """Write the kv cache of the requests in slots with their full sequences."""
+        valid_length = np.array(
+            [request.valid_length if request is not None else 1 for request in self.slots], dtype=np.int32
+        )
+        model = self.model
+        model.is_first_iteration = True
+        model.add_flags_recursive(is_first_iteration=True)
+        model_inputs = model.prepare_inputs_for_generation(
+            self.input_ids[slots],
+            current_index=[valid_length[slot] - 1 + i * self.seq_length for i, slot in enumerate(slots)],
+            **self._get_batch_kwargs(slots),
+        )
+        model_inputs["init_reset"] = Tensor([False], mstype.bool_)
+        model_inputs["batch_valid_length"] = Tensor([valid_length[slots]], mstype.int32)
+        if self.block_allocator is not None:
+            seq_ids = [self.slots[slot] for slot in slots]
+            model_inputs["block_tables"] = Tensor(
+                self.block_allocator.build_block_tables(seq_ids, self.seq_length // self.block_allocator.block_size),
+                mstype.int32,
+            )
+            model_inputs["slot_mapping"] = Tensor(
+                self.block_allocator.build_prefill_slots(seq_ids, valid_length[slots], self.seq_length), mstype.int32
+            )
+        elif len(slots) < self.max_batch_size:
+            model_inputs["batch_index"] = Tensor(np.array(slots), mstype.int64)
+        model(**model_inputs)  # pylint: disable=E1102
+        model.is_first_iteration = False
+        model.add_flags_recursive(is_first_iteration=False)
+        for slot in slots:
+            request = self.slots[slot]
+            if request is not None:
+                request.num_cached = request.valid_length
+                if self.prefix_caching:
+                    self.block_allocator.cache_prefix(
+                        request, self.input_ids[slot, : request.valid_length], request.prefix_key
+                    )
+
+    def _decode(self, current_index: List[int], valid_length: np.ndarray):
+        """Decode the last token of every slot at its own position of the kv cache."""
+        model = self.model
+        model_inputs = model.prepare_inputs_for_generation(
+            self.input_ids, current_index=current_index, **self._get_batch_kwargs()
+        )
+        model.slice_incremental_inputs(model_inputs, current_index)
+        model_inputs["input_position"] = Tensor(current_index, mstype.int32)
+        model_inputs["init_reset"] = Tensor([True], mstype.bool_)
+        model_inputs["batch_valid_length"] = Tensor([valid_length], mstype.int32)
+        if self.activate_len_bucket > 0:
+            bucket = self.activate_len_bucket
+            activate_len = min(-(-int(np.max(valid_length)) // bucket) * bucket, self.seq_length)
+            model_inputs["zactivate_len"] = Tensor(np.arange(activate_len), mstype.int64)
+        if self.block_allocator is not None:
+            model_inputs["block_tables"] = Tensor(
+                self.block_allocator.build_block_tables(self.slots, self.seq_length // self.block_allocator.block_size),
+                mstype.int32,
+            )
+            model_inputs["slot_mapping"] = Tensor(
+                self.block_allocator.build_decode_slots(self.slots, valid_length), mstype.int32
+            )
+        if self.prefix_caching:
+            model_inputs["copy_slots"] = Tensor(
+                self.block_allocator.build_copy_slots(self.max_batch_size * self.block_allocator.block_size),
+                mstype.int32,
+            )
+        return model(**model_inputs)  # pylint: disable=E1102
+
+    def _process_outputs(self, res, current_index: List[int], is_finished: List[bool]):
+        """Get the processed probs of the next tokens and their token ids from the outputs of model."""
+        if self.logits_sampler is not None:
+            logits = res[0] if isinstance(res, tuple) else res
+            return self.logits_sampler(logits, current_index)
+        if self.model.config.is_sample_acceleration:
+            probs, p_args = res
+            if isinstance(probs, Tensor):
+                probs = probs.asnumpy()
+            if isinstance(p_args, Tensor):
+                p_args = p_args.asnumpy()
+            return probs, p_args
+
+        logits = res[0] if isinstance(res, tuple) else res
+        if isinstance(logits, Tensor):
+            logits = logits.asnumpy()
+        logits = np.reshape(logits, (-1, logits.shape[-1]))
+        # gather the logits of the last tokens, if not gathered in the model
+        if logits.shape[0] > len(current_index):
+            logits = logits[current_index]
+        probs = self.logits_processor(self.input_ids, logits, is_finished)
+        probs = self.logits_warper(self.input_ids, probs, is_finished)
+        p_args = np.tile(np.arange(logits.shape[-1]), (self.max_batch_size, 1))
+        return probs, p_args
+
+    def _append_token(self, slot: int, target: int):
+        """Append the generated token to the request of slot, and release the slot if the request is finished."""
+        request = self.slots[slot]
+        self.input_ids[slot, request.valid_length] = target
+        request.valid_length += 1
+        if self.logits_sampler is not None:
+            self.logits_sampler.append(slot, target)
+        if request.streamer is not None:
+            request.streamer.put([target])
+        if target == self.generation_config.eos_token_id or request.valid_length >= request.max_length:
+            if self.prefix_caching:
+                # keep the blocks of the whole sequence, e.g. for the next turn of a conversation
+                self.block_allocator.cache_prefix(
+                    request, self.input_ids[slot, : request.num_cached], request.prefix_key
+                )
+            if request.streamer is not None:
+                request.streamer.end()
+            request.future.set_result(self.input_ids[slot, : request.valid_length].copy())
+            self._release(slot)
+
+    def _release(self, slot: int):
+        if self.block_allocator is not None:
+            request = self.slots[slot]
+            self.kv_bytes.append(self.block_allocator.kv_bytes(request))
+            _logger.debug("kv bytes of the request of slot %s: %s reserved, %s used", slot, *self.kv_bytes[-1])
+            self.block_allocator.free(request)
+        self.slots[slot] = None
+        self.input_ids[slot] = self.generation_config.pad_token_id
+        self._batch_kwargs = None
+
+    def _drop_aborted(self):
+        """
+        Remove the aborted requests from their slots, and the aborted or cancelled requests from the waiting requests,
+        so that their streamers are ended without waiting for a free slot.
+        """
+        with self._abort_lock:
+            aborted, self._aborted = self._aborted, set()
+        for i, request in enumerate(self.slots):
+            if request is not None and request.future in aborted:
+                self._fail(request, CancelledError())
+                self._release(i)
+        dropped = [
+            request
+            for request in self._waiting
+            if request.future in aborted or (not request.preempted and request.future.cancelled())
+        ]
+        for request in dropped:
+            self._waiting.remove(request)
+            if request.future.cancelled():
+                request.future.set_running_or_notify_cancel()
+                if request.streamer is not None:
+                    request.streamer.end()
+            else:
+                self._fail(request, CancelledError())
+
+    @staticmethod
+    def _fail(request: _Request, error: Exception):
+        if request.streamer is not None:
+            request.streamer.end()
+        request.future.set_exception(error)
+
+    def _abort_active(self, error: Exception):
+        for i, request in enumerate(self.slots):
+            if request is not None:
+                self._fail(request, error)
+                self._release(i)
@@ -47,6 +47,25 @@ class GenerationConfig:
             Whether to renormalize the logits after applying all the logits processors or wrappers (including the custom
             ones). It's highly recommended to set this flag to `True` as the search algorithms suppose the score logits
             are normalized but some logit processors or wrappers break the normalization.
+        fused_sampling (`bool`, *optional*, defaults to `True`):
+            Whether to apply the repetition penalty, temperature, top-k and top-p of greedy search and sampling in a
+            single pass over the candidate tokens with [`FusedLogitsSampler`], instead of the logits processors. It is
+            not used with custom logits processors, beam search or sample acceleration.
+        topk_on_device (`bool`, *optional*, defaults to `False`):
+            With fused sampling, whether to apply the repetition penalty and select the candidate tokens on device, so
+            that only the candidates instead of the logits of the whole vocabulary are copied to host.
+
+        > Parameters of speculative decoding
+
+        num_speculative_tokens (`int`, *optional*, defaults to 0):
+            Max number of draft tokens proposed per step of greedy search or sampling, which the model verifies in one
+            forward, see [`SpeculativeDecoder`]. 0 means no speculative decoding. It needs `use_past` and the paged
+            attention of the model.
+        prompt_lookup_max_ngram (`int`, *optional*, defaults to 3):
+            Without a draft model, the draft tokens are the ones following the latest earlier occurrence of the last
+            n-gram of the sequence, with n from `prompt_lookup_max_ngram` down to `prompt_lookup_min_ngram`.
+        prompt_lookup_min_ngram (`int`, *optional*, defaults to 1):
+            The shortest n-gram looked up for the draft tokens.
 
         > Special tokens that can be used at generation time
 
@@ -85,6 +104,12 @@ class GenerationConfig:
         self.repetition_penalty = kwargs.pop("repetition_penalty", 1.0)
         self.encoder_repetition_penalty = kwargs.pop("encoder_repetition_penalty", 1.0)
         self.renormalize_logits = kwargs.pop("renormalize_logits", False)
+        self.fused_sampling = kwargs.pop("fused_sampling", True)
+        self.topk_on_device = kwargs.pop("topk_on_device", False)
+        # speculative decoding
+        self.num_speculative_tokens = kwargs.pop("num_speculative_tokens", 0)
+        self.prompt_lookup_max_ngram = kwargs.pop("prompt_lookup_max_ngram", 3)
+        self.prompt_lookup_min_ngram = kwargs.pop("prompt_lookup_min_ngram", 1)
 
         # Special tokens that can be used at generation time
         self.pad_token_id = kwargs.pop("pad_token_id", None)
@@ -1,9 +1,14 @@
 """Logits Processor for generation."""
 import inspect
 from threading import Thread
+from typing import Dict, Optional, Sequence, Tuple
 
 import numpy as np
 
+import mindspore.common.dtype as mstype
+from mindspore import ops
+from mindspore.common.tensor import Tensor
+
 from .utils import log_softmax, softmax, topk
 
 __all__ = [
@@ -15,6 +20,7 @@ __all__ = [
     "TemperatureLogitsWarper",
     "TopKLogitsWarper",
     "TopPLogitsWarper",
+    "FusedLogitsSampler",
 ]
 
 
@@ -218,3 +224,207 @@ class LogitNormalization(LogitsProcessor, LogitsWarper):
     def __call__(self, input_ids, scores):
         scores = log_softmax(scores, axis=-1)
         return scores
+
+
+class FusedLogitsSampler:
+    r"""
+    Repetition penalty, temperature, top-k and top-p fused into a single pass over the candidate tokens, in place of a
+    [`LogitsProcessorList`] of these processors and warpers. The penalty is applied to the seen tokens of each
+    sequence, which are kept incrementally by `set_sequence` and `append` instead of reading the padded input_ids
+    every step. The candidates are then partitioned out of the vocabulary once, and temperature and top-p are applied
+    to the candidates only. As the outputs of sample acceleration, the scores of the candidates and their token ids are
+    returned, sorted by score. Unlike [`TopPLogitsWarper`], which normalizes the probabilities over the whole batch,
+    top-p is applied to the probabilities of each sequence.
+
+    Args:
+        repetition_penalty (`float`, *optional*, defaults to 1.0):
+            The parameter for repetition penalty. 1.0 means no penalty.
+        temperature (`float`, *optional*, defaults to 1.0):
+            The value used to module the logits distribution.
+        top_k (`int`, *optional*, defaults to 0):
+            The number of candidates with the highest scores, 0 means all the tokens.
+        top_p (`float`, *optional*, defaults to 1.0):
+            If set to < 1, only the smallest set of candidates with probabilities that add up to `top_p` or higher are
+            kept.
+        do_sample (`bool`, *optional*, defaults to `True`):
+            If False, the only candidate is the token with the highest score after penalty.
+        candidate_token_num (`int`, *optional*, defaults to 200):
+            Max number of candidates to calculate top_p with, as [`TopPLogitsWarper`].
+        filter_value (`float`, *optional*, defaults to `-50000`):
+            Score of the candidates filtered by top_p.
+        topk_on_device (`bool`, *optional*, defaults to `False`):
+            If the scores are a Tensor, apply the penalty and select the candidates on device, so that only the
+            candidates are copied to host.
+    """
+
+    def __init__(
+        self,
+        repetition_penalty: float = 1.0,
+        temperature: float = 1.0,
+        top_k: int = 0,
+        top_p: float = 1.0,
+        do_sample: bool = True,
+        candidate_token_num: int = 200,
+        filter_value: float = -50000,
+        topk_on_device: bool = False,
+    ):
+        if repetition_penalty <= 0:
+            raise ValueError(f"`penalty` has to be a strictly positive float, but is {repetition_penalty}")
+        if temperature <= 0:
+            raise ValueError(f"`temperature` has to be a strictly positive float, but is {temperature}")
+        if not isinstance(top_k, int) or top_k < 0:
+            raise ValueError(f"`top_k` has to be a non-negative integer, but is {top_k}")
+        if top_p < 0 or top_p > 1.0:
+            raise ValueError(f"`top_p` has to be a float > 0 and < 1, but is {top_p}")
+
+        self.penalty = float(repetition_penalty)
+        self.temperature = float(temperature)
+        self.top_k = top_k
+        self.top_p = float(top_p)
+        self.do_sample = do_sample
+        self.candidate_token_num = candidate_token_num
+        self.filter_value = float(filter_value)
+        self.topk_on_device = topk_on_device
+
+        # the seen tokens of row i are seen_ids[i, :num_seen[i]], the rest of the row repeats its first seen token
+        self._seen_sets: Dict[int, set] = {}
+        self._seen_ids = np.zeros((0, 0), dtype=np.int32)
+        self._num_seen = np.zeros((0,), dtype=np.int32)
+
+    @classmethod
+    def from_generation_config(cls, generation_config) -> "FusedLogitsSampler":
+        do_sample = generation_config.do_sample
+        return cls(
+            repetition_penalty=generation_config.repetition_penalty or 1.0,
+            temperature=(generation_config.temperature or 1.0) if do_sample else 1.0,
+            top_k=(generation_config.top_k or 0) if do_sample else 0,
+            top_p=(generation_config.top_p if generation_config.top_p is not None else 1.0) if do_sample else 1.0,
+            do_sample=do_sample,
+            topk_on_device=getattr(generation_config, "topk_on_device", False),
+        )
+
+    def num_candidates(self, vocab_size: int) -> int:
+        if not self.do_sample:
+            return 1
+        num = self.top_k if self.top_k > 0 else vocab_size
+        if self.top_p < 1.0:
+            num = min(num, self.candidate_token_num)
+        return min(num, vocab_size)
+
+    def reset(self, input_ids: np.ndarray, valid_length: Sequence[int]):
+        """Track the seen tokens of the rows of input_ids, up to their valid length."""
+        self._seen_sets.clear()
+        self._num_seen[:] = 0
+        for i, length in enumerate(valid_length):
+            self.set_sequence(i, input_ids[i, : int(length)])
+
+    def set_sequence(self, row: int, token_ids: Sequence[int]):
+        """Track the seen tokens of the sequence of row, e.g. a new request of continuous batching."""
+        if self.penalty == 1.0:
+            return
+        seen = np.unique(np.asarray(token_ids, dtype=np.int32))
+        self._reserve(row, len(seen))
+        self._seen_sets[row] = set(seen.tolist())
+        self._seen_ids[row] = seen[0] if len(seen) else 0
+        self._seen_ids[row, : len(seen)] = seen
+        self._num_seen[row] = len(seen)
+
+    def append(self, row: int, token: int):
+        """Add the generated token of row to its seen tokens."""
+        token = int(token)
+        if self.penalty == 1.0 or token in self._seen_sets[row]:
+            return
+        self._seen_sets[row].add(token)
+        num_seen = self._num_seen[row]
+        self._reserve(row, num_seen + 1)
+        if num_seen == 0:
+            self._seen_ids[row] = token
+        self._seen_ids[row, num_seen] = token
+        self._num_seen[row] = num_seen + 1
+
+    def _reserve(self, row: int, num_seen: int):
+        num_rows, width = self._seen_ids.shape
+        if row < num_rows and num_seen <= width:
+            return
+        new_rows = num_rows if row < num_rows else max(row + 1, 2 * num_rows)
+        new_width = width if num_seen <= width else max(num_seen, 2 * width)
+        seen_ids = np.zeros((new_rows, new_width), dtype=np.int32)
+        seen_ids[:num_rows, :width] = self._seen_ids
+        if width:
+            seen_ids[:num_rows, width:] = self._seen_ids[:, :1]
+        num = np.zeros((new_rows,), dtype=np.int32)
+        num[:num_rows] = self._num_seen
+        self._seen_ids, self._num_seen = seen_ids, num
+
+    def _penalty_inputs(self, batch_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The seen ids of the batch and the penalty of each row, which is 1 for the rows without seen tokens."""
+        self._reserve(batch_size - 1, 1)
+        width = max(int(np.max(self._num_seen[:batch_size])), 1)
+        penalty = np.where(self._num_seen[:batch_size] > 0, self.penalty, 1.0)[:, None]
+        return self._seen_ids[:batch_size, :width], penalty
+
+    def __call__(self, scores, current_index: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the candidate scores and token ids of scores, a Tensor or array of [batch_size(, seq_length), vocab_size].
+        If scores have more rows than current_index, the rows of current_index are the scores of the next tokens.
+        """
+        if isinstance(scores, Tensor) and self.topk_on_device:
+            candidate_scores, candidate_ids = self._select_on_device(scores, current_index)
+        else:
+            if isinstance(scores, Tensor):
+                scores = scores.asnumpy()
+            scores = np.reshape(scores, (-1, scores.shape[-1]))
+            if current_index is not None and scores.shape[0] > len(current_index):
+                scores = scores[current_index]
+            candidate_scores, candidate_ids = self._select(scores)
+        return self._warp(candidate_scores, candidate_ids), candidate_ids
+
+    def _select(self, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        batch_size, vocab_size = scores.shape
+        if self.penalty != 1.0:
+            seen_ids, penalty = self._penalty_inputs(batch_size)
+            seen = np.take_along_axis(scores, seen_ids, axis=1)
+            np.put_along_axis(scores, seen_ids, np.where(seen < 0, seen * penalty, seen / penalty), axis=1)
+
+        num_candidates = self.num_candidates(vocab_size)
+        # top-p needs the candidates sorted by score, even if all the tokens are candidates
+        if num_candidates == vocab_size and self.top_p >= 1.0:
+            return scores, np.broadcast_to(np.arange(vocab_size), scores.shape)
+        if num_candidates == 1:
+            candidate_ids = np.argmax(scores, axis=-1)[:, None]
+            return np.take_along_axis(scores, candidate_ids, axis=-1), candidate_ids
+        candidate_ids = np.argpartition(-scores, num_candidates - 1, axis=-1)[:, :num_candidates]
+        candidate_scores = np.take_along_axis(scores, candidate_ids, axis=-1)
+        order = np.argsort(-candidate_scores, axis=-1, kind="stable")
+        return np.take_along_axis(candidate_scores, order, axis=-1), np.take_along_axis(candidate_ids, order, axis=-1)
+
+    def _select_on_device(self, scores: Tensor, current_index: Optional[Sequence[int]]):
+        scores = scores.reshape((-1, scores.shape[-1]))
+        if current_index is not None and scores.shape[0] > len(current_index):
+            scores = ops.gather(scores, Tensor(np.array(current_index), mstype.int32), 0)
+        batch_size, vocab_size = scores.shape
+        if self.penalty != 1.0:
+            seen_ids, penalty = self._penalty_inputs(batch_size)
+            seen_ids = Tensor(seen_ids, mstype.int32)
+            penalty = Tensor(penalty, scores.dtype)
+            seen = ops.gather_elements(scores, 1, seen_ids)
+            seen = ops.select(seen < 0, seen * penalty, seen / penalty)
+            scores = ops.tensor_scatter_elements(scores, seen_ids, seen, axis=1)
+        candidate_scores, candidate_ids = ops.topk(scores, self.num_candidates(vocab_size))
+        return candidate_scores.asnumpy(), candidate_ids.asnumpy()
+
+    def _warp(self, candidate_scores: np.ndarray, candidate_ids: np.ndarray) -> np.ndarray:
+        """Temperature and top-p of the candidates sorted by score."""
+        if not self.do_sample:
+            return candidate_scores
+        if self.temperature != 1.0:
+            candidate_scores = candidate_scores / self.temperature
+        if self.top_p < 1.0:
+            cumulative_probs = np.cumsum(softmax(candidate_scores, axis=-1), axis=-1)
+            # keep the candidates until the cumulative probs exceed top_p, including the one exceeding
+            to_keep = np.concatenate(
+                [np.ones((candidate_scores.shape[0], 1), dtype=np.bool_), cumulative_probs[:, :-1] < self.top_p],
+                axis=-1,
+            )
+            candidate_scores = np.where(to_keep, candidate_scores, self.filter_value)
+        return candidate_scores
@@ -0,0 +1,455 @@
+"""Speculative decoding for text generation"""
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from mindspore.common.tensor import Tensor
+
+from mindocr.nlp.generation.generation_config import GenerationConfig
+from mindocr.nlp.generation.logits_process import FusedLogitsSampler
+from mindocr.nlp.generation.utils import softmax
+
+__all__ = ["DraftProposer", "NGramProposer", "DraftModelProposer", "SpeculativeDecoder"]
+_logger = logging.getLogger(__name__)
+
+# the candidate token ids and their probabilities which a draft token is sampled from
+DraftProbs = Tuple[np.ndarray, np.ndarray]
+
+
+class DraftProposer:
+    """
+    Base class of the draft sources of speculative decoding, which propose up to num_tokens tokens to follow each
+    sequence.
+
+    Args:
+        num_tokens: max number of draft tokens proposed per sequence and step.
+    """
+
+    def __init__(self, num_tokens: int):
+        if num_tokens < 1:
+            raise ValueError(f"num_tokens should be a positive integer, but got {num_tokens}")
+        self.num_tokens = num_tokens
+
+    def reset(self, input_ids: np.ndarray, valid_length: Sequence[int], **model_kwargs):
+        """Start proposing for the sequences of input_ids, up to their valid length."""
+
+    def propose(
+        self, input_ids: np.ndarray, valid_length: Sequence[int], max_tokens: Sequence[int]
+    ) -> Tuple[np.ndarray, np.ndarray, Optional[List[List[DraftProbs]]]]:
+        """
+        Propose the draft tokens to follow the sequences, up to max_tokens of each sequence.
+
+        Returns:
+            The draft tokens of (batch_size, num_tokens), the number of draft tokens of each sequence, and the
+            distributions the draft tokens are sampled from, None if the drafts are proposed without probabilities.
+        """
+        raise NotImplementedError
+
+    def rollback(self, num_tokens: Sequence[int]):
+        """The first num_tokens tokens of each sequence are the ones seen by the proposer, the others are rejected."""
+
+    def release(self):
+        """Release the resources of the proposer after generation."""
+
+
+class NGramProposer(DraftProposer):
+    """
+    Propose the tokens following the latest earlier occurrence of the last n-gram of a sequence, in the prompt or in
+    the text generated so far (prompt lookup), trying n from max_ngram down to min_ngram. It needs no model, and pays
+    off when the output copies spans of the prompt or repeats itself, e.g. the tags and cells of tables.
+
+    Args:
+        num_tokens: max number of draft tokens proposed per sequence and step.
+        max_ngram: the longest n-gram to look up.
+        min_ngram: the shortest n-gram to look up.
+    """
+
+    def __init__(self, num_tokens: int, max_ngram: int = 3, min_ngram: int = 1):
+        super().__init__(num_tokens)
+        if min_ngram < 1 or max_ngram < min_ngram:
+            raise ValueError(
+                f"Expect 1 <= min_ngram <= max_ngram, but got min_ngram {min_ngram}, max_ngram {max_ngram}"
+            )
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+
+    def propose(self, input_ids: np.ndarray, valid_length: Sequence[int], max_tokens: Sequence[int]):
+        batch_size = len(valid_length)
+        drafts = np.zeros((batch_size, self.num_tokens), dtype=np.int32)
+        num_drafts = np.zeros((batch_size,), dtype=np.int32)
+        for i in range(batch_size):
+            num_tokens = min(self.num_tokens, int(max_tokens[i]))
+            if num_tokens > 0:
+                draft = self.lookup(input_ids[i, : int(valid_length[i])], num_tokens)
+                drafts[i, : len(draft)] = draft
+                num_drafts[i] = len(draft)
+        return drafts, num_drafts, None
+
+    def lookup(self, token_ids: np.ndarray, num_tokens: int) -> np.ndarray:
+        """Up to num_tokens tokens following the latest earlier occurrence of the last n-gram of token_ids."""
+        length = len(token_ids)
+        for n in range(min(self.max_ngram, length - 1), self.min_ngram - 1, -1):
+            # the n-grams starting before the last one, so that at least a token follows each of them
+            windows = np.lib.stride_tricks.sliding_window_view(token_ids[:-1], n)
+            matches = np.flatnonzero(np.all(windows == token_ids[length - n :], axis=1))
+            if len(matches):
+                start = matches[-1] + n
+                return token_ids[start : start + num_tokens]
+        return token_ids[:0]
+
+
+class DraftModelProposer(DraftProposer):
+    """
+    Propose the tokens generated by a draft model, a smaller model sharing the vocabulary of the target model. The
+    draft tokens are sampled with the same repetition penalty, temperature, top-k and top-p as the target model, and
+    their distributions are returned so that the output of speculative sampling follows the target model exactly.
+
+    The draft model keeps its own kv cache, it should use past and paged attention like the target model: the tokens
+    accepted by the target model are fed to it at the start of the next step, in one forward of num_tokens + 1 tokens
+    if more than one token is pending.
+
+    Args:
+        model: the draft model, a [`GeneratorMixin`].
+        num_tokens: max number of draft tokens proposed per sequence and step.
+        generation_config: the generation configuration of the target model.
+    """
+
+    def __init__(self, model, num_tokens: int, generation_config: GenerationConfig):
+        super().__init__(num_tokens)
+        if not model.config.use_past or not getattr(model.config, "use_paged_attention", False):
+            raise ValueError("The draft model should set use_past and use_paged_attention in its config.")
+        self.model = model
+        self.logits_sampler = FusedLogitsSampler.from_generation_config(generation_config)
+        self.pad_token_id = generation_config.pad_token_id or 0
+        self.model_kwargs = {}
+        # number of tokens of each sequence in the kv cache of the draft model, None before prefill
+        self.num_cached: Optional[np.ndarray] = None
+
+    def reset(self, input_ids: np.ndarray, valid_length: Sequence[int], **model_kwargs):
+        self.model_kwargs = model_kwargs
+        self.num_cached = None
+        self.logits_sampler.reset(input_ids, valid_length)
+
+    def propose(self, input_ids: np.ndarray, valid_length: Sequence[int], max_tokens: Sequence[int]):
+        batch_size = len(valid_length)
+        valid_length = np.asarray(valid_length, dtype=np.int32)
+        num_drafts = np.clip(np.asarray(max_tokens, dtype=np.int32), 0, self.num_tokens)
+        is_finished = num_drafts == 0
+        drafts = np.full((batch_size, self.num_tokens), self.pad_token_id, dtype=np.int32)
+        draft_probs = [[] for _ in range(batch_size)]
+        for i in np.flatnonzero(~is_finished):
+            self.logits_sampler.set_sequence(i, input_ids[i, : valid_length[i]])
+
+        # the tokens after the last one are filled with the draft tokens, as the input ids of the next forwards
+        input_ids = input_ids.copy()
+        scores, candidate_ids = self._catch_up(input_ids, valid_length, is_finished)
+        for j in range(int(np.max(num_drafts))):
+            probs = softmax(scores, axis=-1)
+            for i in np.flatnonzero(num_drafts > j):
+                index = np.random.choice(len(probs[i]), p=probs[i]) if self.logits_sampler.do_sample else 0
+                drafts[i, j] = candidate_ids[i, index]
+                draft_probs[i].append((candidate_ids[i], probs[i]))
+                input_ids[i, valid_length[i] + j] = drafts[i, j]
+                self.logits_sampler.append(i, drafts[i, j])
+            if j + 1 < np.max(num_drafts):
+                is_drafting = num_drafts > j + 1
+                res = self._forward(input_ids, valid_length + j + 1, 1, ~is_drafting)
+                scores, candidate_ids = self.logits_sampler(res[0] if isinstance(res, tuple) else res)
+                self.num_cached = np.where(is_drafting, valid_length + j + 1, self.num_cached)
+        return drafts, num_drafts, draft_probs
+
+    def _catch_up(self, input_ids: np.ndarray, valid_length: np.ndarray, is_finished: np.ndarray):
+        """Feed the tokens of the sequences not in the kv cache of the draft model, return the scores of next tokens."""
+        model = self.model
+        seq_length = input_ids.shape[1]
+        if self.num_cached is None:
+            model.is_first_iteration = True
+            current_index = [valid_length[i] - 1 + i * seq_length for i in range(len(valid_length))]
+            model_inputs = model.prepare_inputs_for_generation(
+                input_ids, current_index=current_index, **self.model_kwargs
+            )
+            res = model._incremental_infer(model_inputs, current_index, valid_length)
+            self.num_cached = valid_length.copy()
+            return self.logits_sampler(res[0] if isinstance(res, tuple) else res, current_index)
+
+        width = self.num_tokens + 1
+        num_cached = np.where(is_finished, valid_length - 1, self.num_cached)
+        # the sequences of more pending tokens than width are fed first, so that the last forward feeds the last
+        # tokens of all the sequences
+        while np.max(valid_length - num_cached) > width:
+            is_feeding = valid_length - num_cached > width
+            self._forward(input_ids, num_cached + 1, width, ~is_feeding)
+            num_cached = np.where(is_feeding, num_cached + width, num_cached)
+        num_pending = valid_length - num_cached
+        num_tokens = 1 if np.max(num_pending) <= 1 else width
+        res = self._forward(input_ids, num_cached + 1, num_tokens, is_finished)
+        self.num_cached = np.where(is_finished, self.num_cached, valid_length)
+        logits = res[0] if isinstance(res, tuple) else res
+        if isinstance(logits, Tensor):
+            logits = logits.asnumpy()
+        logits = np.reshape(logits, (len(valid_length), num_tokens, -1))
+        # the logits of the last token of each sequence
+        last = np.clip(num_pending - 1, 0, num_tokens - 1)
+        return self.logits_sampler(logits[np.arange(len(valid_length)), last])
+
+    def _forward(self, input_ids: np.ndarray, valid_length: np.ndarray, num_tokens: int, is_finished: np.ndarray):
+        model_inputs = self.model.prepare_inputs_for_generation(input_ids, **self.model_kwargs)
+        return self.model._decode_infer(model_inputs, valid_length, num_tokens, is_finished)
+
+    def rollback(self, num_tokens: Sequence[int]):
+        if self.num_cached is not None:
+            self.num_cached = np.minimum(self.num_cached, np.asarray(num_tokens, dtype=np.int32))
+
+    def release(self):
+        self.model._release_kv_blocks()
+
+
+class SpeculativeDecoder:
+    r"""
+    Greedy search and sampling with speculative decoding. At each step, a draft source proposes up to `num_tokens`
+    tokens to follow each sequence, and the model verifies them in one incremental forward of the last token and the
+    draft tokens, at the positions after the sequence in the paged kv cache. The draft tokens are accepted from the
+    first one while they agree with the model, and the model samples the token after them, so that a step emits from 1
+    to num_tokens + 1 tokens for the cost of a single forward of the memory bound decoding. The kv cache of the
+    rejected tokens is rolled back by the valid length of the sequence, and is overwritten by the next steps.
+
+    The output follows the model exactly: the greedy search outputs the same tokens as without drafts, and the
+    sampling accepts a draft token d with probability min(1, p(d) / q(d)), p and q being the distributions of the model
+    and of the draft, and samples the token from max(p - q, 0) normalized on rejection (speculative sampling).
+
+    Parameters:
+        model (`GeneratorMixin`):
+            The model to generate with, a decoder-only model using past and paged attention.
+        generation_config (`GenerationConfig`):
+            The generation configuration, greedy search or sampling.
+        logits_sampler (`FusedLogitsSampler`):
+            The sampler applying the repetition penalty, temperature, top-k and top-p to the logits of the model.
+        proposer (`DraftProposer`):
+            The draft source, e.g. [`NGramProposer`] or [`DraftModelProposer`].
+    """
+
+    def __init__(
+        self,
+        model,
+        generation_config: GenerationConfig,
+        logits_sampler: FusedLogitsSampler,
+        proposer: DraftProposer,
+    ):
+        self.model = model
+        self.generation_config = generation_config
+        self.logits_sampler = logits_sampler
+        self.proposer = proposer
+        self.num_tokens = proposer.num_tokens
+
+        self.num_forwards = 0
+        self.num_proposed = 0
+        self.num_accepted = 0
+        self.num_generated = 0
+        self.total_time = 0.0
+
+    @property
+    def acceptance_rate(self) -> float:
+        """Ratio of the draft tokens accepted by the model."""
+        return self.num_accepted / self.num_proposed if self.num_proposed else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "forwards": self.num_forwards,
+            "proposed_tokens": self.num_proposed,
+            "accepted_tokens": self.num_accepted,
+            "generated_tokens": self.num_generated,
+            "acceptance_rate": self.acceptance_rate,
+            "tokens_per_forward": self.num_generated / self.num_forwards if self.num_forwards else 0.0,
+            "tokens_per_second": self.num_generated / self.total_time if self.total_time else 0.0,
+        }
+
+    def generate(self, origin_inputs: np.ndarray, streamer=None, **model_kwargs) -> List[np.ndarray]:
+        """Generate the sequences of the padded prompts origin_inputs, return the token ids of each sequence."""
+        total_time = time.time()
+        model = self.model
+        generation_config = self.generation_config
+        if generation_config.pad_token_id is None:
+            generation_config.pad_token_id = 0
+        pad_token_id = generation_config.pad_token_id
+        seq_length = model.config.seq_length
+
+        if streamer is not None:
+            streamer.put(origin_inputs)
+
+        batch_size = origin_inputs.shape[0]
+        valid_length = np.array(
+            [np.max(np.argwhere(origin_inputs[i] != pad_token_id)) + 1 for i in range(batch_size)], dtype=np.int32
+        )
+        input_ids_length = np.max(valid_length)
+        if generation_config.max_new_tokens is not None:
+            generation_config.max_length = generation_config.max_new_tokens + input_ids_length
+        max_length = min(generation_config.max_length, seq_length)
+        if input_ids_length >= max_length:
+            raise ValueError(
+                f"the input_ids length {input_ids_length} exceeds the max length config {max_length}."
+                f"check your inputs and set max_length larger than your inputs length."
+            )
+        input_ids = model._pad_inputs_using_max_length(origin_inputs=origin_inputs, pad_token_id=pad_token_id)
+        model.update_model_kwargs_before_generate(input_ids, model_kwargs)
+        is_finished = np.zeros((batch_size,), dtype=np.bool_)
+        origin_len = np.sum(valid_length)
+
+        self.logits_sampler.reset(input_ids, valid_length)
+        self.proposer.reset(input_ids, valid_length, **model_kwargs)
+
+        # prefill
+        model.is_first_iteration = True
+        current_index = [valid_length[i] - 1 + i * seq_length for i in range(batch_size)]
+        model_kwargs["current_index"] = current_index
+        model_inputs = model.prepare_inputs_for_generation(input_ids, **model_kwargs)
+        res = model._incremental_infer(model_inputs, current_index, valid_length)
+        logits = res[0] if isinstance(res, tuple) else res
+        outputs = self._verify(
+            lambda j: (logits, current_index),
+            np.zeros((batch_size, 0), np.int32),
+            np.zeros((batch_size,), np.int32),
+            None,
+            is_finished,
+        )
+        self._update(input_ids, valid_length, is_finished, outputs, max_length, streamer)
+
+        while not np.all(is_finished):
+            # the drafts leave room for the token sampled after them, and their positions should be in the kv cache
+            max_tokens = np.where(is_finished, 0, np.minimum(self.num_tokens, max_length - valid_length - 1))
+            num_drafts = np.zeros((batch_size,), dtype=np.int32)
+            drafts, draft_probs = None, None
+            if np.max(max_tokens) > 0 and np.all(valid_length[~is_finished] + self.num_tokens <= seq_length):
+                drafts, num_drafts, draft_probs = self.proposer.propose(input_ids, valid_length, max_tokens)
+                num_drafts = np.minimum(num_drafts, max_tokens)
+            num_tokens = self.num_tokens + 1 if np.max(num_drafts) > 0 else 1
+            for i in np.flatnonzero(num_drafts):
+                input_ids[i, valid_length[i] : valid_length[i] + num_drafts[i]] = drafts[i, : num_drafts[i]]
+
+            current_index = [valid_length[i] - 1 + i * seq_length for i in range(batch_size)]
+            model_kwargs["current_index"] = current_index
+            model_inputs = model.prepare_inputs_for_generation(input_ids, **model_kwargs)
+            res = model._decode_infer(model_inputs, valid_length, num_tokens, is_finished)
+            logits = res[0] if isinstance(res, tuple) else res
+            if isinstance(logits, Tensor) and not self.logits_sampler.topk_on_device:
+                logits = logits.asnumpy()
+            logits = logits.reshape((batch_size, num_tokens, -1))
+            outputs = self._verify(lambda j: (logits[:, j],), drafts, num_drafts, draft_probs, is_finished)
+
+            # roll back the rejected drafts
+            for i in np.flatnonzero(num_drafts):
+                input_ids[i, valid_length[i] : valid_length[i] + num_drafts[i]] = pad_token_id
+            self.num_proposed += int(np.sum(num_drafts))
+            self._update(input_ids, valid_length, is_finished, outputs, max_length, streamer)
+            self.proposer.rollback(valid_length - 1)
+            allocator = model._get_block_allocator()
+            for i in np.flatnonzero(~is_finished):
+                allocator.truncate(i, int(valid_length[i]))
+
+        self.proposer.release()
+        if streamer is not None:
+            streamer.end()
+        output_ids = [input_ids[i, : valid_length[i]].astype(np.int32) for i in range(batch_size)]
+
+        generate_len = np.sum(valid_length) - origin_len
+        self.num_generated += int(generate_len)
+        total_time = time.time() - total_time
+        self.total_time += total_time
+        _logger.info(
+            "total time: %s s; generated tokens: %s tokens; generate speed: %s tokens/s; draft tokens: %s proposed, "
+            "%s accepted, acceptance rate: %.3f; %.2f tokens per forward",
+            total_time,
+            generate_len,
+            generate_len / total_time,
+            self.num_proposed,
+            self.num_accepted,
+            self.acceptance_rate,
+            self.num_generated / self.num_forwards,
+        )
+        return output_ids
+
+    def _verify(
+        self,
+        get_scores,
+        drafts: np.ndarray,
+        num_drafts: np.ndarray,
+        draft_probs: Optional[List[List[DraftProbs]]],
+        is_finished: np.ndarray,
+    ) -> List[List[int]]:
+        """
+        The accepted draft tokens of each sequence and the token sampled after them, get_scores(j) being the arguments
+        of the sampler for the token after the j-th draft token. The scores of a position are processed after the
+        tokens accepted before it are appended to the sampler, as the repetition penalty depends on them.
+        """
+        self.num_forwards += 1
+        do_sample = self.logits_sampler.do_sample
+        eos_token_id = self.generation_config.eos_token_id
+        outputs = [[] for _ in range(len(num_drafts))]
+        verifying = np.flatnonzero(~is_finished).tolist()
+        j = 0
+        while verifying:
+            scores, candidate_ids = self.logits_sampler(*get_scores(j))
+            probs = softmax(scores, axis=-1) if do_sample else None
+            accepted = []
+            for i in verifying:
+                if j < num_drafts[i]:
+                    token = int(drafts[i, j])
+                    if do_sample:
+                        q = draft_probs[i][j] if draft_probs is not None else None
+                        target = _speculative_sample(candidate_ids[i], probs[i], token, q)
+                    else:
+                        target = int(candidate_ids[i, 0])
+                    if target == token:
+                        self.num_accepted += 1
+                        if token != eos_token_id:
+                            accepted.append(i)
+                else:
+                    target = (
+                        int(candidate_ids[i, np.random.choice(len(probs[i]), p=probs[i])])
+                        if do_sample
+                        else int(candidate_ids[i, 0])
+                    )
+                outputs[i].append(target)
+                self.logits_sampler.append(i, target)
+            verifying = accepted
+            j += 1
+        return outputs
+
+    def _update(self, input_ids, valid_length, is_finished, outputs: List[List[int]], max_length: int, streamer):
+        """Append the tokens of a step to the sequences."""
+        for i, output in enumerate(outputs):
+            if not output:
+                continue
+            input_ids[i, valid_length[i] : valid_length[i] + len(output)] = output
+            valid_length[i] += len(output)
+            if output[-1] == self.generation_config.eos_token_id or valid_length[i] >= max_length:
+                is_finished[i] = True
+        if streamer is not None:
+            streamer.put(outputs[0] if len(outputs) == 1 else outputs)
+
+
+def _speculative_sample(candidate_ids: np.ndarray, probs: np.ndarray, token: int, draft: Optional[DraftProbs]) -> int:
+    """
+    Accept the draft token with probability min(1, p(token) / q(token)), otherwise sample a token from max(p - q, 0)
+    normalized, p being the probs of the candidates of the model, and q the distribution of the draft, a point mass on
+    the token if draft is None.
+    """
+    if draft is None:
+        q = np.where(candidate_ids == token, 1.0, 0.0)
+        q_token = 1.0
+    else:
+        draft_ids, draft_probs = draft
+        q_token = float(np.sum(draft_probs[draft_ids == token]))
+        # the draft probs of the candidates of the model, 0 for the ones not among the candidates of the draft
+        order = np.argsort(draft_ids)
+        index = order[np.clip(np.searchsorted(draft_ids, candidate_ids, sorter=order), 0, len(draft_ids) - 1)]
+        q = np.where(draft_ids[index] == candidate_ids, draft_probs[index], 0.0)
+    p_token = float(np.sum(probs[candidate_ids == token]))
+    if np.random.random() * q_token < p_token:
+        return token
+    residual = np.maximum(probs - q, 0.0)
+    total = np.sum(residual)
+    if total <= 0:
+        residual, total = probs, np.sum(probs)
+    return int(candidate_ids[np.random.choice(len(residual), p=residual / total)])
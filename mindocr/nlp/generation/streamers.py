@@ -0,0 +1,166 @@
+"""Streamers of the generated tokens"""
+import logging
+import queue
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+__all__ = ["BaseStreamer", "TextStreamer", "TextIteratorStreamer"]
+_logger = logging.getLogger(__name__)
+
+
+class BaseStreamer:
+    """Base class of the streamers, which receive the token ids from `generate` as they are generated."""
+
+    def put(self, value):
+        """Receive the token ids, the prompt first, then the new tokens of each step."""
+        raise NotImplementedError
+
+    def end(self):
+        """Called by `generate` once the generation is finished."""
+        raise NotImplementedError
+
+
+class TextStreamer(BaseStreamer):
+    r"""
+    Streamer of the text of the generated tokens of a single sequence, which prints the text to stdout as soon as it
+    is complete. The tokens are decoded with the incremental decoder of the tokenizer, so that a character split over
+    several byte-level tokens is emitted once all its bytes are generated.
+
+    It also measures the time to the first token from the prompt, and the latency between the following tokens.
+
+    Parameters:
+        tokenizer:
+            The tokenizer to decode the tokens with, which provides `incremental_decoder`, e.g. [`QwenTokenizer`].
+        skip_prompt (`bool`, *optional*, defaults to `True`):
+            Whether to skip the prompt, i.e. the first token ids put by `generate`.
+        skip_special_tokens (`bool`, *optional*, defaults to `True`):
+            Whether to remove the special tokens from the text.
+
+    Example:
+        >>> streamer = TextStreamer(tokenizer)
+        >>> _ = model.generate(input_ids, streamer=streamer, max_new_tokens=64)
+        >>> streamer.latency_stats()
+    """
+
+    def __init__(self, tokenizer, skip_prompt: bool = True, skip_special_tokens: bool = True):
+        self.tokenizer = tokenizer
+        self.skip_prompt = skip_prompt
+        self.skip_special_tokens = skip_special_tokens
+        self.decoder = tokenizer.incremental_decoder(skip_special_tokens=skip_special_tokens)
+        self.next_tokens_are_prompt = True
+        self.start_time = None
+        self.token_times = []
+
+    def put(self, value):
+        value = np.asarray(value)
+        if value.ndim > 1:
+            if value.shape[0] > 1:
+                raise ValueError(
+                    f"{self.__class__.__name__} only supports a batch size of 1, but got {value.shape[0]}."
+                )
+            value = value[0]
+        token_ids = value.reshape(-1).tolist()
+
+        if self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            self.start_time = time.time()
+            self.token_times = []
+            if self.skip_prompt:
+                return
+        else:
+            self.token_times.extend([time.time()] * len(token_ids))
+
+        text = self.decoder.decode(token_ids)
+        if text:
+            self.on_finalized_text(text)
+
+    def end(self):
+        text = self.decoder.flush()
+        self.on_finalized_text(text, stream_end=True)
+        self.next_tokens_are_prompt = True
+        _logger.debug("latency of the streamed tokens: %s", self.latency_stats())
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        """Print the new text to stdout, with a new line at the end of stream."""
+        print(text, flush=True, end="" if not stream_end else None)
+
+    def latency_stats(self) -> Dict[str, Optional[float]]:
+        """
+        Return the number of generated tokens, the time to the first token from the prompt, and the mean, median and
+        90th percentile of the latency between two tokens, in seconds.
+        """
+        stats = {
+            "num_tokens": len(self.token_times),
+            "time_to_first_token": None,
+            "inter_token_latency": None,
+            "inter_token_latency_p50": None,
+            "inter_token_latency_p90": None,
+        }
+        if self.token_times and self.start_time is not None:
+            stats["time_to_first_token"] = self.token_times[0] - self.start_time
+        if len(self.token_times) > 1:
+            latencies = np.diff(self.token_times)
+            stats["inter_token_latency"] = float(np.mean(latencies))
+            stats["inter_token_latency_p50"] = float(np.percentile(latencies, 50))
+            stats["inter_token_latency_p90"] = float(np.percentile(latencies, 90))
+        return stats
+
+
+class TextIteratorStreamer(TextStreamer):
+    r"""
+    Streamer of the text of the generated tokens of a single sequence, which is an iterator of the text chunks. The
+    generation runs on another thread, e.g. `generate` or [`ContinuousBatchingScheduler`], and the text is consumed on
+    the current thread as soon as it is complete.
+
+    Parameters:
+        tokenizer:
+            The tokenizer to decode the tokens with, which provides `incremental_decoder`, e.g. [`QwenTokenizer`].
+        skip_prompt (`bool`, *optional*, defaults to `True`):
+            Whether to skip the prompt, i.e. the first token ids put by `generate`.
+        skip_special_tokens (`bool`, *optional*, defaults to `True`):
+            Whether to remove the special tokens from the text.
+        timeout (`float`, *optional*):
+            Timeout in seconds of waiting for the next text chunk, which raises `queue.Empty`. Wait forever if not set.
+
+    Example:
+        >>> streamer = TextIteratorStreamer(tokenizer)
+        >>> thread = Thread(target=model.generate, args=(input_ids,), kwargs={"streamer": streamer})
+        >>> thread.start()
+        >>> for text in streamer:
+        ...     print(text, end="")
+    """
+
+    def __init__(
+        self, tokenizer, skip_prompt: bool = True, skip_special_tokens: bool = True, timeout: Optional[float] = None
+    ):
+        super().__init__(tokenizer, skip_prompt=skip_prompt, skip_special_tokens=skip_special_tokens)
+        self.text_queue = queue.Queue()
+        self.stop_signal = None
+        self.timeout = timeout
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        """Queue the new text, and the stop signal at the end of stream."""
+        if text:
+            self.text_queue.put(text, timeout=self.timeout)
+        if stream_end:
+            self.text_queue.put(self.stop_signal, timeout=self.timeout)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        value = self.text_queue.get(timeout=self.timeout)
+        if value is self.stop_signal:
+            raise StopIteration()
+        return value
+
+
+def format_latency_stats(stats: Dict[str, Optional[float]]) -> str:
+    """Format the latency stats of a streamer in milliseconds for logging."""
+    items = [f"{stats['num_tokens']} tokens"]
+    for key in ("time_to_first_token", "inter_token_latency", "inter_token_latency_p50", "inter_token_latency_p90"):
+        if stats[key] is not None:
+            items.append(f"{key} {stats[key] * 1000:.1f} ms")
+    return ", ".join(items)
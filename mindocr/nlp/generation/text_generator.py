@@ -2,7 +2,7 @@
 import copy
 import logging
 import time
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
 import numpy as np
 
@@ -11,8 +11,10 @@ from mindspore import ops
 from mindspore.common.tensor import Tensor
 
 from mindocr.nlp.generation.beam_search import BeamSearchScorer
+from mindocr.nlp.generation.continuous_batching import ContinuousBatchingScheduler
 from mindocr.nlp.generation.generation_config import GenerationConfig
 from mindocr.nlp.generation.logits_process import (
+    FusedLogitsSampler,
     LogitNormalization,
     LogitsProcessorList,
     RepetitionPenaltyLogitsProcessor,
@@ -20,7 +22,9 @@ from mindocr.nlp.generation.logits_process import (
     TopKLogitsWarper,
     TopPLogitsWarper,
 )
+from mindocr.nlp.generation.speculative import DraftModelProposer, NGramProposer, SpeculativeDecoder
 from mindocr.nlp.generation.utils import softmax_with_threads, topk
+from mindocr.nlp.utils.paged_kvcache import BlockAllocator, PrefixCachingBlockAllocator
 
 __all__ = ["GeneratorMixin"]
 _logger = logging.getLogger(__name__)
@@ -68,8 +72,8 @@ class GeneratorMixin:
         return
 
     @staticmethod
-    def slice_incremental_inputs(model_inputs: dict, current_index):
-        """used for non-first iterations, slice the inputs to length 1."""
+    def slice_incremental_inputs(model_inputs: dict, current_index, num_tokens: int = 1):
+        """used for non-first iterations, slice the inputs to length num_tokens from current index, 1 by default."""
         input_ids = model_inputs.pop("input_ids")
         if isinstance(input_ids, Tensor):
             input_ids = input_ids.asnumpy()
@@ -77,7 +81,7 @@ class GeneratorMixin:
         for i, index_value in enumerate(current_index):
             current_index_tmp = int(index_value) - i * input_ids.shape[1]  # multi batch
             # use numpy to slice array to avoid compile ascend slice op
-            inputs_tmp.append(input_ids[i][current_index_tmp : current_index_tmp + 1])
+            inputs_tmp.append(input_ids[i][current_index_tmp : current_index_tmp + num_tokens])
         inputs_tmp = np.array(inputs_tmp, dtype=np.int32)
         model_inputs["input_ids"] = Tensor(inputs_tmp, mstype.int32)
 
@@ -153,6 +157,22 @@ class GeneratorMixin:
             wrappers.append(LogitNormalization())
         return wrappers
 
+    def _get_logits_sampler(
+        self, generation_config: GenerationConfig, logits_processor: Optional[LogitsProcessorList]
+    ) -> Optional[FusedLogitsSampler]:
+        """
+        The fused sampler replacing the default logits processors and warpers, None if fused sampling is off or not
+        applicable, i.e. with custom logits processors, beam search or sample acceleration.
+        """
+        if (
+            not getattr(generation_config, "fused_sampling", False)
+            or logits_processor
+            or generation_config.num_beams > 1
+            or self.config.is_sample_acceleration
+        ):
+            return None
+        return FusedLogitsSampler.from_generation_config(generation_config)
+
     @staticmethod
     def _get_generation_mode(generation_config: GenerationConfig):
         """determine the generation mode by config"""
@@ -198,8 +218,77 @@ class GeneratorMixin:
         )
         return input_ids
 
+    def _get_block_allocator(self) -> BlockAllocator:
+        """The allocator of the paged kv cache blocks, created at the first use."""
+        if getattr(self, "block_allocator", None) is None:
+            config = self.config
+            n_kv_heads = getattr(config, "n_kv_heads", None) or config.num_heads
+            head_dim = config.hidden_size // config.num_heads
+            itemsize = np.dtype(mstype.dtype_to_nptype(config.compute_dtype)).itemsize
+            bytes_per_token = 2 * config.num_layers * n_kv_heads * head_dim * itemsize
+            prefix_cache_bytes = getattr(config, "prefix_cache_bytes", 0)
+            if prefix_cache_bytes > 0:
+                self.block_allocator = PrefixCachingBlockAllocator(
+                    config.num_blocks, config.block_size, bytes_per_token, prefix_cache_bytes
+                )
+            else:
+                self.block_allocator = BlockAllocator(config.num_blocks, config.block_size, bytes_per_token)
+        return self.block_allocator
+
+    def _min_reused_prefix_length(self, **model_kwargs) -> int:
+        """
+        The shortest cached prefix which can be reused for the inputs. The tokens embedded with the model kwargs, e.g.
+        the image features of a multimodal model, can not be computed after a reused prefix, so the prefix should
+        cover them.
+        """
+        return 0
+
+    def _prefetch_model_kwargs(self, model_kwargs_list: List[Dict]):
+        """
+        Prepare the model kwargs of several requests ahead of their prefill, e.g. encode the images of the requests
+        queued for generation together.
+        """
+
+    def _paged_attention_inputs(self, valid_length_each_example, is_first_iteration: bool) -> dict:
+        """
+        The block tables and slot mapping of the paged kv cache, each example of the batch is a sequence of the block
+        allocator, whose blocks grow with its valid length.
+        """
+        allocator = self._get_block_allocator()
+        if is_first_iteration:
+            allocator.free_all()
+        seq_ids = list(range(len(valid_length_each_example)))
+        for seq_id, valid_length in zip(seq_ids, valid_length_each_example):
+            allocator.allocate(seq_id, int(valid_length))
+        block_tables = allocator.build_block_tables(seq_ids, self.config.seq_length // allocator.block_size)
+        if is_first_iteration:
+            slot_mapping = allocator.build_prefill_slots(seq_ids, valid_length_each_example, self.config.seq_length)
+        else:
+            slot_mapping = allocator.build_decode_slots(seq_ids, valid_length_each_example)
+        return {
+            "block_tables": Tensor(block_tables, mstype.int32),
+            "slot_mapping": Tensor(slot_mapping, mstype.int32),
+        }
+
+    def _release_kv_blocks(self):
+        """Free the kv cache blocks of the examples after generation, and log their memory."""
+        allocator = self._get_block_allocator()
+        for seq_id in list(allocator.block_tables):
+            reserved, used = allocator.kv_bytes(seq_id)
+            _logger.debug("kv bytes of example %s: %s reserved, %s used", seq_id, reserved, used)
+        reserved, used = allocator.kv_bytes()
+        _logger.info(
+            "kv cache: %s bytes reserved by blocks, %s bytes used, %s bytes reserved without paging",
+            reserved,
+            used,
+            len(allocator.block_tables) * self.config.seq_length * allocator.bytes_per_token,
+        )
+        allocator.free_all()
+
     def _incremental_infer(self, model_inputs: dict, current_index, valid_length_each_example):
         """model forward for incremental infer."""
+        if getattr(self.config, "use_paged_attention", False):
+            model_inputs.update(self._paged_attention_inputs(valid_length_each_example, self.is_first_iteration))
         # Claim the first graph
         if self.is_first_iteration:
             self.add_flags_recursive(is_first_iteration=True)
@@ -224,11 +313,41 @@ class GeneratorMixin:
 
         return res
 
+    def _decode_infer(self, model_inputs: dict, valid_length_each_example, num_tokens: int = 1, is_finished=None):
+        """
+        Incremental forward of num_tokens tokens of each example with the paged kv cache: the last token, at position
+        valid_length - 1, and the tokens after it in input_ids, e.g. the draft tokens of speculative decoding. The
+        finished examples are not written to the cache. Returns the outputs of the model, with the logits of all the
+        tokens fed.
+        """
+        seq_length = self.config.seq_length
+        batch_size = len(valid_length_each_example)
+        allocator = self._get_block_allocator()
+        seq_ids = [None if is_finished is not None and is_finished[i] else i for i in range(batch_size)]
+        for seq_id in seq_ids:
+            if seq_id is not None:
+                allocator.allocate(seq_id, int(valid_length_each_example[seq_id]) + num_tokens - 1)
+        # keep the positions of the finished examples in range, their outputs are discarded
+        valid_length = np.minimum(np.asarray(valid_length_each_example), seq_length - num_tokens + 1)
+        current_index = [valid_length[i] - 1 + i * seq_length for i in range(batch_size)]
+        self.slice_incremental_inputs(model_inputs, current_index, num_tokens)
+        model_inputs["input_position"] = Tensor(current_index, mstype.int32)
+        model_inputs["init_reset"] = Tensor([True], mstype.bool_)
+        model_inputs["batch_valid_length"] = Tensor([valid_length], mstype.int32)
+        model_inputs["block_tables"] = Tensor(
+            allocator.build_block_tables(seq_ids, seq_length // allocator.block_size), mstype.int32
+        )
+        model_inputs["slot_mapping"] = Tensor(
+            allocator.build_decode_slots(seq_ids, valid_length, num_tokens), mstype.int32
+        )
+        return self(**model_inputs)  # pylint: disable=E1102
+
     def _greedy_search(
         self,
         origin_inputs,
         generation_config: GenerationConfig,
         logits_processor: Optional[LogitsProcessorList] = None,
+        logits_sampler: Optional[FusedLogitsSampler] = None,
         streamer=None,
         **model_kwargs,
     ):
@@ -252,6 +371,8 @@ class GeneratorMixin:
             logits_processor (`LogitsProcessorList`, *optional*):
                 An instance of [`LogitsProcessorList`]. List of instances of class derived from [`LogitsProcessor`]
                 used to modify the prediction scores of the language modeling head applied at each generation step.
+            logits_sampler (`FusedLogitsSampler`, *optional*):
+                The fused sampler which replaces the logits processors and warpers if given.
             streamer (`TextStreamer, *optional*`):
                 The streamer that generator uses.
             model_kwargs:
@@ -344,6 +465,8 @@ class GeneratorMixin:
         if generation_config.use_past:
             self.is_first_iteration = True
         need_gather_logits = True
+        if logits_sampler is not None:
+            logits_sampler.reset(input_ids, valid_length_each_example)
 
         origin_len = np.sum(valid_length_each_example)
         prepare_time = time.time() - prepare_time
@@ -385,7 +508,10 @@ class GeneratorMixin:
 
             search_time = time.time()
             # post process logits; skip this phase if post process is done in graph
-            if not self.config.is_sample_acceleration:
+            if logits_sampler is not None:
+                logits = res[0] if isinstance(res, tuple) else res
+                probs, p_args = logits_sampler(logits, current_index if need_gather_logits else None)
+            elif not self.config.is_sample_acceleration:
                 # convert to numpy for post process
                 logits = res[0] if isinstance(res, tuple) else res
                 if isinstance(logits, Tensor):
@@ -420,6 +546,8 @@ class GeneratorMixin:
                 # get target token id
                 target = p_args[i][target_index]
                 input_ids[i, valid_length_each_example[i]] = target
+                if logits_sampler is not None:
+                    logits_sampler.append(i, target)
 
                 if streamer is not None:
                     # assign target element
@@ -477,6 +605,7 @@ class GeneratorMixin:
         generation_config: GenerationConfig,
         logits_processor: Optional[LogitsProcessorList] = None,
         logits_warper: Optional[LogitsProcessorList] = None,
+        logits_sampler: Optional[FusedLogitsSampler] = None,
         streamer=None,
         **model_kwargs,
     ):
@@ -501,6 +630,8 @@ class GeneratorMixin:
                 An instance of [`LogitsProcessorList`]. List of instances of class derived from [`LogitsWarper`] used
                 to warp the prediction score distribution of the language modeling head applied before multinomial
                 sampling at each generation step.
+            logits_sampler (`FusedLogitsSampler`, *optional*):
+                The fused sampler which replaces the logits processors and warpers if given.
             streamer (`TextStreamer, *optional*`):
                 The streamer that generator uses.
             model_kwargs:
@@ -594,6 +725,8 @@ class GeneratorMixin:
         if generation_config.use_past:
             self.is_first_iteration = True
         need_gather_logits = True
+        if logits_sampler is not None:
+            logits_sampler.reset(input_ids, valid_length_each_example)
 
         origin_len = np.sum(valid_length_each_example)
         prepare_time = time.time() - prepare_time
@@ -635,7 +768,10 @@ class GeneratorMixin:
 
             sample_time = time.time()
             # post process logits; skip this phase if post process is done in graph
-            if not self.config.is_sample_acceleration:
+            if logits_sampler is not None:
+                logits = res[0] if isinstance(res, tuple) else res
+                probs, p_args = logits_sampler(logits, current_index if need_gather_logits else None)
+            elif not self.config.is_sample_acceleration:
                 # convert to numpy for post process
                 logits = res[0] if isinstance(res, tuple) else res
                 if isinstance(logits, Tensor):
@@ -673,6 +809,8 @@ class GeneratorMixin:
                 # get target token id
                 target = p_args[i][target_index]
                 input_ids[i, valid_length_each_example[i]] = target
+                if logits_sampler is not None:
+                    logits_sampler.append(i, target)
 
                 if streamer is not None:
                     # assign target element
@@ -779,7 +917,7 @@ class GeneratorMixin:
         if generation_config.pad_token_id is None:
             generation_config.pad_token_id = 0
 
-        batch_size = len(beam_scorer._beam_hyps)  # pylint: disable=W0212
+        batch_size = beam_scorer.batch_size
         num_beams = beam_scorer.num_beams
         batch_beam_size = origin_inputs.shape[0]
         _logger.debug("The input shape is: %s", origin_inputs.shape)
@@ -931,18 +1069,16 @@ class GeneratorMixin:
 
             update_time = time.time()
             # reorder model inputs
-            old_input_ids = input_ids.copy()
-            for i in range(batch_beam_size):
-                input_ids[i] = old_input_ids[beam_idx[i], :]
+            input_ids = input_ids[beam_idx]
 
             # add new tokens to input_ids
-            for i in range(batch_beam_size):
-                input_ids[i, valid_length_each_example[i]] = beam_next_tokens[i]
-                if is_encoder_decoder:
-                    target_mask[i][valid_length_each_example[i]] = int(1)
-
-                input_mask[i][valid_length_each_example[i]] = 1
-                valid_length_each_example[i] += int(1)
+            beam_rows = np.arange(batch_beam_size)
+            next_positions = np.reshape(valid_length_each_example, -1)
+            input_ids[beam_rows, next_positions] = beam_next_tokens
+            if is_encoder_decoder:
+                target_mask[beam_rows, next_positions] = 1
+            input_mask[beam_rows, next_positions] = 1
+            valid_length_each_example += 1
 
             update_time = time.time() - update_time
             _logger.debug(
@@ -975,6 +1111,41 @@ class GeneratorMixin:
 
         return sequence_outputs["sequences"]
 
+    def _speculative_search(
+        self,
+        origin_inputs,
+        generation_config: GenerationConfig,
+        logits_sampler: Optional[FusedLogitsSampler],
+        draft_model: Optional["GeneratorMixin"] = None,
+        streamer=None,
+        **model_kwargs,
+    ):
+        """
+        Greedy search or sampling with speculative decoding, see [`SpeculativeDecoder`]. The draft tokens are generated
+        by draft_model if given, otherwise they are looked up in the sequence by [`NGramProposer`].
+        """
+        if not generation_config.use_past or not getattr(self.config, "use_paged_attention", False):
+            raise ValueError(
+                "Speculative decoding verifies the draft tokens in one forward with the paged kv cache, "
+                "please set use_past and use_paged_attention of the model config."
+            )
+        if logits_sampler is None:
+            raise ValueError(
+                "Speculative decoding needs the fused logits sampler, which is not used with custom logits "
+                "processors, `fused_sampling=False` or sample acceleration."
+            )
+        num_tokens = generation_config.num_speculative_tokens
+        if draft_model is not None:
+            proposer = DraftModelProposer(draft_model, num_tokens, generation_config)
+        else:
+            proposer = NGramProposer(
+                num_tokens, generation_config.prompt_lookup_max_ngram, generation_config.prompt_lookup_min_ngram
+            )
+        decoder = SpeculativeDecoder(self, generation_config, logits_sampler, proposer)
+        output_ids = decoder.generate(origin_inputs, streamer=streamer, **model_kwargs)
+        self.speculative_stats = decoder.stats()
+        return output_ids
+
     def generate(
         self,
         input_ids: Optional[Union[List[int], List[List[int]]]],
@@ -982,6 +1153,7 @@ class GeneratorMixin:
         logits_processor: Optional[LogitsProcessorList] = None,
         streamer=None,
         seed: Optional[int] = None,
+        draft_model: Optional["GeneratorMixin"] = None,
         **kwargs,
     ):
         origin_phase = self.phase
@@ -1024,6 +1196,7 @@ class GeneratorMixin:
             generation_config.top_k = 0
         _logger.info("Generation Config is: %s", generation_config)
 
+        logits_sampler = self._get_logits_sampler(generation_config, logits_processor)
         logits_processor = self._get_logits_processor(
             generation_config=generation_config,
             logits_processor=logits_processor,
@@ -1035,12 +1208,23 @@ class GeneratorMixin:
         if streamer is not None and (generation_config.num_beams > 1):
             raise ValueError("`streamer` cannot be used with beam search yet. Make sure that `num_beams` is set to 1.")
 
-        if generation_mode == GenerationMode.GREEDY_SEARCH:
+        if generation_config.num_speculative_tokens > 0 and generation_mode != GenerationMode.BEAM_SEARCH:
+            output_ids = self._speculative_search(
+                origin_inputs=input_ids,
+                generation_config=generation_config,
+                logits_sampler=logits_sampler,
+                draft_model=draft_model,
+                streamer=streamer,
+                **model_kwargs,
+            )
+
+        elif generation_mode == GenerationMode.GREEDY_SEARCH:
             # run greedy search
             output_ids = self._greedy_search(
                 origin_inputs=input_ids,
                 generation_config=generation_config,
                 logits_processor=logits_processor,
+                logits_sampler=logits_sampler,
                 streamer=streamer,
                 **model_kwargs,
             )
@@ -1055,6 +1239,7 @@ class GeneratorMixin:
                 generation_config=generation_config,
                 logits_processor=logits_processor,
                 logits_warper=logits_warper,
+                logits_sampler=logits_sampler,
                 streamer=streamer,
                 **model_kwargs,
             )
@@ -1077,6 +1262,44 @@ class GeneratorMixin:
                 **model_kwargs,
             )
 
+        if generation_config.use_past and getattr(self.config, "use_paged_attention", False):
+            self._release_kv_blocks()
+
         # set to original phase
         self.set_train(origin_phase == "train")
         return output_ids
+
+    def continuous_batching(
+        self,
+        generation_config: Optional[GenerationConfig] = None,
+        logits_processor: Optional[LogitsProcessorList] = None,
+        max_batch_size: Optional[int] = None,
+        **kwargs,
+    ) -> ContinuousBatchingScheduler:
+        """
+        Create a scheduler which generates the requests submitted to it with continuous batching, i.e. finished
+        sequences leave the batch and queued requests join it at every step. Greedy search and sampling are supported.
+
+        Parameters:
+            generation_config (`GenerationConfig`, *optional*):
+                The generation configuration shared by the requests, the default config of the model is used if not
+                set.
+            logits_processor (`LogitsProcessorList`, *optional*):
+                Custom logits processors, merged with the processors created from the generation configuration.
+            max_batch_size (`int`, *optional*):
+                Max number of requests decoded together, which defaults to the batch size of the model.
+            kwargs:
+                Attributes of `generation_config` to update, and the other arguments of
+                [`ContinuousBatchingScheduler`].
+
+        Return:
+            A [`ContinuousBatchingScheduler`], requests are submitted by `scheduler.submit(input_ids, **model_kwargs)`
+            which returns the future of the generated token ids.
+        """
+        return ContinuousBatchingScheduler(
+            self,
+            generation_config=generation_config,
+            logits_processor=logits_processor,
+            max_batch_size=max_batch_size,
+            **kwargs,
+        )
@@ -208,6 +208,7 @@ class QwenConfig(BaseConfig):
         max_decode_length: int = 1024,
         block_size: int = 16,
         num_blocks: int = 512,
+        prefix_cache_bytes: int = 0,
         top_k: int = 5,
         top_p: float = 1.0,
         do_sample: bool = True,
@@ -259,11 +260,14 @@ class QwenConfig(BaseConfig):
         self.use_paged_attention = use_paged_attention
         self.block_size = block_size
         self.num_blocks = num_blocks
+        self.prefix_cache_bytes = prefix_cache_bytes
 
 
 class VaryConfig(QwenConfig):
-    def __init__(self, **kwargs):
+    def __init__(self, image_cache_bytes: int = 0, image_batch_size: int = 1, **kwargs):
         super(VaryConfig, self).__init__(**kwargs)
+        self.image_cache_bytes = image_cache_bytes
+        self.image_batch_size = image_batch_size
 
 
 class SAMConfig(BaseConfig):
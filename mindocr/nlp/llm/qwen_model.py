@@ -12,7 +12,7 @@ from mindspore.nn.layer.flash_attention import FlashAttention
 
 from mindocr.nlp.llm.base_llm_model import BaseLLMModel
 from mindocr.nlp.llm.configs import QwenConfig
-from mindocr.nlp.utils.kvcache_mgr import KVCacheMgr, KVCachePreprocess
+from mindocr.nlp.utils.kvcache_mgr import KVCacheMgr, KVCachePreprocess, PagedKVCacheMgr
 from mindocr.nlp.utils.layers import Linear
 from mindocr.nlp.utils.loss import CrossEntropyLoss
 
@@ -116,6 +116,7 @@ class FreqsMgr(nn.Cell):
             self.reshape.add_prim_attr("skip_redistribution", True)
         self.slice = ops.StridedSlice()
         self.sub = ops.Sub()
+        self.add = ops.Add()
         self.gather = ops.Gather()
 
     def construct(self, seq_length=None):
@@ -125,9 +126,18 @@ class FreqsMgr(nn.Cell):
         freqs_sin = self.slice(freqs_sin, (0, 0), (seqlen, self.head_dim), (1, 1))
         return freqs_cos, freqs_sin, self.swap_mask
 
-    def increment(self, batch_valid_length, batch_size):
-        freqs_cos = self.reshape(self.gather(self.freqs_cos, batch_valid_length, 0), (batch_size, 1, 1, self.head_dim))
-        freqs_sin = self.reshape(self.gather(self.freqs_sin, batch_valid_length, 0), (batch_size, 1, 1, self.head_dim))
+    def increment(self, batch_valid_length, batch_size, seq_length=1):
+        if seq_length > 1:
+            # positions of several tokens fed together, e.g. the draft tokens of speculative decoding
+            batch_valid_length = self.add(
+                self.reshape(batch_valid_length, (-1, 1)), ops.arange(0, seq_length, 1, dtype=mstype.int32)
+            )
+        freqs_cos = self.reshape(
+            self.gather(self.freqs_cos, batch_valid_length, 0), (batch_size, 1, seq_length, self.head_dim)
+        )
+        freqs_sin = self.reshape(
+            self.gather(self.freqs_sin, batch_valid_length, 0), (batch_size, 1, seq_length, self.head_dim)
+        )
         return freqs_cos, freqs_sin, self.swap_mask
 
     @staticmethod
@@ -337,11 +347,12 @@ class LLamaAttention(nn.Cell):
     Inputs:
             - **x** (Tensor) - The input tokens with shape (batch_size, src_seq_length, hidden_size) or
                 (batch_size * src_seq_length, hidden_size), if the use_past is False or is_first_iteration=True.
-                Otherwise, must be (batch_size, 1, hidden_size)
+                Otherwise, must be (batch_size, 1, hidden_size), or (batch_size, num_tokens, hidden_size) to feed
+                several tokens at once with the paged kv cache.
             - **freqs_cis** (Tuple) - The precompute freqs and mask for rotary position embedding used in attention.
             - **attention_mask** (Tensor) - If the use_past is False or is_first_iteration=True, the attention mask
                 matrix should ba (batch_size, src_seq_length, tgt_seq_length), or None. None means there will be no mask
-                in softmax computation. Otherwise, the mask must be (batch_size, 1, tgt_seq_length)
+                in softmax computation. Otherwise, the mask must be (batch_size, 1 or num_tokens, tgt_seq_length)
             - **key_past** (Tensor) - Float16 tensor with shape (batch_size, num_heads, head_dim, tgt_seq_length).
                 The past calculated key vector. Used for incremental prediction when the use_past is True.
                 Default None.
@@ -383,6 +394,9 @@ class LLamaAttention(nn.Cell):
         is_flexible_shape=False,
         use_rope_slice=False,
         use_flash_attention=False,
+        use_paged_attention=False,
+        block_size=16,
+        num_blocks=512,
     ):
         super().__init__()
         self.seq_length = seq_length
@@ -469,7 +483,16 @@ class LLamaAttention(nn.Cell):
         if self.use_flash_attention:
             self.flash_attention = FlashAttention(self.head_dim, n_heads, next_block_num=0, high_precision=True)
 
-        if self.use_past:
+        if self.use_past and use_paged_attention:
+            self.kvcache_mgr = PagedKVCacheMgr(
+                self.n_kv_head,
+                self.head_dim,
+                num_blocks=num_blocks,
+                block_size=block_size,
+                max_seq_length=seq_length,
+                compute_dtype=compute_dtype,
+            )
+        elif self.use_past:
             self.kvcache_mgr = KVCacheMgr(
                 self.n_kv_head,
                 self.head_dim,
@@ -501,7 +524,7 @@ class LLamaAttention(nn.Cell):
             key = self.cast(self.wk(x), self.dtype)  # dp, 1 -> dp, mp
             value = self.cast(self.wv(x), self.dtype)  # dp, 1 -> dp, mp
 
-        if self.use_past and not self.is_first_iteration:
+        if self.use_past and not self.is_first_iteration and seq_len == 1:
             query = self.reshape(query, (bs, self.n_head, 1, self.head_dim))
             key = self.reshape(key, (bs, self.n_kv_head, 1, self.head_dim))
             value = self.reshape(value, (bs, self.n_kv_head, 1, self.head_dim))
@@ -695,6 +718,9 @@ class QwenForCausalLM(BaseLLMModel):
         batch_valid_length=None,
         batch_index=None,
         zactivate_len=None,
+        block_tables=None,
+        slot_mapping=None,
+        copy_slots=None,
     ):
         bsz, seqlen = input_ids.shape
         if self.use_past:
@@ -716,6 +742,9 @@ class QwenForCausalLM(BaseLLMModel):
             batch_valid_length=batch_valid_length,
             batch_index=batch_index,
             zactivate_len=zactivate_len,
+            block_tables=block_tables,
+            slot_mapping=slot_mapping,
+            copy_slots=copy_slots,
         )
         pre_gather = (not self.use_past or self.is_first_iteration) and batch_valid_length is not None
         if pre_gather:
@@ -799,6 +828,9 @@ class QwenModel(BaseLLMModel):
                 qkv_has_bias=True,
                 use_past=config.use_past,
                 use_flash_attention=config.use_flash_attention,
+                use_paged_attention=config.use_paged_attention,
+                block_size=config.block_size,
+                num_blocks=config.num_blocks,
             )
 
             self.layers.append(layer)
@@ -826,6 +858,7 @@ class QwenModel(BaseLLMModel):
             is_dynamic=config.is_dynamic,
             use_kvcache_op=config.use_kvcache_op,
             is_flexible_shape=config.is_flexible_shape,
+            use_paged_attention=config.use_paged_attention,
         )
         # 5. ln_f
         self.ln_f = LlamaRMSNorm(
@@ -838,7 +871,15 @@ class QwenModel(BaseLLMModel):
         self.shape = ops.Shape()
 
     def construct(
-        self, input_ids: Tensor, init_reset=True, batch_valid_length=None, batch_index=None, zactivate_len=None
+        self,
+        input_ids: Tensor,
+        init_reset=True,
+        batch_valid_length=None,
+        batch_index=None,
+        zactivate_len=None,
+        block_tables=None,
+        slot_mapping=None,
+        copy_slots=None,
     ):
         """construct"""
         if input_ids is not None:
@@ -863,7 +904,7 @@ class QwenModel(BaseLLMModel):
                 freqs_cis = self.freqs_mgr(seq_len)
                 mask = self.casual_mask(input_ids)  # mask: [bs, seq, seq]
             else:
-                freqs_cis = self.freqs_mgr.increment(batch_valid_length, bs)
+                freqs_cis = self.freqs_mgr.increment(batch_valid_length, bs, seq_len)
                 if self.is_dynamic and self.is_flexible_shape and not self.use_kvcache_op:
                     mask = self.casual_mask.increment_slice(
                         self.kvcache_preprocess.range,
@@ -872,10 +913,14 @@ class QwenModel(BaseLLMModel):
                         zactivate_len,
                     )
                 else:
-                    mask = self.casual_mask.increment(self.kvcache_preprocess.range, batch_valid_length, zactivate_len)
+                    mask = self.casual_mask.increment(
+                        self.kvcache_preprocess.range, batch_valid_length, zactivate_len, seq_len
+                    )
             mask = self.casual_mask.post_process(mask)
 
-            kvcache_inputs = self.kvcache_preprocess(bs, batch_valid_length, batch_index, zactivate_len)
+            kvcache_inputs = self.kvcache_preprocess(
+                bs, batch_valid_length, batch_index, zactivate_len, block_tables, slot_mapping, copy_slots
+            )
 
         # 4. hidden_states
         for i in range(self.num_hidden_layers):
@@ -914,6 +959,9 @@ class QwenDecodeLayer(nn.Cell):
         use_rope_slice=False,
         use_flash_attention=False,
         qkv_has_bias=True,
+        use_paged_attention=False,
+        block_size=16,
+        num_blocks=512,
     ):
         super().__init__()
         self.batch_size = batch_size
@@ -963,6 +1011,9 @@ class QwenDecodeLayer(nn.Cell):
             is_flexible_shape=is_flexible_shape,
             use_rope_slice=use_rope_slice,
             use_flash_attention=use_flash_attention,
+            use_paged_attention=use_paged_attention,
+            block_size=block_size,
+            num_blocks=num_blocks,
         )
         self.feed_forward = LlamaFeedForward(
             dim=self.hidden_size,
@@ -1097,6 +1148,7 @@ class CausalMaskForQwen(nn.Cell):
         self.slice = ops.StridedSlice()
         self.mul = ops.Mul()
         self.sub = ops.Sub()
+        self.add = ops.Add()
         self.mul_post = ops.Mul()
         self.expand_dim_post = ops.ExpandDims()
 
@@ -1117,10 +1169,16 @@ class CausalMaskForQwen(nn.Cell):
         attention_mask = self.mul(mask_right, lower_triangle)
         return attention_mask
 
-    def increment(self, seq_range, batch_valid_length, zactivate_len=None):
+    def increment(self, seq_range, batch_valid_length, zactivate_len=None, seq_length=1):
         if zactivate_len is not None:
             seq_range = self.slice(seq_range, (0, 0, 0), (1, 1, self.shape(zactivate_len)[0]), (1, 1, 1))
-        mask = self.less_equal(self.reshape(seq_range, (1, 1, -1)), self.reshape(batch_valid_length, (-1, 1, 1)))
+        batch_valid_length = self.reshape(batch_valid_length, (-1, 1, 1))
+        if seq_length > 1:
+            # [bs, seq, 1], each of the tokens fed together attends to the positions up to its own
+            batch_valid_length = self.add(
+                batch_valid_length, self.reshape(ops.arange(0, seq_length, 1, dtype=mstype.int32), (1, -1, 1))
+            )
+        mask = self.less_equal(self.reshape(seq_range, (1, 1, -1)), batch_valid_length)
         return mask
 
     def increment_slice(self, seq_range, seq_length, batch_valid_length, zactivate_len=None):
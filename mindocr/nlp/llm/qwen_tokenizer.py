@@ -1,4 +1,5 @@
 import base64
+import codecs
 import unicodedata
 from typing import Collection, Dict, List, Set, Union
 
@@ -176,6 +177,10 @@ class QwenTokenizer:
             token_ids = [i for i in token_ids if i < self.eod_id]
         return self.tokenizer.decode(token_ids, errors=self.errors)
 
+    def incremental_decoder(self, skip_special_tokens: bool = False) -> "QwenIncrementalDecoder":
+        """Return a decoder of a stream of token ids, see [`QwenIncrementalDecoder`]."""
+        return QwenIncrementalDecoder(self, skip_special_tokens=skip_special_tokens)
+
     def _call_one(self, text, max_length=None):
         is_batched = isinstance(text, (list, tuple))
 
@@ -319,3 +324,31 @@ class QwenTokenizer:
         else:
             output = self._decode(token_ids=token_ids, skip_special_tokens=skip_special_tokens)
         return output
+
+
+class QwenIncrementalDecoder:
+    """
+    Decoder of a stream of token ids of [`QwenTokenizer`]. The byte-level BPE tokens may split a UTF-8 character,
+    so the bytes of an incomplete character are kept until the tokens of its remaining bytes are decoded, instead of
+    being replaced. The text of the whole stream is the same as `QwenTokenizer.decode` of all its token ids.
+    """
+
+    def __init__(self, tokenizer: QwenTokenizer, skip_special_tokens: bool = False):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors=tokenizer.errors)
+
+    def decode(self, token_ids) -> str:
+        """Decode the next token ids, return the text of the characters they complete."""
+        token_ids = to_py_obj(token_ids)
+        if isinstance(token_ids, int):
+            token_ids = [token_ids]
+        if self.skip_special_tokens:
+            token_ids = [i for i in token_ids if i < self.tokenizer.eod_id]
+        return self.decoder.decode(self.tokenizer.tokenizer.decode_bytes(token_ids))
+
+    def flush(self) -> str:
+        """End the stream, return the text of the bytes left, and reset the decoder."""
+        text = self.decoder.decode(b"", final=True)
+        self.decoder.reset()
+        return text
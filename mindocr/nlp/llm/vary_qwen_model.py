@@ -1,11 +1,18 @@
+from threading import Thread
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
 import mindspore as ms
 from mindspore import ops
 
+from mindocr.nlp.generation.streamers import TextIteratorStreamer
 from mindocr.nlp.llm import register_llm
 from mindocr.nlp.llm.configs import SAMConfig, VaryConfig
 from mindocr.nlp.llm.qwen_model import QwenForCausalLM, QwenModel
 from mindocr.nlp.llm.vary_clip_model import build_model
 from mindocr.nlp.llm.vary_sam_model import SAMEncoder
+from mindocr.nlp.utils.embedding_cache import EmbeddingCache
 from mindocr.nlp.utils.layers import Linear
 from mindocr.utils.conversation import Conversation
 
@@ -37,38 +44,19 @@ class VaryQwenModel(QwenModel):
         zactivate_len=None,
         image=None,
         image_high=None,
+        block_tables=None,
+        slot_mapping=None,
+        copy_slots=None,
+        image_features=None,
     ):
         # 1. wte
         bs, seq_len = self.shape(input_ids)
         inputs_embeds = self.wte(input_ids)
 
-        if seq_len > 1 and image is not None and image_high is not None:
-            sam_out = self.vision_tower_high(image_high)
-            sam_out = self.mm_projector_vary(sam_out)
-
-            clip_out = self.vision_tower(image)
-            clip_out = self.mm_projector(clip_out)
-
-            image_features = ops.concat((clip_out, sam_out), -1)
-
-            new_input_embeds = []
-            num_patches = self.num_patches
-            image_start_token_pos = self.image_start_token_pos
-            for i in range(bs):
-                cur_input_embeds = inputs_embeds[i]
-                per_cur_image_features = image_features[i]
-                cur_input_embeds = ops.cat(
-                    (
-                        cur_input_embeds[: image_start_token_pos + 1],
-                        per_cur_image_features,
-                        cur_input_embeds[image_start_token_pos + num_patches + 1 :],
-                    ),
-                    axis=0,
-                )
-
-                new_input_embeds.append(cur_input_embeds)
-
-            hidden_states = ops.stack(new_input_embeds, axis=0)
+        if self.is_first_iteration and seq_len > 1 and image_features is not None:
+            hidden_states = self.merge_image_features(inputs_embeds, image_features)
+        elif self.is_first_iteration and seq_len > 1 and image is not None and image_high is not None:
+            hidden_states = self.merge_image_features(inputs_embeds, self.encode_images(image, image_high))
         else:
             hidden_states = inputs_embeds
 
@@ -86,7 +74,7 @@ class VaryQwenModel(QwenModel):
                 freqs_cis = self.freqs_mgr(seq_len)
                 mask = self.casual_mask(input_ids)  # mask: [bs, seq, seq]
             else:
-                freqs_cis = self.freqs_mgr.increment(batch_valid_length, bs)
+                freqs_cis = self.freqs_mgr.increment(batch_valid_length, bs, seq_len)
                 if self.is_dynamic and self.is_flexible_shape and not self.use_kvcache_op:
                     mask = self.casual_mask.increment_slice(
                         self.kvcache_preprocess.range,
@@ -95,10 +83,14 @@ class VaryQwenModel(QwenModel):
                         zactivate_len,
                     )
                 else:
-                    mask = self.casual_mask.increment(self.kvcache_preprocess.range, batch_valid_length, zactivate_len)
+                    mask = self.casual_mask.increment(
+                        self.kvcache_preprocess.range, batch_valid_length, zactivate_len, seq_len
+                    )
             mask = self.casual_mask.post_process(mask)
 
-            kvcache_inputs = self.kvcache_preprocess(bs, batch_valid_length, batch_index, zactivate_len)
+            kvcache_inputs = self.kvcache_preprocess(
+                bs, batch_valid_length, batch_index, zactivate_len, block_tables, slot_mapping, copy_slots
+            )
 
         # 4. hidden_states
         for i in range(self.num_hidden_layers):
@@ -109,6 +101,38 @@ class VaryQwenModel(QwenModel):
 
         return hidden_states
 
+    def encode_images(self, image, image_high):
+        """Run the vision towers, return the image features which replace the embeddings of the image tokens."""
+        sam_out = self.vision_tower_high(image_high)
+        sam_out = self.mm_projector_vary(sam_out)
+
+        clip_out = self.vision_tower(image)
+        clip_out = self.mm_projector(clip_out)
+
+        return ops.concat((clip_out, sam_out), -1)
+
+    def merge_image_features(self, inputs_embeds, image_features):
+        """Replace the embeddings of the image tokens after the image start token with the image features."""
+        bs = inputs_embeds.shape[0]
+        new_input_embeds = []
+        num_patches = self.num_patches
+        image_start_token_pos = self.image_start_token_pos
+        for i in range(bs):
+            cur_input_embeds = inputs_embeds[i]
+            per_cur_image_features = image_features[i]
+            cur_input_embeds = ops.cat(
+                (
+                    cur_input_embeds[: image_start_token_pos + 1],
+                    per_cur_image_features,
+                    cur_input_embeds[image_start_token_pos + num_patches + 1 :],
+                ),
+                axis=0,
+            )
+
+            new_input_embeds.append(cur_input_embeds)
+
+        return ops.stack(new_input_embeds, axis=0)
+
 
 @register_llm
 class VaryQwenForCausalLM(QwenForCausalLM):
@@ -120,16 +144,47 @@ class VaryQwenForCausalLM(QwenForCausalLM):
 
         self.image_past = None
         self.image_high_past = None
+        # the vision towers run as a separate stage, once per unique image, if the image features are cached
+        self.image_cache = None
+        if config.image_cache_bytes > 0:
+            self.image_cache = EmbeddingCache(self.encode_images, config.image_cache_bytes, config.image_batch_size)
+
+    def encode_images(self, image, image_high) -> np.ndarray:
+        """Run the vision towers on a batch of images, return the image features."""
+        image_features = self.transformer.encode_images(ms.Tensor(image, ms.float16), ms.Tensor(image_high, ms.float16))
+        return image_features.asnumpy()
 
     def prepare_inputs_for_generation(self, input_ids, **kwargs):
         image = kwargs.get("image")
         image_high = kwargs.get("image_high")
+        if self.image_cache is not None:
+            image_features = None
+            # the image features are only used by the prefill, or by every step without the kv cache
+            if image is not None and image_high is not None and (self.is_first_iteration or not self.use_past):
+                image_features = self.image_cache(image, image_high)
+            return {
+                "input_ids": ms.Tensor(input_ids, ms.int32),
+                "image": None,
+                "image_high": None,
+                "image_features": ms.Tensor(image_features) if image_features is not None else None,
+            }
         return {
             "input_ids": ms.Tensor(input_ids, ms.int32),
             "image": ms.Tensor(image, ms.float16) if image is not None else None,
             "image_high": ms.Tensor(image_high, ms.float16) if image_high is not None else None,
         }
 
+    def _prefetch_model_kwargs(self, model_kwargs_list: List[Dict]):
+        if self.image_cache is None:
+            return
+        images = [
+            (model_kwargs["image"], model_kwargs["image_high"])
+            for model_kwargs in model_kwargs_list
+            if model_kwargs.get("image") is not None and model_kwargs.get("image_high") is not None
+        ]
+        if images:
+            self.image_cache.prefetch(images)
+
     def construct(
         self,
         input_ids,
@@ -144,6 +199,10 @@ class VaryQwenForCausalLM(QwenForCausalLM):
         zactivate_len=None,
         image=None,
         image_high=None,
+        block_tables=None,
+        slot_mapping=None,
+        copy_slots=None,
+        image_features=None,
     ):
         """construct"""
         bsz, seqlen = input_ids.shape
@@ -168,6 +227,10 @@ class VaryQwenForCausalLM(QwenForCausalLM):
             zactivate_len=zactivate_len,
             image=image,
             image_high=image_high,
+            block_tables=block_tables,
+            slot_mapping=slot_mapping,
+            copy_slots=copy_slots,
+            image_features=image_features,
         )
         pre_gather = (not self.use_past or self.is_first_iteration) and batch_valid_length is not None
         if pre_gather:
@@ -221,15 +284,66 @@ class VaryQwenForCausalLM(QwenForCausalLM):
                 ]
 
         """
+        prompt, input_ids = self._build_chat_inputs(tokenizer, query, image, image_high)
+        outputs = self._generate_chat(input_ids)
+        outputs = tokenizer.decode(outputs, skip_special_tokens=False)
+        response = outputs[0][len(prompt) :]
+
+        for special_token in tokenizer.special_tokens:
+            response = response.replace(special_token, "")
+        self.conversation.add_message(role="assistant", message=response)
+
+        return response
+
+    def stream_chat(
+        self,
+        tokenizer,
+        query: str,
+        image=None,
+        image_high=None,
+        streamer: Optional[TextIteratorStreamer] = None,
+    ) -> Iterator[str]:
+        """
+        Same as `chat`, but yield the text chunks of the response as soon as they are generated, the generation runs
+        on a background thread. The latency of the tokens is measured by the streamer, see
+        `TextIteratorStreamer.latency_stats`.
+
+        example:
+            >>> streamer = TextIteratorStreamer(tokenizer)
+            >>> for text in model.stream_chat(tokenizer, query, image, image_high, streamer=streamer):
+            ...     print(text, end="", flush=True)
+            >>> streamer.latency_stats()
+        """
+        _, input_ids = self._build_chat_inputs(tokenizer, query, image, image_high)
+        if streamer is None:
+            streamer = TextIteratorStreamer(tokenizer)
+        errors = []
+
+        def generate():
+            try:
+                self._generate_chat(input_ids, streamer=streamer)
+            except Exception as e:  # pylint: disable=W0703
+                errors.append(e)
+                streamer.end()
+
+        thread = Thread(target=generate, name="stream_chat", daemon=True)
+        thread.start()
+        chunks = []
+        for text in streamer:
+            chunks.append(text)
+            yield text
+        thread.join()
+        if errors:
+            raise errors[0]
+        self.conversation.add_message(role="assistant", message="".join(chunks))
+
+    def _build_chat_inputs(self, tokenizer, query: str, image=None, image_high=None):
+        """Add the query to the conversation, return the prompt of the conversation and its token ids."""
         if self.conversation is None:
             self.conversation = Conversation()
 
         if image is not None and image_high is not None:
-            num_patch = 256
-            im_start_token = "<img>"
-            im_end_token = "</img>"
-            im_patch_token = "<imgpad>"
-            query = im_start_token + im_patch_token * num_patch + im_end_token + query
+            query = self.add_image_tokens(query)
             self.image_past = image
             self.image_high_past = image_high
 
@@ -237,16 +351,41 @@ class VaryQwenForCausalLM(QwenForCausalLM):
         prompt = self.conversation.get_prompt()
 
         inputs = tokenizer([prompt], max_length=self.seq_length)
-        input_ids = inputs["input_ids"]
-        outputs = self.generate(input_ids=input_ids, image=self.image_past, image_high=self.image_high_past)
-        outputs = tokenizer.decode(outputs, skip_special_tokens=False)
-        response = outputs[0][len(prompt) :]
-
-        for special_token in tokenizer.special_tokens:
-            response = response.replace(special_token, "")
-        self.conversation.add_message(role="assistant", message=response)
+        return prompt, inputs["input_ids"]
+
+    def _generate_chat(self, input_ids, streamer=None):
+        """Generate the response of the conversation with the image of the conversation."""
+        if self.use_past and self.config.use_paged_attention and self.config.prefix_cache_bytes > 0:
+            # reuse the kv cache of the conversation so far, which is cached by the scheduler at the end of each turn
+            scheduler = self.continuous_batching(max_batch_size=1)
+            future = scheduler.submit(
+                input_ids, image=self.image_past, image_high=self.image_high_past, streamer=streamer
+            )
+            scheduler.run_until_complete()
+            return [future.result()]
+        return self.generate(
+            input_ids=input_ids, image=self.image_past, image_high=self.image_high_past, streamer=streamer
+        )
 
-        return response
+    def _min_reused_prefix_length(self, **model_kwargs) -> int:
+        if model_kwargs.get("image") is None:
+            return 0
+        # the image features replace the tokens after the image start token, and are computed only in prefill
+        return self.transformer.image_start_token_pos + self.transformer.num_patches + 1
+
+    @staticmethod
+    def add_image_tokens(query: str, num_patch: int = 256) -> str:
+        """Prepend the placeholder tokens of image to the query, which are replaced by the image features."""
+        im_start_token = "<img>"
+        im_end_token = "</img>"
+        im_patch_token = "<imgpad>"
+        return im_start_token + im_patch_token * num_patch + im_end_token + query
+
+    def build_page_prompt(self, query: str) -> str:
+        """The prompt of a single-turn conversation about an image, as the first turn of `chat`."""
+        conversation = Conversation()
+        conversation.add_message(role="user", message=self.add_image_tokens(query))
+        return conversation.get_prompt()
 
     def reset(self):
         if self.conversation is not None:
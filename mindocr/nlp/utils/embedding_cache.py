@@ -0,0 +1,134 @@
+"""Content-addressed cache of the embeddings of model inputs, e.g. the features of the images of a multimodal model."""
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+__all__ = ["EmbeddingCache"]
+_logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    LRU cache of the embeddings of inputs keyed by the hash of their content, so that an encoder, e.g. the vision tower
+    of a multimodal model, runs once per unique input however many requests share it. The inputs missing in the cache
+    are encoded together in batches of at most `batch_size`, padded to a power of two so that the encoder is compiled
+    for a few batch sizes only. The least recently used embeddings are evicted once they exceed `max_bytes`.
+
+    Args:
+        encode_fn: encoder of a batch of inputs, which takes one array per input with a batch dim, e.g. the image and
+            the high resolution image, and returns a numpy array of the embeddings with the same batch dim.
+        max_bytes: max bytes of the cached embeddings.
+        batch_size: max batch size of the encoder.
+    """
+
+    def __init__(self, encode_fn: Callable[..., np.ndarray], max_bytes: int, batch_size: int = 1):
+        if batch_size < 1:
+            raise ValueError(f"batch_size should be at least 1, but got {batch_size}")
+        self.encode_fn = encode_fn
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.embeddings: Dict[str, np.ndarray] = OrderedDict()
+        self.num_bytes = 0
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_encoded = 0
+        # the inputs and embeddings of the last lookup, e.g. the same batch of images at every step of generation
+        self._last_inputs = None
+        self._last_embeddings = None
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    @staticmethod
+    def hash_inputs(*inputs: np.ndarray) -> str:
+        """Hash of the content of an example, given as one array per input without the batch dim."""
+        sha1 = hashlib.sha1()
+        for value in inputs:
+            value = np.ascontiguousarray(value)
+            sha1.update(f"{value.shape}{value.dtype}".encode())
+            sha1.update(value.tobytes())
+        return sha1.hexdigest()
+
+    def __call__(self, *inputs: np.ndarray) -> np.ndarray:
+        """Return the embeddings of a batch of inputs, given as one array per input with a batch dim."""
+        if self._last_inputs is not None and all(a is b for a, b in zip(inputs, self._last_inputs)):
+            return self._last_embeddings
+        examples = self._split(inputs)
+        embeddings = self._lookup(examples)
+        embeddings = np.stack([embeddings[key] for key, _ in examples], axis=0)
+        self._last_inputs = inputs
+        self._last_embeddings = embeddings
+        return embeddings
+
+    def prefetch(self, batches: Sequence[Sequence[np.ndarray]]):
+        """
+        Encode the inputs of several requests which are missing in the cache together, e.g. the images of the
+        requests queued for generation, each given as one array per input with a batch dim.
+        """
+        examples = [example for inputs in batches for example in self._split(inputs)]
+        if examples:
+            self._lookup(examples)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "num_embeddings": len(self.embeddings),
+            "num_bytes": self.num_bytes,
+            "num_hits": self.num_hits,
+            "num_misses": self.num_misses,
+            "num_encoded": self.num_encoded,
+        }
+
+    def _split(self, inputs: Sequence[np.ndarray]) -> List[Tuple[str, Tuple[np.ndarray, ...]]]:
+        """Split the batch of inputs into examples with their keys."""
+        inputs = [np.asarray(value) for value in inputs]
+        batch_size = inputs[0].shape[0]
+        if any(value.shape[0] != batch_size for value in inputs):
+            raise ValueError(f"the inputs should have the same batch size, but got {[v.shape for v in inputs]}")
+        examples = []
+        for i in range(batch_size):
+            example = tuple(value[i] for value in inputs)
+            examples.append((self.hash_inputs(*example), example))
+        return examples
+
+    def _lookup(self, examples: List[Tuple[str, Tuple[np.ndarray, ...]]]) -> Dict[str, np.ndarray]:
+        """Return the embeddings of the examples by key, encoding the missing ones in batches."""
+        found = {}
+        missing = OrderedDict()
+        for key, example in examples:
+            if key in found or key in missing:
+                continue
+            if key in self.embeddings:
+                self.embeddings.move_to_end(key)
+                found[key] = self.embeddings[key]
+                self.num_hits += 1
+            else:
+                missing[key] = example
+                self.num_misses += 1
+
+        missing = list(missing.items())
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start : start + self.batch_size]
+            # pad the batch to a power of two with the last example
+            padded_size = min(1 << (len(chunk) - 1).bit_length(), self.batch_size)
+            padded = chunk + [chunk[-1]] * (padded_size - len(chunk))
+            batch = [np.stack([example[j] for _, example in padded], axis=0) for j in range(len(chunk[0][1]))]
+            embeddings = np.asarray(self.encode_fn(*batch))
+            self.num_encoded += len(chunk)
+            for i, (key, _) in enumerate(chunk):
+                found[key] = np.ascontiguousarray(embeddings[i])
+                self._insert(key, found[key])
+        if missing:
+            _logger.debug("Encoded %s inputs, embedding cache: %s", len(missing), self.stats())
+        return found
+
+    def _insert(self, key: str, embedding: np.ndarray):
+        if embedding.nbytes > self.max_bytes:
+            return
+        while self.embeddings and self.num_bytes + embedding.nbytes > self.max_bytes:
+            _, evicted = self.embeddings.popitem(last=False)
+            self.num_bytes -= evicted.nbytes
+        self.embeddings[key] = embedding
+        self.num_bytes += embedding.nbytes
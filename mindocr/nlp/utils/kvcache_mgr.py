@@ -197,6 +197,82 @@ class KVCacheMgr(nn.Cell):
         return key, value
 
 
+class PagedKVCacheMgr(nn.Cell):
+    """
+    Paged KVCache Manager. The cache of a layer is a pool of num_blocks blocks of block_size tokens, shared by the
+    sequences of the batch. Keys and values are written to the slots given by slot_mapping, and the blocks of each
+    sequence are gathered by its row of block_tables for attention, so memory is reserved by blocks in use instead of
+    (max_batch_size, max_seq_length) for every sequence. Blocks are allocated on host by `BlockAllocator`.
+    An incremental forward may feed several tokens per sequence, whose slots follow each other in slot_mapping, e.g. to
+    verify the draft tokens of speculative decoding.
+    copy_slots of (2, n), if given, copies the slots of row 0 to the slots of row 1 before writing, for the partial
+    blocks of the prefixes shared by `PrefixCachingBlockAllocator`.
+    """
+
+    def __init__(
+        self, n_head, head_dim, num_blocks=512, block_size=16, max_seq_length=4096, compute_dtype=mstype.float16
+    ):
+        super().__init__()
+        if max_seq_length % block_size:
+            raise ValueError(f"max_seq_length {max_seq_length} should be a multiple of block_size {block_size}.")
+        self.n_head = n_head
+        self.head_dim = head_dim
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.is_first_iteration = True
+
+        self.scatter_update = ops.ScatterUpdate()
+        self.gather = ops.Gather()
+        self.slice = ops.StridedSlice()
+        self.shape = ops.Shape()
+        self.transpose = ops.Transpose()
+        self.reshape = ops.Reshape().add_prim_attr("skip_redistribution", True)
+
+        cache_shape = (num_blocks * block_size, n_head, head_dim)
+        self.key_cache = Parameter(Tensor(np.zeros(cache_shape), compute_dtype), name="key_cache", requires_grad=False)
+        self.value_cache = Parameter(
+            Tensor(np.zeros(cache_shape), compute_dtype), name="value_cache", requires_grad=False
+        )
+
+    def gather_blocks(self, cache, block_tables, zactivate_len, batch_size):
+        """gather the blocks of each sequence to [bs, n_head, width * block_size, head_dim]"""
+        if zactivate_len is not None:
+            width = self.shape(zactivate_len)[0] // self.block_size
+            block_tables = self.slice(block_tables, (0, 0), (batch_size, width), (1, 1))
+        blocks = self.reshape(cache, (self.num_blocks, self.block_size, self.n_head, self.head_dim))
+        seq = self.gather(blocks, block_tables, 0)
+        seq = self.reshape(seq, (batch_size, -1, self.n_head, self.head_dim))
+        return self.transpose(seq, (0, 2, 1, 3))
+
+    def construct(self, key, value, kvcache_inputs=None):
+        """The forward compute of PagedKVCacheMgr."""
+        slot_mapping, block_tables, zactivate_len, copy_slots = kvcache_inputs
+        batch_size = self.shape(key)[0]
+        if copy_slots is not None:
+            # copy on write: the shared blocks of a prefix are copied to the blocks of the sequence before writing
+            key_cache = self.scatter_update(
+                self.key_cache, copy_slots[1], self.gather(self.key_cache, copy_slots[0], 0)
+            )
+            value_cache = self.scatter_update(
+                self.value_cache, copy_slots[1], self.gather(self.value_cache, copy_slots[0], 0)
+            )
+            slot_mapping = ops.depend(slot_mapping, key_cache)
+            slot_mapping = ops.depend(slot_mapping, value_cache)
+        # [bs, n_head, seq, head_dim] -> [bs * seq, n_head, head_dim]
+        key_update = self.reshape(self.transpose(key, (0, 2, 1, 3)), (-1, self.n_head, self.head_dim))
+        value_update = self.reshape(self.transpose(value, (0, 2, 1, 3)), (-1, self.n_head, self.head_dim))
+        key_cache = self.scatter_update(self.key_cache, slot_mapping, key_update)
+        value_cache = self.scatter_update(self.value_cache, slot_mapping, value_update)
+        if self.is_first_iteration:
+            key = ops.depend(key, key_cache)
+            value = ops.depend(value, value_cache)
+            return key, value
+
+        key = self.gather_blocks(key_cache, block_tables, zactivate_len, batch_size)
+        value = self.gather_blocks(value_cache, block_tables, zactivate_len, batch_size)
+        return key, value
+
+
 class KVCachePreprocess(nn.Cell):
     """KVCache Manager."""
 
@@ -207,11 +283,13 @@ class KVCachePreprocess(nn.Cell):
         is_dynamic=False,
         use_kvcache_op=False,
         is_flexible_shape=False,
+        use_paged_attention=False,
     ):
         super().__init__()
         self.is_dynamic = is_dynamic
         self.use_kvcache_op = use_kvcache_op
         self.is_flexible_shape = is_flexible_shape
+        self.use_paged_attention = use_paged_attention
         self.max_cache_length = max_batch_size * max_seq_length
         range_len = self.max_cache_length if self.is_flexible_shape else max_seq_length
         self.range = Tensor(np.arange(range_len).reshape((1, 1, -1)), mstype.int32)
@@ -229,8 +307,20 @@ class KVCachePreprocess(nn.Cell):
         self.div = ops.Div()
         self.concat = ops.Concat(axis=0)
 
-    def construct(self, batch_size, batch_valid_length=None, batch_index=None, zactivate_len=None):
+    def construct(
+        self,
+        batch_size,
+        batch_valid_length=None,
+        batch_index=None,
+        zactivate_len=None,
+        block_tables=None,
+        slot_mapping=None,
+        copy_slots=None,
+    ):
         """precompute kvcache inputs"""
+        if self.use_paged_attention:
+            return slot_mapping, block_tables, zactivate_len, copy_slots
+
         seq_range = self.range
         if self.is_dynamic and self.is_flexible_shape and not self.use_kvcache_op:
             seq_range = self.slice(seq_range, (0, 0, 0), (1, 1, self.max_cache_length // batch_size), (1, 1, 1))
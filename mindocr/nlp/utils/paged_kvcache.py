@@ -0,0 +1,348 @@
+"""Host side of the paged kv cache: allocation of blocks to sequences, and the block inputs of PagedKVCacheMgr."""
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+__all__ = ["NULL_BLOCK", "BlockAllocator", "PrefixCachingBlockAllocator", "HostPagedKVCache"]
+
+# block 0 is never allocated: padding positions are written to it, and unused entries of block tables point to it
+NULL_BLOCK = 0
+
+
+class BlockAllocator:
+    """
+    Allocate the fixed-size blocks of the paged kv cache to sequences from a free list. A sequence holds
+    ceil(num_tokens / block_size) blocks, listed in its block table, so that the memory reserved for a sequence follows
+    its actual length instead of the max seq length of the model.
+
+    Args:
+        num_blocks: number of blocks of the cache, including the null block.
+        block_size: number of tokens of a block.
+        bytes_per_token: kv bytes of a token over all the layers, for the stats of memory.
+    """
+
+    def __init__(self, num_blocks: int, block_size: int, bytes_per_token: int = 0):
+        if num_blocks < 2:
+            raise ValueError(f"num_blocks should be at least 2 as block {NULL_BLOCK} is reserved, but got {num_blocks}")
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.bytes_per_token = bytes_per_token
+        # popped from the end, so that low blocks are allocated first
+        self.free_blocks = list(range(num_blocks - 1, NULL_BLOCK, -1))
+        self.block_tables: Dict[Hashable, List[int]] = {}
+        self.seq_lengths: Dict[Hashable, int] = {}
+
+    @property
+    def num_free_blocks(self) -> int:
+        return len(self.free_blocks)
+
+    def blocks_needed(self, num_tokens: int) -> int:
+        return -(-num_tokens // self.block_size)
+
+    def can_allocate(self, seq_id: Hashable, num_tokens: int) -> bool:
+        held = len(self.block_tables.get(seq_id, []))
+        return self.blocks_needed(num_tokens) - held <= self.num_free_blocks
+
+    def allocate(self, seq_id: Hashable, num_tokens: int):
+        """Grow the blocks of seq_id to hold num_tokens tokens, raise RuntimeError if the free blocks run out."""
+        if not self.can_allocate(seq_id, num_tokens):
+            raise RuntimeError(
+                f"Out of kv cache blocks: {num_tokens} tokens of sequence {seq_id} need "
+                f"{self.blocks_needed(num_tokens)} blocks, while {self.num_free_blocks} blocks are free. "
+                f"Please increase num_blocks of the model config."
+            )
+        block_table = self.block_tables.setdefault(seq_id, [])
+        while len(block_table) < self.blocks_needed(num_tokens):
+            block_table.append(self._pop_free_block())
+        self.seq_lengths[seq_id] = max(num_tokens, self.seq_lengths.get(seq_id, 0))
+
+    def free(self, seq_id: Hashable):
+        for block in reversed(self.block_tables.pop(seq_id, [])):
+            self._free_block(block)
+        self.seq_lengths.pop(seq_id, None)
+
+    def truncate(self, seq_id: Hashable, num_tokens: int):
+        """Roll seq_id back to its first num_tokens tokens, the blocks after are freed."""
+        block_table = self.block_tables[seq_id]
+        while len(block_table) > self.blocks_needed(num_tokens):
+            self._free_block(block_table.pop())
+        self.seq_lengths[seq_id] = num_tokens
+
+    def _pop_free_block(self) -> int:
+        return self.free_blocks.pop()
+
+    def _free_block(self, block: int):
+        self.free_blocks.append(block)
+
+    def free_all(self):
+        for seq_id in list(self.block_tables):
+            self.free(seq_id)
+
+    def get_slots(self, seq_id: Hashable, positions: Sequence[int]) -> np.ndarray:
+        """Slots of the positions of seq_id in the flattened cache of (num_blocks * block_size) tokens."""
+        block_table = np.array(self.block_tables[seq_id], dtype=np.int32)
+        positions = np.asarray(positions, dtype=np.int32)
+        return block_table[positions // self.block_size] * self.block_size + positions % self.block_size
+
+    def build_block_tables(self, seq_ids: Sequence[Optional[Hashable]], width: int) -> np.ndarray:
+        """Block tables of (len(seq_ids), width), padded with the null block. None stands for a free batch row."""
+        block_tables = np.full((len(seq_ids), width), NULL_BLOCK, dtype=np.int32)
+        for i, seq_id in enumerate(seq_ids):
+            if seq_id is not None:
+                block_table = self.block_tables[seq_id]
+                block_tables[i, : len(block_table)] = block_table
+        return block_tables
+
+    def build_prefill_slots(
+        self, seq_ids: Sequence[Optional[Hashable]], lengths: Sequence[int], seq_length: int
+    ) -> np.ndarray:
+        """Slots of the (len(seq_ids) * seq_length) prompt positions, padding positions are mapped to the null block."""
+        slot_mapping = np.full((len(seq_ids), seq_length), NULL_BLOCK * self.block_size, dtype=np.int32)
+        for i, (seq_id, length) in enumerate(zip(seq_ids, lengths)):
+            if seq_id is not None:
+                slot_mapping[i, :length] = self.get_slots(seq_id, np.arange(length))
+        return slot_mapping.reshape(-1)
+
+    def build_decode_slots(
+        self, seq_ids: Sequence[Optional[Hashable]], lengths: Sequence[int], num_tokens: int = 1
+    ) -> np.ndarray:
+        """
+        Slots of the last token of each sequence, at position length - 1, and of the num_tokens - 1 tokens fed after
+        it in the same forward, flattened to (len(seq_ids) * num_tokens,).
+        """
+        slot_mapping = np.full((len(seq_ids), num_tokens), NULL_BLOCK * self.block_size, dtype=np.int32)
+        for i, (seq_id, length) in enumerate(zip(seq_ids, lengths)):
+            if seq_id is not None:
+                slot_mapping[i] = self.get_slots(seq_id, np.arange(length - 1, length - 1 + num_tokens))
+        return slot_mapping.reshape(-1)
+
+    def kv_bytes(self, seq_id: Optional[Hashable] = None) -> Tuple[int, int]:
+        """(reserved, used) kv bytes of seq_id, or of all the sequences if seq_id is None."""
+        seq_ids = list(self.block_tables) if seq_id is None else [seq_id]
+        reserved = sum(len(self.block_tables[x]) for x in seq_ids) * self.block_size * self.bytes_per_token
+        used = sum(self.seq_lengths[x] for x in seq_ids) * self.bytes_per_token
+        return reserved, used
+
+
+class PrefixCachingBlockAllocator(BlockAllocator):
+    """
+    Block allocator which keeps the blocks of finished prefixes for reuse. A block written with the tokens of a prefix
+    is keyed by the tokens it holds and the key of its previous block, the first block by an extra key of the inputs
+    other than tokens, e.g. the hash of an image, so that a key identifies the whole prefix up to the block.
+
+    A new sequence shares the cached blocks of its longest cached prefix, counted by references, and only the tokens
+    after the prefix are computed. If the prefix ends inside a block, the block is copied to a block of the sequence
+    before it is written (copy on write), see `build_copy_slots`. Blocks not held by any sequence stay cached in
+    least recently used order, up to cache_bytes, and are evicted when the free blocks run out.
+
+    Args:
+        num_blocks: number of blocks of the cache, including the null block.
+        block_size: number of tokens of a block.
+        bytes_per_token: kv bytes of a token over all the layers.
+        cache_bytes: memory budget of the cached blocks not held by any sequence.
+    """
+
+    def __init__(self, num_blocks: int, block_size: int, bytes_per_token: int = 0, cache_bytes: int = 0):
+        super().__init__(num_blocks, block_size, bytes_per_token)
+        block_bytes = block_size * bytes_per_token
+        self.max_cached_blocks = cache_bytes // block_bytes if block_bytes else num_blocks
+        self.ref_counts = [0] * num_blocks
+        # key of a full block -> block, and block -> (key of the previous block, tokens) of every cached block
+        self.cached_blocks: Dict[Tuple, int] = {}
+        self.block_keys: Dict[int, Tuple[int, Tuple[int, ...]]] = {}
+        # key of a block -> blocks cached after it, to match the prefixes ending inside a block
+        self.children: Dict[int, Dict[int, None]] = {}
+        # cached blocks not held by any sequence, least recently used first
+        self.evictable: "OrderedDict[int, None]" = OrderedDict()
+        # seq_id -> (source block, number of tokens, index of the block of seq_id) of the copies of partial blocks
+        self.pending_copies: Dict[Hashable, Tuple[int, int, int]] = {}
+
+        self.num_queries = 0
+        self.num_hits = 0
+        self.query_tokens = 0
+        self.hit_tokens = 0
+
+    @property
+    def num_free_blocks(self) -> int:
+        return len(self.free_blocks) + len(self.evictable)
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of the prompt tokens reused from the cache."""
+        return self.hit_tokens / self.query_tokens if self.query_tokens else 0.0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queries": self.num_queries,
+            "hits": self.num_hits,
+            "query_tokens": self.query_tokens,
+            "hit_tokens": self.hit_tokens,
+            "cached_blocks": len(self.block_keys),
+        }
+
+    def _pop_free_block(self) -> int:
+        if self.free_blocks:
+            block = self.free_blocks.pop()
+        else:
+            block, _ = self.evictable.popitem(last=False)
+            self._uncache(block)
+        self.ref_counts[block] = 1
+        return block
+
+    def _free_block(self, block: int):
+        self.ref_counts[block] -= 1
+        if self.ref_counts[block] > 0:
+            return
+        if block in self.block_keys:
+            self.evictable[block] = None
+            while len(self.evictable) > self.max_cached_blocks:
+                evicted, _ = self.evictable.popitem(last=False)
+                self._uncache(evicted)
+                self.free_blocks.append(evicted)
+        else:
+            self.free_blocks.append(block)
+
+    def _hold(self, block: int):
+        self.ref_counts[block] += 1
+        self.evictable.pop(block, None)
+
+    def _uncache(self, block: int):
+        parent, tokens = self.block_keys.pop(block)
+        if len(tokens) == self.block_size and self.cached_blocks.get((parent, tokens)) == block:
+            del self.cached_blocks[(parent, tokens)]
+        siblings = self.children[parent]
+        del siblings[block]
+        if not siblings:
+            del self.children[parent]
+
+    def prefix_keys(self, token_ids: Sequence[int], extra_key: Optional[Hashable] = None) -> List[Tuple]:
+        """Keys (key of the previous block, tokens) of the blocks of token_ids, the last block may be partial."""
+        keys, parent = [], hash(("prefix", extra_key))
+        for start in range(0, len(token_ids), self.block_size):
+            key = (parent, tuple(int(x) for x in token_ids[start : start + self.block_size]))
+            keys.append(key)
+            parent = hash(key)
+        return keys
+
+    def num_cached_blocks(self, keys: List[Tuple]) -> int:
+        """Number of the leading full blocks of keys which are cached."""
+        num_blocks = 0
+        while num_blocks < len(keys) and keys[num_blocks] in self.cached_blocks:
+            num_blocks += 1
+        return num_blocks
+
+    def match_prefix(
+        self, seq_id: Hashable, token_ids: Sequence[int], extra_key: Optional[Hashable] = None, min_length: int = 0
+    ) -> int:
+        """
+        Share the blocks of the longest cached prefix of token_ids with seq_id, which holds no blocks yet, and return
+        the length of the prefix. The last token is always left to compute. A prefix shorter than min_length is not
+        reused, e.g. if it ends inside the tokens embedded with the extra inputs.
+        """
+        keys = self.prefix_keys(token_ids[: len(token_ids) - 1], extra_key)
+        blocks = [self.cached_blocks[key] for key in keys[: self.num_cached_blocks(keys)]]
+        length = len(blocks) * self.block_size
+        # the prefix may go on inside a cached block, which is copied
+        source, num_copied = NULL_BLOCK, 0
+        if len(blocks) < len(keys):
+            parent, rest = keys[len(blocks)]
+            for block in self.children.get(parent, ()):
+                tokens = self.block_keys[block][1]
+                common = 0
+                while common < min(len(tokens), len(rest)) and tokens[common] == rest[common]:
+                    common += 1
+                if common > num_copied:
+                    source, num_copied = block, common
+
+        self.num_queries += 1
+        self.query_tokens += len(token_ids)
+        if length + num_copied < max(min_length, 1):
+            return 0
+        self.num_hits += 1
+        self.hit_tokens += length + num_copied
+        for block in blocks:
+            self._hold(block)
+        self.block_tables[seq_id] = blocks
+        self.seq_lengths[seq_id] = length
+        if num_copied:
+            self._hold(source)
+            self.pending_copies[seq_id] = (source, num_copied, len(blocks))
+        return length + num_copied
+
+    def cache_prefix(self, seq_id: Hashable, token_ids: Sequence[int], extra_key: Optional[Hashable] = None):
+        """Cache the blocks of seq_id written with token_ids, the last block may be partially written."""
+        for key, block in zip(self.prefix_keys(token_ids, extra_key), self.block_tables[seq_id]):
+            if self.block_keys.get(block) == key:
+                continue
+            if block in self.block_keys:
+                self._uncache(block)
+            self.block_keys[block] = key
+            self.children.setdefault(key[0], {})[block] = None
+            if len(key[1]) == self.block_size:
+                self.cached_blocks.setdefault(key, block)
+
+    def build_copy_slots(self, width: int) -> np.ndarray:
+        """
+        Slots (2, width) of the pending copies from the source blocks (row 0) to the blocks of the sequences (row 1),
+        padded with the null block, and release the source blocks. The copies should be done before the next
+        allocation.
+        """
+        copy_slots = np.full((2, width), NULL_BLOCK * self.block_size, dtype=np.int32)
+        index = 0
+        for seq_id, (source, num_copied, target_index) in self.pending_copies.items():
+            target = self.block_tables[seq_id][target_index]
+            copy_slots[0, index : index + num_copied] = source * self.block_size + np.arange(num_copied)
+            copy_slots[1, index : index + num_copied] = target * self.block_size + np.arange(num_copied)
+            index += num_copied
+            self._free_block(source)
+        self.pending_copies.clear()
+        return copy_slots
+
+    def free(self, seq_id: Hashable):
+        source, _, _ = self.pending_copies.pop(seq_id, (NULL_BLOCK, 0, 0))
+        if source != NULL_BLOCK:
+            self._free_block(source)
+        super().free(seq_id)
+
+
+class HostPagedKVCache:
+    """
+    Numpy implementation of PagedKVCacheMgr of a layer, which writes and gathers the blocks on host, e.g. to test the
+    block inputs on CPU.
+    """
+
+    def __init__(self, num_blocks: int, block_size: int, n_kv_head: int, head_dim: int, dtype=np.float16):
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.key_cache = np.zeros((num_blocks * block_size, n_kv_head, head_dim), dtype=dtype)
+        self.value_cache = np.zeros((num_blocks * block_size, n_kv_head, head_dim), dtype=dtype)
+
+    def __call__(
+        self,
+        key: np.ndarray,
+        value: np.ndarray,
+        slot_mapping: np.ndarray,
+        block_tables: np.ndarray,
+        is_first_iteration: bool = False,
+        copy_slots: Optional[np.ndarray] = None,
+    ):
+        """
+        Write key, value of [bs, n_kv_head, seq/1, head_dim] to their slots. In the first iteration they are returned
+        as is, otherwise the keys and values of the sequences are gathered by block tables to
+        [bs, n_kv_head, width * block_size, head_dim].
+        """
+        bs, n_kv_head, _, head_dim = key.shape
+        if copy_slots is not None:
+            self.key_cache[copy_slots[1]] = self.key_cache[copy_slots[0]]
+            self.value_cache[copy_slots[1]] = self.value_cache[copy_slots[0]]
+        self.key_cache[slot_mapping] = np.transpose(key, (0, 2, 1, 3)).reshape(-1, n_kv_head, head_dim)
+        self.value_cache[slot_mapping] = np.transpose(value, (0, 2, 1, 3)).reshape(-1, n_kv_head, head_dim)
+        if is_first_iteration:
+            return key, value
+        return self._gather(self.key_cache, block_tables), self._gather(self.value_cache, block_tables)
+
+    def _gather(self, cache: np.ndarray, block_tables: np.ndarray) -> np.ndarray:
+        blocks = cache.reshape(self.num_blocks, self.block_size, *cache.shape[1:])
+        seq = blocks[block_tables].reshape(block_tables.shape[0], -1, *cache.shape[1:])
+        return np.transpose(seq, (0, 2, 1, 3))
@@ -0,0 +1,212 @@
+import cv2
+import numpy as np
+
+__all__ = ["crop_text_regions", "crop_resize_norm_text_regions"]
+
+
+def _order_rect_points(rect_points):
+    """
+    Order the corner points of rotated rectangles (e.g. from cv2.boxPoints) as [top-left, top-right, bottom-right,
+    bottom-left], following the same rule as `crop_text_region` of tools/infer/text/utils, for all rectangles at once.
+
+    Args:
+        rect_points: array of shape [N, 4, 2]
+
+    Returns:
+        np.ndarray of shape [N, 4, 2]
+    """
+    idx = np.argsort(rect_points[..., 0], axis=1, kind="stable")
+    pts = np.take_along_axis(rect_points, idx[..., None], axis=1)
+    left_swap = pts[:, 1, 1] <= pts[:, 0, 1]
+    right_swap = pts[:, 3, 1] <= pts[:, 2, 1]
+    index_a = np.where(left_swap, 1, 0)
+    index_d = 1 - index_a
+    index_b = np.where(right_swap, 3, 2)
+    index_c = 5 - index_b
+    order = np.stack([index_a, index_b, index_c, index_d], axis=1)
+    return np.take_along_axis(pts, order[..., None], axis=1)
+
+
+def _polys_to_quads(polys, box_type="quad"):
+    """Convert detected polygons into an array of ordered quadrilaterals of shape [N, 4, 2]."""
+    if box_type[:4] != "poly":
+        return np.asarray(polys, dtype=np.float32).reshape(-1, 4, 2)
+    rect_points = np.stack(
+        [cv2.boxPoints(cv2.minAreaRect(np.asarray(poly).astype(np.int32))) for poly in polys]
+    ).astype(np.float32)
+    return _order_rect_points(rect_points)
+
+
+def _quad_crop_sizes(quads):
+    """Vectorized version of the crop width/height computation in `crop_text_region`."""
+    width = np.maximum(
+        np.linalg.norm(quads[:, 0] - quads[:, 1], axis=-1), np.linalg.norm(quads[:, 2] - quads[:, 3], axis=-1)
+    )
+    height = np.maximum(
+        np.linalg.norm(quads[:, 0] - quads[:, 3], axis=-1), np.linalg.norm(quads[:, 1] - quads[:, 2], axis=-1)
+    )
+    return np.maximum(width.astype(np.int64), 1), np.maximum(height.astype(np.int64), 1)
+
+
+def _axis_aligned_mask(quads, img_h, img_w, eps=1e-3):
+    """
+    Boxes with integer, axis-aligned corners lying inside the image can be cropped by slicing, which gives exactly
+    the same pixels as the perspective warp.
+    """
+    integral = np.all(np.abs(quads - np.round(quads)) < eps, axis=(1, 2))
+    aligned = (
+        (np.abs(quads[:, 0, 1] - quads[:, 1, 1]) < eps)
+        & (np.abs(quads[:, 2, 1] - quads[:, 3, 1]) < eps)
+        & (np.abs(quads[:, 0, 0] - quads[:, 3, 0]) < eps)
+        & (np.abs(quads[:, 1, 0] - quads[:, 2, 0]) < eps)
+        & (quads[:, 1, 0] > quads[:, 0, 0])
+        & (quads[:, 3, 1] > quads[:, 0, 1])
+    )
+    inside = (quads[..., 0].min(axis=1) >= 0) & (quads[..., 1].min(axis=1) >= 0)
+    inside &= (quads[..., 0].max(axis=1) <= img_w) & (quads[..., 1].max(axis=1) <= img_h)
+    return integral & aligned & inside
+
+
+def _warp_quad(img, quad, crop_w, crop_h, rotate=False, out_size=None, interpolation=cv2.INTER_LINEAR, margin=2):
+    """
+    Warp the quadrilateral `quad` of `img` to an upright crop of size (crop_w, crop_h), reading only a padded ROI
+    around the quad instead of the full image. The 90-degree counterclockwise rotation for vertical texts and the
+    resize to `out_size` (w, h) are folded into the same transform so that the crop is produced in a single pass.
+    """
+    img_h, img_w = img.shape[:2]
+    x0 = max(int(np.floor(quad[:, 0].min())) - margin, 0)
+    y0 = max(int(np.floor(quad[:, 1].min())) - margin, 0)
+    x1 = min(int(np.ceil(quad[:, 0].max())) + margin + 1, img_w)
+    y1 = min(int(np.ceil(quad[:, 1].max())) + margin + 1, img_h)
+    if x1 <= x0 or y1 <= y0:  # quad lies fully outside of the image, fall back to the full image
+        x0, y0, x1, y1 = 0, 0, img_w, img_h
+    roi = img[y0:y1, x0:x1]
+    src_pts = (quad - np.array([x0, y0], dtype=np.float32)).astype(np.float32)
+
+    if rotate:
+        # equivalent to np.rot90 applied on the upright crop
+        dst_pts = np.float32([[0, crop_w - 1], [0, -1], [crop_h, -1], [crop_h, crop_w - 1]])
+        dst_w, dst_h = crop_h, crop_w
+    else:
+        dst_pts = np.float32([[0, 0], [crop_w, 0], [crop_w, crop_h], [0, crop_h]])
+        dst_w, dst_h = crop_w, crop_h
+
+    if out_size is not None and tuple(out_size) != (dst_w, dst_h):
+        # follow the pixel-center convention of cv2.resize
+        scale = np.array([out_size[0] / dst_w, out_size[1] / dst_h], dtype=np.float32)
+        dst_pts = (dst_pts + 0.5) * scale - 0.5
+        dst_w, dst_h = out_size
+
+    trans_matrix = cv2.getPerspectiveTransform(src_pts, dst_pts)
+    return cv2.warpPerspective(
+        roi, trans_matrix, (int(dst_w), int(dst_h)), borderMode=cv2.BORDER_REPLICATE, flags=interpolation
+    )
+
+
+def crop_text_regions(img, polys, box_type="quad", rotate_if_vertical=True, interpolation=cv2.INTER_LINEAR):
+    """
+    Crop all detected text regions of an image at once. Batched counterpart of `crop_text_region` of
+    tools/infer/text/utils: axis-aligned boxes are cropped by slicing, the others are warped from a padded ROI
+    around the box and vertical texts are rotated within the same warp.
+
+    Args:
+        img: image of shape [h, w, c]
+        polys: detected text boxes, in shape [num_boxes, num_points, 2]
+        box_type: "quad" or "poly"
+        rotate_if_vertical: rotate the crop by 90 degrees counterclockwise if h / w >= 1.5
+        interpolation: interpolation method of the warp. Bilinear by default.
+
+    Returns:
+        list of cropped images
+    """
+    if len(polys) == 0:
+        return []
+    quads = _polys_to_quads(polys, box_type)
+    widths, heights = _quad_crop_sizes(quads)
+    rotates = (heights / widths.astype(np.float32) >= 1.5) & rotate_if_vertical
+    sliceable = _axis_aligned_mask(quads, *img.shape[:2])
+
+    crops = []
+    for i, quad in enumerate(quads):
+        if sliceable[i]:
+            x, y = int(round(quad[0, 0])), int(round(quad[0, 1]))
+            crop = img[y : y + heights[i], x : x + widths[i]]
+            crops.append(np.rot90(crop) if rotates[i] else crop)
+        else:
+            crops.append(_warp_quad(img, quad, widths[i], heights[i], rotates[i], interpolation=interpolation))
+    return crops
+
+
+def crop_resize_norm_text_regions(
+    img,
+    polys,
+    target_height=32,
+    target_width=320,
+    keep_ratio=True,
+    padding=True,
+    box_type="quad",
+    rotate_if_vertical=True,
+    interpolation=cv2.INTER_LINEAR,
+    norm_before_pad=False,
+    mean=(127.0, 127.0, 127.0),
+    std=(127.0, 127.0, 127.0),
+    divisor=None,
+):
+    """
+    Crop all detected text regions and write them directly into a preallocated recognition input batch, i.e.
+    `crop_text_regions` fused with `RecResizeNormForInfer` (batch mode) and `ToCHWImage`. Each crop is warped
+    straight to its resized shape, so no intermediate full-resolution crop is created.
+
+    Args:
+        img: image of shape [h, w, c]
+        polys: detected text boxes, in shape [num_boxes, num_points, 2]
+        target_height, target_width, keep_ratio, padding, norm_before_pad, mean, std, divisor: same as
+            `RecResizeNormForInfer`.
+        box_type, rotate_if_vertical, interpolation: same as `crop_text_regions`.
+
+    Returns:
+        batch: np.ndarray of shape [num_boxes, c, target_height, target_width], float32
+        resized_widths: np.ndarray of the valid (unpadded) width of each crop in the batch
+    """
+    num_channels = img.shape[2] if img.ndim == 3 else 1
+    if len(polys) == 0:
+        return np.zeros((0, num_channels, target_height, target_width), dtype=np.float32), np.zeros(0, np.int64)
+
+    quads = _polys_to_quads(polys, box_type)
+    widths, heights = _quad_crop_sizes(quads)
+    rotates = (heights / widths.astype(np.float32) >= 1.5) & rotate_if_vertical
+    sliceable = _axis_aligned_mask(quads, *img.shape[:2])
+    src_w = np.where(rotates, heights, widths)
+    src_h = np.where(rotates, widths, heights)
+
+    if keep_ratio:
+        resized_widths = np.minimum(np.ceil(target_height * src_w / src_h.astype(np.float32)), target_width)
+        resized_widths = np.maximum(resized_widths.astype(np.int64), 1)
+    else:
+        resized_widths = np.full(len(quads), target_width, dtype=np.int64)
+    batch_w = target_width if (padding or not keep_ratio) else int(resized_widths.max())
+
+    batch = np.zeros((len(quads), target_height, batch_w, num_channels), dtype=np.float32)
+    for i, quad in enumerate(quads):
+        out_size = (int(resized_widths[i]), target_height)
+        if sliceable[i]:
+            x, y = int(round(quad[0, 0])), int(round(quad[0, 1]))
+            crop = img[y : y + heights[i], x : x + widths[i]]
+            if rotates[i]:
+                crop = cv2.rotate(crop, cv2.ROTATE_90_COUNTERCLOCKWISE)
+            crop = cv2.resize(crop, out_size, interpolation=interpolation)
+        else:
+            crop = _warp_quad(img, quad, widths[i], heights[i], rotates[i], out_size, interpolation)
+        batch[i, :, : out_size[0]] = crop.reshape(target_height, out_size[0], num_channels)
+
+    mean = np.array(mean, dtype=np.float32)
+    std = np.array(std, dtype=np.float32)
+    if divisor:
+        batch /= divisor
+    batch -= mean
+    batch /= std
+    if norm_before_pad:
+        for i, resized_w in enumerate(resized_widths):
+            batch[i, :, resized_w:] = 0.0
+
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2)), resized_widths
@@ -0,0 +1,180 @@
+"""
+The list-based beam scorer replaced by the vectorized `BeamSearchScorer`, as the reference of its outputs. The scores
+of the hypotheses are python floats, as the scalars of NumPy 1.x.
+"""
+from typing import List, Optional, Union
+
+import numpy as np
+
+
+class BeamSearchScorer:
+    def __init__(
+        self,
+        batch_size: int,
+        num_beams: int,
+        length_penalty: float = 1.0,
+        do_early_stopping: Union[bool, str] = False,
+        num_beam_hyps_to_keep: int = 1,
+        num_beam_groups: int = 1,
+        max_length: Optional[int] = None,
+    ):
+        self.num_beams = num_beams
+        self.num_beam_hyps_to_keep = num_beam_hyps_to_keep
+        self.num_beam_groups = num_beam_groups
+        self.group_size = num_beams // num_beam_groups
+        self._beam_hyps = [
+            BeamHypotheses(self.group_size, length_penalty, do_early_stopping, max_length)
+            for _ in range(batch_size * num_beam_groups)
+        ]
+        self._done = np.array([False for _ in range(batch_size * num_beam_groups)])
+
+    @property
+    def is_done(self) -> bool:
+        return self._done.all()
+
+    def process(
+        self,
+        input_ids,
+        next_scores,
+        next_tokens,
+        next_indices,
+        pad_token_id: Optional[int] = None,
+        eos_token_id: Optional[Union[int, List[int]]] = None,
+        beam_indices=None,
+        group_index: int = 0,
+    ):
+        batch_size = len(self._beam_hyps) // self.num_beam_groups
+        next_beam_scores = np.zeros((batch_size, self.group_size), dtype=next_scores.dtype)
+        next_beam_tokens = np.zeros((batch_size, self.group_size), dtype=next_tokens.dtype)
+        next_beam_indices = np.zeros((batch_size, self.group_size), dtype=next_indices.dtype)
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+
+        for batch_idx in range(batch_size):
+            batch_group_idx = batch_idx * self.num_beam_groups + group_index
+            if self._done[batch_group_idx]:
+                next_beam_scores[batch_idx, :] = 0
+                next_beam_tokens[batch_idx, :] = pad_token_id
+                next_beam_indices[batch_idx, :] = 0
+                continue
+
+            beam_idx = 0
+            cur_len = np.min(np.where(input_ids[beam_idx] == pad_token_id))
+            for beam_token_rank, (next_token, next_score, next_index) in enumerate(
+                zip(next_tokens[batch_idx], next_scores[batch_idx], next_indices[batch_idx])
+            ):
+                batch_beam_idx = batch_idx * self.group_size + next_index
+                if (eos_token_id is not None) and (next_token in eos_token_id):
+                    if beam_token_rank >= self.group_size:
+                        continue
+                    beam_index = None
+                    if beam_indices is not None:
+                        beam_index = beam_indices[batch_beam_idx] + (batch_beam_idx,)
+                    self._beam_hyps[batch_group_idx].add(input_ids[batch_beam_idx].copy(), next_score, beam_index)
+                else:
+                    next_beam_scores[batch_idx, beam_idx] = next_score
+                    next_beam_tokens[batch_idx, beam_idx] = next_token
+                    next_beam_indices[batch_idx, beam_idx] = batch_beam_idx
+                    beam_idx += 1
+                if beam_idx == self.group_size:
+                    break
+
+            self._done[batch_group_idx] = self._done[batch_group_idx] or self._beam_hyps[batch_group_idx].is_done(
+                next_scores[batch_idx].max(), cur_len
+            )
+
+        return {
+            "next_beam_scores": next_beam_scores.flatten(),
+            "next_beam_tokens": next_beam_tokens.flatten(),
+            "next_beam_indices": next_beam_indices.flatten(),
+        }
+
+    def finalize(
+        self,
+        input_ids,
+        final_beam_scores,
+        max_length: int,
+        pad_token_id: Optional[int] = None,
+        eos_token_id: Optional[Union[int, List[int]]] = None,
+        beam_indices=None,
+    ):
+        batch_size = len(self._beam_hyps) // self.num_beam_groups
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+
+        for batch_group_idx, beam_hyp in enumerate(self._beam_hyps):
+            if self._done[batch_group_idx]:
+                continue
+            for index_per_group in range(self.group_size):
+                batch_beam_idx = batch_group_idx * self.group_size + index_per_group
+                beam_index = beam_indices[batch_beam_idx] if beam_indices is not None else None
+                beam_hyp.add(input_ids[batch_beam_idx], final_beam_scores[batch_beam_idx].item(), beam_index)
+
+        sent_lengths = np.zeros(batch_size * self.num_beam_hyps_to_keep, dtype=np.int32)
+        best = []
+        best_indices = []
+        best_scores = np.zeros(batch_size * self.num_beam_hyps_to_keep, dtype=np.float32)
+        for i in range(batch_size):
+            beam_hyps_in_batch = self._beam_hyps[i * self.num_beam_groups : (i + 1) * self.num_beam_groups]
+            candidate_beams = [beam for beam_hyp in beam_hyps_in_batch for beam in beam_hyp.beams]
+            sorted_hyps = sorted(candidate_beams, key=lambda x: x[0])
+            for j in range(self.num_beam_hyps_to_keep):
+                best_score, best_hyp, best_index = sorted_hyps.pop()
+                sent_lengths[self.num_beam_hyps_to_keep * i + j] = len(best_hyp)
+                best.append(best_hyp)
+                best_indices.append(best_index)
+                best_scores[i * self.num_beam_hyps_to_keep + j] = best_score
+
+        sent_lengths_max = max(sent_lengths) + 1
+        sent_max_len = min(sent_lengths_max, max_length) if max_length is not None else sent_lengths_max
+        decoded = np.zeros((batch_size * self.num_beam_hyps_to_keep, sent_max_len), dtype=np.int32)
+        indices = None
+        if best_indices and best_indices[0] is not None:
+            indices = np.full((batch_size * self.num_beam_hyps_to_keep, sent_max_len), -1, dtype=np.int32)
+        if min(sent_lengths) != max(sent_lengths):
+            decoded.fill(pad_token_id)
+        for i, (hypo, best_idx) in enumerate(zip(best, best_indices)):
+            sent_length = min(decoded.shape[-1], sent_lengths[i])
+            decoded[i, :sent_length] = hypo[:sent_length]
+            if indices is not None:
+                indices[i, : len(best_idx)] = best_idx
+            if sent_lengths[i] < sent_max_len:
+                decoded[i, sent_lengths[i]] = eos_token_id[0]
+
+        return {"sequences": decoded, "sequence_scores": best_scores, "beam_indices": indices}
+
+
+class BeamHypotheses:
+    def __init__(self, num_beams: int, length_penalty: float, early_stopping, max_length: Optional[int] = None):
+        self.length_penalty = length_penalty
+        self.early_stopping = early_stopping
+        self.max_length = max_length
+        self.num_beams = num_beams
+        self.beams = []
+        self.worst_score = 1e9
+
+    def __len__(self):
+        return len(self.beams)
+
+    def add(self, hyp, sum_logprobs: float, beam_indices=None):
+        score = float(sum_logprobs) / (hyp.shape[-1] ** self.length_penalty)
+        if len(self) < self.num_beams or score > self.worst_score:
+            self.beams.append((score, hyp, beam_indices))
+            if len(self) > self.num_beams:
+                sorted_next_scores = sorted([(s, idx) for idx, (s, _, _) in enumerate(self.beams)])
+                del self.beams[sorted_next_scores[0][1]]
+                self.worst_score = sorted_next_scores[1][0]
+            else:
+                self.worst_score = min(score, self.worst_score)
+
+    def is_done(self, best_sum_logprobs: float, cur_len: int) -> bool:
+        if len(self) < self.num_beams:
+            return False
+        best_sum_logprobs = float(best_sum_logprobs)
+        if self.early_stopping is True:
+            return True
+        if self.early_stopping is False or self.length_penalty <= 0.0:
+            highest_attainable_score = best_sum_logprobs / cur_len**self.length_penalty
+        else:
+            highest_attainable_score = best_sum_logprobs / self.max_length**self.length_penalty
+        return self.worst_score >= highest_attainable_score
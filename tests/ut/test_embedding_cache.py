@@ -0,0 +1,83 @@
+import sys
+
+sys.path.append(".")
+
+import numpy as np
+import pytest
+
+from mindocr.nlp.utils.embedding_cache import EmbeddingCache
+
+
+class _Encoder:
+    """Embeddings of 4 float32 (16 bytes) of a batch of images and scales, recording the batch sizes."""
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, images, scales):
+        self.batch_sizes.append(len(images))
+        return np.stack([images.reshape(len(images), -1).sum(axis=1) * scales] * 4, axis=1).astype(np.float32)
+
+
+def _images(values):
+    return np.array(values, dtype=np.float32).reshape(-1, 1, 1, 1) * np.ones((1, 1, 2, 2), dtype=np.float32)
+
+
+def test_embedding_cache_batches():
+    encoder = _Encoder()
+    cache = EmbeddingCache(encoder, max_bytes=1 << 20, batch_size=4)
+    images, scales = _images([1, 2, 1, 3, 4, 5, 2]), np.ones((7,), dtype=np.float32)
+    embeddings = cache(images, scales)
+
+    np.testing.assert_array_equal(embeddings, encoder(images, scales))
+    # the 5 unique images are encoded once, in a batch of 4 and a batch of 1
+    assert encoder.batch_sizes[:2] == [4, 1]
+    assert cache.stats() == {"num_embeddings": 5, "num_bytes": 80, "num_hits": 0, "num_misses": 5, "num_encoded": 5}
+
+    # the same batch of inputs is returned as is, a new batch with the same content hits the cache
+    encoder.batch_sizes.clear()
+    assert cache(images, scales) is embeddings
+    np.testing.assert_array_equal(cache(images.copy(), scales.copy()), embeddings)
+    assert encoder.batch_sizes == []
+    assert cache.num_hits == 5
+
+    # the inputs other than images are part of the key, a batch of 3 is padded to 4
+    cache(_images([1, 6, 7]), np.array([2, 1, 1], dtype=np.float32))
+    assert encoder.batch_sizes == [4]
+    assert cache.num_encoded == 8
+
+    with pytest.raises(ValueError):
+        cache(images, scales[:3])
+
+
+def test_embedding_cache_prefetch():
+    encoder = _Encoder()
+    cache = EmbeddingCache(encoder, max_bytes=1 << 20, batch_size=8)
+    requests = [(_images([i, i + 1]), np.ones((2,), dtype=np.float32)) for i in range(3)]
+    # the images of the queued requests are encoded together
+    cache.prefetch(requests)
+    assert encoder.batch_sizes == [4]
+    for images, scales in requests:
+        cache(images, scales)
+    assert encoder.batch_sizes == [4]
+    assert cache.num_encoded == 4
+
+
+def test_embedding_cache_eviction():
+    encoder = _Encoder()
+    # room for 2 embeddings
+    cache = EmbeddingCache(encoder, max_bytes=32)
+    scales = np.ones((1,), dtype=np.float32)
+    for value in [1, 2, 1, 3]:
+        cache(_images([value]), scales)
+    # the least recently used embedding of 2 is evicted
+    assert len(cache) == 2 and cache.num_bytes == 32
+    assert cache.num_encoded == 3
+    cache(_images([1]), scales)
+    cache(_images([2]), scales)
+    assert cache.num_encoded == 4
+
+    # an embedding larger than max_bytes is not cached
+    cache = EmbeddingCache(encoder, max_bytes=8)
+    cache(_images([1]), scales)
+    assert len(cache) == 0 and cache.num_bytes == 0
@@ -0,0 +1,309 @@
+import sys
+
+sys.path.append(".")
+sys.path.append("tests/ut")
+
+from concurrent.futures import CancelledError
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from mindocr.nlp.generation import GeneratorMixin
+from mindocr.nlp.generation.generation_config import GenerationConfig
+from mindocr.nlp.generation.logits_process import (
+    FusedLogitsSampler,
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+from mindocr.nlp.generation.speculative import NGramProposer, SpeculativeDecoder, _speculative_sample
+from mindocr.nlp.generation.utils import softmax
+
+
+def _sampler_probs(sampler, logits):
+    """Probabilities over the vocabulary of the candidates returned by the sampler."""
+    scores, ids = sampler(logits.copy())
+    probs = np.zeros(logits.shape, dtype=np.float64)
+    for i in range(logits.shape[0]):
+        probs[i, ids[i]] = softmax(scores[i].astype(np.float64))
+    return probs
+
+
+@pytest.mark.parametrize("penalty", [1.0, 1.3, 0.8])
+@pytest.mark.parametrize("temperature", [1.0, 0.7])
+@pytest.mark.parametrize("top_k", [0, 5, 300])
+@pytest.mark.parametrize("top_p", [1.0, 0.9])
+def test_fused_sampler(penalty, temperature, top_k, top_p):
+    # batch size 1, since TopPLogitsWarper normalizes the probabilities over the whole batch
+    rng = np.random.default_rng(0)
+    input_ids = rng.integers(1, 1000, (1, 30))
+    logits = rng.standard_normal((1, 1000)).astype(np.float32) * 3
+
+    processors = LogitsProcessorList()
+    if penalty != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(penalty))
+    if temperature != 1.0:
+        processors.append(TemperatureLogitsWarper(temperature))
+    if top_k:
+        processors.append(TopKLogitsWarper(top_k))
+    if top_p < 1.0:
+        processors.append(TopPLogitsWarper(top_p))
+    expected = softmax(processors(input_ids, logits.copy()).astype(np.float64), axis=-1)
+
+    sampler = FusedLogitsSampler(penalty, temperature, top_k, top_p)
+    sampler.reset(input_ids, [input_ids.shape[1]])
+    assert np.allclose(_sampler_probs(sampler, logits), expected, atol=1e-5)
+
+    greedy = FusedLogitsSampler(penalty, do_sample=False)
+    greedy.reset(input_ids, [input_ids.shape[1]])
+    _, ids = greedy(logits.copy())
+    penalized = processors[0](input_ids, logits.copy()) if penalty != 1.0 else logits
+    assert ids[0, 0] == np.argmax(penalized)
+
+
+def test_fused_sampler_top_p_of_all_tokens():
+    # all the tokens of a small vocabulary are candidates, which top-p needs sorted
+    rng = np.random.default_rng(1)
+    logits = rng.standard_normal((1, 50)).astype(np.float32) * 3
+    expected = softmax(TopPLogitsWarper(0.9)(None, logits.copy()).astype(np.float64), axis=-1)
+    assert np.allclose(_sampler_probs(FusedLogitsSampler(top_p=0.9), logits), expected, atol=1e-5)
+
+
+def test_fused_sampler_top_p_per_row():
+    rng = np.random.default_rng(2)
+    logits = rng.standard_normal((4, 1000)).astype(np.float32) * 3
+    probs = _sampler_probs(FusedLogitsSampler(top_p=0.9), logits)
+    for i in range(len(logits)):
+        expected = softmax(TopPLogitsWarper(0.9)(None, logits[i : i + 1].copy()).astype(np.float64), axis=-1)
+        assert np.allclose(probs[i], expected[0], atol=1e-5)
+
+
+def test_fused_sampler_seen_tokens():
+    rng = np.random.default_rng(3)
+    sampler = FusedLogitsSampler(1.5, do_sample=False)
+    input_ids = rng.integers(1, 1000, (2, 5))
+    sampler.reset(input_ids, [5, 3])
+    tokens = rng.integers(1, 1000, 300)
+    for token in tokens:
+        sampler.append(0, token)
+    seen_ids, penalty = sampler._penalty_inputs(2)
+    assert set(seen_ids[0, : sampler._num_seen[0]].tolist()) == set(input_ids[0].tolist()) | set(tokens.tolist())
+    assert set(seen_ids[1, : sampler._num_seen[1]].tolist()) == set(input_ids[1, :3].tolist())
+    # the padding of a row repeats its seen tokens, so that it is penalized once
+    assert set(seen_ids[1].tolist()) == set(input_ids[1, :3].tolist())
+    assert penalty[:, 0].tolist() == [1.5, 1.5]
+
+
+def _run_beam_scorers(seed, batch_size, num_beams, num_groups, early_stopping, length_penalty, eos_token_id):
+    """Run the beam scorer and the list-based reference on the same random steps, and compare their outputs."""
+    from _beam_search_reference import BeamSearchScorer as ReferenceScorer
+
+    from mindocr.nlp.generation.beam_search import BeamSearchScorer
+
+    rng = np.random.default_rng(seed)
+    max_length = 12
+    kwargs = dict(
+        batch_size=batch_size,
+        num_beams=num_beams,
+        length_penalty=length_penalty,
+        do_early_stopping=early_stopping,
+        num_beam_hyps_to_keep=1 if seed % 3 else min(2, num_beams),
+        num_beam_groups=num_groups,
+        max_length=max_length,
+    )
+    scorer, reference = BeamSearchScorer(**kwargs), ReferenceScorer(**kwargs)
+    group_size = num_beams // num_groups
+    eos_list = [eos_token_id] if isinstance(eos_token_id, int) else eos_token_id
+    input_ids = np.zeros((batch_size * num_beams, max_length), dtype=np.int64)
+    input_ids[:, :3] = rng.integers(5, 20, (batch_size * num_beams, 3))
+    beam_indices = [()] * (batch_size * num_beams) if seed % 2 else None
+    cur_len = 3
+    while cur_len < max_length:
+        beam_scores = np.zeros(batch_size * num_beams, dtype=np.float64)
+        new_input_ids = input_ids.copy()
+        new_beam_indices = list(beam_indices) if beam_indices is not None else None
+        for group in range(num_groups):
+            next_scores = rng.normal(size=(batch_size, 2 * group_size)) - cur_len
+            if seed % 4 == 0:
+                # ties of scores
+                next_scores = np.round(next_scores * 2) / 2
+            next_scores = -np.sort(-next_scores, axis=1).astype(np.float32)
+            next_tokens = rng.integers(1, 8, (batch_size, 2 * group_size))
+            for row in next_tokens:
+                # at most group_size eos tokens
+                is_eos = np.isin(row, eos_list)
+                row[np.flatnonzero(is_eos)[: max(is_eos.sum() - group_size, 0)]] = 9
+            next_indices = rng.integers(0, group_size, (batch_size, 2 * group_size))
+            rows = [
+                (i // group_size) * num_beams + group * group_size + i % group_size
+                for i in range(batch_size * group_size)
+            ]
+            group_ids = input_ids[rows]
+            group_beam_indices = [beam_indices[r] for r in rows] if beam_indices is not None else None
+
+            outputs = [
+                s.process(
+                    group_ids,
+                    next_scores,
+                    next_tokens,
+                    next_indices,
+                    pad_token_id=0,
+                    eos_token_id=eos_token_id,
+                    beam_indices=group_beam_indices,
+                    group_index=group,
+                )
+                for s in (scorer, reference)
+            ]
+            for key in outputs[1]:
+                assert outputs[0][key].dtype == outputs[1][key].dtype
+                assert np.array_equal(outputs[0][key], outputs[1][key]), key
+
+            for i, row in enumerate(rows):
+                source = outputs[1]["next_beam_indices"][i]
+                new_input_ids[row] = group_ids[source]
+                new_input_ids[row, cur_len] = outputs[1]["next_beam_tokens"][i]
+                beam_scores[row] = outputs[1]["next_beam_scores"][i]
+                if beam_indices is not None:
+                    new_beam_indices[row] = group_beam_indices[source] + (source,)
+        assert scorer.is_done == reference.is_done
+        input_ids, beam_indices = new_input_ids, new_beam_indices
+        cur_len += 1
+        if reference.is_done:
+            break
+
+    outputs = [
+        s.finalize(
+            input_ids, beam_scores, max_length, pad_token_id=0, eos_token_id=eos_token_id, beam_indices=beam_indices
+        )
+        for s in (scorer, reference)
+    ]
+    for key in outputs[1]:
+        if outputs[1][key] is None:
+            assert outputs[0][key] is None, key
+            continue
+        assert outputs[0][key].dtype == outputs[1][key].dtype
+        assert np.array_equal(outputs[0][key], outputs[1][key]), key
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("batch_size, num_beams, num_groups", [(1, 2, 1), (3, 4, 1), (8, 4, 1), (2, 4, 2), (4, 6, 3)])
+@pytest.mark.parametrize("early_stopping", [False, True, "never"])
+@pytest.mark.parametrize("length_penalty", [1.0, 0.0, -0.5, 2.0])
+@pytest.mark.parametrize("eos_token_id", [2, [2, 3]])
+def test_beam_search_scorer(seed, batch_size, num_beams, num_groups, early_stopping, length_penalty, eos_token_id):
+    _run_beam_scorers(seed, batch_size, num_beams, num_groups, early_stopping, length_penalty, eos_token_id)
+
+
+class _ConstantModel(GeneratorMixin):
+    """A model of batch size 2 which always generates the token 5."""
+
+    def __init__(self):
+        self.config = SimpleNamespace(
+            batch_size=2, seq_length=16, is_encoder_decoder=False, is_sample_acceleration=False, use_kvcache_op=False
+        )
+
+    def set_train(self, mode):
+        pass
+
+    def prepare_inputs_for_generation(self, input_ids, **kwargs):
+        return {"input_ids": input_ids}
+
+    def __call__(self, input_ids, **kwargs):
+        logits = np.full((len(input_ids), 50), -1e9, dtype=np.float32)
+        logits[:, 5] = 0
+        return logits
+
+
+class _CountingStreamer:
+    def __init__(self):
+        self.num_ended = 0
+
+    def put(self, value):
+        pass
+
+    def end(self):
+        self.num_ended += 1
+
+
+def test_continuous_batching_abort():
+    scheduler = _ConstantModel().continuous_batching(
+        GenerationConfig(pad_token_id=0, eos_token_id=1, use_past=False, max_length=16)
+    )
+    streamers = [_CountingStreamer() for _ in range(4)]
+    futures = [scheduler.submit([3, 4], streamer=streamer) for streamer in streamers]
+    scheduler.step()
+    # abort a running request, and cancel a queued one while all the slots are busy
+    scheduler.abort(futures[0])
+    assert futures[3].cancel()
+    scheduler.step()
+    assert isinstance(futures[0].exception(), CancelledError)
+    assert streamers[0].num_ended == 1 and streamers[3].num_ended == 1
+    assert not scheduler._waiting
+
+    # the slot of the aborted request is reused
+    scheduler.run_until_complete()
+    assert futures[1].result().tolist() == futures[2].result().tolist() == [3, 4] + [5] * 14
+    assert [streamer.num_ended for streamer in streamers] == [1, 1, 1, 1]
+
+
+def test_ngram_proposer():
+    proposer = NGramProposer(num_tokens=3, max_ngram=3)
+    # the last 3-gram does not occur before, the latest earlier occurrence of the last 2-gram does
+    token_ids = np.array([1, 2, 8, 1, 2, 3, 4, 9, 1, 2])
+    assert proposer.lookup(token_ids, 3).tolist() == [3, 4, 9]
+    assert proposer.lookup(token_ids, 1).tolist() == [3]
+    assert proposer.lookup(np.array([1, 2, 3]), 3).tolist() == []
+
+    input_ids = np.zeros((3, 12), dtype=np.int32)
+    input_ids[:, :10] = token_ids
+    drafts, num_drafts, draft_probs = proposer.propose(input_ids, [10, 10, 2], [3, 0, 3])
+    assert drafts[0].tolist() == [3, 4, 9]
+    assert num_drafts.tolist() == [3, 0, 0]
+    assert draft_probs is None
+
+
+def test_speculative_verify_greedy():
+    eos_token_id = 1
+    # the tokens of the model at the positions of the last token and the 3 draft tokens
+    targets = np.array([[4, 5, 7, 2], [3, 3, 3, 3], [6, 6, 6, 6], [1, 5, 5, 5]])
+    logits = np.where(np.arange(10) == targets[..., None], 1.0, 0.0).astype(np.float32)
+    drafts = np.array([[4, 5, 6], [2, 2, 2], [6, 6, 6], [1, 5, 5]])
+    num_drafts = np.array([3, 2, 3, 2])
+    is_finished = np.array([False, False, True, False])
+
+    sampler = FusedLogitsSampler(do_sample=False)
+    sampler.reset(np.full((4, 8), 2, dtype=np.int32), [2] * 4)
+    decoder = SpeculativeDecoder(None, GenerationConfig(eos_token_id=eos_token_id), sampler, NGramProposer(3))
+    outputs = decoder._verify(lambda j: (logits[:, j],), drafts, num_drafts, None, is_finished)
+
+    # the drafts are accepted while they agree with the model, and the model emits the token after them
+    assert outputs == [[4, 5, 7], [3], [], [1]]
+    assert decoder.num_accepted == 3
+
+
+@pytest.mark.parametrize("with_draft_probs", [True, False])
+def test_speculative_sample_distribution(with_draft_probs):
+    np.random.seed(0)
+    candidate_ids = np.array([3, 7, 1, 9])
+    probs = np.array([0.4, 0.3, 0.2, 0.1])
+    # the draft may propose a token out of the candidates of the model
+    draft_ids = np.array([7, 3, 5])
+    draft_probs = np.array([0.5, 0.2, 0.3])
+
+    num_samples = 20000
+    counts = {}
+    for _ in range(num_samples):
+        if with_draft_probs:
+            token = int(draft_ids[np.random.choice(3, p=draft_probs)])
+            target = _speculative_sample(candidate_ids, probs, token, (draft_ids, draft_probs))
+        else:
+            target = _speculative_sample(candidate_ids, probs, 9, None)
+        counts[target] = counts.get(target, 0) + 1
+
+    # the accepted or resampled tokens follow the distribution of the model
+    assert set(counts) <= set(candidate_ids.tolist())
+    freqs = np.array([counts.get(token, 0) for token in candidate_ids.tolist()]) / num_samples
+    assert np.allclose(freqs, probs, atol=0.015)
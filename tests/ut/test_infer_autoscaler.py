@@ -0,0 +1,146 @@
+import itertools
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+py_infer_path = "deploy/py_infer"
+sys.path.insert(0, py_infer_path)
+
+from src.parallel.framework import autoscaler
+from src.parallel.framework.autoscaler import RuntimeRebalancer, plan_module_counts, predict_fps
+from src.utils import log
+
+STAGE_COSTS = {"HandoutNode": 0.001, "DecodeNode": 0.01, "DetInferNode": 0.04, "RecInferNode": 0.02, "CollectNode": 0}
+
+
+def test_plan_module_counts():
+    topology = plan_module_counts(STAGE_COSTS, core_budget=7)
+    # the fixed modules have one instance out of the budget, the others are added to the bottleneck one at a time
+    assert topology.module_counts == {
+        "HandoutNode": 1,
+        "DecodeNode": 1,
+        "DetInferNode": 4,
+        "RecInferNode": 2,
+        "CollectNode": 1,
+    }
+    assert topology.predicted_fps == pytest.approx(100.0)
+
+    # one instance for each module at the minimal budget
+    topology = plan_module_counts(STAGE_COSTS, core_budget=3)
+    assert set(topology.module_counts.values()) == {1}
+    assert topology.predicted_fps == pytest.approx(25.0)
+
+    with pytest.raises(ValueError):
+        plan_module_counts(STAGE_COSTS, core_budget=2)
+
+
+@pytest.mark.parametrize("core_budget", [3, 4, 6, 9])
+@pytest.mark.parametrize("costs", [(0.01, 0.04, 0.02), (0.03, 0.005, 0.011), (0.02, 0.02, 0.02)])
+def test_plan_module_counts_optimal(costs, core_budget):
+    stage_costs = dict(zip(["DecodeNode", "DetInferNode", "RecInferNode"], costs))
+    topology = plan_module_counts(stage_costs, core_budget)
+    assert sum(topology.module_counts.values()) == core_budget
+
+    # no allocation within the budget is faster
+    best_fps = max(
+        predict_fps(stage_costs, dict(zip(stage_costs, counts)))
+        for counts in itertools.product(range(1, core_budget + 1), repeat=len(stage_costs))
+        if sum(counts) <= core_budget
+    )
+    assert topology.predicted_fps == pytest.approx(best_fps)
+
+
+def test_predict_fps():
+    assert predict_fps({"DecodeNode": 0.01, "DetInferNode": 0.05}, {"DetInferNode": 2}) == pytest.approx(40.0)
+    # the modules without cost are not bottlenecks
+    assert predict_fps({"CollectNode": 0}, {}) == 0.0
+
+
+def _instance(active=True):
+    return SimpleNamespace(
+        process_cost=SimpleNamespace(value=0.0),
+        send_cost=SimpleNamespace(value=0.0),
+        active=SimpleNamespace(value=active),
+    )
+
+
+def _busy(instances, process_cost, send_cost=0.0):
+    for instance in instances:
+        instance.process_cost.value += process_cost
+        instance.send_cost.value += send_cost
+
+
+def _active_counts(rebalancer):
+    return {name: len(rebalancer._active(name)) for name in rebalancer.modules}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(autoscaler, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def _build_rebalancer(core_budget):
+    log.init_logger()
+    modules = {
+        "HandoutNode": [_instance()],
+        "DetInferNode": [_instance(), _instance(active=False)],
+        "RecInferNode": [_instance(), _instance(), _instance(active=False)],
+    }
+    return RuntimeRebalancer(modules, core_budget=core_budget, interval=1.0), modules
+
+
+def test_runtime_rebalancer_move_instance(clock):
+    rebalancer, modules = _build_rebalancer(core_budget=3)
+    assert list(rebalancer.modules) == ["DetInferNode", "RecInferNode"]
+
+    # the costs are measured every interval
+    clock.now = 0.5
+    _busy(modules["DetInferNode"], 0.5)
+    rebalancer.step()
+    assert rebalancer.last_time == 0.0
+
+    # det is busy 90% of the time, excluding the time waiting for sending, and rec 20% with 2 instances
+    clock.now = 1.0
+    _busy(modules["DetInferNode"], 0.5, send_cost=0.1)
+    _busy(modules["DetInferNode"][:1], 0.5)
+    _busy(modules["RecInferNode"][:2], 0.2)
+    rebalancer.step()
+    # an instance of rec is deactivated for the standby instance of det, within the core budget
+    assert _active_counts(rebalancer) == {"DetInferNode": 2, "RecInferNode": 1}
+    assert [x.active.value for x in modules["RecInferNode"]] == [True, False, False]
+
+    # det is still the busiest, but has no standby instance
+    clock.now = 2.0
+    _busy(modules["DetInferNode"], 1.0)
+    rebalancer.step()
+    assert _active_counts(rebalancer) == {"DetInferNode": 2, "RecInferNode": 1}
+
+
+def test_runtime_rebalancer_keep_instances(clock):
+    rebalancer, modules = _build_rebalancer(core_budget=3)
+
+    # no module is busy enough
+    clock.now = 1.0
+    _busy(modules["DetInferNode"][:1], 0.7)
+    rebalancer.step()
+    assert _active_counts(rebalancer) == {"DetInferNode": 1, "RecInferNode": 2}
+
+    # the other modules are not idle enough to give an instance
+    clock.now = 2.0
+    _busy(modules["DetInferNode"][:1], 0.9)
+    _busy(modules["RecInferNode"][:2], 0.5)
+    rebalancer.step()
+    assert _active_counts(rebalancer) == {"DetInferNode": 1, "RecInferNode": 2}
+
+
+def test_runtime_rebalancer_within_budget(clock):
+    # a standby instance is activated without deactivating others, while the core budget is not used up
+    rebalancer, modules = _build_rebalancer(core_budget=4)
+    clock.now = 1.0
+    _busy(modules["RecInferNode"][:2], 0.95)
+    _busy(modules["DetInferNode"][:1], 0.9)
+    rebalancer.step()
+    assert _active_counts(rebalancer) == {"DetInferNode": 1, "RecInferNode": 3}
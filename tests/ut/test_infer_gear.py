@@ -0,0 +1,229 @@
+import argparse
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+import pytest
+
+py_infer_path = "deploy/py_infer"
+sys.path.insert(0, py_infer_path)
+
+from src.core import Model
+from src.core.model import model as model_module
+from src.data_process.utils.gear_planner import GearPlanner
+from src.data_process.utils.gear_utils import get_matched_gear_bs
+from src.infer.infer_base import InferBase
+from src.utils import log
+
+
+@pytest.mark.parametrize("image_num", [1, 3, 7, 8, 9, 17])
+def test_plan_batches_without_latency(image_num):
+    planner = GearPlanner((1, 4, 8))
+    assert planner.plan_batches(image_num) == get_matched_gear_bs(image_num, (1, 4, 8))
+
+
+@pytest.mark.parametrize(
+    "bs_latency, image_num, expected",
+    [
+        # 2 calls of batch 1 cost less than a call of batch 4
+        ({1: 1.0, 4: 3.0, 8: 4.0}, 2, (1, 1)),
+        ({1: 1.0, 4: 1.5, 8: 2.0}, 3, (4,)),
+        ({1: 1.0, 4: 1.5, 8: 2.0}, 9, (8, 1)),
+        # the latency grows linearly with the batch size, the ties are broken by the number of calls
+        ({1: 1.0, 4: 4.0, 8: 8.0}, 12, (8, 4)),
+    ],
+)
+def test_plan_batches(bs_latency, image_num, expected):
+    planner = GearPlanner((1, 4, 8), latency_table={"bs": bs_latency})
+    batch_list = planner.plan_batches(image_num)
+    assert sum(batch_list) >= image_num
+    assert tuple(sorted(batch_list, reverse=True)) == expected
+
+
+@pytest.mark.parametrize(
+    "image_hw, hw_latency, expected",
+    [
+        # the smallest gear the image fits in without downscaling
+        ((30, 300), {}, (48, 320)),
+        ((40, 500), {}, (48, 640)),
+        # the image does not fit in any gear, take the gear with the least downscale
+        ((100, 2000), {}, (48, 1280)),
+        # a larger gear is taken if it is measured to be faster
+        ((30, 300), {(48, 320): 5.0, (48, 640): 3.0, (48, 1280): 8.0}, (48, 640)),
+    ],
+)
+def test_match_hw(image_hw, hw_latency, expected):
+    planner = GearPlanner((1,), ((48, 320), (48, 640), (48, 1280)), {"hw": hw_latency})
+    assert planner.match_hw(image_hw) == expected
+
+
+def test_latency_table_save_load(tmp_path):
+    path = GearPlanner.get_latency_table_path(str(tmp_path / "rec.om"))
+    assert path == str(tmp_path / "rec_gear_latency.json")
+
+    latency_table = {"bs": {1: 2.5, 8: 9.0}, "hw": {(48, 320): 3.0}}
+    GearPlanner.save_latency_table(path, latency_table)
+    assert GearPlanner.load_latency_table(path) == latency_table
+
+
+class TextRecognizer(InferBase):
+    """
+    Named after the recognizer, whose model path the gear planner looks up by the class name.
+    """
+
+    def _measure_gear_latency(self, repeat: int = 5):
+        with open(self.args.measure_log, "a") as fp:
+            fp.write("measured\n")
+        time.sleep(0.2)
+        return {"bs": {1: 1.0, 4: 2.0}, "hw": {}}
+
+    def _init_preprocess(self):
+        pass
+
+    def _init_model(self):
+        pass
+
+    def _init_postprocess(self):
+        pass
+
+    def get_params(self):
+        return {}
+
+    def __call__(self, *args, **kwargs):
+        pass
+
+    def preprocess(self, *args, **kwargs):
+        pass
+
+    def model_infer(self, *args, **kwargs):
+        pass
+
+    def postprocess(self, *args, **kwargs):
+        pass
+
+
+def _init_gear_planner(args, result_queue):
+    recognizer = TextRecognizer(args)
+    recognizer._bs_list = (1, 4)
+    recognizer._init_gear_planner()
+    result_queue.put(recognizer.gear_planner.bs_cost)
+
+
+def test_gear_calibration_once(tmp_path):
+    log.init_logger()
+    args = argparse.Namespace(
+        det_model_path=None,
+        cls_model_path=None,
+        rec_model_path=str(tmp_path / "rec.om"),
+        layout_model_path=None,
+        gear_calibration=True,
+        measure_log=str(tmp_path / "measure.log"),
+    )
+    context = multiprocessing.get_context("fork")
+    result_queue = context.Queue()
+    # the preprocess instances of a pipeline init at the same time
+    processes = [context.Process(target=_init_gear_planner, args=(args, result_queue)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    results = [result_queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+
+    assert (tmp_path / "measure.log").read_text().count("measured") == 1
+    assert results == [{1: 1.0, 4: 2.0}] * len(processes)
+
+
+class _Backend:
+    """A fake backend of the shapes and gears of inputs, recording the shapes of the inferred inputs."""
+
+    def __init__(self, model_path, input_shape, gears=(), input_dtype=None):
+        self.model_path = model_path
+        self.input_shape = input_shape
+        self.input_num = len(input_shape)
+        self.input_dtype = input_dtype or [np.float32] * self.input_num
+        self.gears = gears
+        self.inferred = []
+
+    def get_gear(self):
+        return self.gears
+
+    def infer(self, inputs):
+        self.inferred.append([(x.shape, x.dtype) for x in inputs])
+        return inputs
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    monkeypatch.setitem(model_module._INFER_BACKEND_MAP, "fake", _Backend)
+
+
+@pytest.mark.parametrize(
+    "input_shape, gears, batch_sizes, image_sizes, expected",
+    [
+        # static shape
+        ([[1, 3, 48, 320]], (), (1, 4), ((32, 100),), [[(1, 3, 48, 320)]]),
+        # gears of batch size and image size
+        ([[-1, 3, 48, 320]], ([4, 3, 48, 320], [1, 3, 48, 320]), (), (), [[(1, 3, 48, 320)], [(4, 3, 48, 320)]]),
+        ([[1, 3, -1, -1]], ([1, 3, 48, 640], [1, 3, 48, 320]), (), (), [[(1, 3, 48, 320)], [(1, 3, 48, 640)]]),
+        # dynamic shape, filled by the representative batch sizes and image sizes, or 64 without them
+        ([[-1, 3, -1, -1]], (), (), (), [[(64, 3, 64, 64)]]),
+        (
+            [[-1, 3, -1, -1]],
+            (),
+            (1, 4),
+            ((736, 1280), (960, 960)),
+            [[(1, 3, 736, 1280)], [(1, 3, 960, 960)], [(4, 3, 736, 1280)], [(4, 3, 960, 960)]],
+        ),
+        # the static dims are kept
+        ([[8, 3, 48, -1]], (), (1, 4), ((32, 320), (48, 640)), [[(8, 3, 48, 320)], [(8, 3, 48, 640)]]),
+        # multiple inputs
+        ([[-1, 3, -1, -1], [-1, 2]], (), (1, 4), ((48, 320),), [[(64, 3, 64, 64), (64, 2)]]),
+    ],
+)
+def test_get_warmup_shapes(fake_backend, input_shape, gears, batch_sizes, image_sizes, expected):
+    model = Model(backend="fake", model_path="rec.onnx", input_shape=input_shape, gears=gears)
+    assert model.get_warmup_shapes(batch_sizes, image_sizes) == expected
+
+
+def test_model_warmup(fake_backend):
+    model = Model(
+        backend="fake", model_path="det.onnx", input_shape=[[1, 3, -1, -1], [1]], input_dtype=[np.float32, np.int32]
+    )
+    cost = model.warmup(image_sizes=((736, 1280),))
+    # a dummy inference of the dtypes of inputs on each shape, the cost is keyed by the shape of input[0]
+    assert model.model.inferred == [[((1, 3, 64, 64), np.float32), ((1,), np.int32)]]
+    assert list(cost) == [(1, 3, 64, 64)]
+    assert cost[(1, 3, 64, 64)] >= 0
+
+
+def test_infer_base_warmup(fake_backend):
+    log.init_logger()
+    args = argparse.Namespace(warmup_shapes={"det": [(736, 1280)], "rec": [(48, 320), (48, 640)]})
+    recognizer = TextRecognizer(args)
+    recognizer._bs_list = (1, 4, 8)
+    recognizer.warmup()  # without model
+
+    # the model of a gear is shared by batch sizes 1 and 4, and a dynamic shape model serves batch size 8
+    gear_model = Model(
+        backend="fake", model_path="rec_gear.onnx", input_shape=[[-1, 3, 48, 320]], gears=([1, 3, 48, 320],)
+    )
+    dynamic_model = Model(backend="fake", model_path="rec_dynamic.onnx", input_shape=[[-1, 3, -1, -1]])
+    recognizer.model = {1: gear_model, 4: gear_model, 8: dynamic_model}
+    recognizer.warmup()
+
+    # the shared model is warmed up once, and the dynamic one on the batch sizes and the rec image sizes
+    assert [shapes[0][0] for shapes in gear_model.model.inferred] == [(1, 3, 48, 320)]
+    assert sorted(shapes[0][0] for shapes in dynamic_model.model.inferred) == [
+        (1, 3, 48, 320),
+        (1, 3, 48, 640),
+        (4, 3, 48, 320),
+        (4, 3, 48, 640),
+        (8, 3, 48, 320),
+        (8, 3, 48, 640),
+    ]
+
+    recognizer.model = dynamic_model
+    recognizer._bs_list = (1,)
+    recognizer.warmup()
+    assert [shapes[0][0] for shapes in dynamic_model.model.inferred[6:]] == [(1, 3, 48, 320), (1, 3, 48, 640)]
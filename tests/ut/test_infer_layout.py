@@ -0,0 +1,76 @@
+import sys
+
+import numpy as np
+
+py_infer_path = "deploy/py_infer"
+sys.path.insert(0, py_infer_path)
+
+from src.data_process.utils.layout_utils import build_regions, crop_region, sort_lines, sort_regions
+
+
+def _region(name, bbox):
+    return {"type": name, "bbox": bbox, "score": 0.9}
+
+
+def test_build_regions():
+    layout_results = [
+        {"category_id": 1, "bbox": [0, 0, 100, 50], "score": 0.8},
+        # the same box predicted as another category of lower score
+        {"category_id": 3, "bbox": [1, 1, 100, 50], "score": 0.7},
+        {"category_id": 4, "bbox": [0, 100, 100, 50], "score": 0.9},
+        {"category_id": 2, "bbox": [0, 200, 100, 20], "score": 0.3},
+        {"category_id": 9, "bbox": [0, 300, 100, 20], "score": 0.6},
+    ]
+    regions = build_regions(layout_results, score_thresh=0.5)
+    assert [(region["type"], region["bbox"]) for region in regions] == [
+        ("table", [0, 100, 100, 150]),
+        ("text", [0, 0, 100, 50]),
+        ("9", [0, 300, 100, 320]),
+    ]
+
+
+def test_sort_regions():
+    page_width = 200
+    regions = [
+        _region("right 1", [110, 60, 190, 100]),
+        _region("left 2", [10, 110, 90, 150]),
+        _region("footer", [10, 300, 190, 320]),
+        _region("left 1", [10, 60, 90, 100]),
+        _region("title", [10, 10, 190, 50]),
+        _region("right 2", [110, 110, 190, 150]),
+        _region("left 3", [10, 330, 90, 350]),
+    ]
+    # the regions wider than half of the page separate the bands, the left column of a band is read first
+    names = [region["type"] for region in sort_regions(regions, page_width)]
+    assert names == ["title", "left 1", "left 2", "right 1", "right 2", "footer", "left 3"]
+
+
+def test_crop_region():
+    image = np.arange(20 * 30 * 3, dtype=np.uint8).reshape(20, 30, 3)
+    crop, offset = crop_region(image, [5.5, 2.2, 12.5, 8.7], padding=2)
+    assert offset == [3, 0]
+    assert crop.shape == (7 + 4, 8 + 4, 3)
+    np.testing.assert_array_equal(crop[2:-2, 2:-2], image[2:9, 5:13])
+    assert np.all(crop[:2] == 255) and np.all(crop[:, -2:] == 255)
+
+    # the region is clipped to the page
+    crop, offset = crop_region(image, [-5, 15, 40, 30], padding=0)
+    assert offset == [0, 15]
+    np.testing.assert_array_equal(crop, image[15:, :])
+    crop, offset = crop_region(image, [40, 0, 50, 10])
+    assert crop is None
+
+
+def test_sort_lines():
+    def _line(text, x0, y0, x1, y1):
+        return {"transcription": text, "points": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]}
+
+    texts = [
+        _line("row 2 right", 60, 42, 100, 58),
+        _line("row 1 right", 60, 12, 100, 28),
+        _line("row 2 left", 0, 40, 50, 60),
+        _line("row 1 left", 0, 10, 50, 30),
+        _line("row 3", 0, 70, 100, 90),
+    ]
+    names = [text["transcription"] for text in sort_lines(texts)]
+    assert names == ["row 1 left", "row 1 right", "row 2 left", "row 2 right", "row 3"]
@@ -0,0 +1,74 @@
+import sys
+
+import numpy as np
+import pytest
+
+py_infer_path = "deploy/py_infer"
+sys.path.insert(0, py_infer_path)
+
+from src.core.model import Model, ShapeType
+
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+
+def _save_model(path, input_shape, outputs):
+    """A model of Relu(x) as "y", with the other outputs given by (node, output shape)."""
+    helper = onnx.helper
+    nodes = [helper.make_node("Relu", ["x"], ["y"])] + [node for node, _ in outputs]
+    graph = helper.make_graph(
+        nodes,
+        "model",
+        [helper.make_tensor_value_info("x", onnx.TensorProto.FLOAT, input_shape)],
+        [helper.make_tensor_value_info("y", onnx.TensorProto.FLOAT, input_shape)]
+        + [helper.make_tensor_value_info(node.output[0], onnx.TensorProto.INT64, shape) for node, shape in outputs],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+
+def _build_model(model_path, monkeypatch):
+    model = Model(backend="onnx", model_path=model_path, device="CPU", device_id=0)
+
+    def _copy_outputs_to_cpu():
+        raise AssertionError("the outputs are copied")
+
+    monkeypatch.setattr(model.model.io_binding, "copy_outputs_to_cpu", _copy_outputs_to_cpu)
+    return model
+
+
+def test_onnx_model_static_shape(tmp_path, monkeypatch):
+    model_path = _save_model(tmp_path / "static.onnx", [1, 3, 4, 4], [])
+    model = _build_model(model_path, monkeypatch)
+    assert model.get_shape_details() == (ShapeType.STATIC_SHAPE, [[1, 3, 4, 4]])
+    assert model.input_dtype == [np.float32]
+
+    x = np.random.default_rng(0).standard_normal((1, 3, 4, 4)).astype(np.float32)
+    (y,) = model.infer([x])
+    np.testing.assert_array_equal(y, np.maximum(x, 0))
+    # the output is written into a numpy array of its own, which is not overwritten by the next run
+    assert y.flags.owndata
+    model.infer([-x])
+    np.testing.assert_array_equal(y, np.maximum(x, 0))
+
+
+def test_onnx_model_dynamic_shape(tmp_path, monkeypatch):
+    nonzero = onnx.helper.make_node("NonZero", ["x"], ["index"])
+    model_path = _save_model(tmp_path / "dynamic.onnx", ["N", 3, "H", "W"], [(nonzero, [4, None])])
+    model = _build_model(model_path, monkeypatch)
+    # the symbolic dims are dynamic
+    assert model.input_shape == [[-1, 3, -1, -1]]
+    assert model.get_shape_details() == (ShapeType.DYNAMIC_SHAPE, [[-1, 3, -1, -1]])
+
+    for shape in [(2, 3, 5, 7), (1, 3, 8, 4)]:
+        x = np.random.default_rng(0).standard_normal(shape).astype(np.float32)
+        y, index = model.infer([x])
+        # the shape of "y" is resolved from the symbols of the input shape,
+        # the shape of "index" depends on the data, it is allocated by onnxruntime and returned as a view of it
+        np.testing.assert_array_equal(y, np.maximum(x, 0))
+        assert y.flags.owndata
+        np.testing.assert_array_equal(index, np.stack(np.nonzero(x)))
+        assert not index.flags.owndata
+        assert index.dtype == np.int64
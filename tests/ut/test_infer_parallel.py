@@ -0,0 +1,262 @@
+import argparse
+import json
+import queue
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+py_infer_path = "deploy/py_infer"
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["src.parallel", "src.parallel.inproc_pipeline", "src.parallel.parallel_pipeline", "src.parallel.framework"],
+)
+def test_import_parallel(module):
+    # in a new interpreter, since a circular import only fails for the first of the modules to be imported
+    result = subprocess.run(
+        [sys.executable, "-c", f"import {module}"], cwd=py_infer_path, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_infer_help():
+    result = subprocess.run([sys.executable, "infer.py", "--help"], cwd=py_infer_path, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def _build_collect_node(task_type, res_save_dir):
+    sys.path.insert(0, py_infer_path)
+    from src.parallel.module.common.collect_node import CollectNode
+    from src.utils import log
+
+    log.init_logger()
+    args = argparse.Namespace(task_type=task_type, res_save_dir=str(res_save_dir), result_contain_score=False)
+    node = CollectNode(args, msg_queue=None)
+    node.sent = []
+    node.send_to_next_module = node.sent.append
+    return node
+
+
+def _rec_result(x, text):
+    return [[x, 0], [x + 1, 0], [x + 1, 1], [x, 1], text, 0.9]
+
+
+def test_collect_streamed_image_split_across_batches(tmp_path):
+    sys.path.insert(0, py_infer_path)
+    from src.infer import TaskType
+    from src.parallel.datatype import ProcessData
+
+    node = _build_collect_node(TaskType.DET_REC, tmp_path)
+    # the 3 sub images of an image of a streaming source, i.e. task_images_num=0, recognized in 2 batches
+    pieces = [
+        ([_rec_result(2, "c"), _rec_result(0, "a")], [2, 0]),
+        ([_rec_result(1, "b")], [1]),
+    ]
+    for infer_result, sub_image_index in pieces:
+        node.process(
+            ProcessData(
+                image_path=["a.jpg"],
+                infer_result=infer_result,
+                sub_image_index=sub_image_index,
+                sub_image_total=3,
+                sub_image_size=len(infer_result),
+                task_images_num=0,
+            )
+        )
+        assert not node.sent
+    node.process(ProcessData(skip=True, task_end=True, task_images_num=1))
+
+    assert len(node.sent) == 1
+    result = node.sent[0][0]["a.jpg"]
+    assert [x["transcription"] for x in result] == ["a", "b", "c"]
+    node.close_sinks()
+
+
+def test_collect_streamed_regions(tmp_path):
+    sys.path.insert(0, py_infer_path)
+    from src.infer import TaskType
+    from src.parallel.datatype import ProcessData
+
+    node = _build_collect_node(TaskType.LAYOUT_DET_REC, tmp_path)
+    regions = [
+        {"index": 1, "total": 2, "type": "text", "bbox": [0, 50, 100, 100], "score": 0.9, "offset": [0, 50]},
+        {"index": 0, "total": 2, "type": "title", "bbox": [0, 0, 100, 40], "score": 0.9, "offset": [0, 0]},
+    ]
+    # the second region of the page is recognized first, its 2 sub images in 2 batches
+    pieces = [
+        (regions[0], [_rec_result(0, "body 1")], 2),
+        (regions[1], [_rec_result(0, "title")], 1),
+        (regions[0], [_rec_result(50, "body 2")], 2),
+    ]
+    for region, infer_result, sub_image_total in pieces:
+        node.process(
+            ProcessData(
+                image_path=["page.jpg"],
+                infer_result=infer_result,
+                sub_image_total=sub_image_total,
+                sub_image_size=len(infer_result),
+                layout_region=region,
+                task_images_num=0,
+            )
+        )
+        assert not node.sent
+    node.process(ProcessData(skip=True, task_end=True, task_images_num=1))
+
+    assert len(node.sent) == 1
+    result = node.sent[0][0]["page.jpg"]
+    assert [region["type"] for region in result] == ["title", "text"]
+    assert [x["transcription"] for x in result[1]["texts"]] == ["body 1", "body 2"]
+    node.close_sinks()
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_task_finished_with_decoded_images(tmp_path, streaming):
+    import cv2
+
+    sys.path.insert(0, py_infer_path)
+    from src.data_process.utils.image_source import VideoSegment
+    from src.infer import TaskType
+    from src.parallel.datatype import ProcessData
+    from src.parallel.module.common.decode_node import DecodeNode
+
+    video_path = str(tmp_path / "video.avi")
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (32, 24))
+    for i in range(5):
+        writer.write(np.full((24, 32, 3), i * 40, dtype=np.uint8))
+    writer.release()
+    (tmp_path / "broken.jpg").write_bytes(b"not an image")
+
+    collect_node = _build_collect_node(TaskType.DET, tmp_path)
+    decode_node = DecodeNode(argparse.Namespace(), msg_queue=None)
+    decoded = []
+    decode_node.send_to_next_module = decoded.append
+    # the frame count of the video is over estimated, and the image can not be decoded
+    source_items = [VideoSegment(path=video_path, start=0, stop=8), str(tmp_path / "broken.jpg")]
+    task_images_num = 0 if streaming else 9
+    decode_node.process(ProcessData(source_items=source_items, taskid=1, task_images_num=task_images_num))
+    assert [len(data.frame) for data in decoded] == [2, 2, 1, 0]
+    assert decoded[-1].skip and decoded[-1].images_undecoded == 4
+    assert decode_node.avail_image_total == 5
+
+    for data in decoded[:-1]:
+        for image_path in data.image_path:
+            collect_node.process(ProcessData(image_path=[image_path], taskid=1, task_images_num=task_images_num))
+    if streaming:
+        collect_node.process(ProcessData(skip=True, task_end=True, taskid=1, task_images_num=9))
+    assert not collect_node.sent
+
+    # the task is finished with the images actually decoded
+    collect_node.process(decoded[-1])
+    assert len(collect_node.sent) == 1
+    assert len(collect_node.sent[0][1]) == 5
+    assert 1 not in collect_node.task_images_undecoded
+    collect_node.close_sinks()
+
+
+@pytest.mark.parametrize("sink_type", ["txt", "jsonl"])
+def test_result_sink(tmp_path, sink_type):
+    sys.path.insert(0, py_infer_path)
+    from src.parallel.framework.result_sink import RESULT_SINKS
+    from src.utils import log
+
+    log.init_logger()
+    sink = RESULT_SINKS[sink_type](str(tmp_path / "results"), flush_size=2)
+    results = [(f"dir/{i}.jpg", [{"transcription": f"text {i}"}]) for i in range(3)]
+    for image_name, result in results:
+        sink.write(image_name, result)
+
+    # the results are written in batches of flush_size
+    save_path = tmp_path / f"results.{sink_type}"
+    assert sink.save_path == str(save_path)
+    assert len(save_path.read_text(encoding="utf-8").splitlines()) == 2
+    sink.close()
+    assert sink.result_total == 3
+
+    lines = save_path.read_text(encoding="utf-8").splitlines()
+    if sink_type == "txt":
+        assert [line.split("\t") for line in lines] == [[f"{i}.jpg", json.dumps(r)] for i, (_, r) in enumerate(results)]
+    else:
+        assert [json.loads(line) for line in lines] == [{"image": name, "result": r} for name, r in results]
+
+
+def test_parquet_result_sink(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    sys.path.insert(0, py_infer_path)
+    from src.parallel.framework.result_sink import ParquetResultSink
+    from src.utils import log
+
+    log.init_logger()
+    sink = ParquetResultSink(str(tmp_path / "results"), flush_size=2)
+    for i in range(3):
+        sink.write(f"{i}.jpg", {"index": i})
+    sink.close()
+
+    parquet_file = pq.ParquetFile(str(tmp_path / "results.parquet"))
+    assert parquet_file.metadata.num_row_groups == 2
+    table = parquet_file.read().to_pydict()
+    assert table["image"] == ["0.jpg", "1.jpg", "2.jpg"]
+    assert [json.loads(x) for x in table["result"]] == [{"index": i} for i in range(3)]
+
+
+def test_vis_worker_pool():
+    sys.path.insert(0, py_infer_path)
+    from src.parallel.framework.result_sink import VisWorkerPool
+    from src.utils import log
+
+    log.init_logger()
+    done = []
+
+    def _job(i):
+        if i == 1:
+            raise ValueError("bad image")
+        done.append(i)
+
+    pool = VisWorkerPool(workers=2, max_pending=1)
+    for i in range(4):
+        pool.submit(_job, i)
+    pool.close()
+    # a failed job does not stop the others
+    assert sorted(done) == [0, 2, 3]
+
+
+@pytest.mark.parametrize("task_type_name, batch_num", [("DET", 1), ("REC", 3)])
+def test_pipeline_array_results_in_order(tmp_path, task_type_name, batch_num):
+    sys.path.insert(0, py_infer_path)
+    from src.infer import TaskType
+    from src.parallel.module.common.handout_node import HandoutNode
+    from src.parallel.parallel_pipeline import ParallelPipeline
+
+    task_type = TaskType[task_type_name]
+    collect_node = _build_collect_node(task_type, tmp_path)
+    args = argparse.Namespace(task_type=task_type, show_log=True, input_array_save_dir=None)
+    handout_node = HandoutNode(args, msg_queue=None)
+    handout_node.sent = []
+    handout_node.send_to_next_module = handout_node.sent.append
+
+    # the models are left out: the pipeline sends the arrays, and the result of an image is its value
+    pipeline = ParallelPipeline.__new__(ParallelPipeline)
+    pipeline.args = args
+    pipeline.input_queue = queue.Queue()
+    pipeline.infer_params = {"rec_batch_num": [batch_num]}
+    images = [np.full((4, 4, 3), i, dtype=np.uint8) for i in range(7)]
+    pipeline.send_array(images, task_id=5)
+    while not pipeline.input_queue.empty():
+        handout_node.process(pipeline.input_queue.get())
+
+    for data in handout_node.sent:
+        assert len(data.image_path) == (1 if task_type == TaskType.DET else len(data.frame))
+        # the boxes of an image in det, the text of each image in rec
+        data.infer_result = [int(frame[0, 0, 0]) for frame in data.frame]
+        data.frame = None
+        collect_node.process(data)
+
+    assert len(collect_node.sent) == 1
+    result = collect_node.sent[0][5]
+    # the results are keyed by the index of the image in the request, as PipelineService reads them
+    assert [result[key] for key in sorted(result, key=int)] == [
+        [i] if task_type == TaskType.DET else i for i in range(len(images))
+    ]
+    collect_node.close_sinks()
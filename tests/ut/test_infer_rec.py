@@ -0,0 +1,228 @@
+import argparse
+import sys
+
+import numpy as np
+import pytest
+
+py_infer_path = "deploy/py_infer"
+sys.path.insert(0, py_infer_path)
+
+from src.data_process.utils.gear_planner import GearPlanner
+from src.infer import TaskType, TextRecognizer
+from src.parallel.datatype import ProcessData, StopData
+from src.parallel.module.common.collect_node import CollectNode
+from src.parallel.module.recognition.rec_post_node import RecPostNode
+from src.parallel.module.recognition.rec_pre_node import RecPreNode
+from src.utils import log
+
+# images of height 10 and mixed widths, whose text is their width
+WIDTHS = [30, 200, 50, 120, 20, 80, 60]
+
+
+class _Model:
+    """A rec model of a batch size, whose prediction of an image is its width, recording the widths of the batches."""
+
+    def __init__(self, batch_size, batches):
+        self.batch_size = batch_size
+        self.batches = batches
+
+    def infer(self, inputs):
+        assert inputs[0].shape[0] == self.batch_size
+        self.batches.append(inputs[0][:, 0].tolist())
+        return [inputs[0]]
+
+
+def _build_recognizer(bs_list=(1, 4)):
+    recognizer = TextRecognizer(argparse.Namespace())
+    recognizer._bs_list = bs_list
+    recognizer.requires_gear_bs = True
+    recognizer.gear_planner = GearPlanner(bs_list)
+    recognizer.preprocess_ops = lambda images, max_wh_ratio: {
+        "net_inputs": [np.array([[image.shape[1]] for image in images], dtype=np.float32)]
+    }
+    recognizer.postprocess_ops = lambda pred: {
+        "texts": [str(int(x)) for x in pred[:, 0]],
+        "confs": [0.9] * len(pred),
+    }
+    recognizer.batches = []
+    recognizer.model = {bs: _Model(bs, recognizer.batches) for bs in bs_list}
+    return recognizer
+
+
+def _images(widths):
+    return [np.zeros((10, w, 3), dtype=np.uint8) for w in widths]
+
+
+def _box(x):
+    return [[x, 0], [x + 1, 0], [x + 1, 1], [x, 1]]
+
+
+def _build_node(node_cls, task_type, **kwargs):
+    log.init_logger()
+    args = argparse.Namespace(task_type=task_type, result_contain_score=False, **kwargs)
+    node = node_cls(args, msg_queue=None)
+    node.sent = []
+    node.send_to_next_module = node.sent.append
+    return node
+
+
+def test_text_recognizer_order():
+    recognizer = _build_recognizer()
+    order = recognizer.get_sorted_indices(_images(WIDTHS))
+    assert [WIDTHS[i] for i in order] == sorted(WIDTHS)
+
+    results = recognizer(_images(WIDTHS))
+    # the images are batched by aspect ratio, the results are in the order of the images
+    assert recognizer.batches == [[20, 30, 50, 60], [80, 120, 200, 0]]
+    assert results["texts"] == [str(w) for w in WIDTHS]
+    assert results["confs"] == [0.9] * len(WIDTHS)
+
+
+def test_det_rec_nodes_keep_detection_order(tmp_path):
+    recognizer = _build_recognizer()
+    rec_pre_node = _build_node(RecPreNode, TaskType.DET_REC)
+    rec_post_node = _build_node(RecPostNode, TaskType.DET_REC)
+    collect_node = _build_node(CollectNode, TaskType.DET_REC, res_save_dir=str(tmp_path))
+    rec_pre_node.text_recognizer = rec_post_node.text_recognizer = recognizer
+
+    # the boxes of an image in detection order, as sent by DetPostNode
+    boxes = [_box(i) for i in range(len(WIDTHS))]
+    rec_pre_node.process(
+        ProcessData(
+            image_path=["a.jpg"],
+            sub_image_list=_images(WIDTHS),
+            infer_result=boxes,
+            sub_image_index=list(range(len(WIDTHS))),
+            sub_image_total=len(WIDTHS),
+            task_images_num=1,
+        )
+    )
+    # the sub images are recognized in batches sorted by aspect ratio
+    assert [item.sub_image_size for item in rec_pre_node.sent] == [4, 3]
+    assert [WIDTHS[i] for item in rec_pre_node.sent for i in item.sub_image_index] == sorted(WIDTHS)
+
+    for item in rec_pre_node.sent:
+        item.data = {"pred": recognizer.model_infer(item.data)}
+        rec_post_node.process(item)
+    for item in rec_post_node.sent:
+        collect_node.process(item)
+
+    # the results of the image follow the detection order
+    assert len(collect_node.sent) == 1
+    results = collect_node.sent[0][0]["a.jpg"]
+    assert [result["transcription"] for result in results] == [str(w) for w in WIDTHS]
+    assert [result["points"] for result in results] == [_box(i) for i in range(len(WIDTHS))]
+    collect_node.close_sinks()
+
+
+@pytest.mark.parametrize("widths", [[], [40], [40, 40, 40]])
+def test_text_recognizer_order_few_images(widths):
+    recognizer = _build_recognizer()
+    assert recognizer(_images(widths))["texts"] == [str(w) for w in widths]
+
+
+def _build_aggregating_node(bs_list, bs_latency=None):
+    node = _build_node(RecPreNode, TaskType.DET_REC, rec_batch_max_wait=10.0)
+    node.text_recognizer = _build_recognizer(bs_list)
+    if bs_latency:
+        node.text_recognizer.gear_planner = GearPlanner(bs_list, latency_table={"bs": bs_latency})
+    node.batch_max_size = max(bs_list)
+    return node
+
+
+def _det_data(image_path, widths, taskid=0):
+    return ProcessData(
+        image_path=[image_path],
+        sub_image_list=_images(widths),
+        infer_result=[_box(i) for i in range(len(widths))],
+        sub_image_index=list(range(len(widths))),
+        sub_image_total=len(widths),
+        sub_image_size=len(widths),
+        taskid=taskid,
+    )
+
+
+def _batch_items(data):
+    return [(item.image_path[0], item.sub_image_index) for item in data.batch_items]
+
+
+def test_rec_pre_node_aggregate():
+    node = _build_aggregating_node((1, 4))
+    node.process(_det_data("a.jpg", [30, 10, 20]))
+    assert node.sent == []
+    assert node.pending_size == 3
+
+    # the images without text and the ends of tasks pass the pending sub images
+    empty = ProcessData(image_path=["empty.jpg"], skip=True)
+    task_end = ProcessData(skip=True, task_end=True, task_images_num=3)
+    node.process(empty)
+    node.process(task_end)
+    assert node.sent == [empty, task_end]
+    assert node.pending_size == 3
+
+    # the batch is flushed once full, the rest of the image is pending
+    node.process(_det_data("b.jpg", [40, 50], taskid=1))
+    assert len(node.sent) == 3
+    batch = node.sent[2]
+    assert batch.sub_image_size == 4 and batch.image_path == ["a.jpg", "b.jpg"]
+    # the sub images of each image are sorted by aspect ratio, with their index in the detection result
+    assert _batch_items(batch) == [("a.jpg", [1, 2, 0]), ("b.jpg", [0])]
+    assert [item.taskid for item in batch.batch_items] == [0, 1]
+    assert batch.batch_items[1].infer_result == [_box(0)]
+    assert batch.batch_fill[node.module_name] == (4, 4)
+    assert node.pending_size == 1 and node.pending_items[0].sub_image_index == [1]
+
+    # the stop sign flushes the pending sub images before it
+    stop = StopData(image_total=3)
+    node.process(stop)
+    assert _batch_items(node.sent[3]) == [("b.jpg", [1])]
+    assert node.sent[4] is stop
+    assert node.pending_items == [] and node.pending_size == 0
+
+
+def test_rec_pre_node_flush_across_gears():
+    # 3 sub images cost less in a batch of 2 and a batch of 1 than in a padded batch of 4
+    node = _build_aggregating_node((1, 2, 4), bs_latency={1: 1.0, 2: 1.5, 4: 4.0})
+    node.process(_det_data("a.jpg", [10, 20]))
+    node.process(_det_data("b.jpg", [30]))
+    assert node.sent == []
+    node.flush_pending()
+
+    # the items are regrouped by the gear batches, and an item crossing two batches is split in two
+    assert sorted(data.sub_image_size for data in node.sent) == [1, 2]
+    items = [item for data in node.sent for item in data.batch_items]
+    assert sum(item.sub_image_size for item in items) == 3
+    assert sorted((item.image_path[0], i) for item in items for i in item.sub_image_index) == [
+        ("a.jpg", 0),
+        ("a.jpg", 1),
+        ("b.jpg", 0),
+    ]
+    for data in node.sent:
+        assert data.data["net_inputs"][0].shape[0] == data.sub_image_size
+        assert len(data.image_path) == len(data.batch_items)
+        for item in data.batch_items:
+            assert item.sub_image_list == [] and len(item.infer_result) == item.sub_image_size
+
+    node = _build_aggregating_node((1, 2, 4), bs_latency={1: 1.0, 2: 1.5, 4: 4.0})
+    node.process(_det_data("a.jpg", [10, 20, 30]))
+    node.flush_pending()
+    assert [_batch_items(data) for data in node.sent] in (
+        [[("a.jpg", [0, 1])], [("a.jpg", [2])]],
+        [[("a.jpg", [0])], [("a.jpg", [1, 2])]],
+    )
+
+
+def test_rec_pre_node_flush_on_deadline():
+    node = _build_aggregating_node((1, 4))
+    node.process(_det_data("a.jpg", [10]))
+    node.idle_process()
+    assert node.sent == []
+
+    # the pending sub images are flushed once the deadline passed, on idle or by the next skipped data
+    node.pending_deadline = 0.0
+    empty = ProcessData(image_path=["empty.jpg"], skip=True)
+    node.process(empty)
+    assert node.sent[0] is empty
+    assert _batch_items(node.sent[1]) == [("a.jpg", [0])]
+    assert node.sent[1].sub_image_size == 1
+    assert node.pending_items == []
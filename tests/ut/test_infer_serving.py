@@ -0,0 +1,170 @@
+import asyncio
+import base64
+import json
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+py_infer_path = "deploy/py_infer"
+sys.path.insert(0, py_infer_path)
+
+from src.serving import OCRHttpServer, PipelineService, ServingMetrics, StubPipeline
+from src.utils import log
+
+
+def _encode_image(h, w):
+    return cv2.imencode(".png", np.full((h, w, 3), 128, dtype=np.uint8))[1].tobytes()
+
+
+async def _request(reader, writer, method, path, body=b"", headers=None):
+    headers = {"Content-Length": str(len(body)), **(headers or {})}
+    lines = [f"{method} {path} HTTP/1.1"] + [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+    return await _read_response(reader)
+
+
+async def _read_response(reader):
+    code = int((await reader.readline()).split()[1])
+    response_headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+    content = await reader.readexactly(int(response_headers["content-length"]))
+    return code, response_headers, content
+
+
+def _run_with_server(client, **server_kwargs):
+    """Run the coroutine function client(port, services) against a server of a ready and a busy stub pipeline."""
+    log.init_logger()
+
+    async def _main():
+        metrics = ServingMetrics()
+        services = {
+            "stub": PipelineService("stub", StubPipeline(latency=0.01), metrics),
+            "busy": PipelineService("busy", StubPipeline(latency=0.01), metrics, max_queue_depth=0),
+        }
+        server = OCRHttpServer(services, metrics, **server_kwargs)
+        await server.start("127.0.0.1", 0)
+        try:
+            await client(server.server.sockets[0].getsockname()[1], services)
+        finally:
+            server.stop()
+
+    asyncio.run(_main())
+
+
+def test_http_server_routes():
+    async def _client(port, services):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        assert (await _request(reader, writer, "GET", "/health"))[::2] == (200, b"ok")
+        code, _, content = await _request(reader, writer, "GET", "/ready")
+        assert code == 200 and json.loads(content) == {"stub": True, "busy": True}
+        code, _, content = await _request(reader, writer, "GET", "/v1/pipelines?verbose=1")
+        assert code == 200 and json.loads(content)["stub"] == {"ready": True, "queue_depth": 0}
+
+        # an encoded image as the body
+        code, _, content = await _request(reader, writer, "POST", "/v1/pipelines/stub/infer", _encode_image(20, 30))
+        assert code == 200
+        assert json.loads(content)["results"] == [
+            [{"transcription": "stub", "points": [[0, 0], [29, 0], [29, 19], [0, 19]]}]
+        ]
+
+        # the images of a json body, the results are in the order of the images
+        body = json.dumps(
+            {"images": [base64.b64encode(_encode_image(h, w)).decode() for h, w in [(10, 40), (50, 20), (30, 30)]]}
+        ).encode()
+        code, _, content = await _request(
+            reader, writer, "POST", "/v1/pipelines/stub/infer", body, {"Content-Type": "application/json"}
+        )
+        assert code == 200
+        assert [result[0]["points"][2] for result in json.loads(content)["results"]] == [[39, 9], [19, 49], [29, 29]]
+
+        code, _, content = await _request(reader, writer, "GET", "/metrics")
+        assert code == 200
+        assert 'ocr_requests_total{pipeline="stub",code="200"} 2.0' in content.decode()
+        writer.close()
+
+    _run_with_server(_client)
+
+
+@pytest.mark.parametrize(
+    "method, path, body, headers, expected",
+    [
+        ("GET", "/unknown", b"", {}, 404),
+        ("POST", "/v1/pipelines/unknown/infer", b"", {}, 404),
+        ("GET", "/v1/pipelines/stub/infer", b"", {}, 405),
+        ("POST", "/v1/pipelines/stub/infer", b"not an image", {}, 400),
+        ("POST", "/v1/pipelines/stub/infer", b'{"texts": []}', {"Content-Type": "application/json"}, 400),
+        ("POST", "/v1/pipelines/stub/infer", b'{"images": []}', {"Content-Type": "application/json"}, 400),
+        ("POST", "/v1/pipelines/busy/infer", _encode_image(8, 8), {}, 429),
+    ],
+)
+def test_http_server_errors(method, path, body, headers, expected):
+    async def _client(port, services):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        code, response_headers, content = await _request(reader, writer, method, path, body, headers)
+        assert code == expected
+        assert "error" in json.loads(content)
+        # the connection is kept alive after the error of a request
+        assert response_headers["connection"] == "keep-alive"
+        assert (await _request(reader, writer, "GET", "/health"))[0] == 200
+        writer.close()
+
+    _run_with_server(_client)
+
+
+def test_http_server_not_ready():
+    async def _client(port, services):
+        services["stub"].ready = False
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        assert (await _request(reader, writer, "GET", "/ready"))[0] == 503
+        assert (await _request(reader, writer, "POST", "/v1/pipelines/stub/infer", _encode_image(8, 8)))[0] == 503
+        writer.close()
+
+    _run_with_server(_client)
+
+
+@pytest.mark.parametrize(
+    "request_bytes, expected",
+    [
+        (b"GET\r\n\r\n", 400),
+        (b"POST /v1/pipelines/stub/infer HTTP/1.1\r\nContent-Length: abc\r\n\r\n", 400),
+        (b"POST /v1/pipelines/stub/infer HTTP/1.1\r\nContent-Length: -1\r\n\r\n", 400),
+        (b"POST /v1/pipelines/stub/infer HTTP/1.1\r\nContent-Length: 1025\r\n\r\n", 413),
+    ],
+)
+def test_http_server_invalid_request(request_bytes, expected):
+    async def _client(port, services):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request_bytes)
+        await writer.drain()
+        code, response_headers, content = await _read_response(reader)
+        assert code == expected
+        assert "error" in json.loads(content)
+        # the connection is closed as the rest of the request can not be read
+        assert response_headers["connection"] == "close"
+        assert await reader.read() == b""
+        writer.close()
+
+    _run_with_server(_client, max_body_size=1024)
+
+
+def test_http_server_keep_alive():
+    async def _client(port, services):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for _ in range(3):
+            code, response_headers, _ = await _request(reader, writer, "GET", "/health")
+            assert code == 200 and response_headers["connection"] == "keep-alive"
+
+        code, response_headers, _ = await _request(reader, writer, "GET", "/health", headers={"Connection": "close"})
+        assert code == 200 and response_headers["connection"] == "close"
+        assert await reader.read() == b""
+        writer.close()
+
+    _run_with_server(_client)
@@ -0,0 +1,188 @@
+import sys
+
+sys.path.append(".")
+
+import numpy as np
+import pytest
+
+from mindocr.data.transforms.rec_transforms import RecResizeNormForInfer
+from mindocr.postprocess.kie_ser_postprocess import VQASerTokenLayoutLMPostProcess
+from mindocr.utils.crop_utils import crop_resize_norm_text_regions, crop_text_regions
+from tools.infer.text.utils.kie_chunk import TOKEN_KEYS, KieChunkScheduler
+from tools.infer.text.utils.shape_bucket import ShapeBucketer, default_batch_buckets, parse_buckets
+from tools.infer.text.utils.utils import crop_text_region
+
+
+def _build_docs(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    docs = []
+    for length in lengths:
+        doc = {key: rng.integers(0, 100, (length, 4) if key == "bbox" else (length,)) for key in TOKEN_KEYS}
+        doc["image"] = np.zeros((3, 2, 2), dtype=np.float32)
+        docs.append(doc)
+    return docs
+
+
+def _smooth_image(h, w):
+    y, x = np.mgrid[0:h, 0:w].astype(np.float32)
+    channels = [127 + 100 * np.sin(x / 17 + y / 23), 127 + 100 * np.cos(x / 29 - y / 13), 0.6 * x + 0.3 * y]
+    return np.clip(np.stack(channels, axis=-1), 0, 255).astype(np.uint8)
+
+
+def _rotated_quad(cx, cy, w, h, angle):
+    """Corners of a w x h box centered at (cx, cy) and rotated by angle degrees, clockwise from the top-left."""
+    rad = np.deg2rad(angle)
+    rotation = np.array([[np.cos(rad), -np.sin(rad)], [np.sin(rad), np.cos(rad)]])
+    corners = np.array([[-w / 2, -h / 2], [w / 2, -h / 2], [w / 2, h / 2], [-w / 2, h / 2]])
+    return (corners @ rotation.T + [cx, cy]).astype(np.float32)
+
+
+def test_kie_chunk_windows():
+    scheduler = KieChunkScheduler(max_seq_len=8)
+    assert scheduler.windows(0) == []
+    assert scheduler.windows(5) == [(0, 5)]
+    assert scheduler.windows(17) == [(0, 8), (8, 16), (16, 17)]
+
+    # the last window is aligned to the end of the sequence
+    scheduler = KieChunkScheduler(max_seq_len=8, overlap=3)
+    assert scheduler.windows(8) == [(0, 8)]
+    assert scheduler.windows(9) == [(0, 8), (1, 9)]
+    assert scheduler.windows(17) == [(0, 8), (5, 13), (9, 17)]
+
+    with pytest.raises(ValueError):
+        KieChunkScheduler(max_seq_len=8, overlap=8)
+
+
+@pytest.mark.parametrize("overlap", [0, 3])
+def test_kie_chunk_pack_and_merge(overlap):
+    scheduler = KieChunkScheduler(
+        max_seq_len=8, batch_size=3, overlap=overlap, length_buckets=[2, 4], batch_buckets=[1, 2, 4]
+    )
+    docs = _build_docs([1, 3, 0, 8, 17, 30])
+    batches = scheduler.pack(docs)
+    for batch in batches:
+        assert batch["input_ids"].shape[0] in scheduler.batch_buckets
+        assert batch["input_ids"].shape[1] in scheduler.length_buckets
+        assert batch["num_valid"] == len(batch["windows"]) <= scheduler.batch_size
+        # the padding of the input ids and the attention mask
+        for i, (_, start, end) in enumerate(batch["windows"]):
+            assert np.all(batch["input_ids"][i, end - start :] == 1)
+            assert np.all(batch["attention_mask"][i, end - start :] == 0)
+
+    # logits as a function of the token ids, which the merged logits of each document must be
+    table = np.random.default_rng(1).standard_normal((100, 5)).astype(np.float32)
+    logits = [table[batch["input_ids"]] for batch in batches]
+    doc_logits = scheduler.merge(docs, batches, logits)
+    for doc, doc_logit in zip(docs, doc_logits):
+        assert doc_logit.shape == (len(doc["input_ids"]), 5)
+        assert np.allclose(doc_logit, table[doc["input_ids"]], atol=1e-6)
+
+
+def test_kie_chunk_merge_overlap_average():
+    scheduler = KieChunkScheduler(max_seq_len=4, batch_size=4, overlap=2)
+    docs = _build_docs([6])
+    batches = scheduler.pack(docs)
+    assert batches[0]["windows"] == [(0, 0, 4), (0, 2, 6)]
+    logits = [np.stack([np.zeros((4, 1)), np.ones((4, 1))]).astype(np.float32)]
+    doc_logits = scheduler.merge(docs, batches, logits)
+    assert doc_logits[0][:, 0].tolist() == [0, 0, 0.5, 0.5, 1, 1]
+
+
+def test_kie_chunk_documents_without_tokens():
+    scheduler = KieChunkScheduler(max_seq_len=8)
+    docs = _build_docs([0, 0])
+    batches = scheduler.pack(docs)
+    assert batches == []
+    with pytest.raises(ValueError):
+        scheduler.merge(docs, batches, [])
+
+    postprocess = VQASerTokenLayoutLMPostProcess("mindocr/utils/dict/class_list_xfun.txt")
+    doc_logits = scheduler.merge(docs, batches, [], num_classes=len(postprocess.id2label_map))
+    ocr_infos = [[], [{"transcription": "", "points": [0, 0, 1, 0, 1, 1, 0, 1]}]]
+    results = postprocess(doc_logits, segment_offset_ids=[[], [0]], ocr_infos=ocr_infos)
+    assert results[0] == [] and results[1][0]["pred"] == "O"
+
+
+def test_parse_buckets():
+    assert parse_buckets(None) == []
+    assert parse_buckets("8, 1,4,,4") == [1, 4, 8]
+    assert default_batch_buckets(1) == [1]
+    assert default_batch_buckets(12) == [1, 2, 4, 8, 12]
+
+
+@pytest.mark.parametrize(
+    "shape, padded_shape",
+    [
+        ((3, 3, 48, 300), (4, 3, 48, 320)),
+        ((4, 3, 48, 320), (4, 3, 48, 320)),
+        ((5, 3, 48, 321), (8, 3, 48, 640)),
+        # larger than the largest buckets, fed as is
+        ((9, 3, 48, 700), (9, 3, 48, 700)),
+    ],
+)
+def test_shape_bucketer_pad(shape, padded_shape):
+    bucketer = ShapeBucketer(batch_buckets=[1, 4, 8], width_buckets=[320, 640], pad_value=[-1.0, 0.0, 1.0])
+    img_batch = np.random.default_rng(0).random(shape, dtype=np.float32)
+    padded, num_valid = bucketer.pad(img_batch)
+
+    assert padded.shape == padded_shape
+    assert num_valid == shape[0]
+    np.testing.assert_array_equal(padded[: shape[0], ..., : shape[3]], img_batch)
+    # the padded width is filled with the per-channel pad value, the padded samples with zeros
+    for channel, value in enumerate([-1.0, 0.0, 1.0]):
+        assert np.all(padded[: shape[0], channel, :, shape[3] :] == value)
+    assert np.all(padded[shape[0] :] == 0)
+
+    pred = np.arange(padded.shape[0])
+    np.testing.assert_array_equal(ShapeBucketer.unpad(pred, num_valid), np.arange(shape[0]))
+    assert [p.tolist() for p in ShapeBucketer.unpad((pred, pred), num_valid)] == [list(range(shape[0]))] * 2
+
+
+def test_shape_bucketer_compile_count():
+    bucketer = ShapeBucketer(batch_buckets=[1, 4, 8], width_buckets=[320, 640])
+    warmup_shapes = bucketer.warmup_shapes(num_channels=3, height=48, default_width=320)
+    assert len(warmup_shapes) == 6
+    for shape in warmup_shapes:
+        bucketer.record(shape)
+    assert bucketer.compile_count == 6
+
+    # all the shapes padded to a bucket are compiled at warmup
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        batch_size, width = rng.integers(1, 9), rng.integers(16, 641)
+        bucketer.pad(np.zeros((batch_size, 3, 48, width), dtype=np.float32))
+    assert bucketer.compile_count == 6
+
+    assert ShapeBucketer().warmup_shapes(3, 48, 320) == [(1, 3, 48, 320)]
+
+
+@pytest.mark.parametrize("box_type", ["quad", "poly"])
+def test_crop_resize_norm_text_regions(box_type):
+    image = _smooth_image(200, 300)
+    quads = [
+        _rotated_quad(80, 50, 120, 24, 10),
+        _rotated_quad(200, 120, 90, 30, -25),
+        # a vertical text, rotated counterclockwise
+        _rotated_quad(250, 60, 20, 70, 5),
+        # an axis-aligned box, cropped by slicing
+        _rotated_quad(60, 150, 60, 20, 0),
+    ]
+    references = [crop_text_region(image, quad, box_type=box_type) for quad in quads]
+    crops = crop_text_regions(image, quads, box_type=box_type)
+    assert [crop.shape for crop in crops] == [reference.shape for reference in references]
+    assert references[2].shape[0] < references[2].shape[1]
+
+    # the same as the crops resized and normalized one by one, up to the interpolation of warping them once
+    op = RecResizeNormForInfer(target_height=32, target_width=320, keep_ratio=True, padding=True)
+    batch, resized_widths = crop_resize_norm_text_regions(
+        image, quads, target_height=32, target_width=320, padding=True, box_type=box_type
+    )
+    assert batch.shape == (len(quads), 3, 32, 320)
+    for i, reference in enumerate(references):
+        data = op({"image": reference})
+        assert resized_widths[i] == round(data["shape_list"][3] * reference.shape[1])
+        diff = np.abs(batch[i] - data["image"].transpose(2, 0, 1))
+        assert diff.mean() < 0.01 and diff.max() < 0.05
+
+    batch, resized_widths = crop_resize_norm_text_regions(image, [], target_height=32, target_width=320)
+    assert batch.shape == (0, 3, 32, 320) and len(resized_widths) == 0
@@ -0,0 +1,65 @@
+import sys
+
+sys.path.append(".")
+
+import pytest
+
+from mindocr.models.backbones.layoutxlm.tokenizer import LayoutXLMTokenizer
+
+TEXTS = [
+    "Name:",
+    "Date of birth",
+    "Name:",
+    "John Smith",
+    "2024-01-31",
+    "ADDRESS 221B Baker St.",
+    "",
+    "Date of birth",
+    "电话：12345",
+]
+
+
+@pytest.fixture(scope="module")
+def vocab_file(tmp_path_factory):
+    spm = pytest.importorskip("sentencepiece")
+    save_dir = tmp_path_factory.mktemp("layoutxlm_tokenizer")
+    corpus = save_dir / "corpus.txt"
+    corpus.write_text("\n".join(TEXTS * 4 + ["the quick brown fox jumps over the lazy dog"] * 4), encoding="utf-8")
+    spm.SentencePieceTrainer.Train(
+        input=str(corpus), model_prefix=str(save_dir / "sp"), vocab_size=60, character_coverage=1.0
+    )
+    return str(save_dir / "sp.model")
+
+
+def test_batch_tokenize_to_ids(vocab_file):
+    tokenizer = LayoutXLMTokenizer(vocab_file=vocab_file)
+    batch_ids = tokenizer.batch_tokenize_to_ids(TEXTS)
+
+    # the same ids as encoding the texts one by one
+    for text, ids in zip(TEXTS, batch_ids):
+        assert ids == tokenizer.convert_tokens_to_ids(tokenizer.tokenize(text))
+        if text:
+            encoded = tokenizer.encode(text, pad_to_max_seq_len=False, return_attention_mask=True)
+            assert tokenizer.build_inputs_with_special_tokens(ids) == encoded["input_ids"]
+
+    # the repeated texts are tokenized once, and the cached ids are not shared with the outputs
+    assert len(tokenizer._tokenize_cache) == len(set(TEXTS))
+    batch_ids[0].append(-1)
+    assert tokenizer.batch_tokenize_to_ids(TEXTS) == tokenizer.batch_tokenize_to_ids(list(reversed(TEXTS)))[::-1]
+    assert -1 not in tokenizer.batch_tokenize_to_ids(TEXTS[:1])[0]
+
+
+def test_batch_tokenize_cache(vocab_file):
+    tokenizer = LayoutXLMTokenizer(vocab_file=vocab_file)
+    tokenizer.tokenize_cache_size = 2
+    tokenizer.batch_tokenize_to_ids(["Name:", "John Smith", "Name:", "Date of birth"])
+    # the least recently used text is evicted
+    assert list(tokenizer._tokenize_cache) == ["Name:", "Date of birth"]
+
+    # the cache is cleared once the added tokens change, as they are not split
+    ids = tokenizer.batch_tokenize_to_ids(["Name:<field>"])[0]
+    tokenizer.add_tokens(["<field>"])
+    assert not tokenizer._tokenize_cache
+    new_ids = tokenizer.batch_tokenize_to_ids(["Name:<field>"])[0]
+    assert new_ids != ids
+    assert new_ids[-1] == tokenizer.convert_tokens_to_ids("<field>")
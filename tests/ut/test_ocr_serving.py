@@ -0,0 +1,86 @@
+import sys
+from io import BytesIO
+
+sys.path.append(".")
+
+import numpy as np
+import pytest
+import yaml
+from PIL import Image
+
+from deploy.ocr_serving.server_helper.model_process_helper import ModelProcessor
+
+
+def _encode_image(h, w, value):
+    buffer = BytesIO()
+    Image.fromarray(np.full((h, w, 3), value, dtype=np.uint8)).save(buffer, format="PNG")
+    return np.frombuffer(buffer.getvalue(), dtype=np.uint8)
+
+
+class _Model:
+    """A servable model taking CHW images, whose output of an image is its sum, and only one input shape if static."""
+
+    def __init__(self, input_hw=None):
+        self.input_hw = input_hw
+        self.batch_shapes = []
+
+    def call(self, instances):
+        batch = np.stack([instance[0] for instance in instances])
+        if self.input_hw and batch.shape[-2:] != self.input_hw:
+            raise RuntimeError(f"input shape {batch.shape} mismatches the model")
+        self.batch_shapes.append(batch.shape)
+        return [(np.full((2,), image.sum()),) for image in batch]
+
+
+def _build_processor(tmp_path, data_shape_nchw):
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.dump({"batch_size": 4, "data_shape_nchw": data_shape_nchw}), encoding="utf-8")
+    processor = ModelProcessor(str(config_path))
+
+    # the images are taken as is by the preprocess, and the results are the outputs as is by the postprocess
+    def _preprocess(images):
+        return {"net_inputs": [np.transpose(images[0], (2, 0, 1))[None].astype(np.float32)]}
+
+    processor.preprocess_method = _preprocess
+    processor.postprocess_method = lambda preds: {"polys": list(preds)}
+    return processor
+
+
+@pytest.mark.parametrize("data_shape_nchw", [["1", "3", "32", "100"], ["1", "3", "-1", "-1"], None])
+def test_model_processor_batch(tmp_path, data_shape_nchw):
+    processor = _build_processor(tmp_path, data_shape_nchw)
+    static = data_shape_nchw is not None and "-1" not in data_shape_nchw
+    assert processor.batch_size == 4
+    assert processor.input_hw == ((32, 100) if static else None)
+
+    requests = [
+        _encode_image(32, 100, 1),
+        _encode_image(30, 90, 2),
+        _encode_image(32, 100, 3),
+        _encode_image(20, 70, 4),
+    ]
+    images = processor.preprocess_batch(requests)
+    if static:
+        # the static shape model takes the exported input shape only
+        assert [image.shape for image in images] == [(3, 32, 100)] * 4
+    else:
+        assert [image.shape for image in images] == [(3, 32, 128), (3, 32, 96), (3, 32, 128), (3, 32, 96)]
+
+    model = _Model(processor.input_hw)
+    outputs = processor.infer_batch(model, images)
+    # the requests of the same shape share a batch of the model
+    assert sorted(shape[0] for shape in model.batch_shapes) == ([4] if static else [2, 2])
+
+    results = processor.postprocess_batch(outputs, "polys")
+    assert len(results) == len(requests)
+    for i, (result, (h, w)) in enumerate(zip(results, [(32, 100), (30, 90), (32, 100), (20, 70)])):
+        # the padding is zeros, the result of each request is in the order of the requests
+        expected = 3 * (i + 1) * h * w
+        assert len(result) == 1
+        np.testing.assert_allclose(result[0], [expected] * 2, rtol=1e-5)
+
+
+def test_model_processor_image_exceeds_input_shape(tmp_path):
+    processor = _build_processor(tmp_path, ["1", "3", "32", "100"])
+    with pytest.raises(ValueError):
+        processor.preprocess_batch([_encode_image(32, 120, 1)])
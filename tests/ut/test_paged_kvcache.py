@@ -0,0 +1,161 @@
+import sys
+
+sys.path.append(".")
+
+import numpy as np
+import pytest
+
+from mindocr.nlp.utils.paged_kvcache import NULL_BLOCK, BlockAllocator, HostPagedKVCache, PrefixCachingBlockAllocator
+
+
+def test_block_allocator():
+    with pytest.raises(ValueError):
+        BlockAllocator(num_blocks=1, block_size=4)
+
+    allocator = BlockAllocator(num_blocks=6, block_size=4, bytes_per_token=2)
+    allocator.allocate("a", 5)
+    allocator.allocate("b", 1)
+    # the null block is never allocated, low blocks first
+    assert allocator.block_tables == {"a": [1, 2], "b": [3]}
+    assert allocator.num_free_blocks == 2
+
+    # blocks are allocated as the sequence grows
+    allocator.allocate("b", 4)
+    assert allocator.block_tables["b"] == [3]
+    allocator.allocate("b", 5)
+    assert allocator.block_tables["b"] == [3, 4]
+    assert allocator.kv_bytes("b") == (8 * 2, 5 * 2)
+    assert allocator.kv_bytes() == (16 * 2, 10 * 2)
+
+    assert not allocator.can_allocate("a", 13)
+    with pytest.raises(RuntimeError):
+        allocator.allocate("a", 13)
+
+    allocator.truncate("b", 3)
+    assert allocator.block_tables["b"] == [3]
+    allocator.free("a")
+    assert "a" not in allocator.block_tables
+    assert allocator.num_free_blocks == 4
+    allocator.free_all()
+    assert allocator.num_free_blocks == 5
+
+
+def test_block_allocator_slots():
+    allocator = BlockAllocator(num_blocks=8, block_size=4)
+    allocator.allocate("a", 6)
+    allocator.allocate("b", 3)
+    assert allocator.block_tables == {"a": [1, 2], "b": [3]}
+
+    np.testing.assert_array_equal(allocator.get_slots("a", [0, 3, 4, 5]), [4, 7, 8, 9])
+    np.testing.assert_array_equal(
+        allocator.build_block_tables(["a", None, "b"], width=3), [[1, 2, NULL_BLOCK], [NULL_BLOCK] * 3, [3, 0, 0]]
+    )
+    # the padding positions and the free rows are mapped to the null block
+    np.testing.assert_array_equal(
+        allocator.build_prefill_slots(["a", "b", None], [6, 3], seq_length=6).reshape(3, 6),
+        [[4, 5, 6, 7, 8, 9], [12, 13, 14, 0, 0, 0], [0] * 6],
+    )
+    np.testing.assert_array_equal(allocator.build_decode_slots(["a", None, "b"], [6, 0, 3]), [9, 0, 14])
+    np.testing.assert_array_equal(allocator.build_decode_slots(["a"], [5], num_tokens=2), [8, 9])
+
+
+def test_host_paged_kv_cache():
+    block_size, seq_length = 4, 7
+    allocator = BlockAllocator(num_blocks=8, block_size=block_size)
+    cache = HostPagedKVCache(num_blocks=8, block_size=block_size, n_kv_head=2, head_dim=3, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    lengths = [7, 3]
+    seq_ids = ["a", "b"]
+    for seq_id, length in zip(seq_ids, lengths):
+        allocator.allocate(seq_id, length + 1)
+
+    # prefill, the keys and values are returned as is
+    key = rng.random((2, 2, seq_length, 3), dtype=np.float32)
+    slot_mapping = allocator.build_prefill_slots(seq_ids, lengths, seq_length)
+    block_tables = allocator.build_block_tables(seq_ids, width=2)
+    key_out, _ = cache(key, key, slot_mapping, block_tables, is_first_iteration=True)
+    np.testing.assert_array_equal(key_out, key)
+
+    # decode, the keys of the sequences are gathered from their blocks
+    new_key = rng.random((2, 2, 1, 3), dtype=np.float32)
+    slot_mapping = allocator.build_decode_slots(seq_ids, [length + 1 for length in lengths])
+    key_out, value_out = cache(new_key, new_key, slot_mapping, block_tables)
+    assert key_out.shape == (2, 2, 2 * block_size, 3)
+    for i, length in enumerate(lengths):
+        expected = np.concatenate([key[i, :, :length], new_key[i]], axis=1)
+        np.testing.assert_array_equal(key_out[i, :, : length + 1], expected)
+        np.testing.assert_array_equal(value_out[i, :, : length + 1], expected)
+
+
+def test_prefix_cache_copy_on_write():
+    allocator = PrefixCachingBlockAllocator(num_blocks=10, block_size=4)
+    tokens = list(range(10, 21))
+    allocator.allocate("a", len(tokens))
+    allocator.cache_prefix("a", tokens)
+    allocator.free("a")
+    assert allocator.block_tables == {}
+    assert allocator.num_free_blocks == 9
+
+    # the prefix goes on inside the partial block 3 of "a" for 2 tokens
+    prompt = tokens[:10] + [99, 98]
+    assert allocator.match_prefix("b", prompt) == 10
+    assert allocator.block_tables["b"] == [1, 2]
+    allocator.allocate("b", len(prompt))
+    assert allocator.block_tables["b"] == [1, 2, 4]
+
+    # the 2 tokens are copied to the block of "b" before it is written, the cached block is not written
+    np.testing.assert_array_equal(allocator.build_copy_slots(width=4), [[12, 13, 0, 0], [16, 17, 0, 0]])
+    np.testing.assert_array_equal(allocator.get_slots("b", [10, 11]), [18, 19])
+    assert allocator.pending_copies == {}
+    assert allocator.ref_counts[1:5] == [1, 1, 0, 1]
+    assert allocator.stats() == {"queries": 1, "hits": 1, "query_tokens": 12, "hit_tokens": 10, "cached_blocks": 3}
+
+    # the shared blocks are held until both sequences are freed
+    assert allocator.match_prefix("c", tokens) == 10
+    allocator.free("b")
+    assert allocator.ref_counts[1:3] == [1, 1]
+    allocator.free("c")
+    assert allocator.ref_counts[1:5] == [0, 0, 0, 0]
+    assert allocator.num_free_blocks == 9
+
+
+def test_prefix_cache_miss():
+    allocator = PrefixCachingBlockAllocator(num_blocks=10, block_size=4)
+    tokens = list(range(10, 21))
+    allocator.allocate("a", len(tokens))
+    allocator.cache_prefix("a", tokens, extra_key="image 1")
+    allocator.free("a")
+
+    # the prefix is keyed by the inputs other than tokens as well
+    assert allocator.match_prefix("b", tokens, extra_key="image 2") == 0
+    # the prefix is shorter than min_length
+    assert allocator.match_prefix("c", tokens[:6], extra_key="image 1", min_length=6) == 0
+    # the last token is always computed
+    assert allocator.match_prefix("d", tokens[:1], extra_key="image 1") == 0
+    assert allocator.block_tables == {}
+    assert allocator.match_prefix("e", tokens, extra_key="image 1") == 10
+    assert allocator.hit_rate == pytest.approx(10 / (11 + 6 + 1 + 11))
+
+
+def test_prefix_cache_eviction():
+    # blocks of 2 tokens of 1 byte, up to 2 cached blocks not held by any sequence
+    allocator = PrefixCachingBlockAllocator(num_blocks=6, block_size=2, bytes_per_token=1, cache_bytes=4)
+    tokens = [1, 2, 3, 4, 5, 6]
+    allocator.allocate("a", len(tokens))
+    allocator.cache_prefix("a", tokens)
+    allocator.free("a")
+    # the last block is freed first, and evicted as the least recently used
+    assert list(allocator.evictable) == [2, 1]
+    assert allocator.num_free_blocks == 5
+    assert allocator.match_prefix("b", tokens + [7]) == 4
+    allocator.free("b")
+
+    # without free blocks, the least recently used cached block is evicted to allocate
+    allocator = PrefixCachingBlockAllocator(num_blocks=5, block_size=2)
+    allocator.allocate("a", 4)
+    allocator.cache_prefix("a", [1, 2, 3, 4])
+    allocator.free("a")
+    assert list(allocator.evictable) == [2, 1]
+    allocator.allocate("x", 6)
+    assert allocator.block_tables["x"] == [3, 4, 2]
+    assert allocator.match_prefix("b", [1, 2, 3, 4, 9]) == 2
@@ -0,0 +1,132 @@
+import base64
+import queue
+import sys
+import threading
+from types import SimpleNamespace
+
+sys.path.append(".")
+
+import pytest
+
+pytest.importorskip("tiktoken")
+
+from mindocr.nlp.generation import streamers
+from mindocr.nlp.generation.streamers import TextIteratorStreamer
+from mindocr.nlp.llm.qwen_tokenizer import QwenTokenizer
+
+TEXT = "Hi 你好，世界! naïve 🙂🧪 done"
+
+
+@pytest.fixture(scope="module")
+def tokenizer(tmp_path_factory):
+    # byte-level BPE of the single bytes, and merges of 2 bytes splitting the multi-byte characters
+    merges = [b"Hi", "你".encode()[:2], "界".encode()[1:], "🙂".encode()[:2], "🙂".encode()[2:], "ï".encode()]
+    vocab_file = tmp_path_factory.mktemp("qwen_tokenizer") / "qwen.tiktoken"
+    lines = [
+        f"{base64.b64encode(token).decode()} {rank}" for rank, token in enumerate([bytes([i]) for i in range(256)])
+    ]
+    lines += [f"{base64.b64encode(token).decode()} {rank}" for rank, token in enumerate(merges, start=256)]
+    vocab_file.write_text("\n".join(lines), encoding="utf-8")
+    return QwenTokenizer(vocab_file=str(vocab_file))
+
+
+def _stream(decoder, token_ids):
+    chunks = [decoder.decode(token_id) for token_id in token_ids]
+    return chunks, decoder.flush()
+
+
+def test_incremental_decoder(tokenizer):
+    token_ids = tokenizer.tokenizer.encode(TEXT)
+    # the characters are split over several tokens
+    assert len(token_ids) > len(TEXT.encode()) // 2
+    assert tokenizer.decode(token_ids) == TEXT
+
+    chunks, rest = _stream(tokenizer.incremental_decoder(), token_ids)
+    # only complete characters are emitted, the text of the stream is the text of all token ids
+    assert "�" not in "".join(chunks)
+    assert "".join(chunks) + rest == TEXT
+    assert rest == ""
+    start = token_ids.index(tokenizer.mergeable_ranks["你".encode()[:2]])
+    assert chunks[start : start + 5] == ["", "你", "", "", "好"]
+
+    # the special tokens are skipped even inside a character
+    eod_id = tokenizer.eod_id
+    token_ids = token_ids[: start + 1] + [eod_id] + token_ids[start + 1 :] + [tokenizer.im_end_id]
+    chunks, rest = _stream(tokenizer.incremental_decoder(skip_special_tokens=True), token_ids)
+    assert "".join(chunks) + rest == tokenizer.decode(token_ids, skip_special_tokens=True) == TEXT
+
+
+def test_incremental_decoder_incomplete(tokenizer):
+    token_ids = tokenizer.tokenizer.encode("好🙂")
+    decoder = tokenizer.incremental_decoder()
+    # the bytes of the incomplete character at the end of stream are replaced, like decode
+    chunks, rest = _stream(decoder, token_ids[:-1])
+    assert "".join(chunks) + rest == tokenizer.decode(token_ids[:-1]) == "好�"
+    # the decoder is reset by flush
+    chunks, rest = _stream(decoder, token_ids)
+    assert "".join(chunks) + rest == "好🙂"
+
+
+def test_text_iterator_streamer(tokenizer, monkeypatch):
+    clock = iter([10.0, 10.5, 10.6, 10.8, 11.1, 11.2, 11.4, 20.0, 20.2])
+    monkeypatch.setattr(streamers, "time", SimpleNamespace(time=lambda: next(clock)))
+    streamer = TextIteratorStreamer(tokenizer, timeout=1.0)
+    new_ids = tokenizer.tokenizer.encode("你好")
+    assert len(new_ids) == 5
+
+    streamer.put([tokenizer.tokenizer.encode("Hi")])
+    for token_id in new_ids:
+        streamer.put([[token_id]])
+    streamer.put([[tokenizer.eod_id]])
+    streamer.end()
+    # the prompt and the special tokens are skipped, the iterator stops at the end of stream
+    assert list(streamer) == ["你", "好"]
+
+    stats = streamer.latency_stats()
+    assert stats["num_tokens"] == 6
+    assert stats["time_to_first_token"] == pytest.approx(0.5)
+    assert stats["inter_token_latency"] == pytest.approx(0.18)
+    assert stats["inter_token_latency_p50"] == pytest.approx(0.2)
+    assert stats["inter_token_latency_p90"] == pytest.approx(0.26)
+    assert streamers.format_latency_stats(stats) == (
+        "6 tokens, time_to_first_token 500.0 ms, inter_token_latency 180.0 ms, "
+        "inter_token_latency_p50 200.0 ms, inter_token_latency_p90 260.0 ms"
+    )
+
+    # the next generation starts with its prompt, the incomplete character is flushed at its end
+    streamer.put([tokenizer.tokenizer.encode("Hi")])
+    streamer.put([new_ids[:1]])
+    streamer.end()
+    assert list(streamer) == ["�"]
+    assert streamer.latency_stats() == {
+        "num_tokens": 1,
+        "time_to_first_token": pytest.approx(0.2),
+        "inter_token_latency": None,
+        "inter_token_latency_p50": None,
+        "inter_token_latency_p90": None,
+    }
+
+    with pytest.raises(ValueError):
+        streamer.put([[1], [2]])
+
+
+def test_text_iterator_streamer_thread(tokenizer):
+    streamer = TextIteratorStreamer(tokenizer, timeout=5.0)
+    token_ids = tokenizer.tokenizer.encode(TEXT)
+
+    def _generate():
+        streamer.put([[tokenizer.im_start_id]])
+        for token_id in token_ids:
+            streamer.put([token_id])
+        streamer.end()
+
+    thread = threading.Thread(target=_generate)
+    thread.start()
+    assert "".join(streamer) == TEXT
+    thread.join()
+    assert streamer.latency_stats()["num_tokens"] == len(token_ids)
+
+    # no text in time
+    streamer = TextIteratorStreamer(tokenizer, timeout=0.01)
+    with pytest.raises(queue.Empty):
+        next(streamer)
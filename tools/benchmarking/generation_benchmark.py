@@ -0,0 +1,171 @@
+"""A script to benchmark the throughput of text generation under requests arriving at random.
+
+Requests arrive as a Poisson process and are generated by a stub model, whose forward takes a fixed time per step
+whatever the number of sequences in the batch, like the memory bound decoding of a LLM, and which emits the eos token
+at random so that the lengths of outputs vary. Two schedulers are compared:
+    static: requests arrived are grouped into a batch, and `model.generate` runs until every sequence of the batch
+        finishes, while the requests arriving meanwhile wait.
+    continuous: requests are submitted to `model.continuous_batching()`, finished sequences leave the batch and queued
+        requests join it at every step.
+
+USAGE:
+    ```
+        python tools/benchmarking/generation_benchmark.py --num_requests 64 --arrival_rate 4 --step_latency 0.02
+    ```
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../..")))
+
+from mindocr.nlp.generation import GeneratorMixin  # noqa
+from mindocr.nlp.generation.generation_config import GenerationConfig  # noqa
+
+PAD_TOKEN_ID = 0
+EOS_TOKEN_ID = 1
+
+
+class StubGenerationModel(GeneratorMixin):
+    """A model of random logits, each forward sleeps step_latency and emits eos with probability 1/mean_new_tokens."""
+
+    def __init__(self, batch_size, seq_length, vocab_size, step_latency, mean_new_tokens, seed=0):
+        super().__init__()
+        self.config = SimpleNamespace(
+            batch_size=batch_size, seq_length=seq_length, is_encoder_decoder=False, is_sample_acceleration=False
+        )
+        self.phase = "predict"
+        self.vocab_size = vocab_size
+        self.step_latency = step_latency
+        self.eos_prob = 1.0 / mean_new_tokens
+        self.rng = np.random.default_rng(seed)
+
+    def set_train(self, mode=True):
+        self.phase = "train" if mode else "predict"
+
+    def prepare_inputs_for_generation(self, input_ids, **kwargs):
+        return {"input_ids": input_ids}
+
+    def __call__(self, input_ids, **kwargs):
+        time.sleep(self.step_latency)
+        batch_size, seq_length = input_ids.shape
+        logits = self.rng.standard_normal((batch_size, seq_length, self.vocab_size)).astype(np.float32)
+        logits[:, :, EOS_TOKEN_ID] = np.where(self.rng.random((batch_size, 1)) < self.eos_prob, 100.0, -100.0)
+        return logits
+
+
+def make_requests(args):
+    rng = np.random.default_rng(args.seed)
+    arrivals = np.cumsum(rng.exponential(1.0 / args.arrival_rate, args.num_requests))
+    prompts = [
+        rng.integers(EOS_TOKEN_ID + 1, args.vocab_size, rng.integers(args.min_prompt_len, args.max_prompt_len + 1))
+        for _ in range(args.num_requests)
+    ]
+    return arrivals, prompts
+
+
+def arrive(arrivals, prompts, submit):
+    """Submit the prompts at their arrival times relative to now, return the absolute arrival times."""
+    start = time.time()
+    arrival_times = []
+    for arrival, prompt in zip(arrivals, prompts):
+        time.sleep(max(0.0, start + arrival - time.time()))
+        arrival_times.append(time.time())
+        submit(prompt)
+    return arrival_times
+
+
+def run_static(model, generation_config, arrivals, prompts, max_batch_size):
+    requests = queue.Queue()
+    outputs, finish_times = [None] * len(prompts), [0.0] * len(prompts)
+
+    def serve():
+        served = 0
+        while served < len(prompts):
+            batch = [requests.get()]
+            while len(batch) < max_batch_size and not requests.empty():
+                batch.append(requests.get_nowait())
+            max_len = max(len(prompts[i]) for i in batch)
+            input_ids = [
+                np.pad(prompts[i], (0, max_len - len(prompts[i])), constant_values=PAD_TOKEN_ID) for i in batch
+            ]
+            output_ids = model.generate(input_ids, generation_config=generation_config)
+            for i, output in zip(batch, output_ids):
+                outputs[i], finish_times[i] = output, time.time()
+            served += len(batch)
+
+    server = threading.Thread(target=serve)
+    server.start()
+    indexes = iter(range(len(prompts)))
+    arrival_times = arrive(arrivals, prompts, lambda _: requests.put(next(indexes)))
+    server.join()
+    return outputs, arrival_times, finish_times
+
+
+def run_continuous(model, generation_config, arrivals, prompts, max_batch_size):
+    futures, finish_times = [], [0.0] * len(prompts)
+
+    def submit(prompt):
+        future = scheduler.submit(prompt)
+        index = len(futures)
+        future.add_done_callback(lambda _: finish_times.__setitem__(index, time.time()))
+        futures.append(future)
+
+    with model.continuous_batching(generation_config, max_batch_size=max_batch_size) as scheduler:
+        arrival_times = arrive(arrivals, prompts, submit)
+        outputs = [future.result() for future in futures]
+    return outputs, arrival_times, finish_times
+
+
+def report(name, prompts, outputs, arrival_times, finish_times):
+    generated = sum(len(output) - len(prompt) for prompt, output in zip(prompts, outputs))
+    total_time = max(finish_times) - min(arrival_times)
+    latency = np.array(finish_times) - np.array(arrival_times)
+    print(
+        f"{name:>10}: {generated} tokens in {total_time:.2f} s, {generated / total_time:.1f} tokens/s, "
+        f"latency mean {latency.mean():.2f} s, p90 {np.percentile(latency, 90):.2f} s"
+    )
+
+
+def main(args):
+    arrivals, prompts = make_requests(args)
+    generation_config = GenerationConfig(
+        max_new_tokens=args.max_new_tokens,
+        pad_token_id=PAD_TOKEN_ID,
+        eos_token_id=EOS_TOKEN_ID,
+        do_sample=False,
+        use_past=False,
+    )
+    for name, run in (("static", run_static), ("continuous", run_continuous)):
+        model = StubGenerationModel(
+            args.batch_size, args.seq_length, args.vocab_size, args.step_latency, args.mean_new_tokens, args.seed
+        )
+        outputs, arrival_times, finish_times = run(model, generation_config, arrivals, prompts, args.batch_size)
+        report(name, prompts, outputs, arrival_times, finish_times)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generation Benchmark Args")
+    parser.add_argument("--num_requests", type=int, default=64, help="number of requests")
+    parser.add_argument("--arrival_rate", type=float, default=4.0, help="mean number of requests arriving per second")
+    parser.add_argument("--batch_size", type=int, default=8, help="max number of sequences decoded together")
+    parser.add_argument("--seq_length", type=int, default=256, help="seq length of the stub model")
+    parser.add_argument("--vocab_size", type=int, default=64, help="vocab size of the stub model")
+    parser.add_argument("--step_latency", type=float, default=0.02, help="time(s) of each forward of the stub model")
+    parser.add_argument("--mean_new_tokens", type=int, default=48, help="mean number of tokens generated per request")
+    parser.add_argument("--max_new_tokens", type=int, default=128, help="max number of tokens generated per request")
+    parser.add_argument("--min_prompt_len", type=int, default=8)
+    parser.add_argument("--max_prompt_len", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,156 @@
+"""A script to benchmark the throughput in pages/s of SER inference on long documents with chunk batching.
+
+The pages are the token sequences of a label file of XFUND format, i.e. lines of `image_name\t[ocr info in json]`,
+encoded by `VQATokenLabelEncode`, or of random lengths between `--min_tokens` and `--max_tokens` if no label file is
+given. They are run by a stub network, whose forward takes a fixed time per call plus a time per token of the padded
+batch, like a compute bound transformer, and a compile time for every new input shape, like graph mode. Each
+schedule runs a pass over the pages to compile its shapes, and is timed on a second pass. Three schedules are
+compared:
+    chunk_by_chunk: the 512-token chunks of each page are run one by one, each padded to max_seq_len.
+    packed: the windows of `--batch_size` pages are packed into batches padded to length and batch buckets
+        by `KieChunkScheduler`.
+    packed_overlap: as packed, with consecutive windows sharing `--overlap` tokens, whose logits are averaged.
+
+USAGE:
+    ```
+        python tools/benchmarking/kie_chunk_benchmark.py --num_pages 64 --min_tokens 100 --max_tokens 1600
+    ```
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../..")))
+
+from tools.infer.text.utils.kie_chunk import TOKEN_KEYS, KieChunkScheduler  # noqa
+from tools.infer.text.utils.shape_bucket import default_batch_buckets  # noqa
+
+NUM_CLASSES = 7
+
+
+class StubKieNetwork:
+    """A network of random logits, whose forward sleeps call_latency plus token_latency per token of the batch."""
+
+    def __init__(self, call_latency, token_latency, compile_latency, seed=0):
+        self.call_latency = call_latency
+        self.token_latency = token_latency
+        self.compile_latency = compile_latency
+        self.seen_shapes = set()
+        self.num_calls = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, input_ids):
+        batch_size, seq_length = input_ids.shape
+        latency = self.call_latency + self.token_latency * batch_size * seq_length
+        if input_ids.shape not in self.seen_shapes:
+            self.seen_shapes.add(input_ids.shape)
+            latency += self.compile_latency
+        time.sleep(latency)
+        self.num_calls += 1
+        return self.rng.standard_normal((batch_size, seq_length, NUM_CLASSES)).astype(np.float32)
+
+
+def load_docs(args):
+    """The token inputs of the pages, each with a dummy image since the stub network does not use it."""
+    if args.label_file:
+        from mindocr.data.transforms.layoutlm_transforms import VQATokenLabelEncode
+
+        encoder = VQATokenLabelEncode(args.class_path, infer_mode=True, order_method="tb-yx")
+        image = np.zeros((1000, 800, 3), dtype=np.uint8)
+        lengths = []
+        with open(args.label_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    lengths.append(
+                        len(encoder({"label": line.strip("\n").split("\t", 1)[1], "image": image})["input_ids"])
+                    )
+                if args.num_pages and len(lengths) >= args.num_pages:
+                    break
+    else:
+        rng = np.random.default_rng(args.seed)
+        lengths = rng.integers(args.min_tokens, args.max_tokens + 1, args.num_pages).tolist()
+
+    docs = []
+    for length in lengths:
+        doc = {key: np.zeros((length, 4) if key == "bbox" else (length,), dtype=np.int64) for key in TOKEN_KEYS}
+        doc["image"] = np.zeros((3, 8, 8), dtype=np.float32)
+        docs.append(doc)
+    return docs
+
+
+def run_chunk_by_chunk(network, docs, args):
+    num_tokens = num_padded = 0
+    for doc in docs:
+        length = len(doc["input_ids"])
+        for start in range(0, length, args.max_seq_len):
+            chunk = doc["input_ids"][start : start + args.max_seq_len]
+            network(np.pad(chunk, (0, args.max_seq_len - len(chunk)))[None])
+            num_tokens += len(chunk)
+            num_padded += args.max_seq_len
+    return num_tokens, num_padded
+
+
+def run_packed(network, docs, args, overlap=0):
+    scheduler = KieChunkScheduler(
+        max_seq_len=args.max_seq_len,
+        batch_size=args.batch_size,
+        overlap=overlap,
+        length_buckets=[args.max_seq_len // 4, args.max_seq_len // 2],
+        batch_buckets=default_batch_buckets(args.batch_size),
+    )
+    num_tokens = num_padded = 0
+    for i in range(0, len(docs), args.batch_size):
+        group = docs[i : i + args.batch_size]
+        batches = scheduler.pack(group)
+        logits = [network(batch["input_ids"]) for batch in batches]
+        scheduler.merge(group, batches, logits)
+        num_tokens += sum(end - start for batch in batches for _, start, end in batch["windows"])
+        num_padded += sum(batch["input_ids"].size for batch in batches)
+    return num_tokens, num_padded
+
+
+def main(args):
+    docs = load_docs(args)
+    print(f"{len(docs)} pages, {sum(len(doc['input_ids']) for doc in docs)} tokens")
+    schedules = [("chunk_by_chunk", run_chunk_by_chunk), ("packed", run_packed)]
+    if args.overlap > 0:
+        schedules.append(("packed_overlap", lambda network, docs, args: run_packed(network, docs, args, args.overlap)))
+    for name, run in schedules:
+        network = StubKieNetwork(args.call_latency, args.token_latency, args.compile_latency, args.seed)
+        start = time.time()
+        run(network, docs, args)
+        warmup_time = time.time() - start
+        network.num_calls = 0
+        start = time.time()
+        num_tokens, num_padded = run(network, docs, args)
+        elapsed = time.time() - start
+        print(
+            f"{name:>14}: {len(docs) / elapsed:8.2f} pages/s, {network.num_calls} forwards, "
+            f"{1 - num_tokens / num_padded:.1%} padding, {len(network.seen_shapes)} shapes compiled in the first "
+            f"pass of {warmup_time:.2f} s"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="KIE Chunk Benchmark Args")
+    parser.add_argument("--label_file", type=str, default=None, help="label file of XFUND format")
+    parser.add_argument("--class_path", type=str, default="mindocr/utils/dict/class_list_xfun.txt")
+    parser.add_argument("--num_pages", type=int, default=64, help="number of pages")
+    parser.add_argument("--min_tokens", type=int, default=100, help="min number of tokens of the random pages")
+    parser.add_argument("--max_tokens", type=int, default=1600, help="max number of tokens of the random pages")
+    parser.add_argument("--max_seq_len", type=int, default=512, help="max number of tokens of a window")
+    parser.add_argument("--batch_size", type=int, default=8, help="max number of windows of a batch")
+    parser.add_argument("--overlap", type=int, default=128, help="number of tokens shared by consecutive windows")
+    parser.add_argument("--call_latency", type=float, default=0.005, help="time(s) of each forward of the stub")
+    parser.add_argument("--token_latency", type=float, default=2e-6, help="time(s) per token of a padded batch")
+    parser.add_argument("--compile_latency", type=float, default=0.5, help="time(s) to compile a new input shape")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
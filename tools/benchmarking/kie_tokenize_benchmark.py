@@ -0,0 +1,104 @@
+"""A script to benchmark the throughput in pages/s of the token label encoding of KIE (SER/RE) with LayoutXLM.
+
+Each page of a label file of XFUND format, i.e. lines of `image_name\t[ocr info in json]`, is encoded by
+`VQATokenLabelEncode` and padded by `VQATokenPad`. Two tokenization paths are compared:
+    per_segment: each text segment of a page is encoded by `tokenizer.encode` one at a time.
+    batch: all the segments of a page are tokenized in one call of `tokenizer.batch_tokenize_to_ids`, which memoizes
+        the ids of the repeated texts, e.g. the field names of forms, as `VQATokenLabelEncode` does.
+Only the shape of the images is used by the encoding, so the pages are encoded with a blank image of `--image_shape`.
+
+USAGE:
+    ```
+        python tools/benchmarking/kie_tokenize_benchmark.py --label_file XFUND/zh_train/train.json \
+            --class_path mindocr/utils/dict/class_list_xfun.txt --num_epochs 2
+    ```
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../..")))
+
+from mindocr.data.transforms.layoutlm_transforms import VQATokenLabelEncode, VQATokenPad  # noqa
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark of the token label encoding of KIE")
+    parser.add_argument("--label_file", type=str, required=True, help="label file of XFUND format")
+    parser.add_argument(
+        "--class_path", type=str, default="mindocr/utils/dict/class_list_xfun.txt", help="class list of SER"
+    )
+    parser.add_argument("--contains_re", action="store_true", help="encode the relations of RE as well")
+    parser.add_argument("--max_seq_len", type=int, default=512)
+    parser.add_argument("--num_pages", type=int, default=None, help="number of pages to encode, all if not set")
+    parser.add_argument("--num_epochs", type=int, default=1, help="number of passes over the pages")
+    parser.add_argument("--image_shape", type=int, nargs=3, default=[1000, 800, 3], help="HWC shape of the pages")
+    return parser.parse_args()
+
+
+def load_labels(label_file, num_pages=None):
+    labels = []
+    with open(label_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip("\n")
+            if not line:
+                continue
+            labels.append(line.split("\t", 1)[1])
+            if num_pages is not None and len(labels) >= num_pages:
+                break
+    return labels
+
+
+def encode_per_segment(encoder, data):
+    """Tokenize the segments of the page one by one with `tokenizer.encode`."""
+    tokenizer = encoder.tokenizer
+    batch_tokenize_to_ids = tokenizer.batch_tokenize_to_ids
+
+    def tokenize_one_by_one(texts):
+        batch_ids = []
+        for text in texts:
+            encode_res = tokenizer.encode(
+                text, pad_to_max_seq_len=False, return_attention_mask=True, return_token_type_ids=True
+            )
+            batch_ids.append(encode_res["input_ids"][1:-1])
+        return batch_ids
+
+    tokenizer.batch_tokenize_to_ids = tokenize_one_by_one
+    try:
+        return encoder(data)
+    finally:
+        tokenizer.batch_tokenize_to_ids = batch_tokenize_to_ids
+
+
+def run(encode_fn, encoder, pad, labels, image, num_epochs):
+    num_tokens = 0
+    start = time.time()
+    for _ in range(num_epochs):
+        for label in labels:
+            data = encode_fn(encoder, {"label": label, "image": image})
+            num_tokens += len(data["input_ids"])
+            pad(data)
+    elapsed = time.time() - start
+    return len(labels) * num_epochs / elapsed, num_tokens / elapsed
+
+
+def main():
+    args = parse_args()
+    labels = load_labels(args.label_file, args.num_pages)
+    image = np.zeros(args.image_shape, dtype=np.uint8)
+    pad = VQATokenPad(max_seq_len=args.max_seq_len)
+
+    print(f"{len(labels)} pages, {args.num_epochs} epochs")
+    for name, encode_fn in [("per_segment", encode_per_segment), ("batch", lambda encoder, data: encoder(data))]:
+        # a new encoder for each path, so that no tokenized text is cached beforehand
+        encoder = VQATokenLabelEncode(args.class_path, contains_re=args.contains_re)
+        pages_per_second, tokens_per_second = run(encode_fn, encoder, pad, labels, image, args.num_epochs)
+        print(f"{name:>12}: {pages_per_second:8.2f} pages/s, {tokens_per_second:10.1f} tokens/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -50,7 +50,7 @@ from mindocr.utils.logger import set_logger
 logger = logging.getLogger("mindocr.export")
 
 
-def common_exporter(save_dir, name, net, data_shape, is_dynamic_shape, model_type):
+def common_exporter(save_dir, name, net, data_shape, is_dynamic_shape, model_type, batch_size=1):
     if is_dynamic_shape:
         if model_type == "det":
             x = ms.Tensor(shape=[None, 3, None, None], dtype=ms.float32)
@@ -58,7 +58,7 @@ def common_exporter(save_dir, name, net, data_shape, is_dynamic_shape, model_typ
             x = ms.Tensor(shape=[None, 3, 32, None], dtype=ms.float32)
     else:
         h, w = data_shape
-        bs, c = 1, 3
+        bs, c = batch_size, 3
         x = ms.Tensor(np.ones([bs, c, h, w]), dtype=ms.float32)
     output_path = os.path.join(save_dir, name) + ".mindir"
     ms.export(net, x, file_name=output_path, file_format="MINDIR")
@@ -167,7 +167,7 @@ def export(model_name_or_config, data_shape, local_ckpt_path, save_dir, is_dynam
 
     if "custom_exported_name" in kwargs:
         name = kwargs["custom_exported_name"]
-    common_exporter(save_dir, name, net, data_shape, is_dynamic_shape, model_type)
+    common_exporter(save_dir, name, net, data_shape, is_dynamic_shape, model_type, kwargs.get("batch_size", 1))
 
 
 def check_args(args):
@@ -245,6 +245,13 @@ if __name__ == "__main__":
     parser.add_argument(
         "--custom_exported_name", type=str, default="", help="mindir name to save the exported mindir file."
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help="The batch size of exported mindir file with static data shape. Only works for det, rec and cls models "
+        "exported by the common exporter.",
+    )
     args = parser.parse_args()
     check_args(args)
     export(**vars(args))
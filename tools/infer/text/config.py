@@ -112,6 +112,25 @@ def create_parser():
         "due to padding or resizing to the same shape.",
     )  # added
     parser.add_argument("--rec_batch_num", type=int, default=8)
+    parser.add_argument(
+        "--rec_shape_bucket",
+        type=str2bool,
+        default=False,
+        help="Whether to pad recognition inputs to a fixed set of (batch, width) shape buckets and compile all of "
+        "them at startup, which avoids recompiling the network for every new input shape in graph mode.",
+    )
+    parser.add_argument(
+        "--rec_batch_buckets",
+        type=str,
+        default=None,
+        help="Comma-separated batch size buckets, e.g. '1,4,8'. If None, powers of two up to rec_batch_num are used.",
+    )
+    parser.add_argument(
+        "--rec_width_buckets",
+        type=str,
+        default=None,
+        help="Comma-separated input width buckets, e.g. '160,320,640'. If None, the input width is not bucketed.",
+    )
     parser.add_argument("--max_text_length", type=int, default=25)
     parser.add_argument(
         "--rec_char_dict_path",
@@ -207,6 +226,29 @@ def create_parser():
         "due to padding or resizing to the same shape.",
     )
     parser.add_argument("--kie_batch_num", type=int, default=8)
+    parser.add_argument(
+        "--kie_chunk_batch",
+        type=str2bool,
+        default=False,
+        help="Whether to split the token sequences of the documents into windows of kie_max_seq_len tokens and pack "
+        "the windows of kie_batch_num documents into batches padded to length buckets, instead of truncating each "
+        "document to kie_max_seq_len tokens.",
+    )
+    parser.add_argument("--kie_max_seq_len", type=int, default=512, help="max number of tokens of a window.")
+    parser.add_argument(
+        "--kie_window_overlap",
+        type=int,
+        default=0,
+        help="Number of tokens shared by consecutive windows of a document in kie_chunk_batch mode, whose logits "
+        "are averaged.",
+    )
+    parser.add_argument(
+        "--kie_length_buckets",
+        type=str,
+        default=None,
+        help="Comma-separated padded lengths of the windows, e.g. '128,256,512'. If None, a quarter, a half and "
+        "the whole of kie_max_seq_len are used.",
+    )
 
     parser.add_argument(
         "--table_algorithm",
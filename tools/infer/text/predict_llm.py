@@ -1,12 +1,17 @@
 import argparse
+import json
 import logging
 import os
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
 from PIL import Image
 
 import mindspore as ms
 
 from mindocr.data.transforms.llm_transform import image_processor, image_processor_high
+from mindocr.nlp.generation.streamers import TextIteratorStreamer, format_latency_stats
 from mindocr.nlp.llm.configs import LLMConfig
 from mindocr.nlp.llm.qwen_tokenizer import QwenTokenizer
 from mindocr.nlp.llm.vary_qwen_model import VaryQwenForCausalLM
@@ -31,11 +36,45 @@ def str2bool(v):
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Inference Config Args")
-    parser.add_argument("--image_dir", type=str, required=True, help="image path")
-    parser.add_argument("--query", type=str, required=False, default="Provide the ocr results of this image.")
+    parser.add_argument(
+        "--image_dir",
+        type=str,
+        required=False,
+        default=None,
+        help="image path, or a directory of images which are generated with continuous batching, required unless "
+        "serving",
+    )
+    parser.add_argument(
+        "--query",
+        type=str,
+        nargs="+",
+        required=False,
+        default=["Provide the ocr results of this image."],
+        help="query, or several queries about each image, which share the prefix cache of the image if "
+        "prefix_cache_bytes of the model config is set",
+    )
     parser.add_argument("--config_path", type=str, required=False, default="../../../configs/llm/vary/vary_toy.yaml")
     parser.add_argument("--chat_mode", type=str2bool, required=False, default=False)
+    parser.add_argument(
+        "--stream",
+        type=str2bool,
+        required=False,
+        default=False,
+        help="print the response of a single image as it is generated, and log the latency of the tokens",
+    )
+    parser.add_argument(
+        "--serve",
+        type=str2bool,
+        required=False,
+        default=False,
+        help="serve the generation over http instead, the responses are streamed as server-sent events from "
+        "/generate?image=<image path>&query=<query>",
+    )
+    parser.add_argument("--host", type=str, required=False, default="127.0.0.1", help="host of the http server")
+    parser.add_argument("--port", type=int, required=False, default=8000, help="port of the http server")
     args = parser.parse_args()
+    if args.image_dir is None and not args.serve:
+        parser.error("the following arguments are required: --image_dir")
     return args
 
 
@@ -59,21 +98,77 @@ class LLMGenerator(object):
         self.query = args.query
         self.seq_length = self.model.seq_length
         self.chat_mode = args.chat_mode
+        self.stream = args.stream
 
     def _call_one(self, query=None, image=None, image_high=None):
+        if self.stream:
+            return self._stream_one(query=query, image=image, image_high=image_high)
         response = self.model.chat(tokenizer=self.tokenizer, query=query, image=image, image_high=image_high)
         print(">" * 100)
         print(response)
         print("<" * 100)
         return response
 
+    def _stream_one(self, query=None, image=None, image_high=None):
+        streamer = TextIteratorStreamer(self.tokenizer)
+        chunks = []
+        print(">" * 100)
+        for text in self.model.stream_chat(
+            tokenizer=self.tokenizer, query=query, image=image, image_high=image_high, streamer=streamer
+        ):
+            print(text, end="", flush=True)
+            chunks.append(text)
+        print()
+        print("<" * 100)
+        logging.info("Latency of the response: %s", format_latency_stats(streamer.latency_stats()))
+        return "".join(chunks)
+
+    def _call_pages(self, queries, image_paths):
+        """
+        Generate the responses of the queries about images with continuous batching, a request joins the batch as
+        soon as a slot is free instead of waiting for the whole batch. The queries about an image share the prefix of
+        the image with the prefix cache.
+        """
+        prompts = [self.model.build_page_prompt(query) for query in queries]
+        input_ids = [self.tokenizer([prompt], max_length=self.seq_length)["input_ids"] for prompt in prompts]
+        responses = []
+        with self.model.continuous_batching() as scheduler:
+            futures = []
+            for image_path in image_paths:
+                image = load_image(image_path)
+                image_high = image_processor_high(image)
+                image = image_processor(image)
+                for ids in input_ids:
+                    futures.append(scheduler.submit(ids, prefix_key=image_path, image=image, image_high=image_high))
+            requests = [
+                (image_path, query, prompt) for image_path in image_paths for query, prompt in zip(queries, prompts)
+            ]
+            for (image_path, query, prompt), future in zip(requests, futures):
+                output = self.tokenizer.decode([future.result()], skip_special_tokens=False)[0]
+                response = output[len(prompt) :]
+                for special_token in self.tokenizer.special_tokens:
+                    response = response.replace(special_token, "")
+                print(">" * 100)
+                print(image_path, query)
+                print(response)
+                print("<" * 100)
+                responses.append(response)
+        return responses
+
     def __call__(self, query=None, image_dir=None):
         self.model.reset()
         is_first_iteration = True
         if query is None:
             query = self.query
+        queries = [query] if isinstance(query, str) else list(query)
+        query = queries[0]
         if image_dir is None:
             image_dir = self.image_dir
+        if os.path.isdir(image_dir):
+            image_paths = [os.path.join(image_dir, name) for name in sorted(os.listdir(image_dir))]
+            return self._call_pages(queries, [path for path in image_paths if os.path.isfile(path)])
+        if len(queries) > 1:
+            return self._call_pages(queries, [image_dir])
         image = load_image(image_dir)
         image_high = image_processor_high(image)
         image = image_processor(image)
@@ -97,10 +192,130 @@ class LLMGenerator(object):
                 raise e
 
 
+class LLMServer(object):
+    """
+    Local http server of the generation, which streams the response of each request as server-sent events as soon as
+    it is generated. The requests are generated together with continuous batching on a background thread, a request
+    is `GET /generate?image=<image path>&query=<query>`, or a `POST /generate` of a json body with these keys. The
+    text chunks are sent as `data: {"text": ...}` events, then a `done` event with the latency of the tokens, or an
+    `error` event if the generation fails.
+    """
+
+    def __init__(self, llm_generator, host="127.0.0.1", port=8000):
+        self.llm_generator = llm_generator
+        self.host = host
+        self.port = port
+
+    def generate(self, image_path, query):
+        """Yield the events of the response of the query about the image."""
+        generator = self.llm_generator
+        image = load_image(image_path)
+        image_high = image_processor_high(image)
+        image = image_processor(image)
+        prompt = generator.model.build_page_prompt(query)
+        input_ids = generator.tokenizer([prompt], max_length=generator.seq_length)["input_ids"]
+        streamer = TextIteratorStreamer(generator.tokenizer)
+        future = self.scheduler.submit(
+            input_ids, prefix_key=image_path, image=image, image_high=image_high, streamer=streamer
+        )
+        try:
+            for text in streamer:
+                yield "message", {"text": text}
+        finally:
+            # the generator is closed before the end of the stream if the client disconnects
+            if not future.done():
+                self.scheduler.abort(future)
+        error = future.exception()
+        if error is not None:
+            yield "error", {"error": str(error)}
+            return
+        stats = streamer.latency_stats()
+        logging.info("Latency of the response to %s: %s", image_path, format_latency_stats(stats))
+        yield "done", stats
+
+    def serve_forever(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/health":
+                    self._send_json(200, {"status": "ok"})
+                    return
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                self._generate(url.path, params)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    params = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError as e:
+                    self._send_json(400, {"error": f"invalid json body: {e}"})
+                    return
+                self._generate(urlparse(self.path).path, params)
+
+            def _generate(self, path, params):
+                if path != "/generate":
+                    self._send_json(404, {"error": f"unknown path {path}"})
+                    return
+                image_path = params.get("image")
+                if not image_path or not os.path.isfile(image_path):
+                    self._send_json(400, {"error": f"image {image_path} is not a file"})
+                    return
+                query = params.get("query", server.llm_generator.query[0])
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    with closing(server.generate(image_path, query)) as events:
+                        for event, data in events:
+                            message = f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+                            if event != "message":
+                                message = f"event: {event}\n" + message
+                            self.wfile.write(message.encode("utf-8"))
+                            self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    logging.warning("The client of %s disconnected, its request is aborted.", image_path)
+                except Exception as e:  # pylint: disable=W0703
+                    logging.exception("Failed to generate the response to %s.", image_path)
+                    message = f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+                    self.wfile.write(message.encode("utf-8"))
+
+            def _send_json(self, status, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=W0622
+                logging.info("%s - %s", self.address_string(), format % args)
+
+        with self.llm_generator.model.continuous_batching() as self.scheduler:
+            httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+            logging.info("Serving on http://%s:%s/generate", self.host, self.port)
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                httpd.server_close()
+
+
 def main():
     set_logger()
     args = parse_args()
     llm_generator = LLMGenerator(args)
+    if args.serve:
+        LLMServer(llm_generator, host=args.host, port=args.port).serve_forever()
+        return
     llm_generator()
 
 
@@ -14,7 +14,7 @@ import numpy as np
 from config import parse_args
 from postprocess import Postprocessor
 from preprocess import Preprocessor
-from utils import get_ckpt_file, get_image_paths
+from utils import ShapeBucketer, default_batch_buckets, get_ckpt_file, get_image_paths, parse_buckets
 
 import mindspore as ms
 import mindspore.ops as ops
@@ -24,6 +24,8 @@ __dir__ = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../../../")))
 
 from mindocr import build_model
+from mindocr.data.transforms.rec_transforms import RecResizeNormForInfer
+from mindocr.utils.crop_utils import crop_resize_norm_text_regions
 from mindocr.utils.logger import set_logger
 from mindocr.utils.visualize import show_imgs
 
@@ -109,6 +111,33 @@ class TextRecognizer(object):
         self.vis_dir = args.draw_img_save_dir
         os.makedirs(self.vis_dir, exist_ok=True)
 
+        # crop and preprocess can be fused only if all images in a batch are resized to the same shape
+        resize_ops = [op for op in self.preprocess.transforms if isinstance(op, RecResizeNormForInfer)]
+        self.resize_op = resize_ops[0] if resize_ops else None
+        self.support_fused_crop = (
+            self.batch_mode
+            and self.resize_op is not None
+            and (self.resize_op.padding or not self.resize_op.keep_ratio)
+            and self.resize_op.tar_w is not None
+        )
+
+        # pad inputs to shape buckets so that graph mode does not recompile for every new input shape
+        self.shape_bucketer = None
+        if args.rec_shape_bucket:
+            batch_buckets = parse_buckets(args.rec_batch_buckets) or default_batch_buckets(self.batch_num)
+            width_buckets = parse_buckets(args.rec_width_buckets)
+            pad_value = 0.0
+            if self.resize_op is not None and not self.resize_op.norm_before_pad:
+                pad_value = self.resize_op.norm(np.zeros(3, dtype=np.float32))
+            self.shape_bucketer = ShapeBucketer(batch_buckets, width_buckets, pad_value=pad_value)
+            logger.info(f"Rec shape buckets - batch: {batch_buckets}, width: {width_buckets or 'not bucketed'}")
+            if not width_buckets and (self.resize_op is None or self.resize_op.tar_w is None):
+                logger.warning(
+                    "The rec input width varies with the image under the current preprocess setting. "
+                    "Set `rec_width_buckets` to avoid recompiling for every new width."
+                )
+            self.warmup()
+
     def __call__(self, img_or_path_list: list, do_visualize=False):
         """
         Run text recognition serially for input images
@@ -183,12 +212,7 @@ class TextRecognizer(object):
             img_batch = np.stack(img_batch) if len(img_batch) > 1 else np.expand_dims(img_batch[0], axis=0)
 
             # infer
-            net_pred = self.model(ms.Tensor(img_batch))
-            if self.cast_pred_fp32:
-                if isinstance(net_pred, list) or isinstance(net_pred, tuple):
-                    net_pred = [self.cast(p, mstype.float32) for p in net_pred]
-                else:
-                    net_pred = self.cast(net_pred, mstype.float32)
+            net_pred = self._predict(img_batch)
 
             # postprocess
             batch_res = self.postprocess(net_pred)
@@ -196,6 +220,84 @@ class TextRecognizer(object):
 
         return rec_res
 
+    def run_batchwise_on_regions(self, image, polys, box_type="quad"):
+        """
+        Run text recognition on the text regions of an image. The regions are cropped and written directly into
+        the preprocessed input batch, which saves the separate crop and resize steps. Only available if
+        `support_fused_crop` is True.
+
+        Args:
+            image: np.array of the RGB image where the text regions are detected
+            polys: detected text boxes, in shape [num_boxes, num_points, 2]
+            box_type: "quad" or "poly"
+
+        Return:
+            rec_res: list of tuple (text, score) for each text region in order.
+        """
+        assert self.support_fused_crop, "Fused crop is only supported in batch mode with a fixed target width."
+        rec_res = []
+        num_regions = len(polys)
+        op = self.resize_op
+        for batch_begin in range(0, num_regions, self.batch_num):
+            batch_end = min(batch_begin + self.batch_num, num_regions)
+            logger.info(f"Rec region idx range: [{batch_begin}, {batch_end})")
+            img_batch, _ = crop_resize_norm_text_regions(
+                image,
+                polys[batch_begin:batch_end],
+                target_height=op.tar_h,
+                target_width=op.tar_w,
+                keep_ratio=op.keep_ratio,
+                padding=op.padding,
+                box_type=box_type,
+                interpolation=op.interpolation,
+                norm_before_pad=op.norm_before_pad,
+                mean=op.mean,
+                std=op.std,
+                divisor=op.divisor,
+            )
+            net_pred = self._predict(img_batch)
+            batch_res = self.postprocess(net_pred)
+            rec_res.extend(list(zip(batch_res["texts"], batch_res["confs"])))
+
+        return rec_res
+
+    def warmup(self):
+        """
+        Run the network once for every shape bucket, so that all graphs are compiled before the first request.
+        """
+        if self.shape_bucketer is None or self.resize_op is None:
+            logger.warning("Rec warmup is skipped since shape bucketing is not enabled for the algorithm.")
+            return
+        default_width = self.resize_op.tar_w or self.resize_op.tar_h * 4
+        shapes = self.shape_bucketer.warmup_shapes(3, self.resize_op.tar_h, default_width)
+        start = time()
+        for shape in shapes:
+            self.shape_bucketer.record(shape)
+            self.model(ms.Tensor(np.zeros(shape, dtype=np.float32)))
+        logger.info(f"Rec warmup of {len(shapes)} shapes {shapes} done. Time cost: {time() - start:.2f}s")
+
+    def _predict(self, img_batch):
+        num_valid = len(img_batch)
+        if self.shape_bucketer is not None:
+            num_compiles = self.shape_bucketer.compile_count
+            img_batch, num_valid = self.shape_bucketer.pad(img_batch)
+            if self.shape_bucketer.compile_count > num_compiles:
+                logger.warning(
+                    f"Rec input shape {img_batch.shape} is out of the warmed-up shape buckets and triggers a "
+                    f"recompile. Total compile count: {self.shape_bucketer.compile_count}"
+                )
+
+        net_pred = self.model(ms.Tensor(img_batch))
+        if self.cast_pred_fp32:
+            if isinstance(net_pred, list) or isinstance(net_pred, tuple):
+                net_pred = [self.cast(p, mstype.float32) for p in net_pred]
+            else:
+                net_pred = self.cast(net_pred, mstype.float32)
+
+        if num_valid < len(img_batch):
+            net_pred = ShapeBucketer.unpad(net_pred, num_valid)
+        return net_pred
+
     def run_single(self, img_or_path, crop_idx=0, do_visualize=True):
         """
         Text recognition inference on a single image
@@ -231,12 +333,7 @@ class TextRecognizer(object):
         if len(input_np.shape) == 3:
             net_input = np.expand_dims(input_np, axis=0)
 
-        net_pred = self.model(ms.Tensor(net_input))
-        if self.cast_pred_fp32:
-            if isinstance(net_pred, list) or isinstance(net_pred, tuple):
-                net_pred = [self.cast(p, mstype.float32) for p in net_pred]
-            else:
-                net_pred = self.cast(net_pred, mstype.float32)
+        net_pred = self._predict(net_input)
 
         # postprocess
         rec_res = self.postprocess(net_pred)
@@ -280,8 +377,6 @@ if __name__ == "__main__":
     # init detector
     text_recognize = TextRecognizer(args)
 
-    # TODO: warmup
-
     # run for each image
     start = time()
     rec_res_all = text_recognize(img_paths, do_visualize=False)
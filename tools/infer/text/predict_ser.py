@@ -16,11 +16,19 @@ from config import parse_args
 from postprocess import Postprocessor
 from predict_system import TextSystem
 from preprocess import Preprocessor
-from utils import get_ckpt_file, get_image_paths, get_ocr_result_paths
+from utils import (
+    KieChunkScheduler,
+    default_batch_buckets,
+    get_ckpt_file,
+    get_image_paths,
+    get_ocr_result_paths,
+    parse_buckets,
+)
 
 from mindspore import Tensor, set_context
 
 from mindocr import build_model  # noqa
+from mindocr.utils.kie_utils import load_vqa_bio_label_maps  # noqa
 from mindocr.utils.logger import set_logger  # noqa
 from mindocr.utils.visualize import draw_ser_results
 
@@ -71,13 +79,34 @@ class SemanticEntityRecognition:
         )
         self.model.set_train(False)
 
-        self.preprocess = Preprocessor(task="ser", ser_class_dict_path=args.ser_class_dict_path)
+        self.preprocess = Preprocessor(
+            task="ser", ser_class_dict_path=args.ser_class_dict_path, kie_chunk_batch=args.kie_chunk_batch
+        )
 
         self.postprocess = Postprocessor(task="ser", ser_class_dict_path=args.ser_class_dict_path)
 
         self.batch_mode = args.kie_batch_mode
         self.batch_num = args.kie_batch_num
 
+        # pack the windows of the long documents into batches instead of truncating the documents
+        self.chunk_scheduler = None
+        if args.kie_chunk_batch:
+            max_seq_len = args.kie_max_seq_len
+            length_buckets = parse_buckets(args.kie_length_buckets) or [max_seq_len // 4, max_seq_len // 2]
+            # the logits of a group of documents without tokens, e.g. blank pages, are empty arrays of the classes
+            self.num_ser_classes = len(load_vqa_bio_label_maps(args.ser_class_dict_path)[1])
+            self.chunk_scheduler = KieChunkScheduler(
+                max_seq_len=max_seq_len,
+                batch_size=self.batch_num,
+                overlap=args.kie_window_overlap,
+                length_buckets=length_buckets,
+                batch_buckets=default_batch_buckets(self.batch_num),
+            )
+            logger.info(
+                f"KIE chunk batching - length buckets: {self.chunk_scheduler.length_buckets}, "
+                f"batch buckets: {self.chunk_scheduler.batch_buckets}, overlap: {args.kie_window_overlap}"
+            )
+
     def format_ocr_result(self, boxes_all, text_scores_all, img_paths):
         """
         Format OCR results for a list of images.
@@ -248,6 +277,49 @@ class SemanticEntityRecognition:
                 ser_res.append(res_dict)
         return ser_res
 
+    def run_chunked(self, ocr_info_list):
+        """
+        Run semantic entity recognition on the windows of the documents, the windows of every `batch_num` documents
+        are packed into batches by the chunk scheduler, and their logits are merged back into the documents.
+
+        Args:
+            ocr_info_list: list of dict with the img path and the ocr label of each image
+
+        Return:
+            ser_res: list of dictionaries, each containing keys 'img_path' and 'ser_output' for recognition results.
+        """
+        ser_res = []
+        num_imgs = len(ocr_info_list)
+
+        for idx in range(0, num_imgs, self.batch_num):
+            docs = [self.preprocess(ocr_info) for ocr_info in ocr_info_list[idx : idx + self.batch_num]]
+            batches = self.chunk_scheduler.pack(docs)
+            self.chunk_scheduler.log_stats(batches, len(docs))
+
+            logits = []
+            for batch in batches:
+                input_x = [
+                    Tensor(batch["input_ids"]),
+                    Tensor(batch["bbox"]),
+                    Tensor(batch["attention_mask"]),
+                    Tensor(batch["token_type_ids"]),
+                    Tensor(batch["image"]),
+                ]
+                batch_logits = self.model(input_x)
+                if isinstance(batch_logits, (list, tuple)):
+                    batch_logits = batch_logits[0]
+                logits.append(batch_logits.asnumpy())
+            doc_logits = self.chunk_scheduler.merge(docs, batches, logits, num_classes=self.num_ser_classes)
+
+            batch_res = self.postprocess(
+                doc_logits,
+                segment_offset_ids=[doc["segment_offset_id"] for doc in docs],
+                ocr_infos=[doc["ocr_info"] for doc in docs],
+            )
+            for index, res in enumerate(batch_res):
+                ser_res.append({"img_path": ocr_info_list[idx + index]["img_path"], "ser_output": res})
+        return ser_res
+
     def run_single(self, ocr_info_list):
         """
         Text recognition inference on a single image
@@ -309,7 +381,9 @@ class SemanticEntityRecognition:
             ocr_info, time_report = self.get_from_predict(img_list)
             ocr_info_list += ocr_info
         start_time = time()
-        if self.batch_mode:
+        if self.chunk_scheduler is not None:
+            results_ser = self.run_chunked(ocr_info_list)
+        elif self.batch_mode:
             results_ser = self.run_batchwise(ocr_info_list)
         else:
             results_ser = self.run_single(ocr_info_list)
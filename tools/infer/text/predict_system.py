@@ -22,7 +22,7 @@ from postprocess import Postprocessor
 from predict_det import TextDetector
 from predict_rec import TextRecognizer
 from preprocess import Preprocessor
-from utils import crop_text_region, get_image_paths, img_rotate
+from utils import get_image_paths, img_rotate
 
 import mindspore as ms
 from mindspore import ops
@@ -31,6 +31,7 @@ __dir__ = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, os.path.abspath(os.path.join(__dir__, "../../../")))
 
 from mindocr import build_model
+from mindocr.utils.crop_utils import crop_text_regions
 from mindocr.utils.logger import set_logger
 from mindocr.utils.visualize import visualize  # noqa
 from tools.infer.text.utils import get_ckpt_file
@@ -272,14 +273,20 @@ class TextSystem(object):
         polys = det_res["polys"].copy()
         logger.info(f"Num detected text boxes: {len(polys)}\nDet time: {time_profile['det']}")
 
-        # crop text regions
-        crops = []
-        for i in range(len(polys)):
-            poly = polys[i].astype(np.float32)
-            cropped_img = crop_text_region(data["image_ori"], poly, box_type=self.box_type)
-            crops.append(cropped_img)
+        # crop and recognize text regions in one pass if the crops are not needed elsewhere
+        if self.cls_algorithm is None and not self.save_crop_res and self.text_recognize.support_fused_crop:
+            rs = time()
+            polys = [poly.astype(np.float32) for poly in polys]
+            rec_res_all_crops = self.text_recognize.run_batchwise_on_regions(
+                data["image_ori"], polys, box_type=self.box_type
+            )
+            time_profile["rec"] = time() - rs
+            return self._merge_and_visualize(det_res, data, rec_res_all_crops, fn, time_profile, start, do_visualize)
 
-            if self.save_crop_res:
+        # crop text regions
+        crops = crop_text_regions(data["image_ori"], [poly.astype(np.float32) for poly in polys], self.box_type)
+        if self.save_crop_res:
+            for i, cropped_img in enumerate(crops):
                 cv2.imwrite(os.path.join(self.crop_res_save_dir, f"{fn}_crop_{i}.jpg"), cropped_img)
         # show_imgs(crops, is_bgr_img=False)
 
@@ -310,6 +317,9 @@ class TextSystem(object):
         rec_res_all_crops = self.text_recognize(crops, do_visualize=False)
         time_profile["rec"] = time() - rs
 
+        return self._merge_and_visualize(det_res, data, rec_res_all_crops, fn, time_profile, start, do_visualize)
+
+    def _merge_and_visualize(self, det_res, data, rec_res_all_crops, fn, time_profile, start, do_visualize):
         logger.info(
             "Recognized texts: \n"
             + "\n".join([f"{text}\t{score}" for text, score in rec_res_all_crops])
@@ -318,7 +328,7 @@ class TextSystem(object):
 
         # filter out low-score texts and merge detection and recognition results
         boxes, text_scores = [], []
-        for i in range(len(polys)):
+        for i in range(len(det_res["polys"])):
             box = det_res["polys"][i]
             # box_score = det_res["scores"][i]
             text = rec_res_all_crops[i][0]
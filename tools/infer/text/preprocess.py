@@ -191,6 +191,8 @@ class Preprocessor(object):
 
         elif task == "ser":
             class_path = kwargs.get("ser_class_dict_path", "mindocr/utils/dict/class_list_xfun.txt")
+            # the tokens of the whole documents are kept if they are split into windows by the KieChunkScheduler
+            chunk_batch = kwargs.get("kie_chunk_batch", False)
             pipeline = [
                 {"DecodeImage": {"img_mode": "RGB", "infer_mode": True, "to_float32": False}},
                 {
@@ -202,8 +204,13 @@ class Preprocessor(object):
                         "order_method": "tb-yx",
                     }
                 },
-                {"VQATokenPad": {"max_seq_len": 512, "infer_mode": True, "return_attention_mask": True}},
-                {"VQASerTokenChunk": {"infer_mode": True, "max_seq_len": 512}},
+            ]
+            if not chunk_batch:
+                pipeline += [
+                    {"VQATokenPad": {"max_seq_len": 512, "infer_mode": True, "return_attention_mask": True}},
+                    {"VQASerTokenChunk": {"infer_mode": True, "max_seq_len": 512}},
+                ]
+            pipeline += [
                 {"LayoutResize": {"infer_mode": True, "size": [224, 224]}},
                 {
                     "NormalizeImage": {
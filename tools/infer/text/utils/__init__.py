@@ -1,4 +1,6 @@
+from .kie_chunk import *
 from .matcher import Matcher, TableMasterMatcher
 from .recovery_to_doc import *
+from .shape_bucket import *
 from .table_process import *
 from .utils import *
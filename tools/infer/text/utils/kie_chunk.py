@@ -0,0 +1,174 @@
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_logger = logging.getLogger("mindocr")
+
+# the inputs of the KIE networks which have a value per token
+TOKEN_KEYS = ("input_ids", "bbox", "attention_mask", "token_type_ids")
+
+
+class KieChunkScheduler(object):
+    """
+    Split the token sequences of KIE documents into windows of at most `max_seq_len` tokens, and pack the windows of
+    several documents into batches, so that a dense document costs as many forwards as its tokens need, instead of
+    being truncated to, or run chunk by chunk at, `max_seq_len`.
+
+    The windows are grouped by the nearest length bucket above their length, and each batch is padded to its length
+    bucket and to the nearest batch bucket, so that the last small window of a document is not padded to
+    `max_seq_len`, and graph mode compiles the network for a few shapes only. With `overlap` > 0, consecutive windows
+    share `overlap` tokens, the last window of a document ends at its last token, and the logits of a token covered
+    by several windows are averaged.
+
+    Args:
+        max_seq_len: max number of tokens of a window.
+        batch_size: max number of windows of a batch.
+        overlap: number of tokens shared by consecutive windows of a document.
+        length_buckets: candidate padded lengths of the windows. If empty, the windows are padded to `max_seq_len`.
+        batch_buckets: candidate batch sizes. If empty, the batch size is not padded.
+
+    Example:
+        >>> scheduler = KieChunkScheduler(max_seq_len=512, batch_size=8, overlap=128, length_buckets=[128, 256, 512])
+        >>> batches = scheduler.pack(docs)
+        >>> logits = [model(batch).asnumpy() for batch in batches]
+        >>> doc_logits = scheduler.merge(docs, batches, logits)
+    """
+
+    def __init__(
+        self,
+        max_seq_len: int = 512,
+        batch_size: int = 8,
+        overlap: int = 0,
+        length_buckets: Sequence[int] = (),
+        batch_buckets: Sequence[int] = (),
+    ):
+        if not 0 <= overlap < max_seq_len:
+            raise ValueError(f"overlap should be in [0, max_seq_len), but got {overlap} with max_seq_len {max_seq_len}")
+        self.max_seq_len = max_seq_len
+        self.batch_size = batch_size
+        self.overlap = overlap
+        self.length_buckets = sorted({b for b in length_buckets if b < max_seq_len} | {max_seq_len})
+        self.batch_buckets = sorted(set(batch_buckets))
+
+    def windows(self, num_tokens: int) -> List[Tuple[int, int]]:
+        """The (start, end) of the windows of a sequence of `num_tokens` tokens."""
+        if num_tokens <= self.max_seq_len:
+            return [(0, num_tokens)] if num_tokens > 0 else []
+        stride = self.max_seq_len - self.overlap
+        windows = []
+        start = 0
+        while True:
+            end = start + self.max_seq_len
+            if end >= num_tokens:
+                if self.overlap > 0:
+                    # align the last window to the end of the sequence, which gives its tokens the most context
+                    start = num_tokens - self.max_seq_len
+                windows.append((start, num_tokens))
+                return windows
+            windows.append((start, end))
+            start += stride
+
+    def match_length(self, length: int) -> int:
+        for bucket in self.length_buckets:
+            if length <= bucket:
+                return bucket
+        return length
+
+    def match_batch(self, batch_size: int) -> int:
+        for bucket in self.batch_buckets:
+            if batch_size <= bucket:
+                return bucket
+        return batch_size
+
+    def pack(self, docs: List[Dict]) -> List[Dict]:
+        """
+        Pack the windows of the documents into batches.
+
+        Args:
+            docs: the preprocessed documents, each with the arrays of `TOKEN_KEYS` of all its tokens, the CHW
+                `image`, and optionally the `tokenizer_params` of the padding.
+
+        Returns:
+            batches, each with the padded arrays of `TOKEN_KEYS` and `image`, the `windows` of the batch, i.e.
+            (document index, start, end), and the number of valid windows `num_valid`
+        """
+        buckets = {}
+        for doc_idx, doc in enumerate(docs):
+            for start, end in self.windows(len(doc["input_ids"])):
+                buckets.setdefault(self.match_length(end - start), []).append((doc_idx, start, end))
+
+        batches = []
+        for length in sorted(buckets):
+            windows = buckets[length]
+            for i in range(0, len(windows), self.batch_size):
+                batches.append(self._make_batch(docs, windows[i : i + self.batch_size], length))
+        return batches
+
+    def _make_batch(self, docs: List[Dict], windows: List[Tuple[int, int, int]], length: int) -> Dict:
+        batch_size = self.match_batch(len(windows))
+        first = docs[windows[0][0]]
+        params = first.get("tokenizer_params", {})
+        pad_values = {
+            "input_ids": params.get("pad_token_id", 1),
+            "bbox": 0,
+            "attention_mask": 0,
+            "token_type_ids": params.get("pad_token_type_id", 0),
+        }
+        batch = {}
+        for key in TOKEN_KEYS:
+            value = np.asarray(first[key])
+            batch[key] = np.full((batch_size, length) + value.shape[1:], pad_values[key], dtype=value.dtype)
+        image = np.asarray(first["image"])
+        batch["image"] = np.zeros((batch_size,) + image.shape, dtype=image.dtype)
+
+        for i, (doc_idx, start, end) in enumerate(windows):
+            doc = docs[doc_idx]
+            for key in TOKEN_KEYS:
+                batch[key][i, : end - start] = doc[key][start:end]
+            batch["image"][i] = doc["image"]
+        batch["windows"] = windows
+        batch["num_valid"] = len(windows)
+        return batch
+
+    @staticmethod
+    def merge(
+        docs: List[Dict], batches: List[Dict], logits: List[np.ndarray], num_classes: Optional[int] = None
+    ) -> List[np.ndarray]:
+        """
+        Gather the logits of the windows back into the logits of each document, averaging the logits of the tokens
+        covered by several windows.
+
+        Args:
+            docs: the documents given to `pack`.
+            batches: the batches returned by `pack`.
+            logits: the logits of the tokens of each batch, of shape (batch size, padded length, num classes).
+            num_classes: number of classes of the logits, needed if there are no batches, i.e. no document has tokens.
+
+        Returns:
+            the logits of each document, of shape (num tokens, num classes)
+        """
+        if logits:
+            num_classes, dtype = logits[0].shape[-1], logits[0].dtype
+        elif num_classes is None:
+            raise ValueError("num_classes should be given if there are no logits, e.g. of documents without tokens")
+        else:
+            dtype = np.float32
+        sums = [np.zeros((len(doc["input_ids"]), num_classes), dtype=np.float32) for doc in docs]
+        counts = [np.zeros((len(doc["input_ids"]), 1), dtype=np.float32) for doc in docs]
+        for batch, batch_logits in zip(batches, logits):
+            for i, (doc_idx, start, end) in enumerate(batch["windows"]):
+                sums[doc_idx][start:end] += batch_logits[i, : end - start]
+                counts[doc_idx][start:end] += 1
+        return [(s / np.maximum(c, 1)).astype(dtype) for s, c in zip(sums, counts)]
+
+    @staticmethod
+    def log_stats(batches: List[Dict], num_docs: int):
+        """Log the number of windows and batches, and the fraction of padded tokens."""
+        num_tokens = sum(end - start for batch in batches for _, start, end in batch["windows"])
+        num_padded = sum(batch["input_ids"].size for batch in batches)
+        _logger.info(
+            f"KIE chunk batching: {num_docs} documents, "
+            f"{sum(batch['num_valid'] for batch in batches)} windows, {len(batches)} batches, "
+            f"{num_tokens} tokens, {1 - num_tokens / max(num_padded, 1):.1%} padding"
+        )
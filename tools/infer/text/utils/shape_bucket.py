@@ -0,0 +1,128 @@
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_logger = logging.getLogger("mindocr")
+
+
+def parse_buckets(buckets: Optional[str]) -> List[int]:
+    """
+    Parse a comma-separated string of bucket sizes, e.g. "1,4,8" -> [1, 4, 8].
+    """
+    if not buckets:
+        return []
+    return sorted({int(b) for b in str(buckets).split(",") if b.strip()})
+
+
+def default_batch_buckets(batch_num: int) -> List[int]:
+    """
+    Powers of two below `batch_num`, plus `batch_num` itself, e.g. 12 -> [1, 2, 4, 8, 12].
+    """
+    buckets = []
+    b = 1
+    while b < batch_num:
+        buckets.append(b)
+        b *= 2
+    buckets.append(batch_num)
+    return buckets
+
+
+class ShapeBucketer(object):
+    """
+    Pad inputs of a dynamic-shape network to a small set of (batch, width) buckets.
+
+    In graph mode, MindSpore compiles the network again for every new input shape, so feeding whatever batch size
+    and width the preprocess produces causes a recompilation for each unseen shape, e.g. for the last partial batch.
+    Padding inputs to the nearest bucket limits the number of distinct shapes, and all of them can be compiled
+    ahead of time with `warmup_shapes`.
+
+    Args:
+        batch_buckets: candidate batch sizes. If empty, the batch size is not padded.
+        width_buckets: candidate input widths. If empty, the width is not padded.
+        pad_value: value (scalar or per-channel) to fill the padded width with. It should be equal to the value
+            of the padding added by the preprocess.
+
+    Example:
+        >>> bucketer = ShapeBucketer(batch_buckets=[1, 4, 8], width_buckets=[320, 640])
+        >>> padded, num_valid = bucketer.pad(np.zeros((3, 3, 48, 300), dtype=np.float32))
+        >>> padded.shape, num_valid
+        ((4, 3, 48, 320), 3)
+    """
+
+    def __init__(self, batch_buckets: Sequence[int] = (), width_buckets: Sequence[int] = (), pad_value: float = 0.0):
+        self.batch_buckets = sorted(set(batch_buckets))
+        self.width_buckets = sorted(set(width_buckets))
+        self.pad_value = np.asarray(pad_value, dtype=np.float32)
+        self.seen_shapes = set()
+        self.compile_count = 0
+
+    @staticmethod
+    def _match(value: int, buckets: List[int]) -> int:
+        for bucket in buckets:
+            if value <= bucket:
+                return bucket
+        return value
+
+    def match_batch(self, batch_size: int) -> int:
+        return self._match(batch_size, self.batch_buckets)
+
+    def match_width(self, width: int) -> int:
+        return self._match(width, self.width_buckets)
+
+    def pad(self, img_batch: np.ndarray) -> Tuple[np.ndarray, int]:
+        """
+        Pad a batch of NCHW images to the nearest (batch, width) bucket.
+
+        Returns:
+            padded batch, and the number of valid samples in it
+        """
+        num_valid, num_channels, height, width = img_batch.shape
+        tar_b = self.match_batch(num_valid)
+        tar_w = self.match_width(width)
+        if tar_w > width:
+            padded = np.empty((num_valid, num_channels, height, tar_w), dtype=img_batch.dtype)
+            padded[..., :width] = img_batch
+            padded[..., width:] = self.pad_value.reshape(-1, 1, 1)
+            img_batch = padded
+        if tar_b > num_valid:
+            img_batch = np.concatenate(
+                [img_batch, np.zeros((tar_b - num_valid,) + img_batch.shape[1:], dtype=img_batch.dtype)], axis=0
+            )
+        if (self.width_buckets and width > self.width_buckets[-1]) or (
+            self.batch_buckets and num_valid > self.batch_buckets[-1]
+        ):
+            _logger.warning(
+                f"Input shape {(num_valid, width)} exceeds the largest shape bucket "
+                f"{(self.batch_buckets[-1:], self.width_buckets[-1:])}, and will be fed as is."
+            )
+        self.record(img_batch.shape)
+        return img_batch, num_valid
+
+    def record(self, shape: Tuple[int, ...]) -> bool:
+        """
+        Record an input shape fed to the network. Return True if it is new, i.e. triggers a graph compilation.
+        """
+        shape = tuple(shape)
+        if shape in self.seen_shapes:
+            return False
+        self.seen_shapes.add(shape)
+        self.compile_count += 1
+        return True
+
+    def warmup_shapes(self, num_channels: int, height: int, default_width: int) -> List[Tuple[int, int, int, int]]:
+        """
+        All input shapes that can be produced by `pad`, used to compile the network ahead of time.
+        """
+        batch_sizes = self.batch_buckets or [1]
+        widths = self.width_buckets or [default_width]
+        return [(b, num_channels, height, w) for b in batch_sizes for w in widths]
+
+    @staticmethod
+    def unpad(net_pred, num_valid: int):
+        """
+        Remove the predictions of the padded samples.
+        """
+        if isinstance(net_pred, (list, tuple)):
+            return type(net_pred)(p[:num_valid] for p in net_pred)
+        return net_pred[:num_valid]